@@ -0,0 +1,194 @@
+"""
+Access policy for branch-scoped views.
+
+``policy_for(user)`` resolves a user's role, permission codenames and the
+branch IDs they may see once, keeps the result on the user object for the
+rest of the request and in the cache for ``ACCESS_POLICY_CACHE_TIMEOUT``
+seconds. Cache keys carry a version number: role, permission, region and
+branch changes bump it (see the signal handlers in ``accounts.models``), which
+retires every cached policy at once, and saving a user drops only that
+user's entry. Use a shared cache backend (``REDIS_URL``) so every worker
+process sees a bump immediately; with the default local-memory cache other
+processes pick changes up when their entries time out.
+
+Branch visibility:
+
+- superusers, regional managers without assigned regions, and staff without
+  a branch (head office) see every branch;
+- regional managers with regions see the branches in those regions;
+- everyone else sees their own branch.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'access-policy:version'
+
+
+class AccessPolicy:
+    """What one user may do and see; cheap to pickle into the cache"""
+
+    def __init__(self, user_id=None, is_superuser=False, role_id=None, role_type=None, role_name='',
+                 role_category=None, permissions=frozenset(), region_ids=frozenset(), branch_ids=None):
+        self.user_id = user_id
+        self.is_superuser = is_superuser
+        self.role_id = role_id
+        self.role_type = role_type
+        self.role_name = role_name
+        self.role_category = role_category
+        # "app_label.codename" strings, from the role and from direct user permissions
+        self.permissions = permissions
+        # Regions a regional manager is assigned to
+        self.region_ids = region_ids
+        # None means every branch
+        self.branch_ids = branch_ids
+
+    @property
+    def all_branches(self):
+        return self.branch_ids is None
+
+    @property
+    def is_regional_manager(self):
+        from .models import Role
+        return self.role_type == Role.REGIONAL_MANAGER or self.role_name.lower() == 'regional manager'
+
+    @property
+    def is_branch_manager(self):
+        from .models import Role
+        return self.role_type == Role.BRANCH_MANAGER
+
+    def has_perm(self, perm):
+        """perm is "app_label.codename" or a bare codename"""
+        if self.is_superuser:
+            return True
+        if '.' in perm:
+            return perm in self.permissions
+        return any(name.split('.', 1)[1] == perm for name in self.permissions)
+
+    def can_access_branch(self, branch_id):
+        return self.branch_ids is None or branch_id in self.branch_ids
+
+
+ANONYMOUS = AccessPolicy(branch_ids=frozenset())
+
+
+def _timeout():
+    return getattr(settings, 'ACCESS_POLICY_CACHE_TIMEOUT', 300)
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def _user_key(user_id, version):
+    return f"access-policy:{version}:user:{user_id}"
+
+
+def invalidate():
+    """Retire every cached policy; call after role, permission, region or branch changes"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Version key evicted or never set; any new value retires the old keys
+        cache.set(VERSION_KEY, _version() + 1, None)
+
+
+def invalidate_user(user):
+    cache.delete(_user_key(user.pk, _version()))
+    user.__dict__.pop('_access_policy', None)
+    user.__dict__.pop('_role_perm_cache', None)
+
+
+def role_permissions(role_id):
+    """Permission names ("app_label.codename") granted by a role, cached"""
+    if role_id is None:
+        return frozenset()
+    key = f"access-policy:{_version()}:role:{role_id}"
+    permissions = cache.get(key)
+    if permissions is None:
+        from .models import Role
+        permissions = frozenset(
+            f"{app_label}.{codename}" for app_label, codename in
+            Role.permissions.through.objects
+            .filter(role_id=role_id)
+            .values_list('permission__content_type__app_label', 'permission__codename')
+        )
+        cache.set(key, permissions, _timeout())
+    return permissions
+
+
+def _build(user):
+    from branches.models import Branch
+
+    role = user.role
+    permissions = set(role_permissions(role.pk if role else None))
+    permissions.update(
+        f"{app_label}.{codename}" for app_label, codename in
+        user.user_permissions.values_list('content_type__app_label', 'codename')
+    )
+    policy = AccessPolicy(
+        user_id=user.pk,
+        is_superuser=user.is_superuser,
+        role_id=role.pk if role else None,
+        role_type=role.role_type if role else None,
+        role_name=role.name if role else '',
+        role_category=role.category if role else None,
+        permissions=frozenset(permissions),
+    )
+    if user.is_superuser:
+        policy.branch_ids = None
+    elif policy.is_regional_manager:
+        policy.region_ids = frozenset(user.regions.values_list('pk', flat=True))
+        policy.branch_ids = (
+            frozenset(Branch.objects.filter(region_id__in=policy.region_ids).values_list('pk', flat=True))
+            if policy.region_ids else None
+        )
+    elif user.branch_id:
+        policy.branch_ids = frozenset([user.branch_id])
+    else:
+        policy.branch_ids = None
+    return policy
+
+
+def policy_for(user):
+    """The user's access policy: from this request, else the cache, else the database"""
+    if user is None or not user.is_authenticated or not user.is_active:
+        return ANONYMOUS
+    policy = user.__dict__.get('_access_policy')
+    if policy is None:
+        key = _user_key(user.pk, _version())
+        policy = cache.get(key)
+        if policy is None:
+            policy = _build(user)
+            cache.set(key, policy, _timeout())
+        user.__dict__['_access_policy'] = policy
+    return policy
+
+
+def visible_branch_ids(user):
+    """IDs of the branches user may see, or None for all of them"""
+    return policy_for(user).branch_ids
+
+
+def can_access_branch(user, branch_id):
+    return policy_for(user).can_access_branch(branch_id)
+
+
+def visible_branches(user):
+    """Branch queryset limited to the branches user may see"""
+    from branches.models import Branch
+
+    branch_ids = visible_branch_ids(user)
+    branches = Branch.objects.all()
+    return branches if branch_ids is None else branches.filter(pk__in=branch_ids)
+
+
+def restrict_to_branches(queryset, user, path='branch'):
+    """Filter queryset to rows whose branch (at path) user may see"""
+    branch_ids = visible_branch_ids(user)
+    if branch_ids is None:
+        return queryset
+    return queryset.filter(**{f"{path}_id__in": branch_ids})
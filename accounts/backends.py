@@ -0,0 +1,26 @@
+from django.contrib.auth.backends import ModelBackend
+
+from .access import role_permissions
+
+
+class RoleModelBackend(ModelBackend):
+    """
+    ModelBackend that also grants the permissions of the user's role.
+
+    Role permissions are read from the role (cached by ``accounts.access``)
+    rather than copied into each user's ``user_permissions``, so changing a
+    role's permissions takes effect for all of its users at once and saving
+    a user never touches the permission tables.
+    """
+
+    def get_role_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_role_perm_cache'):
+            user_obj._role_perm_cache = set(role_permissions(user_obj.role_id))
+        return user_obj._role_perm_cache
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        return {*super().get_all_permissions(user_obj, obj), *self.get_role_permissions(user_obj, obj)}
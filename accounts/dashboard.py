@@ -0,0 +1,227 @@
+"""
+Home-page dashboard counters, cached per branch.
+
+``metrics_for(branch_ids)`` returns item, loan, sale and customer counters
+for a set of branches, or for every branch when branch_ids is None. One
+database round trip computes any missing branches: a UNION ALL of four
+queries, each grouped by branch.
+
+Each branch's counters are cached for the day under ``dashboard:<date>:<branch>``.
+The "every branch" total is cached under the key ``all``.
+
+Customer counters are per branch like the others, so a user limited to some
+branches sees only those branches' customers. They used to be counted across
+every branch for everyone.
+
+Freshness:
+
+- Loan, Item, Sale and Customer saves and deletes call ``invalidate`` for
+  the affected branches (see the receivers in ``accounts.models``): the
+  row's branch and, on a move, the branch it was loaded with. It marks
+  those entries and ``all`` dirty. Other branches keep their cache.
+- An entry is stale once it is older than ``DASHBOARD_CACHE_TTL`` or has
+  been marked dirty.
+- With ``DASHBOARD_STALE_WHILE_REVALIDATE`` on, stale counters are served
+  while one background thread per process recomputes them. A cache lock
+  (``cache.add``) stops other processes from recomputing the same branch, so
+  a login rush costs one query per change rather than one per login. The
+  lock is only shared with a shared cache backend (``REDIS_URL``); with the
+  default local-memory cache it holds per process, and each process
+  recomputes once.
+- Entries older than ``DASHBOARD_STALE_TTL`` are recomputed in the request.
+"""
+import logging
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, DecimalField, IntegerField, Q, Sum, Value
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ALL = 'all'
+
+COUNTERS = ('total_items', 'available_items', 'pawned_items', 'active_loans', 'overdue_loans',
+            'loans_due_today', 'total_sales', 'customer_count', 'new_customers_today')
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+# Seconds before a refresh lock left by a crashed process expires
+REFRESH_LOCK_TIMEOUT = 30
+
+
+def _fresh_ttl():
+    return getattr(settings, 'DASHBOARD_CACHE_TTL', 30)
+
+
+def _stale_ttl():
+    return max(getattr(settings, 'DASHBOARD_STALE_TTL', 300), _fresh_ttl())
+
+
+def _stale_while_revalidate():
+    return getattr(settings, 'DASHBOARD_STALE_WHILE_REVALIDATE', True)
+
+
+def _key(scope, today):
+    return f"dashboard:{today.isoformat()}:{scope}"
+
+
+def _dirty_key(scope, today):
+    return f"dashboard:{today.isoformat()}:{scope}:dirty"
+
+
+def _empty():
+    metrics = dict.fromkeys(COUNTERS, 0)
+    metrics['total_sales'] = Decimal('0')
+    return metrics
+
+
+def compute(branch_ids, today):
+    """Counters per branch id (None for rows without a branch), for branch_ids or every branch"""
+    from accounts.models import Customer
+    from inventory.models import Item
+    from transactions.models import Loan, Sale
+
+    def grouped(queryset, kind, a, b, c, amount=None):
+        if branch_ids is not None:
+            queryset = queryset.filter(branch_id__in=branch_ids)
+        # Same columns, in the same order, for every part of the UNION
+        return (queryset.order_by().values('branch_id').annotate(
+            kind=Value(kind),
+            a=a, b=b, c=c,
+            amount=amount if amount is not None else Value(Decimal('0'), output_field=MONEY),
+        ).values_list('branch_id', 'kind', 'a', 'b', 'c', 'amount'))
+
+    zero = Value(0, output_field=IntegerField())
+    items = grouped(
+        Item.objects, 'items',
+        Count('pk'), Count('pk', filter=Q(status='available')), Count('pk', filter=Q(status='pawned')),
+    )
+    loans = grouped(
+        Loan.objects.filter(status='active'), 'loans',
+        Count('pk'), Count('pk', filter=Q(due_date__lt=today)), Count('pk', filter=Q(due_date=today)),
+    )
+    sales = grouped(
+        Sale.objects.filter(status='completed', sale_date=today), 'sales',
+        zero, zero, zero, Sum('total_amount', output_field=MONEY),
+    )
+    customers = grouped(
+        Customer.objects, 'customers',
+        Count('pk'), Count('pk', filter=Q(created_at__date=today)), zero,
+    )
+
+    metrics = {}
+    for branch_id, kind, a, b, c, amount in items.union(loans, sales, customers, all=True):
+        row = metrics.setdefault(branch_id, _empty())
+        if kind == 'items':
+            row.update(total_items=a, available_items=b, pawned_items=c)
+        elif kind == 'loans':
+            row.update(active_loans=a, overdue_loans=b, loans_due_today=c)
+        elif kind == 'sales':
+            row['total_sales'] = Decimal(str(amount or 0))
+        else:
+            row.update(customer_count=a, new_customers_today=b)
+    return metrics
+
+
+def _total(rows):
+    metrics = _empty()
+    for row in rows:
+        for counter in COUNTERS:
+            metrics[counter] += row[counter]
+    return metrics
+
+
+def _store(scope, metrics, today, started):
+    cache.set(_key(scope, today), {'metrics': metrics, 'computed_at': started}, _stale_ttl())
+
+
+def _refresh(scopes, today):
+    """Recompute and cache the counters of scopes (branch ids and/or ALL)"""
+    # Stamped with the start time, so a write during the queries leaves the entry dirty
+    started = time.time()
+    if ALL in scopes:
+        per_branch = compute(None, today)
+        _store(ALL, _total(per_branch.values()), today, started)
+        # The per-branch rows came for free; cache the ones that were asked for
+        branch_ids = [scope for scope in scopes if scope != ALL]
+    else:
+        branch_ids = list(scopes)
+        per_branch = compute(branch_ids, today)
+    for branch_id in branch_ids:
+        _store(branch_id, per_branch.get(branch_id, _empty()), today, started)
+    return per_branch
+
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _refresh_in_background(scopes, today):
+    """Recompute scopes on a daemon thread unless this or another process already is"""
+    with _refreshing_lock:
+        scopes = [scope for scope in scopes if (scope, today) not in _refreshing]
+        # The cache lock keeps other processes from recomputing the same scope
+        scopes = [scope for scope in scopes
+                  if cache.add(f"{_key(scope, today)}:refreshing", 1, REFRESH_LOCK_TIMEOUT)]
+        _refreshing.update((scope, today) for scope in scopes)
+    if not scopes:
+        return
+
+    def run():
+        try:
+            _refresh(scopes, today)
+        except Exception:
+            logger.exception("Dashboard refresh failed for %s", scopes)
+        finally:
+            cache.delete_many([f"{_key(scope, today)}:refreshing" for scope in scopes])
+            with _refreshing_lock:
+                _refreshing.difference_update((scope, today) for scope in scopes)
+            connection.close()
+
+    threading.Thread(target=run, name='dashboard-refresh', daemon=True).start()
+
+
+def metrics_for(branch_ids=None, today=None):
+    """Dashboard counters summed over branch_ids, or over every branch when None"""
+    today = today or timezone.localdate()
+    scopes = [ALL] if branch_ids is None else sorted(branch_ids)
+    keys = {scope: _key(scope, today) for scope in scopes}
+    dirty_keys = {scope: _dirty_key(scope, today) for scope in scopes}
+    cached = cache.get_many([*keys.values(), *dirty_keys.values()])
+
+    now = time.time()
+    results, missing, stale = {}, [], []
+    for scope in scopes:
+        entry = cached.get(keys[scope])
+        if entry is None:
+            missing.append(scope)
+            continue
+        results[scope] = entry['metrics']
+        dirty_at = cached.get(dirty_keys[scope])
+        if now - entry['computed_at'] > _fresh_ttl() or (dirty_at and dirty_at >= entry['computed_at']):
+            stale.append(scope)
+
+    if stale and not _stale_while_revalidate():
+        missing += stale
+        stale = []
+    if missing:
+        per_branch = _refresh(missing, today)
+        for scope in missing:
+            results[scope] = _total(per_branch.values()) if scope == ALL else per_branch.get(scope, _empty())
+    if stale:
+        _refresh_in_background(stale, today)
+
+    return results[ALL] if branch_ids is None else _total(results[scope] for scope in scopes)
+
+
+def invalidate(*branch_ids, today=None):
+    """Mark the counters of branch_ids, and the all-branches total, as out of date"""
+    today = today or timezone.localdate()
+    now = time.time()
+    scopes = {ALL, *(branch_id for branch_id in branch_ids if branch_id is not None)}
+    cache.set_many({_dirty_key(scope, today): now for scope in scopes}, _stale_ttl())
@@ -67,6 +67,4 @@ class UserUpdateForm(forms.ModelForm):
             if self.cleaned_data.get('role'):
                 user.role = self.cleaned_data['role']
                 user.save()
-                # Update user permissions based on role
-                user.user_permissions.set(self.cleaned_data['role'].permissions.all())
         return user
\ No newline at end of file
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from accounts import access
+from accounts.models import CustomUser, Role
+
+
+class Command(BaseCommand):
+    help = ('Clean up role permissions that older versions copied onto each user '
+            '(RoleModelBackend now grants them from the role)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Instead of removing the copies, add any that are missing (for tools reading auth tables directly)'
+        )
+        parser.add_argument(
+            '--role-id',
+            type=int,
+            help='Only process users of a specific role by ID'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without actually making changes'
+        )
+
+    def handle(self, *args, **options):
+        through = CustomUser.user_permissions.through
+        dry_run = options['dry_run']
+
+        roles = Role.objects.all()
+        if options['role_id']:
+            roles = roles.filter(id=options['role_id'])
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING("DRY RUN: No changes will be made"))
+
+        action = 'added' if options['copy'] else 'removed'
+        total = 0
+        with transaction.atomic():
+            for role in roles:
+                role_perms = role.permissions.values('pk')
+                if options['copy']:
+                    # One INSERT per role for every (user, permission) pair that is missing
+                    existing = set(through.objects
+                                   .filter(customuser__role=role, permission__in=role_perms)
+                                   .values_list('customuser_id', 'permission_id'))
+                    perm_ids = list(role.permissions.values_list('pk', flat=True))
+                    rows = [
+                        through(customuser_id=user_id, permission_id=perm_id)
+                        for user_id in role.users.values_list('pk', flat=True)
+                        for perm_id in perm_ids
+                        if (user_id, perm_id) not in existing
+                    ]
+                    count = len(rows)
+                    if not dry_run:
+                        through.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+                else:
+                    # One DELETE per role for the copies the role already grants
+                    copies = through.objects.filter(customuser__role=role, permission__in=role_perms)
+                    count = copies.count() if dry_run else copies.delete()[0]
+                total += count
+                self.stdout.write(f"Role: {role.name} - {'would be ' if dry_run else ''}{action} {count} user permission(s)")
+
+        if not dry_run:
+            # Bulk queries send no m2m signals, so retire cached access policies here
+            access.invalidate()
+            self.stdout.write(self.style.SUCCESS(f"Done: {action} {total} user permission(s)"))
+        else:
+            self.stdout.write(self.style.WARNING("DRY RUN completed - no changes were made"))
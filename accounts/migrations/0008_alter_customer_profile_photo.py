@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_ensure_role_defaults'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='profile_photo',
+            field=models.TextField(blank=True, help_text='Profile photo URL in the media store', null=True),
+        ),
+    ]
@@ -1,8 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.utils.translation import gettext_lazy as _
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
+from pawnshop_management.tracking import LoadedValuesMixin
 
 
 class Role(models.Model):
@@ -73,8 +74,12 @@ class Role(models.Model):
         }
     
     def has_permission(self, perm_codename):
-        """Check if role has a specific permission"""
-        return self.permissions.filter(codename=perm_codename).exists()
+        """Check if role has a specific permission ("codename" or "app_label.codename")"""
+        from .access import role_permissions
+        names = role_permissions(self.pk)
+        if '.' in perm_codename:
+            return perm_codename in names
+        return any(name.split('.', 1)[1] == perm_codename for name in names)
     
     def add_permissions(self, *codenames):
         """Add multiple permissions by codename"""
@@ -147,12 +152,6 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.username})"
     
-    def save(self, *args, **kwargs):
-        # Set proper permissions based on role
-        super().save(*args, **kwargs)
-        if self.role:
-            self.user_permissions.set(self.role.permissions.all())
-    
     @property
     def is_regional_manager(self):
         return self.role and self.role.role_type == Role.REGIONAL_MANAGER
@@ -191,15 +190,38 @@ class UserActivity(models.Model):
         return f"{self.user} - {self.activity_type} - {self.timestamp}"
 
 
+class CustomerQuerySet(models.QuerySet):
+    # Columns holding photo and biometric payloads; only detail views need them
+    HEAVY_FIELDS = ('profile_photo', 'face_encoding')
+
+    def without_photos(self):
+        """Leave the photo and face encoding columns out of the SELECT"""
+        return self.defer(*self.HEAVY_FIELDS)
+
+    def with_photos(self):
+        """Load every column, including those deferred by the default manager"""
+        return self.defer(None)
+
+
+class CustomerManager(models.Manager.from_queryset(CustomerQuerySet)):
+    """Default customer manager; heavy columns are deferred unless ``with_photos()`` is used"""
+
+    def get_queryset(self):
+        return super().get_queryset().without_photos()
+
+
 # Add the Customer model that's referenced in the inventory app
-class Customer(models.Model):
+class Customer(LoadedValuesMixin, models.Model):
     """Model for pawnshop customers"""
+    # Dashboard counters a customer may be moving away from
+    tracked_fields = ('branch_id',)
+
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
     email = models.EmailField(blank=True, null=True)
     phone = models.CharField(max_length=20)
     branch = models.ForeignKey('branches.Branch', on_delete=models.PROTECT, related_name='customers', null=True)
-    profile_photo = models.TextField(blank=True, null=True, help_text="Base64-encoded profile photo of customer")
+    profile_photo = models.TextField(blank=True, null=True, help_text="Profile photo URL in the media store")
     address = models.TextField(blank=True)
     city = models.CharField(max_length=100, blank=True)
     state = models.CharField(max_length=100, blank=True)
@@ -218,6 +240,8 @@ class Customer(models.Model):
         null=True
     )
     
+    objects = CustomerManager()
+    
     class Meta:
         verbose_name = _('customer')
         verbose_name_plural = _('customers')
@@ -226,6 +250,13 @@ class Customer(models.Model):
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
     
+    def save(self, *args, **kwargs):
+        # Keep only a media store reference on the row instead of the base64 payload
+        from pawnshop_management import media_store
+        if 'profile_photo' not in self.get_deferred_fields():
+            self.profile_photo = media_store.externalize(self.profile_photo)
+        super().save(*args, **kwargs)
+    
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
@@ -235,3 +266,44 @@ class Customer(models.Model):
         """Return number of active loans for this customer"""
         # Using a property to prevent circular import
         return self.loans.filter(status='active').count() if hasattr(self, 'loans') else 0
+
+
+# Access policy cache invalidation (see accounts.access)
+
+@receiver([post_save, post_delete], sender=Role)
+@receiver([post_save, post_delete], sender=Region)
+@receiver([post_save, post_delete], sender='branches.Branch')
+@receiver(m2m_changed, sender=Role.permissions.through)
+def invalidate_access_policies(sender, **kwargs):
+    """Role, permission, region and branch changes can change anyone's access"""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        from .access import invalidate
+        invalidate()
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+@receiver(m2m_changed, sender=CustomUser.regions.through)
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+def invalidate_user_access_policy(sender, instance, **kwargs):
+    if not kwargs.get('action', 'post_').startswith('post_'):
+        return
+    from .access import invalidate, invalidate_user
+    if isinstance(instance, CustomUser):
+        invalidate_user(instance)
+    else:
+        # Reverse side of the m2m (a region or permission), many users may be affected
+        invalidate()
+
+
+# Dashboard counter invalidation (see accounts.dashboard)
+
+@receiver([post_save, post_delete], sender='transactions.Loan')
+@receiver([post_save, post_delete], sender='transactions.Sale')
+@receiver([post_save, post_delete], sender='inventory.Item')
+@receiver([post_save, post_delete], sender=Customer)
+def invalidate_dashboard(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .dashboard import invalidate
+    # A row moving between branches changes the counters of both (loaded_value is the branch it is leaving)
+    invalidate(instance.branch_id, instance.loaded_value('branch_id'))
@@ -6,6 +6,7 @@ from django.contrib.auth.mixins import UserPassesTestMixin
 from django.utils.translation import gettext_lazy as _
 from rest_framework import permissions
 
+from .access import can_access_branch, policy_for
 from .models import Role
 
 
@@ -78,20 +79,9 @@ class BranchRestrictedMixin(UserPassesTestMixin):
         if user.is_superuser:
             return True
             
-        # Regional managers have access to branches in their regions
-        if user.is_regional_manager:
-            # Check if the object's branch is in the user's managed regions
-            if hasattr(obj, 'branch') and obj.branch:
-                return obj.branch.region in user.regions.all()
-                
-        # Branch managers only have access to their own branch
-        if user.is_branch_manager:
-            if hasattr(obj, 'branch'):
-                return obj.branch == user.branch
-                
-        # Regular staff only have access to their own branch
-        if hasattr(obj, 'branch'):
-            return obj.branch == user.branch
+        # Everyone else needs access to the object's branch (see accounts.access)
+        if hasattr(obj, 'branch_id'):
+            return can_access_branch(user, obj.branch_id)
             
         return False
 
@@ -128,13 +118,10 @@ class IsBranchManagerOrAdmin(permissions.BasePermission):
             
         # Check if object has a branch attribute
         if hasattr(obj, 'branch'):
-            # Branch managers can only modify objects in their branch
-            if user.is_branch_manager:
-                return obj.branch == user.branch
-                
-            # Regional managers can modify objects in their regions
-            if user.is_regional_manager:
-                return obj.branch.region in user.regions.all()
+            # Branch and regional managers can modify objects in branches they can see
+            policy = policy_for(user)
+            if policy.is_branch_manager or policy.is_regional_manager:
+                return policy.can_access_branch(obj.branch_id)
         
         return False
 
@@ -156,11 +143,12 @@ class IsRegionalManagerOrAdmin(permissions.BasePermission):
             return True
             
         # Regional managers have permission for their regions
-        if user.is_regional_manager:
-            if hasattr(obj, 'region'):
-                return obj.region in user.regions.all()
-            elif hasattr(obj, 'branch') and obj.branch and obj.branch.region:
-                return obj.branch.region in user.regions.all()
+        policy = policy_for(user)
+        if policy.is_regional_manager:
+            if hasattr(obj, 'region_id'):
+                return obj.region_id in policy.region_ids
+            elif hasattr(obj, 'branch') and obj.branch and obj.branch.region_id:
+                return obj.branch.region_id in policy.region_ids
                 
         return False
 
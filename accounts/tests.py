@@ -1,3 +1,141 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts import access, dashboard
+from accounts.models import Customer, CustomUser, Region, Role
+from branches.models import Branch
+from inventory.models import Category, Item
+from transactions.models import Loan
+
+
+@override_settings(DASHBOARD_STALE_WHILE_REVALIDATE=False)
+class DashboardMetricsTests(TestCase):
+    """Counters are cached per branch and only the branches a write touches are recomputed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Gold', slug='gold')
+        cls.a, cls.b = [
+            Branch.objects.create(name=name, address='1 Street', city='City', state='State', zip_code='1', phone=name)
+            for name in ('A', 'B')
+        ]
+        today = datetime.date.today()
+        for branch, count in ((cls.a, 3), (cls.b, 2)):
+            for i in range(count):
+                customer = Customer.objects.create(
+                    first_name=f'{branch.name}{i}', last_name='Test', phone=f'{branch.name}{i}', branch=branch
+                )
+                cls.item(branch, status='pawned')
+                Loan.objects.create(
+                    loan_number=f'LN{branch.name}{i}', customer=customer, branch=branch,
+                    principal_amount=10000, distribution_amount=10000,
+                    issue_date=today, due_date=today + datetime.timedelta(days=90 if i else -1),
+                    grace_period_end=today + datetime.timedelta(days=97),
+                )
+
+    @classmethod
+    def item(cls, branch, status='available'):
+        n = Item.objects.count() + 1
+        return Item.objects.create(
+            item_id=f'IT{n:04d}', name=f'Ring {n}', description='Ring', category=cls.category,
+            branch=branch, status=status,
+        )
+
+    def setUp(self):
+        # The cache outlives each test's rollback
+        cache.clear()
+
+    def assertRecomputes(self, branch_ids, recomputes):
+        with CaptureQueriesContext(connection) as context:
+            metrics = dashboard.metrics_for(branch_ids)
+        self.assertEqual(len(context.captured_queries), 1 if recomputes else 0)
+        return metrics
+
+    def test_counters_per_branch_and_total(self):
+        a = self.assertRecomputes([self.a.pk], True)
+        self.assertEqual((a['total_items'], a['pawned_items'], a['available_items']), (3, 3, 0))
+        self.assertEqual((a['active_loans'], a['overdue_loans']), (3, 1))
+        self.assertEqual((a['customer_count'], a['new_customers_today']), (3, 3))
+
+        both = self.assertRecomputes([self.a.pk, self.b.pk], True)
+        self.assertEqual(both['customer_count'], 5)
+        self.assertEqual(self.assertRecomputes(None, True), both)
+
+        # Everything is cached now
+        self.assertEqual(self.assertRecomputes([self.b.pk, self.a.pk], False), both)
+        self.assertEqual(self.assertRecomputes(None, False), both)
+
+    def test_write_recomputes_only_its_branch(self):
+        dashboard.metrics_for([self.a.pk])
+        dashboard.metrics_for([self.b.pk])
+        dashboard.metrics_for(None)
+
+        self.item(self.a)
+
+        self.assertEqual(self.assertRecomputes([self.a.pk], True)['available_items'], 1)
+        self.assertRecomputes([self.b.pk], False)
+        self.assertEqual(self.assertRecomputes(None, True)['total_items'], 6)
+
+    def test_move_between_branches_recomputes_both(self):
+        dashboard.metrics_for([self.a.pk])
+        dashboard.metrics_for([self.b.pk])
+        customer = Customer.objects.get(phone='A0')
+
+        customer.branch = self.b
+        with CaptureQueriesContext(connection) as context:
+            customer.save()
+        # The branch being left comes from the loaded row, not a query before the save
+        lookups = [q['sql'] for q in context.captured_queries
+                   if q['sql'].startswith('SELECT "accounts_customer"."branch_id" AS "branch_id" FROM')]
+        self.assertEqual(lookups, [])
+
+        self.assertEqual(self.assertRecomputes([self.a.pk], True)['customer_count'], 2)
+        self.assertEqual(self.assertRecomputes([self.b.pk], True)['customer_count'], 3)
+
+    def test_delete_recomputes_its_branch(self):
+        dashboard.metrics_for([self.a.pk])
+        dashboard.metrics_for([self.b.pk])
+
+        Item.objects.filter(branch=self.b).first().delete()
+
+        self.assertRecomputes([self.a.pk], False)
+        self.assertEqual(self.assertRecomputes([self.b.pk], True)['total_items'], 1)
+
+
+class CustomerAccessTests(TestCase):
+    """Customer views follow the access policy's branches, whatever the role is called"""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='South')
+        cls.customers = {}
+        for name, branch_region in (('A', region), ('B', region), ('C', None)):
+            branch = Branch.objects.create(
+                name=name, address='1 Street', city='City', state='State', zip_code='1', phone=name,
+                region=branch_region,
+            )
+            cls.customers[name] = Customer.objects.create(first_name=name, last_name='Test', phone=name, branch=branch)
+        role = Role.objects.create(name='Area Lead', role_type=Role.REGIONAL_MANAGER)
+        cls.regional = CustomUser.objects.create_user('regional', password='password', role=role,
+                                                      branch=cls.customers['A'].branch)
+        cls.regional.regions.add(region)
+        cls.regional.user_permissions.add(*Permission.objects.filter(
+            content_type__app_label='accounts', codename__in=['view_customer', 'change_customer'],
+        ))
+
+    def setUp(self):
+        access.invalidate()
+        self.client.force_login(self.regional)
+
+    def test_list_and_detail_follow_the_regions(self):
+        response = self.client.get(reverse('customer_list'))
+        self.assertEqual({customer.first_name for customer in response.context['customers']}, {'A', 'B'})
+        self.assertEqual(self.client.get(reverse('customer_detail', args=[self.customers['B'].pk])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('customer_detail', args=[self.customers['C'].pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('customer_update', args=[self.customers['C'].pk])).status_code, 404)
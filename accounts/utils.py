@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from .access import policy_for
 from .models import Role, UserActivity
 
 User = get_user_model()
@@ -80,20 +81,12 @@ def check_user_permission(user, permission_codename):
     if not user.is_active:
         return False
     
-    # Superusers have all permissions
-    if user.is_superuser:
-        return True
-        
-    # Check role permissions
-    if user.role and user.role.has_permission(permission_codename):
-        return True
-        
-    # Check direct user permissions
-    return user.user_permissions.filter(codename=permission_codename).exists()
+    # Role and direct permissions, resolved once per request (see accounts.access)
+    return policy_for(user).has_perm(permission_codename)
 
 def modify_role_permissions(role, add_permissions=None, remove_permissions=None):
     """
-    Modify permissions for a role and update all users with that role
+    Modify permissions for a role; its users pick them up through RoleModelBackend
     
     Args:
         role: Role instance
@@ -110,10 +103,6 @@ def modify_role_permissions(role, add_permissions=None, remove_permissions=None)
         if remove_permissions:
             role.remove_permissions(*remove_permissions)
             
-        # Update permissions for all users with this role
-        for user in role.users.all():
-            user.user_permissions.set(role.permissions.all())
-            
         return True, "Successfully modified role permissions"
     except Exception as e:
         return False, f"Error modifying permissions: {str(e)}"
\ No newline at end of file
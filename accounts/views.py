@@ -4,7 +4,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin,
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView, View
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.db.models import Count, Sum, Q
+from django.db.models import Count, Sum, Q, Prefetch
 from django.utils import timezone
 from django import forms
 from django.http import JsonResponse, Http404
@@ -20,11 +20,14 @@ from datetime import datetime
 import os
 import glob
 
+from . import dashboard
+from .access import can_access_branch, policy_for, restrict_to_branches, visible_branch_ids, visible_branches
 from .models import CustomUser, Role, UserActivity, Customer
 from .forms import UserFaceCreateForm, UserUpdateForm
 from branches.models import Branch
 from inventory.models import Item
 from transactions.models import Loan, Sale
+from search import index as search_index
 from .utils import assign_role_to_user
 
 
@@ -44,55 +47,29 @@ class DashboardView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
-        today = timezone.now().date()
         
-        # Determine if user is branch-specific or has global access
-        if user.is_superuser or not user.branch:
-            branches = Branch.objects.filter(is_active=True)
-            branch_filter = Q()
-        else:
-            branches = Branch.objects.filter(id=user.branch.id)
-            branch_filter = Q(branch=user.branch)
-        
-        # Get inventory statistics
-        context['total_items'] = Item.objects.filter(branch_filter).count()
-        context['available_items'] = Item.objects.filter(branch_filter, status='available').count()
-        context['pawned_items'] = Item.objects.filter(branch_filter, status='pawned').count()
-        
-        # Get loan statistics
-        context['active_loans'] = Loan.objects.filter(branch_filter, status='active').count()
-        context['overdue_loans'] = Loan.objects.filter(
-            branch_filter, status='active', due_date__lt=today
-        ).count()
-        context['loans_due_today'] = Loan.objects.filter(
-            branch_filter, status='active', due_date=today
-        ).count()
-        
-        # Get sales statistics
-        context['total_sales'] = Sale.objects.filter(
-            branch_filter, status='completed', sale_date=today
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
+        # Branches this user may see; None means all of them
+        branch_ids = visible_branch_ids(user)
+        branches = visible_branches(user).filter(is_active=True)
+        branch_filter = Q() if branch_ids is None else Q(branch_id__in=branch_ids)
+        
+        # Item, loan, sale and customer counters, cached per branch (see accounts.dashboard)
+        context.update(dashboard.metrics_for(branch_ids))
         
         # Get recent loans with all related data
         context['recent_loans'] = Loan.objects.filter(
             branch_filter
-        ).select_related(
-            'customer'
-        ).prefetch_related(
+        ).with_customer().prefetch_related(
             'loanitem_set',
             'loanitem_set__item'
         ).order_by('-created_at')[:5]
         
-        # Get recent customers instead of recent sales
-        context['recent_customers'] = Customer.objects.order_by('-created_at')[:5]
+        # Recent customers of the visible branches, like the customer counters
+        context['recent_customers'] = Customer.objects.filter(branch_filter).order_by('-created_at')[:5]
         
         # Branch information
-        context['branches'] = branches
-        context['branch_count'] = branches.count()
-        
-        # Customer statistics
-        context['customer_count'] = Customer.objects.filter().count()
-        context['new_customers_today'] = Customer.objects.filter(created_at__date=today).count()
+        context['branches'] = list(branches)
+        context['branch_count'] = len(context['branches'])
         
         return context
 
@@ -133,8 +110,8 @@ class UserCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
                 import base64
                 import io
                 from django.core.files.base import ContentFile
-                from PIL import Image
-                import numpy as np
+                from biometrics import face_index
+                from biometrics.models import FaceEnrollment
                 
                 # Extract the base64 encoded image data (remove the data:image/jpeg;base64, prefix)
                 image_data = face_image_data.split(',')[1]
@@ -143,11 +120,6 @@ class UserCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
                 # Create a file-like object
                 image_file = ContentFile(image_binary)
                 
-                # In a production system, you would:
-                # 1. Process the image to extract facial features/encoding
-                # 2. Save the encoding as binary data
-                # For simplicity, we'll just save the image and use a placeholder for encoding
-                
                 # Create face enrollment
                 face_enrollment = FaceEnrollment(user=user)
                 
@@ -155,10 +127,11 @@ class UserCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
                 image_name = f"face_{user.username}.jpg"
                 face_enrollment.face_image.save(image_name, image_file, save=False)
                 
-                # In a real implementation, you would compute the face encoding here
-                # For now, we'll use a placeholder
-                placeholder_encoding = b"placeholder_face_encoding"  # Replace with actual encoding in production
-                face_enrollment.face_encoding = placeholder_encoding
+                # Without face_recognition the image is kept but the face is not indexed
+                try:
+                    face_enrollment.face_encoding = face_index.encode_encoding(face_index.encoding_from_image(image_binary))
+                except face_index.FaceIndexError:
+                    face_enrollment.face_encoding = b""
                 
                 face_enrollment.save()
                 
@@ -303,68 +276,17 @@ class FaceLoginView(View):
         return render(request, 'accounts/face_login.html')
     
     def post(self, request):
-        
-        # Extract the face image data from the POST request
-        face_image = request.POST.get('face_image')
-        
-        if face_image:
-            # In a real implementation, you would:
-            # 1. Process the image data
-            # 2. Compare it against enrolled face data
-            # 3. Authenticate the user if match found
-            
-            # For this demo, we'll simulate a successful authentication
-            # In production, replace this with actual face recognition logic
-            
-            # Log the authentication attempt
-            auth_log = FaceAuthLog(
-                timestamp=datetime.datetime.now(),
-                ip_address=request.META.get('REMOTE_ADDR'),
-                device_info=request.META.get('HTTP_USER_AGENT'),
-                success=True,
-                confidence=0.85  # This would be the actual confidence score from your FR system
-            )
-            
-            # For demo purposes, authenticate as the first admin user
-            # In production, this would be the user matched by facial recognition
-            try:
-                from django.contrib.auth import get_user_model
-                User = get_user_model()
-                user = User.objects.filter(is_staff=True).first()
-                
-                if user:
-                    # Log which user was authenticated
-                    auth_log.user = user
-                    auth_log.save()
-                    
-                    # Log in the user
-                    login(request, user)
-                    
-                    return JsonResponse({
-                        'status': 'success',
-                        'message': 'Authentication successful',
-                        'redirect': '/dashboard/'
-                    })
-                else:
-                    auth_log.success = False
-                    auth_log.save()
-                    return JsonResponse({
-                        'status': 'error', 
-                        'message': 'No matching user found'
-                    })
-            except Exception as e:
-                return JsonResponse({
-                    'status': 'error',
-                    'message': str(e)
-                })
-        
-        return JsonResponse({
-            'status': 'error',
-            'message': 'No image data received'
-        })
+        # Matches the posted face against the staff face index (see biometrics.face_index)
+        from biometrics.views import face_login
+        return face_login(request)
 
 
 # Customer views
+def sees_all_customers(user):
+    """Sales associates look customers up across branches; everyone else sees their branches' customers"""
+    return policy_for(user).role_name.lower() == 'sales associate'
+
+
 class CustomerListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     model = Customer
     template_name = 'accounts/customer_list.html'
@@ -373,7 +295,7 @@ class CustomerListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     
     def has_permission(self):
         # Allow Sales Associates to always view customer list
-        if hasattr(self.request.user, 'role') and self.request.user.role and self.request.user.role.name.lower() == 'sales associate':
+        if sees_all_customers(self.request.user):
             return True
         # For others, use the standard permission check
         return super().has_permission()
@@ -382,33 +304,31 @@ class CustomerListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
         queryset = super().get_queryset()
         user = self.request.user
         
-        # Filter customers by branch for branch managers
-        # Allow regional managers and superusers to see all customers
-        if not user.is_superuser and user.branch and not user.role.name.lower() in ['regional manager', 'sales associate']:
-            queryset = queryset.filter(branch=user.branch)
+        # Customers of the branches the user may see; sales associates look customers up everywhere
+        if not sees_all_customers(user):
+            queryset = restrict_to_branches(queryset, user)
             
         search_term = self.request.GET.get('search', '')
         
         if search_term:
-            queryset = queryset.filter(
-                Q(first_name__icontains=search_term) |
-                Q(last_name__icontains=search_term) |
-                Q(email__icontains=search_term) |
-                Q(phone__icontains=search_term)
-            )
+            queryset = search_index.filter_queryset(queryset, search_index.CUSTOMER, search_term)
         
-        return queryset
+        # Loan thumbnails only need photo references, not the photo columns
+        return queryset.prefetch_related(
+            Prefetch('loans', queryset=Loan.objects.with_photo_refs())
+        )
 
 
 class CustomerDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
     model = Customer
+    queryset = Customer.objects.with_photos()
     template_name = 'accounts/customer_detail.html'
     context_object_name = 'customer'
     permission_required = 'accounts.view_customer'
     
     def has_permission(self):
         # Allow Sales Associates to always view customers
-        if hasattr(self.request.user, 'role') and self.request.user.role and self.request.user.role.name.lower() == 'sales associate':
+        if sees_all_customers(self.request.user):
             return True
         # For others, use the standard permission check
         return super().has_permission()
@@ -418,11 +338,8 @@ class CustomerDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView
         obj = super().get_object(queryset=queryset)
         user = self.request.user
         
-        # Branch managers can only access customers from their branch
-        # Allow Sales Associates, regional managers and superusers to see all customer details
-        if not user.is_superuser and user.branch and not user.role.name.lower() in ['regional manager', 'sales associate']:
-            if obj.branch != user.branch:
-                raise Http404("You don't have permission to view this customer.")
+        if not sees_all_customers(user) and not can_access_branch(user, obj.branch_id):
+            raise Http404("You don't have permission to view this customer.")
         
         return obj
     
@@ -436,10 +353,10 @@ class CustomerDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView
         
         # Get all loans related to the customer
         if hasattr(customer, 'loans'):
-            context['loans'] = customer.loans.all().order_by('-created_at')
+            context['loans'] = customer.loans.with_photos().order_by('-created_at')
             
             # Get active loans with prefetched data for efficiency
-            active_loans = customer.loans.filter(status='active').order_by('-due_date')
+            active_loans = customer.loans.with_photos().filter(status='active').order_by('-due_date')
             
             # Process each active loan to ensure it has the required item photos
             for loan in active_loans:
@@ -588,7 +505,14 @@ class CustomerCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView
                 messages.error(self.request, f"Error processing profile photo: {str(e)}")
         
         messages.success(self.request, f'Customer {form.instance.first_name} {form.instance.last_name} was created successfully.')
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        
+        # Face encoding runs in the background (run_face_encoder); the photo is already in the media store
+        if self.object.profile_photo:
+            from biometrics import encoding_jobs
+            from biometrics.models import FaceEncodingJob
+            encoding_jobs.enqueue(self.object, self.object.profile_photo, FaceEncodingJob.PROFILE_PHOTO)
+        return response
     
     def form_invalid(self, form):
         # Add more helpful error messages
@@ -612,10 +536,8 @@ class CustomerUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView
         obj = super().get_object(queryset=queryset)
         user = self.request.user
         
-        # Branch managers can only access customers from their branch
-        if not user.is_superuser and user.branch and not user.role.name.lower() == 'regional manager':
-            if obj.branch != user.branch:
-                raise Http404("You don't have permission to edit this customer.")
+        if not can_access_branch(user, obj.branch_id):
+            raise Http404("You don't have permission to edit this customer.")
         
         return obj
     
@@ -730,11 +652,8 @@ class CustomerDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView
         obj = super().get_object(queryset=queryset)
         user = self.request.user
         
-        # Branch managers can only access customers from their branch
-        # Allow regional managers and superusers to see all customer details
-        if not user.is_superuser and user.branch and not user.role.name.lower() == 'regional manager':
-            if obj.branch != user.branch:
-                raise Http404("You don't have permission to delete this customer.")
+        if not can_access_branch(user, obj.branch_id):
+            raise Http404("You don't have permission to delete this customer.")
         
         return obj
     
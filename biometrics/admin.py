@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import FaceEnrollment, CustomerFaceEnrollment, FaceAuthLog, BiometricSetting
+from .models import FaceEnrollment, CustomerFaceEnrollment, FaceAuthLog, BiometricSetting, FaceEncodingJob
 
 
 @admin.register(FaceEnrollment)
@@ -45,3 +45,11 @@ class BiometricSettingAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         obj.updated_by = request.user
         super().save_model(request, obj, form, change)
+
+
+@admin.register(FaceEncodingJob)
+class FaceEncodingJobAdmin(admin.ModelAdmin):
+    list_display = ('customer', 'source', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'source')
+    search_fields = ('customer__first_name', 'customer__last_name')
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'worker', 'lease_expires_at')
@@ -0,0 +1,247 @@
+"""
+Background face-encoding pipeline.
+
+Computing a face encoding takes hundreds of milliseconds of CPU, too long
+to do inside a request. Views call ``enqueue``, which moves the captured
+image into the media store and adds a pending ``FaceEncodingJob`` row. The
+database table is the queue, so jobs survive restarts.
+
+``run_face_encoder`` (an ``Encoder``) loops as follows:
+
+1. Requeue running jobs whose lease expired because their worker died.
+   Retries stop after MAX_ATTEMPTS.
+2. Claim a batch of pending jobs with a conditional UPDATE. Several
+   encoders never take the same job.
+3. Send the image bytes to a process pool. face_recognition runs with
+   ``FACE_RECOGNITION_MODEL`` (hog by default, CPU only).
+4. Write each encoding to ``CustomerFaceEnrollment``. Saving it updates the
+   face index.
+
+The UI polls ``customer_face_status`` for the customer's latest job.
+
+``render.yaml`` runs the encoder as its own worker, built with
+requirements-intensive.txt. It must share MEDIA_ROOT and FACE_INDEX_DIR with
+the web service, since index files are local to the host that writes them.
+"""
+import base64
+import binascii
+import datetime
+import io
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from pawnshop_management import media_store
+from . import face_index
+from .models import CustomerFaceEnrollment, FaceEncodingJob
+
+# Jobs claimed per pool worker per round
+BATCH_PER_WORKER = 4
+
+# Seconds a claimed job may run before another encoder retries it
+LEASE_SECONDS = 300
+
+MAX_ATTEMPTS = 3
+
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(customer, image, source=FaceEncodingJob.CAPTURE):
+    """Queue an image (data URL or media store URL) for encoding; returns the job or None"""
+    image = media_store.externalize(image)
+    if not media_store.is_blob_url(image):
+        return None
+    # The same image already waiting for this customer is not queued twice
+    pending = (FaceEncodingJob.objects
+               .filter(customer=customer, image=image, status__in=[FaceEncodingJob.PENDING, FaceEncodingJob.RUNNING])
+               .first())
+    return pending or FaceEncodingJob.objects.create(customer=customer, image=image, source=source)
+
+
+def latest_job(customer_id):
+    return FaceEncodingJob.objects.filter(customer_id=customer_id).order_by('-pk').first()
+
+
+def requeue_expired(now=None):
+    """Put jobs of dead encoders back in the queue; returns (requeued, failed)"""
+    now = now or timezone.now()
+    expired = FaceEncodingJob.objects.filter(status=FaceEncodingJob.RUNNING, lease_expires_at__lt=now)
+    failed = expired.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=FaceEncodingJob.FAILED, error='Encoder stopped responding', finished_at=now, lease_expires_at=None
+    )
+    requeued = expired.update(status=FaceEncodingJob.PENDING, worker='', lease_expires_at=None)
+    return requeued, failed
+
+
+def claim(owner, limit, now=None):
+    """Take up to limit pending jobs for owner, oldest first"""
+    now = now or timezone.now()
+    pks = list(FaceEncodingJob.objects.filter(status=FaceEncodingJob.PENDING)
+               .order_by('pk').values_list('pk', flat=True)[:limit])
+    if not pks:
+        return []
+    # Only rows still pending are taken, so a job claimed by another encoder in between is skipped
+    FaceEncodingJob.objects.filter(pk__in=pks, status=FaceEncodingJob.PENDING).update(
+        status=FaceEncodingJob.RUNNING,
+        worker=owner,
+        attempts=F('attempts') + 1,
+        started_at=now,
+        lease_expires_at=now + datetime.timedelta(seconds=LEASE_SECONDS),
+    )
+    return list(FaceEncodingJob.objects.filter(pk__in=pks, status=FaceEncodingJob.RUNNING, worker=owner)
+                .order_by('pk'))
+
+
+def read_image(image):
+    """Bytes of a media store URL or data URL, or None"""
+    if media_store.is_blob_url(image):
+        return media_store.read_blob(image)
+    if media_store.is_data_url(image):
+        try:
+            return base64.b64decode(image.split(',', 1)[1])
+        except (binascii.Error, ValueError, IndexError):
+            return None
+    return None
+
+
+def _init_worker():
+    # Importing this module loads the models; encode_image itself never touches the database
+    import django
+    django.setup()
+
+
+def encode_image(image_bytes, model='hog'):
+    """Face encoding of the largest face in an image, or None; runs in a pool process"""
+    import face_recognition
+    import numpy as np
+
+    image = face_recognition.load_image_file(io.BytesIO(image_bytes))
+    locations = face_recognition.face_locations(image, model=model)
+    if not locations:
+        return None
+    # Several faces (someone behind the counter): use the largest
+    largest = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+    encodings = face_recognition.face_encodings(image, known_face_locations=[largest])
+    return np.asarray(encodings[0], dtype=np.float64).tobytes() if encodings else None
+
+
+def _finish(job, status, error='', now=None):
+    FaceEncodingJob.objects.filter(pk=job.pk, worker=job.worker).update(
+        status=status, error=error, finished_at=now or timezone.now(), lease_expires_at=None
+    )
+
+
+def complete(job, encoding):
+    """Record an encoding result: enroll the face, or mark the job no_face"""
+    if encoding is None:
+        _finish(job, FaceEncodingJob.NO_FACE)
+        return
+    with transaction.atomic():
+        # Saving the enrollment updates the face index (see biometrics.models)
+        CustomerFaceEnrollment.objects.update_or_create(
+            customer_id=job.customer_id,
+            defaults={'face_encoding': encoding, 'is_active': True},
+        )
+        _finish(job, FaceEncodingJob.DONE)
+
+
+def fail(job, error):
+    """Retry a job later, or give up after MAX_ATTEMPTS"""
+    if job.attempts >= MAX_ATTEMPTS:
+        _finish(job, FaceEncodingJob.FAILED, error)
+    else:
+        FaceEncodingJob.objects.filter(pk=job.pk, worker=job.worker).update(
+            status=FaceEncodingJob.PENDING, error=error, worker='', lease_expires_at=None
+        )
+
+
+class Encoder:
+    """Claim queued jobs and encode them on a process pool"""
+
+    def __init__(self, workers=None, model=None, owner=None):
+        if not face_index.available() or not _has_face_recognition():
+            raise face_index.FaceIndexError(
+                "The face encoder requires face_recognition and numpy. "
+                "Install them with: pip install -r requirements-intensive.txt"
+            )
+        self.workers = workers or getattr(settings, 'FACE_ENCODER_WORKERS', 2)
+        self.model = model or getattr(settings, 'FACE_RECOGNITION_MODEL', 'hog')
+        self.owner = owner or default_owner()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+    def run_once(self):
+        """Encode one batch; returns the number of jobs processed"""
+        requeued, failed = requeue_expired()
+        if requeued or failed:
+            print(f"Requeued {requeued} and failed {failed} face encoding job(s) with expired leases")
+
+        jobs = claim(self.owner, self.workers * BATCH_PER_WORKER)
+        futures = {}
+        for job in jobs:
+            image_bytes = read_image(job.image)
+            if image_bytes is None:
+                _finish(job, FaceEncodingJob.FAILED, 'Image not found in the media store')
+                continue
+            futures[self.pool.submit(encode_image, image_bytes, self.model)] = job
+
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                complete(job, future.result())
+            except Exception as e:
+                print(f"Face encoding job {job.pk} failed: {e}")
+                fail(job, str(e))
+        return len(jobs)
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+        # Jobs this encoder still holds go straight back to the queue
+        (FaceEncodingJob.objects
+         .filter(status=FaceEncodingJob.RUNNING, worker=self.owner)
+         .update(status=FaceEncodingJob.PENDING, worker='', lease_expires_at=None))
+
+
+def _has_face_recognition():
+    try:
+        import face_recognition  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def backfill_candidates(source, force=False):
+    """
+    (customer_id, image) pairs for existing photos: customer profile photos,
+    or each customer's most recent loan capture. Customers that already have
+    an active enrollment or a queued job are skipped unless force is set.
+    """
+    from accounts.models import Customer
+    from transactions.models import Loan
+
+    skip = set()
+    if not force:
+        skip.update(CustomerFaceEnrollment.objects.filter(is_active=True).values_list('customer_id', flat=True))
+        skip.update(FaceEncodingJob.objects
+                    .filter(status__in=[FaceEncodingJob.PENDING, FaceEncodingJob.RUNNING])
+                    .values_list('customer_id', flat=True))
+
+    if source == FaceEncodingJob.PROFILE_PHOTO:
+        rows = (Customer.objects.exclude(Q(profile_photo__isnull=True) | Q(profile_photo=''))
+                .order_by('pk').values_list('pk', 'profile_photo'))
+    else:
+        rows = (Loan.objects.exclude(Q(customer_face_capture__isnull=True) | Q(customer_face_capture=''))
+                .order_by('customer_id', '-pk').values_list('customer_id', 'customer_face_capture'))
+
+    last_customer = None
+    for customer_id, image in rows.iterator(chunk_size=2000):
+        if customer_id == last_customer or customer_id in skip:
+            continue
+        last_customer = customer_id
+        yield customer_id, image
@@ -0,0 +1,414 @@
+"""
+Face-embedding index for 1:N identification.
+
+Face encodings are 128-number vectors from face_recognition. The
+``face_encoding`` fields store them as raw float64 bytes. Each kind
+(customers, staff) has one index per branch, kept in two append-only files
+under ``FACE_INDEX_DIR``:
+
+- ``<kind>-<branch>.vectors``: a contiguous float32 matrix with one row per
+  face. It is memory-mapped read-only, so worker processes share the page
+  cache instead of each loading a copy.
+- ``<kind>-<branch>.ids``: the customer or user id of each row, as int64.
+
+Enrollment changes append a row, and the newest row for an id wins. A NaN
+row removes the id. ``search`` gets the squared Euclidean distance to every
+row with one matrix-vector product, masks superseded rows and takes the top
+k with ``argpartition``, so 500k faces is one pass over 256 MB. Confidence
+is ``1 - distance``, checked against ``BiometricSetting.min_confidence``.
+face_recognition itself treats a distance of 0.6 as a match.
+
+Other processes notice appends by file size and rebuilds
+(``manage.py build_face_index``) by inode, so nothing needs a restart.
+
+Requires numpy (requirements-intensive.txt). face_recognition is only needed
+to compute encodings from images. Signed-in staff may send the encoding
+instead when enrolling or identifying; face login only takes an image, since
+anyone holding a stored encoding could otherwise log in with it.
+"""
+import base64
+import io
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is an optional dependency
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: no cross-process locking
+    fcntl = None
+
+try:
+    import face_recognition
+except ImportError:  # pragma: no cover - face_recognition is an optional dependency
+    face_recognition = None
+
+DIMENSIONS = 128
+
+CUSTOMERS = 'customers'
+STAFF = 'staff'
+KINDS = (CUSTOMERS, STAFF)
+
+# Index key for people without a branch
+NO_BRANCH = 'none'
+
+DEFAULT_MIN_CONFIDENCE = 0.6
+
+
+class FaceIndexError(Exception):
+    """Missing dependency or unusable face data"""
+
+
+def available():
+    return np is not None
+
+
+def _require_numpy():
+    if np is None:
+        raise FaceIndexError(
+            "The face index requires numpy. "
+            "Install it with: pip install -r requirements-intensive.txt"
+        )
+
+
+# Encodings
+
+def decode_encoding(data):
+    """A stored face_encoding as a float32 vector, or None if it is not one"""
+    _require_numpy()
+    if not data:
+        return None
+    data = bytes(data)
+    if len(data) == DIMENSIONS * 8:
+        vector = np.frombuffer(data, dtype='<f8')
+    elif len(data) == DIMENSIONS * 4:
+        vector = np.frombuffer(data, dtype='<f4')
+    else:
+        # Placeholders and other legacy values
+        return None
+    vector = vector.astype(np.float32)
+    return vector if np.isfinite(vector).all() else None
+
+
+def encode_encoding(vector):
+    """Bytes for a face_encoding field (float64, as face_recognition returns)"""
+    _require_numpy()
+    return np.asarray(vector, dtype='<f8').reshape(DIMENSIONS).tobytes()
+
+
+def encoding_from_image(image_bytes):
+    if face_recognition is None:
+        raise FaceIndexError(
+            "Computing encodings from images requires face_recognition. "
+            "Install it with: pip install -r requirements-intensive.txt"
+        )
+    image = face_recognition.load_image_file(io.BytesIO(image_bytes))
+    encodings = face_recognition.face_encodings(image)
+    if not encodings:
+        raise FaceIndexError("No face found in the image")
+    return np.asarray(encodings[0], dtype=np.float32)
+
+
+def encoding_from_request(data, accept_encoding=True):
+    """
+    Encoding from POST data: 'encoding' (JSON list of 128 numbers) or
+    'face_image' (data URL). With accept_encoding=False only an image is
+    accepted and the encoding is always computed here.
+    """
+    _require_numpy()
+    if not accept_encoding:
+        if data.get('encoding'):
+            raise FaceIndexError("Send 'face_image'; encodings are not accepted here")
+    elif raw := data.get('encoding'):
+        try:
+            vector = np.asarray(json.loads(raw), dtype=np.float32)
+        except (TypeError, ValueError):
+            raise FaceIndexError("'encoding' must be a JSON list of numbers")
+        if vector.shape != (DIMENSIONS,) or not np.isfinite(vector).all():
+            raise FaceIndexError(f"'encoding' must have {DIMENSIONS} finite numbers")
+        return vector
+    if image := data.get('face_image'):
+        try:
+            image_bytes = base64.b64decode(image.split(',', 1)[-1])
+        except ValueError:
+            raise FaceIndexError("'face_image' is not valid base64")
+        return encoding_from_image(image_bytes)
+    raise FaceIndexError("No face data received")
+
+
+def confidence(vector, other):
+    """Confidence that two encodings are the same face (1 - Euclidean distance)"""
+    distance = float(np.linalg.norm(np.asarray(vector, dtype=np.float32) - np.asarray(other, dtype=np.float32)))
+    return max(0.0, 1.0 - distance)
+
+
+# Index
+
+def index_dir():
+    return Path(getattr(settings, 'FACE_INDEX_DIR', Path(settings.BASE_DIR) / 'face_index'))
+
+
+def branch_key(branch_id):
+    return NO_BRANCH if branch_id is None else str(branch_id)
+
+
+class FaceIndex:
+    """One kind's faces for one branch, shared by every process through the files"""
+
+    def __init__(self, kind, key, directory=None):
+        _require_numpy()
+        self.kind = kind
+        self.key = str(key)
+        base = Path(directory or index_dir()) / f"{kind}-{self.key}"
+        self.vectors_path = base.with_name(base.name + '.vectors')
+        self.ids_path = base.with_name(base.name + '.ids')
+        self.lock_path = base.with_name(base.name + '.lock')
+        self._refresh_lock = threading.Lock()
+        self._inode = None
+        # (matrix, ids, norms, live) replaced as a whole so searches never see a half update
+        self._state = self._empty_state()
+
+    @staticmethod
+    def _empty_state():
+        return (np.empty((0, DIMENSIONS), dtype=np.float32), np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.float32), np.empty(0, dtype=bool))
+
+    def __len__(self):
+        self.refresh()
+        return int(self._state[3].sum())
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _current(self):
+        try:
+            return os.stat(self.ids_path)
+        except FileNotFoundError:
+            return None
+
+    def refresh(self):
+        """Pick up rows appended, or a rebuild done, by any process"""
+        stat = self._current()
+        if stat is None:
+            self._inode, self._state = None, self._empty_state()
+            return
+        if stat.st_ino == self._inode and stat.st_size == len(self._state[1]) * 8:
+            return
+        with self._refresh_lock, self._file_lock(exclusive=False):
+            stat = self._current()
+            if stat is None:
+                self._inode, self._state = None, self._empty_state()
+            else:
+                self._load(stat)
+
+    def _load(self, stat):
+        matrix, ids, norms, live = self._state if stat.st_ino == self._inode else self._empty_state()
+        rows = min(stat.st_size // 8, os.path.getsize(self.vectors_path) // (DIMENSIONS * 4))
+        start = len(ids)
+        if rows > start:
+            with open(self.ids_path, 'rb') as f:
+                f.seek(start * 8)
+                new_ids = np.fromfile(f, dtype='<i8', count=rows - start).astype(np.int64)
+            matrix = np.memmap(self.vectors_path, dtype='<f4', mode='r', shape=(rows, DIMENSIONS))
+            new_rows = np.asarray(matrix[start:rows])
+            new_norms = np.einsum('ij,ij->i', new_rows, new_rows)
+            # NaN rows are removals
+            new_live = ~np.isnan(new_norms)
+            # Within the new rows only the last one for each id counts...
+            _, last = np.unique(new_ids[::-1], return_index=True)
+            newest = np.zeros(len(new_ids), dtype=bool)
+            newest[len(new_ids) - 1 - last] = True
+            new_live &= newest
+            # ...and it supersedes any older row for that id
+            live = live & ~np.isin(ids, new_ids)
+            ids = np.concatenate([ids, new_ids])
+            norms = np.concatenate([norms, new_norms])
+            live = np.concatenate([live, new_live])
+        self._inode = stat.st_ino
+        self._state = (matrix, ids, norms, live)
+
+    def search(self, vector, k=5, min_confidence=None):
+        """Up to k (id, confidence) pairs, best first, none below min_confidence"""
+        self.refresh()
+        matrix, ids, norms, live = self._state
+        if not len(ids) or k < 1:
+            return []
+        query = np.asarray(vector, dtype=np.float32).reshape(DIMENSIONS)
+        distances = norms - 2 * (matrix @ query) + query @ query
+        distances[~live] = np.inf
+        k = min(k, len(distances))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        matches = []
+        for row in nearest:
+            if not np.isfinite(distances[row]):
+                break
+            score = max(0.0, 1.0 - float(np.sqrt(max(distances[row], 0.0))))
+            if min_confidence is not None and score < min_confidence:
+                break
+            matches.append((int(ids[row]), score))
+        return matches
+
+    def add(self, person_id, vector):
+        self._append([person_id], np.asarray(vector, dtype=np.float32).reshape(1, DIMENSIONS))
+
+    def remove(self, person_id):
+        self._append([person_id], np.full((1, DIMENSIONS), np.nan, dtype=np.float32))
+
+    def _append(self, person_ids, vectors):
+        with self._file_lock(exclusive=True):
+            # Drop a partial row left by a writer that died between the two files
+            rows = os.path.getsize(self.ids_path) // 8 if self.ids_path.exists() else 0
+            for path, width in ((self.ids_path, 8), (self.vectors_path, DIMENSIONS * 4)):
+                if path.exists() and os.path.getsize(path) != rows * width:
+                    os.truncate(path, rows * width)
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.astype('<f4').tobytes())
+            with open(self.ids_path, 'ab') as f:
+                f.write(np.asarray(person_ids, dtype='<i8').tobytes())
+
+    def replace(self, vectors_tmp, ids_tmp):
+        """Swap in files written by rebuild(); readers reload on their next search"""
+        with self._file_lock(exclusive=True):
+            os.replace(vectors_tmp, self.vectors_path)
+            os.replace(ids_tmp, self.ids_path)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(kind, branch_id):
+    """This process's FaceIndex for kind and branch (an id, NO_BRANCH or None)"""
+    key = (kind, branch_key(branch_id))
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = FaceIndex(*key)
+        return _indexes[key]
+
+
+def branch_keys(kind):
+    """Branch keys that have an index of this kind on disk"""
+    prefix = f"{kind}-"
+    return sorted(path.name[len(prefix):-len('.ids')] for path in index_dir().glob(f"{prefix}*.ids"))
+
+
+# Identification
+
+def min_confidences(keys):
+    """BiometricSetting.min_confidence for each branch key (the default for branches without one)"""
+    from .models import BiometricSetting
+
+    branch_ids = [int(key) for key in keys if key != NO_BRANCH]
+    thresholds = {}
+    for branch_id, value in (BiometricSetting.objects.filter(branch_id__in=branch_ids)
+                             .order_by('-pk').values_list('branch_id', 'min_confidence')):
+        thresholds[str(branch_id)] = value
+    return {key: thresholds.get(key, DEFAULT_MIN_CONFIDENCE) for key in keys}
+
+
+def min_confidence(branch_id):
+    key = branch_key(branch_id)
+    return min_confidences([key])[key]
+
+
+def identify(kind, vector, branch_ids=None, k=5):
+    """
+    Best matches for an encoding across branch indexes (every branch when
+    branch_ids is None), each branch's min_confidence applied.
+    Returns [(person_id, branch key, confidence)], best first.
+    """
+    keys = branch_keys(kind) if branch_ids is None else [branch_key(branch_id) for branch_id in branch_ids]
+    thresholds = min_confidences(keys)
+    matches = []
+    for key in keys:
+        for person_id, score in get_index(kind, key).search(vector, k, thresholds[key]):
+            matches.append((person_id, key, score))
+    matches.sort(key=lambda match: -match[2])
+    return matches[:k]
+
+
+# Keeping indexes in step with enrollments
+
+def _enrollment_rows(kind):
+    """(person id, branch id, encoding) of every active enrollment of a kind"""
+    from .models import CustomerFaceEnrollment, FaceEnrollment
+
+    if kind == CUSTOMERS:
+        queryset = CustomerFaceEnrollment.objects.values_list('customer_id', 'customer__branch_id', 'face_encoding')
+    else:
+        queryset = FaceEnrollment.objects.values_list('user_id', 'user__branch_id', 'face_encoding')
+    return queryset.filter(is_active=True).order_by('pk').iterator(chunk_size=2000)
+
+
+def index_enrollment(kind, person_id, branch_id, encoding, active=True):
+    """Add, update or (when inactive or unusable) remove one person's face"""
+    index = get_index(kind, branch_id)
+    vector = decode_encoding(encoding) if active else None
+    if vector is None:
+        index.remove(person_id)
+    else:
+        index.add(person_id, vector)
+
+
+def rebuild(kind, branch_ids=None):
+    """
+    Rewrite indexes from the enrollment tables, dropping superseded rows.
+    Returns {branch key: faces indexed}. Enrollment changes saved while it
+    runs may be missed; run it when enrollment is quiet.
+    """
+    directory = index_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    wanted = None if branch_ids is None else {branch_key(branch_id) for branch_id in branch_ids}
+    files = {}
+    counts = {}
+    try:
+        for person_id, branch_id, encoding in _enrollment_rows(kind):
+            key = branch_key(branch_id)
+            if wanted is not None and key not in wanted:
+                continue
+            vector = decode_encoding(encoding)
+            if vector is None:
+                continue
+            if key not in files:
+                base = directory / f".{kind}-{key}.{os.getpid()}"
+                files[key] = (open(f"{base}.vectors", 'wb'), open(f"{base}.ids", 'wb'))
+                counts[key] = 0
+            vectors_file, ids_file = files[key]
+            vectors_file.write(vector.astype('<f4').tobytes())
+            ids_file.write(np.int64(person_id).astype('<i8').tobytes())
+            counts[key] += 1
+    finally:
+        for vectors_file, ids_file in files.values():
+            vectors_file.close()
+            ids_file.close()
+
+    # Branches that no longer have any faces get empty indexes
+    for key in set(branch_keys(kind)) - set(counts):
+        if wanted is None or key in wanted:
+            base = directory / f".{kind}-{key}.{os.getpid()}"
+            open(f"{base}.vectors", 'wb').close()
+            open(f"{base}.ids", 'wb').close()
+            counts[key] = 0
+
+    for key in counts:
+        base = directory / f".{kind}-{key}.{os.getpid()}"
+        get_index(kind, key).replace(f"{base}.vectors", f"{base}.ids")
+    return counts
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from pawnshop_management import media_store
+from biometrics import encoding_jobs
+from biometrics.models import FaceEncodingJob
+
+
+class Command(BaseCommand):
+    help = 'Queue face encoding jobs for existing customer profile photos and loan captures'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            choices=['all', FaceEncodingJob.PROFILE_PHOTO, FaceEncodingJob.LOAN_CAPTURE],
+            default='all',
+            help='Photos to queue; with all, profile photos win over loan captures (default: all)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Also queue customers that are already enrolled or queued'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Jobs created per INSERT (default: 1000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the jobs without creating them'
+        )
+
+    def handle(self, *args, **options):
+        sources = ([FaceEncodingJob.PROFILE_PHOTO, FaceEncodingJob.LOAN_CAPTURE]
+                   if options['source'] == 'all' else [options['source']])
+        queued_customers = set()
+        total = 0
+        for source in sources:
+            batch = []
+            count = 0
+            for customer_id, image in encoding_jobs.backfill_candidates(source, options['force']):
+                if customer_id in queued_customers:
+                    continue
+                queued_customers.add(customer_id)
+                if not options['dry_run']:
+                    # Legacy rows may still hold base64 payloads; jobs only keep media store URLs
+                    image = media_store.externalize(image)
+                    if not media_store.is_blob_url(image):
+                        continue
+                    batch.append(FaceEncodingJob(customer_id=customer_id, image=image, source=source))
+                    if len(batch) >= options['batch_size']:
+                        FaceEncodingJob.objects.bulk_create(batch)
+                        batch = []
+                count += 1
+            if batch:
+                FaceEncodingJob.objects.bulk_create(batch)
+            total += count
+            self.stdout.write(f"{source}: {'would queue' if options['dry_run'] else 'queued'} {count} job(s)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would queue' if options['dry_run'] else 'Queued'} {total} face encoding job(s); "
+            "run 'manage.py run_face_encoder' to process them"
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from biometrics import face_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the face-embedding indexes from the enrollment tables (also compacts them)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            choices=face_index.KINDS,
+            help='Only rebuild customer or staff indexes (default: both)'
+        )
+        parser.add_argument(
+            '--branch',
+            action='append',
+            type=int,
+            help='Only rebuild the index of this branch ID (repeatable)'
+        )
+
+    def handle(self, *args, **options):
+        if not face_index.available():
+            raise CommandError("The face index requires numpy. Install it with: pip install -r requirements-intensive.txt")
+
+        kinds = [options['kind']] if options['kind'] else face_index.KINDS
+        for kind in kinds:
+            counts = face_index.rebuild(kind, options['branch'])
+            for key, count in sorted(counts.items()):
+                self.stdout.write(f"{kind} index for branch {key}: {count} face(s)")
+            self.stdout.write(self.style.SUCCESS(
+                f"Rebuilt {len(counts)} {kind} index(es) in {face_index.index_dir()}"
+            ))
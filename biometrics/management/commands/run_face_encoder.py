@@ -0,0 +1,72 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from biometrics import encoding_jobs, face_index
+
+
+class Command(BaseCommand):
+    help = 'Compute face encodings for queued customer images (long-running)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'FACE_ENCODER_WORKERS', 2),
+            help='Encoding processes (default: FACE_ENCODER_WORKERS)'
+        )
+        parser.add_argument(
+            '--model',
+            choices=['hog', 'cnn'],
+            default=getattr(settings, 'FACE_RECOGNITION_MODEL', 'hog'),
+            help='Face detection model: hog (CPU) or cnn (needs a GPU build of dlib)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=5,
+            help='Seconds to wait when the queue is empty (default: 5)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Work through the queue once and exit'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            encoder = encoding_jobs.Encoder(workers=max(options['workers'], 1), model=options['model'])
+        except face_index.FaceIndexError as e:
+            raise CommandError(str(e))
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Stopping after the current batch...")
+            stop.set()
+
+        if not options['once']:
+            signal.signal(signal.SIGTERM, request_stop)
+            signal.signal(signal.SIGINT, request_stop)
+            self.stdout.write(f"Face encoder {encoder.owner} started: {encoder.workers} worker(s), model {encoder.model}")
+
+        total = 0
+        try:
+            while not stop.is_set():
+                try:
+                    processed = encoder.run_once()
+                except Exception as e:
+                    # A database hiccup should not kill the encoder; retry after the interval
+                    print(f"Face encoder round failed: {e}")
+                    connection.close()
+                    processed = 0
+                total += processed
+                if processed:
+                    continue
+                if options['once'] or stop.wait(max(options['interval'], 1)):
+                    break
+        finally:
+            encoder.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} face encoding job(s)"))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_alter_customer_profile_photo'),
+        ('biometrics', '0003_alter_biometricsetting_lockout_duration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceEncodingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('capture', 'Face capture'), ('profile_photo', 'Customer profile photo'), ('loan_capture', 'Loan customer photo')], default='capture', max_length=20)),
+                ('image', models.TextField(help_text='Media store URL of the image to encode')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('no_face', 'No face found'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='face_encoding_jobs', to='accounts.customer')),
+            ],
+            options={
+                'verbose_name': 'face encoding job',
+                'verbose_name_plural': 'face encoding jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'id'], name='biometrics_job_status_idx'), models.Index(fields=['customer', '-id'], name='biometrics_job_customer_idx')],
+            },
+        ),
+    ]
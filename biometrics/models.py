@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from accounts.models import Customer  # Import Customer from accounts app
 
 
@@ -77,3 +79,76 @@ class BiometricSetting(models.Model):
     class Meta:
         verbose_name = _('biometric setting')
         verbose_name_plural = _('biometric settings')
+
+
+
+class FaceEncodingJob(models.Model):
+    """Queued face encoding of a captured customer image (see biometrics.encoding_jobs)"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    NO_FACE = 'no_face'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, _('Pending')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (NO_FACE, _('No face found')),
+        (FAILED, _('Failed')),
+    ]
+
+    CAPTURE = 'capture'
+    PROFILE_PHOTO = 'profile_photo'
+    LOAN_CAPTURE = 'loan_capture'
+    SOURCE_CHOICES = [
+        (CAPTURE, _('Face capture')),
+        (PROFILE_PHOTO, _('Customer profile photo')),
+        (LOAN_CAPTURE, _('Loan customer photo')),
+    ]
+
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='face_encoding_jobs')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default=CAPTURE)
+    image = models.TextField(help_text=_('Media store URL of the image to encode'))
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    worker = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('face encoding job')
+        verbose_name_plural = _('face encoding jobs')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='biometrics_job_status_idx'),
+            models.Index(fields=['customer', '-id'], name='biometrics_job_customer_idx'),
+        ]
+
+    def __str__(self):
+        return f"Face encoding for {self.customer_id} ({self.status})"
+
+
+# Keep the face index (see biometrics.face_index) in step with enrollments
+
+@receiver([post_save, post_delete], sender=CustomerFaceEnrollment)
+def index_customer_face(sender, instance, **kwargs):
+    from . import face_index
+    if not face_index.available():
+        return
+    branch_id = Customer.objects.filter(pk=instance.customer_id).values_list('branch_id', flat=True).first()
+    active = instance.is_active and kwargs['signal'] is post_save
+    face_index.index_enrollment(face_index.CUSTOMERS, instance.customer_id, branch_id, instance.face_encoding, active)
+
+
+@receiver([post_save, post_delete], sender=FaceEnrollment)
+def index_staff_face(sender, instance, **kwargs):
+    from django.contrib.auth import get_user_model
+    from . import face_index
+    if not face_index.available():
+        return
+    branch_id = get_user_model().objects.filter(pk=instance.user_id).values_list('branch_id', flat=True).first()
+    active = instance.is_active and kwargs['signal'] is post_save
+    face_index.index_enrollment(face_index.STAFF, instance.user_id, branch_id, instance.face_encoding, active)
@@ -1,3 +1,142 @@
-from django.test import TestCase
+import base64
+import json
+import tempfile
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from biometrics import face_index
+from biometrics.models import FaceAuthLog, FaceEnrollment
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def vectors(n, seed=0):
+    """n random face encodings, far enough apart that none matches another"""
+    return np.random.default_rng(seed).normal(scale=0.1, size=(n, face_index.DIMENSIONS)).astype(np.float32)
+
+
+class IndexDirMixin:
+    """Points FACE_INDEX_DIR at a fresh directory and forgets this process's open indexes"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(FACE_INDEX_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        face_index._indexes.clear()
+        self.addCleanup(face_index._indexes.clear)
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class FaceIndexTests(IndexDirMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.index = face_index.FaceIndex(face_index.STAFF, 1, self.directory)
+        self.faces = vectors(4)
+
+    def near(self, vector):
+        return vector + np.float32(0.01)
+
+    def test_add_and_search(self):
+        for person_id, vector in enumerate(self.faces, 1):
+            self.index.add(person_id, vector)
+        self.assertEqual(len(self.index), 4)
+
+        matches = self.index.search(self.near(self.faces[2]), k=2)
+        self.assertEqual(matches[0][0], 3)
+        self.assertGreater(matches[0][1], 0.8)
+        # The other faces are too far away to clear the threshold
+        self.assertEqual(self.index.search(self.near(self.faces[2]), k=4, min_confidence=0.6), [matches[0]])
+
+    def test_newest_row_supersedes_older_ones(self):
+        self.index.add(1, self.faces[0])
+        self.index.add(2, self.faces[1])
+        self.index.add(1, self.faces[2])
+
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.search(self.near(self.faces[0]), min_confidence=0.6), [])
+        self.assertEqual(self.index.search(self.near(self.faces[2]), k=1)[0][0], 1)
+
+    def test_remove(self):
+        self.index.add(1, self.faces[0])
+        self.index.add(2, self.faces[1])
+        self.index.remove(1)
+
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual([person_id for person_id, _ in self.index.search(self.faces[0], k=5)], [2])
+
+    def test_other_processes_see_appends(self):
+        reader = face_index.FaceIndex(face_index.STAFF, 1, self.directory)
+        self.assertEqual(reader.search(self.faces[0]), [])
+        self.index.add(1, self.faces[0])
+        self.assertEqual(reader.search(self.faces[0], k=1)[0][0], 1)
+
+    def test_encoding_from_request(self):
+        data = {'encoding': json.dumps(self.faces[0].tolist())}
+        np.testing.assert_array_equal(face_index.encoding_from_request(data), self.faces[0])
+        with self.assertRaisesMessage(face_index.FaceIndexError, 'not accepted'):
+            face_index.encoding_from_request(data, accept_encoding=False)
+        with self.assertRaisesMessage(face_index.FaceIndexError, 'finite numbers'):
+            face_index.encoding_from_request({'encoding': json.dumps([0.5] * 3)})
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class FaceLoginTests(IndexDirMixin, TestCase):
+    """Staff face login matches an image against the staff index; it never trusts a client encoding"""
+
+    IMAGE = 'data:image/jpeg;base64,' + base64.b64encode(b'jpeg bytes').decode('ascii')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('teller', 'teller@example.com', 'password')
+
+    def setUp(self):
+        super().setUp()
+        self.faces = vectors(2)
+        FaceEnrollment.objects.create(user=self.user, face_encoding=face_index.encode_encoding(self.faces[0]))
+
+    def post(self, data, encoded=None):
+        # face_recognition is an optional dependency; the test supplies the encoder's result
+        with mock.patch.object(face_index, 'encoding_from_image', return_value=encoded) as encoder:
+            response = self.client.post(reverse('face_login'), data)
+        return response, encoder
+
+    def test_image_of_enrolled_face_logs_in(self):
+        response, encoder = self.post({'face_image': self.IMAGE}, encoded=self.faces[0] + np.float32(0.01))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'success')
+        encoder.assert_called_once_with(b'jpeg bytes')
+        self.assertEqual(self.client.session['_auth_user_id'], str(self.user.pk))
+        self.assertTrue(FaceAuthLog.objects.get(user=self.user).success)
+
+    def test_image_of_unknown_face_is_refused(self):
+        response, _ = self.post({'face_image': self.IMAGE}, encoded=self.faces[1])
+
+        self.assertEqual(response.json()['status'], 'error')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_posted_encoding_is_rejected(self):
+        response, encoder = self.post({'encoding': json.dumps(self.faces[0].tolist())})
+
+        self.assertEqual(response.status_code, 400)
+        encoder.assert_not_called()
+        self.assertNotIn('_auth_user_id', self.client.session)
+        self.assertFalse(FaceAuthLog.objects.exists())
+
+    @unittest.skipIf(face_index.face_recognition is not None, "face_recognition is installed")
+    def test_image_login_needs_face_recognition(self):
+        response = self.client.post(reverse('face_login'), {'face_image': self.IMAGE})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('face_recognition', response.json()['message'])
@@ -11,6 +11,7 @@ urlpatterns = [
     path('enroll/customer/<int:customer_id>/', views.CustomerFaceEnrollmentView.as_view(), name='customer_face_enroll'),
     path('enroll/customer/capture/<int:customer_id>/', views.CustomerFaceCaptureView.as_view(), name='customer_face_capture'),
     path('enroll/customer/verify/<int:customer_id>/', views.CustomerFaceVerificationView.as_view(), name='customer_face_verify'),
+    path('enroll/customer/status/<int:customer_id>/', views.CustomerFaceStatusView.as_view(), name='customer_face_status'),
     
     # Authentication
     path('auth/face-login/', views.FaceLoginView.as_view(), name='face_login'),
@@ -1,31 +1,104 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import View, TemplateView, ListView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
+from django.contrib.auth import login
+from django.urls import reverse
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Count, Avg
-from .models import BiometricSetting, FaceEnrollment, CustomerFaceEnrollment, FaceAuthLog
+from django.db.models import Count, Avg, Q
+from .models import BiometricSetting, FaceEnrollment, CustomerFaceEnrollment, FaceAuthLog, FaceEncodingJob
+from . import encoding_jobs, face_index
+from accounts.access import can_access_branch, visible_branch_ids
+from accounts.models import Customer
 from branches.models import Branch
+from pawnshop_management.stats import status_histogram
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-# Placeholder views for biometrics functionality
+def _face_error(message, status=400):
+    return JsonResponse({'status': 'error', 'message': message}, status=status)
+
+
+def _request_encoding(request, accept_encoding=True):
+    """(encoding, None) from the POST data, or (None, error response)"""
+    try:
+        return face_index.encoding_from_request(request.POST, accept_encoding), None
+    except face_index.FaceIndexError as e:
+        return None, _face_error(str(e))
+
+
+def _log_attempt(request, user, success, confidence=None, customer=None):
+    FaceAuthLog.objects.create(
+        user=user,
+        customer=customer,
+        success=success,
+        confidence=confidence,
+        ip_address=request.META.get('REMOTE_ADDR'),
+        device_info=request.META.get('HTTP_USER_AGENT', ''),
+    )
+
+
+def _customer_for(request, customer_id):
+    customer = get_object_or_404(Customer.objects.only('pk', 'branch_id', 'first_name', 'last_name'), pk=customer_id)
+    if not can_access_branch(request.user, customer.branch_id):
+        raise Http404("Customer not found")
+    return customer
+
+
+def face_login(request):
+    """Identify the staff member in the posted face and log them in; shared with accounts.FaceLoginView"""
+    # Unauthenticated: the encoding is computed from the image here, never taken from the client
+    encoding, error = _request_encoding(request, accept_encoding=False)
+    if error:
+        return error
+    matches = face_index.identify(face_index.STAFF, encoding, k=1)
+    user = User.objects.filter(pk=matches[0][0], is_active=True).first() if matches else None
+    if user is None:
+        return JsonResponse({'status': 'error', 'message': 'No matching user found'})
+
+    _log_attempt(request, user, True, matches[0][2])
+    login(request, user)
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Authentication successful',
+        'confidence': matches[0][2],
+        'redirect': '/dashboard/'
+    })
+
+
 class UserFaceEnrollmentView(LoginRequiredMixin, TemplateView):
     template_name = 'biometrics/user_face_enrollment.html'
 
 
 class UserFaceCaptureView(LoginRequiredMixin, View):
     def post(self, request):
-        # This would implement the face capture logic
+        encoding, error = _request_encoding(request)
+        if error:
+            return error
+        # Saving the enrollment updates the face index (see biometrics.models)
+        FaceEnrollment.objects.update_or_create(
+            user=request.user,
+            defaults={'face_encoding': face_index.encode_encoding(encoding), 'is_active': True},
+        )
+        User.objects.filter(pk=request.user.pk).update(face_id=True)
         return JsonResponse({'status': 'success'})
 
 
 class UserFaceVerificationView(LoginRequiredMixin, View):
     def post(self, request):
-        # This would implement face verification logic
-        return JsonResponse({'status': 'success', 'verified': True})
+        encoding, error = _request_encoding(request)
+        if error:
+            return error
+        enrollment = FaceEnrollment.objects.filter(user=request.user, is_active=True).first()
+        stored = face_index.decode_encoding(enrollment.face_encoding) if enrollment else None
+        if stored is None:
+            return _face_error('No face enrolled for this user', status=404)
+        score = face_index.confidence(encoding, stored)
+        verified = score >= face_index.min_confidence(request.user.branch_id)
+        _log_attempt(request, request.user, verified, score)
+        return JsonResponse({'status': 'success', 'verified': verified, 'confidence': score})
 
 
 class CustomerFaceEnrollmentView(LoginRequiredMixin, TemplateView):
@@ -39,14 +112,63 @@ class CustomerFaceEnrollmentView(LoginRequiredMixin, TemplateView):
 
 class CustomerFaceCaptureView(LoginRequiredMixin, View):
     def post(self, request, customer_id):
-        # This would implement the customer face capture logic
+        customer = _customer_for(request, customer_id)
+        if face_image := request.POST.get('face_image'):
+            # Encoding an image takes too long for a request; run_face_encoder picks it up
+            job = encoding_jobs.enqueue(customer, face_image, FaceEncodingJob.CAPTURE)
+            if job is None:
+                return _face_error("'face_image' must be a base64 image data URL")
+            return JsonResponse({
+                'status': 'queued',
+                'job_id': job.pk,
+                'status_url': reverse('customer_face_status', args=[customer.pk]),
+            }, status=202)
+
+        encoding, error = _request_encoding(request)
+        if error:
+            return error
+        CustomerFaceEnrollment.objects.update_or_create(
+            customer=customer,
+            defaults={'face_encoding': face_index.encode_encoding(encoding), 'is_active': True},
+        )
         return JsonResponse({'status': 'success'})
 
 
+class CustomerFaceStatusView(LoginRequiredMixin, View):
+    """Enrollment state and latest encoding job of a customer, polled by the capture UI"""
+
+    def get(self, request, customer_id):
+        customer = _customer_for(request, customer_id)
+        job = encoding_jobs.latest_job(customer.pk)
+        return JsonResponse({
+            'status': 'success',
+            'enrolled': CustomerFaceEnrollment.objects.filter(customer=customer, is_active=True).exists(),
+            'job': job and {
+                'id': job.pk,
+                'source': job.source,
+                'status': job.status,
+                'attempts': job.attempts,
+                'error': job.error,
+                'created_at': job.created_at,
+                'finished_at': job.finished_at,
+            },
+        })
+
+
 class CustomerFaceVerificationView(LoginRequiredMixin, View):
     def post(self, request, customer_id):
-        # This would implement customer face verification logic
-        return JsonResponse({'status': 'success', 'verified': True})
+        customer = _customer_for(request, customer_id)
+        encoding, error = _request_encoding(request)
+        if error:
+            return error
+        enrollment = CustomerFaceEnrollment.objects.filter(customer=customer, is_active=True).first()
+        stored = face_index.decode_encoding(enrollment.face_encoding) if enrollment else None
+        if stored is None:
+            return _face_error('No face enrolled for this customer', status=404)
+        score = face_index.confidence(encoding, stored)
+        verified = score >= face_index.min_confidence(customer.branch_id)
+        _log_attempt(request, request.user, verified, score, customer=customer)
+        return JsonResponse({'status': 'success', 'verified': verified, 'confidence': score})
 
 
 class FaceLoginView(View):
@@ -54,8 +176,7 @@ class FaceLoginView(View):
         return render(request, 'biometrics/face_login.html')
     
     def post(self, request):
-        # This would implement face login logic
-        return JsonResponse({'status': 'success'})
+        return face_login(request)
 
 
 class CustomerIdentificationView(LoginRequiredMixin, View):
@@ -63,8 +184,29 @@ class CustomerIdentificationView(LoginRequiredMixin, View):
         return render(request, 'biometrics/customer_identify.html')
     
     def post(self, request):
-        # This would implement customer identification logic
-        return JsonResponse({'status': 'success'})
+        encoding, error = _request_encoding(request)
+        if error:
+            return error
+        try:
+            limit = min(max(int(request.POST.get('limit', 5)), 1), 20)
+        except ValueError:
+            limit = 5
+        # Only the indexes of branches this user may see are searched
+        matches = face_index.identify(face_index.CUSTOMERS, encoding, visible_branch_ids(request.user), k=limit)
+        customers = Customer.objects.only('pk', 'first_name', 'last_name', 'phone').in_bulk([m[0] for m in matches])
+        results = [
+            {
+                'customer_id': customer_id,
+                'name': customers[customer_id].full_name,
+                'phone': customers[customer_id].phone,
+                'confidence': score,
+                'url': reverse('customer_detail', args=[customer_id]),
+            }
+            for customer_id, _, score in matches if customer_id in customers
+        ]
+        _log_attempt(request, request.user, bool(results), results[0]['confidence'] if results else None,
+                     customer=customers[results[0]['customer_id']] if results else None)
+        return JsonResponse({'status': 'success', 'matches': results})
 
 
 class BiometricSettingsView(LoginRequiredMixin, TemplateView):
@@ -258,20 +400,18 @@ class BiometricLogListView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         
         # Get all logs for calculating statistics (regardless of pagination)
-        all_logs = self.get_queryset()
-        total_logs = all_logs.count()
-        successful_logs = all_logs.filter(success=True).count()
+        all_logs = self.object_list
+        
+        # Success counts and recent failures (in the last 24 hours) in one grouped query
+        one_day_ago = timezone.now() - timezone.timedelta(days=1)
+        counts = status_histogram(all_logs, 'success', recent_failures=Q(success=False, timestamp__gte=one_day_ago))
+        total_logs = counts['total']
+        successful_logs = counts.get(True, 0)
         
         # Calculate statistics for dashboard cards
         context['total_logs'] = total_logs
         context['success_rate'] = round((successful_logs / total_logs) * 100) if total_logs > 0 else 0
-        
-        # Recent failures (in the last 24 hours)
-        one_day_ago = timezone.now() - timezone.timedelta(days=1)
-        context['recent_failures'] = all_logs.filter(
-            success=False, 
-            timestamp__gte=one_day_ago
-        ).count()
+        context['recent_failures'] = counts['recent_failures']
         
         # Average confidence score (only for successful authentications)
         avg_confidence = all_logs.filter(
@@ -283,45 +423,14 @@ class BiometricLogListView(LoginRequiredMixin, ListView):
         
         return context
         
-    def render_to_response(self, context, **response_kwargs):
-        # Check if CSV export is requested
-        if self.request.GET.get('export') == 'csv':
-            return self.export_csv(context['logs'])
-        return super().render_to_response(context, **response_kwargs)
+    def get(self, request, *args, **kwargs):
+        # The export covers every filtered log, not just the current page
+        if request.GET.get('export') == 'csv':
+            return self.export_csv(self.get_queryset())
+        return super().get(request, *args, **kwargs)
         
     def export_csv(self, logs):
-        import csv
-        from django.http import HttpResponse
-        
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="biometric_logs.csv"'
+        from reporting import exports
         
-        writer = csv.writer(response)
-        writer.writerow([
-            'Timestamp', 'User Type', 'User/Customer', 'Success', 
-            'Confidence', 'IP Address', 'Device Info'
-        ])
-        
-        for log in logs:
-            # Determine user type and name
-            if log.user:
-                user_type = 'Staff'
-                name = log.user.get_full_name() or log.user.username
-            elif log.customer:
-                user_type = 'Customer'
-                name = log.customer.get_full_name()
-            else:
-                user_type = 'Unknown'
-                name = 'Unknown'
-                
-            writer.writerow([
-                log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                user_type,
-                name,
-                'Success' if log.success else 'Failed',
-                f"{log.confidence:.2f}" if log.confidence else 'N/A',
-                log.ip_address or 'N/A',
-                log.device_info or 'N/A',
-            ])
-            
-        return response
+        dataset = exports.DATASETS['face_auth_logs']
+        return exports.streaming_response(dataset.columns, dataset.queryset(logs), 'csv', 'biometric_logs')
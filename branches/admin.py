@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Branch, BranchSettings
+from .models import Branch, BranchSettings, Sequence
 
 
 class BranchSettingsInline(admin.StackedInline):
@@ -28,3 +28,11 @@ class BranchSettingsAdmin(admin.ModelAdmin):
                    'require_id_verification', 'enable_face_recognition')
     list_filter = ('require_id_verification', 'enable_face_recognition')
     search_fields = ('branch__name',)
+
+
+@admin.register(Sequence)
+class SequenceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'key', 'last_value', 'updated_at')
+    list_filter = ('name',)
+    search_fields = ('key',)
+    readonly_fields = ('updated_at',)
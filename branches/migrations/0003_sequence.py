@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0002_branch_region'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text="What the sequence numbers, e.g. 'loan' or 'item'", max_length=50)),
+                ('key', models.CharField(help_text='Scope of the sequence, e.g. the number prefix', max_length=100)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'sequence',
+                'verbose_name_plural': 'sequences',
+                'constraints': [models.UniqueConstraint(fields=('name', 'key'), name='unique_sequence_name_key')],
+            },
+        ),
+    ]
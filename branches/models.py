@@ -84,3 +84,21 @@ class BranchSettings(models.Model):
         
     def __str__(self):
         return f"{self.branch.name} Settings"
+
+
+class Sequence(models.Model):
+    """Counter behind sequential document numbers (see branches.sequences)"""
+    name = models.CharField(max_length=50, help_text="What the sequence numbers, e.g. 'loan' or 'item'")
+    key = models.CharField(max_length=100, help_text="Scope of the sequence, e.g. the number prefix")
+    last_value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('sequence')
+        verbose_name_plural = _('sequences')
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'key'], name='unique_sequence_name_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} {self.key}: {self.last_value}"
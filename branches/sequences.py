@@ -0,0 +1,80 @@
+"""
+Sequential numbers for loans and inventory items.
+
+Each sequence is a row in ``branches.Sequence`` identified by a name and a key
+(the number prefix, e.g. ``2025-06-03-`` for loans of branch 3 in June 2025).
+Numbers are taken with a single ``UPDATE ... SET last_value = last_value + n``,
+so concurrent workers never hand out the same value and no lookup of existing
+numbers is needed.
+
+With ``SEQUENCE_BLOCK_SIZE`` above 1 each process reserves a block of values at
+a time and hands them out from memory. That saves a write per number at the
+cost of gaps when a process exits with part of a block unused. Blocks are only
+reserved outside transactions, so a rollback can never return a block to the
+counter that a process is still handing out.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import Sequence
+
+# (name, key) -> [next value, last value] of the block reserved by this process
+_blocks = {}
+_blocks_pid = None
+_lock = threading.Lock()
+
+
+def block_size():
+    return max(1, int(getattr(settings, 'SEQUENCE_BLOCK_SIZE', 1)))
+
+
+def max_numeric_suffix(queryset, field, prefix):
+    """Highest number following prefix in existing values, used to seed a new sequence"""
+    values = queryset.filter(**{f'{field}__startswith': prefix}).values_list(field, flat=True)
+    return max((int(value[len(prefix):]) for value in values if value[len(prefix):].isdigit()), default=0)
+
+
+def reserve(name, key, count=1, seed=None):
+    """Advance a sequence by count and return the first of the reserved values.
+
+    ``seed`` is called once, when the sequence does not exist yet, and returns
+    the value to start counting after.
+    """
+    counter = Sequence.objects.filter(name=name, key=key)
+    with transaction.atomic():
+        if not counter.update(last_value=F('last_value') + count):
+            start = seed() if seed else 0
+            try:
+                with transaction.atomic():
+                    Sequence.objects.create(name=name, key=key, last_value=start + count)
+                return start + 1
+            except IntegrityError:
+                # Another worker created the sequence first
+                counter.update(last_value=F('last_value') + count)
+        last_value = counter.values_list('last_value', flat=True).get()
+    return last_value - count + 1
+
+
+def next_value(name, key, seed=None):
+    """Return the next value of a sequence, from this process's block when enabled"""
+    size = block_size()
+    if size == 1 or connection.in_atomic_block:
+        return reserve(name, key, 1, seed)
+
+    global _blocks_pid
+    with _lock:
+        if _blocks_pid != os.getpid():
+            # Blocks inherited from a parent process belong to the parent
+            _blocks.clear()
+            _blocks_pid = os.getpid()
+        block = _blocks.get((name, key))
+        if block is None or block[0] > block[1]:
+            start = reserve(name, key, size, seed)
+            block = _blocks[(name, key)] = [start, start + size - 1]
+        value = block[0]
+        block[0] += 1
+    return value
@@ -1,3 +1,105 @@
-from django.test import TestCase
+import threading
+import time
 
-# Create your tests here.
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from branches import sequences
+from branches.models import Sequence
+
+
+def run_in_threads(count, target):
+    """Run target(index) in count threads, each on its own database connection; returns the results"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+    errors = []
+
+    def worker(i):
+        try:
+            barrier.wait()
+            results[i] = target(i)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def retry_locked(call):
+    """
+    SQLite's shared-cache test database reports a conflicting writer as
+    "table is locked" instead of waiting for it, as a server database or a
+    file database with a busy timeout would. A failed reserve changes
+    nothing, so the call is simply repeated.
+    """
+    while True:
+        try:
+            return call()
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            time.sleep(0.001)
+
+
+class SequenceAllocationTests(TransactionTestCase):
+    """Numbers handed out through separate connections never repeat"""
+
+    ROUNDS = 20
+    COUNT = 10
+
+    def test_reserve_from_two_connections(self):
+        def allocate(i):
+            # The first call of each thread races to create the sequence
+            starts = [retry_locked(lambda: sequences.reserve('loan', 'race-', self.COUNT, seed=lambda: 100))
+                      for _ in range(self.ROUNDS)]
+            return [value for start in starts for value in range(start, start + self.COUNT)]
+
+        first, second = run_in_threads(2, allocate)
+        values = first + second
+        self.assertEqual(len(values), len(set(values)))
+        self.assertEqual(sorted(values), list(range(101, 101 + 2 * self.ROUNDS * self.COUNT)))
+        self.assertEqual(Sequence.objects.get(name='loan', key='race-').last_value, 100 + 2 * self.ROUNDS * self.COUNT)
+
+    @override_settings(SEQUENCE_BLOCK_SIZE=10)
+    def test_blocks_of_two_processes_do_not_overlap(self):
+        first_process = [sequences.next_value('item', 'IT-') for _ in range(15)]
+        # Another process starts with no blocks of its own
+        sequences._blocks_pid = None
+        second_process = [sequences.next_value('item', 'IT-') for _ in range(5)]
+        sequences._blocks_pid = None
+
+        self.assertEqual(first_process, list(range(1, 16)))
+        # The first process's unused 16-20 are skipped, never handed out twice
+        self.assertEqual(second_process, list(range(21, 26)))
+        self.assertEqual(Sequence.objects.get(name='item', key='IT-').last_value, 30)
+
+    @override_settings(SEQUENCE_BLOCK_SIZE=10)
+    def test_no_blocks_inside_transactions(self):
+        from django.db import transaction
+
+        with transaction.atomic():
+            values = [sequences.next_value('item', 'TX-') for _ in range(3)]
+        self.assertEqual(values, [1, 2, 3])
+        self.assertEqual(Sequence.objects.get(name='item', key='TX-').last_value, 3)
+
+
+class SequenceSeedTests(TestCase):
+    def test_seed_from_existing_numbers(self):
+        from inventory.models import Category, Item
+        from branches.models import Branch
+
+        branch = Branch.objects.create(name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1')
+        category = Category.objects.create(name='Gold', slug='gold')
+        for suffix in ('0007', '0012', 'X'):
+            Item.objects.create(item_id=f'OLD-{suffix}', name='Ring', description='Ring', category=category, branch=branch)
+        self.assertEqual(sequences.max_numeric_suffix(Item.objects.all(), 'item_id', 'OLD-'), 12)
+        seed = lambda: sequences.max_numeric_suffix(Item.objects.all(), 'item_id', 'OLD-')
+        self.assertEqual(sequences.reserve('item', 'OLD-', seed=seed), 13)
@@ -6,6 +6,7 @@ from django.contrib import messages
 from django.db.models import Count, Sum, Q
 from django.utils import timezone
 
+from pawnshop_management.stats import status_histogram
 from .models import Branch, BranchSettings
 from .forms import BranchForm, BranchSettingsForm
 
@@ -44,13 +45,15 @@ class BranchDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
         context['staff_count'] = branch.staff.count()
         
         # Get inventory statistics
-        context['inventory_count'] = branch.items.count()
-        context['available_items'] = branch.items.filter(status='available').count()
-        context['pawned_items'] = branch.items.filter(status='pawned').count()
+        item_counts = status_histogram(branch.items.all())
+        context['inventory_count'] = item_counts['total']
+        context['available_items'] = item_counts['available']
+        context['pawned_items'] = item_counts['pawned']
         
         # Get loan statistics
-        context['active_loans'] = branch.loans.filter(status='active').count()
-        context['overdue_loans'] = branch.loans.filter(status='active', due_date__lt=today).count()
+        loan_counts = status_histogram(branch.loans.all(), overdue=Q(status='active', due_date__lt=today))
+        context['active_loans'] = loan_counts['active']
+        context['overdue_loans'] = loan_counts['overdue']
         
         # Get sales statistics
         context['sales_this_month'] = branch.sales.filter(
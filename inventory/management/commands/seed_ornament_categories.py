@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from inventory import ornaments
+from inventory.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Create any missing gold ornament categories offered on the loan form'
+
+    def handle(self, *args, **options):
+        created = ornaments.seed(Category)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} ornament categor{'y' if created == 1 else 'ies'} "
+            f"({len(ornaments.ORNAMENT_CATEGORIES)} in total)"
+        ))
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def seed_ornament_categories(apps, schema_editor):
+    # Formerly created with get_or_create every time a loan form was built
+    from inventory import ornaments
+    ornaments.seed(apps.get_model('inventory', 'Category'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_alter_item_loans'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_ornament_categories, migrations.RunPython.noop),
+    ]
@@ -6,6 +6,8 @@ import uuid
 import os
 
 from branches.models import Branch
+from branches import sequences
+from pawnshop_management.tracking import LoadedValuesMixin
 
 
 def item_image_path(instance, filename):
@@ -38,7 +40,10 @@ class Category(models.Model):
         return reverse('category_detail', args=[str(self.slug)])
 
 
-class Item(models.Model):
+class Item(LoadedValuesMixin, models.Model):
+    # Dashboard counters an item may be moving away from
+    tracked_fields = ('branch_id',)
+
     STATUS_CHOICES = (
         ('available', 'Available'),
         ('pawned', 'Pawned'),
@@ -139,21 +144,12 @@ class Item(models.Model):
             branch_code = self.branch.code if hasattr(self.branch, 'code') else 'XX'
             category_code = self.category.slug[:2].upper() if self.category else 'GN'
             
-            # Get the highest existing sequence number for this branch and category prefix
+            # Take the next number for this branch and category prefix from its sequence
             prefix = f"{branch_code}-{category_code}-"
-            highest_item = Item.objects.filter(item_id__startswith=prefix).order_by('-item_id').first()
-            
-            if highest_item:
-                # Extract sequence number from the highest item_id
-                try:
-                    seq_str = highest_item.item_id.split('-')[-1]
-                    seq_num = int(seq_str) + 1
-                except (IndexError, ValueError):
-                    # Fallback if parsing fails
-                    seq_num = 1
-            else:
-                seq_num = 1
-                
+            seq_num = sequences.next_value(
+                'item', prefix,
+                seed=lambda: sequences.max_numeric_suffix(Item.objects.all(), 'item_id', prefix),
+            )
             self.item_id = f"{branch_code}-{category_code}-{seq_num:04d}"
             
         super().save(*args, **kwargs)
@@ -0,0 +1,50 @@
+"""
+Gold ornament categories offered on the loan form, in display order.
+
+They are created by migration 0004 and the ``seed_ornament_categories``
+command; the loan form only reads them (see transactions.form_choices).
+"""
+from django.utils.text import slugify
+
+MIXED_ITEMS = 'Mixed Items'
+
+# Top priority ornament types, shown first
+TOP_CATEGORIES = ['Chain', 'Chain with Dollar', 'Chain without Dollar', 'Ring']
+
+# Tamil Nadu relevant gold ornament categories
+TAMIL_NADU_CATEGORIES = [
+    'Thali (Mangalsutra)', 'Jimikki (Earrings)', 'Mothiram (Rings)',
+    'Valai (Bangles)', 'Malai (Necklaces)', 'Koppu (Studs)',
+    'Odiyanam (Waist Belt)', 'Thodu (Ear Hoops)', 'Vanki (Armlet)',
+    'Kolusu (Anklet)', 'Metti (Toe Ring)', 'Jadai Nagam (Hair Ornament)',
+]
+
+ORNAMENT_CATEGORIES = (
+    [(MIXED_ITEMS, 'Multiple types of gold ornaments')]
+    + [(name, f'Gold ornament: {name}') for name in TOP_CATEGORIES]
+    + [(name, f'Traditional Tamil Nadu gold ornament: {name}') for name in TAMIL_NADU_CATEGORIES]
+)
+
+ORNAMENT_CATEGORY_NAMES = [name for name, _description in ORNAMENT_CATEGORIES]
+
+
+def seed(category_model):
+    """
+    Create the ornament categories that do not exist yet; returns how many
+    were created. Takes the Category model so migrations can pass their
+    historical version.
+    """
+    existing = set(category_model.objects.filter(name__in=ORNAMENT_CATEGORY_NAMES).values_list('name', flat=True))
+    slugs = set(category_model.objects.values_list('slug', flat=True))
+    created = 0
+    for name, description in ORNAMENT_CATEGORIES:
+        if name in existing:
+            continue
+        slug, n = slugify(name), 1
+        while slug in slugs:
+            n += 1
+            slug = f"{slugify(name)}-{n}"
+        slugs.add(slug)
+        category_model.objects.create(name=name, description=description, slug=slug)
+        created += 1
+    return created
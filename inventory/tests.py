@@ -1,3 +1,67 @@
+from django.db import connection
+from django.db.models import Q
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from accounts.models import CustomUser
+from branches.models import Branch
+from inventory.models import Category, Item
+from pawnshop_management.stats import status_histogram
+
+
+class StatusCountQueryTests(TestCase):
+    """Status cards are counted in one grouped query, not one query per status"""
+
+    STATUSES = {'available': 5, 'pawned': 3, 'sold': 2}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.branch = Branch.objects.create(
+            name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1'
+        )
+        category = Category.objects.create(name='Gold', slug='gold')
+        n = 0
+        for status, count in cls.STATUSES.items():
+            for _ in range(count):
+                n += 1
+                Item.objects.create(
+                    item_id=f'IT{n:04d}', name=f'Ring {n}', description='Ring', category=category,
+                    branch=cls.branch, status=status,
+                )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_histogram_matches_per_status_counts(self):
+        items = Item.objects.filter(branch=self.branch)
+
+        # The per-status counting the list and detail views used to do
+        with CaptureQueriesContext(connection) as before:
+            expected = {status: items.filter(status=status).count() for status in self.STATUSES}
+            expected['total'] = items.count()
+        with CaptureQueriesContext(connection) as after:
+            counts = status_histogram(items, ring_one=Q(name__startswith='Ring 1'))
+
+        for key, value in expected.items():
+            self.assertEqual(counts[key], value)
+        # Choices without rows are still reported
+        self.assertEqual(counts['expired'], 0)
+        self.assertEqual(counts['ring_one'], 2)  # Ring 1 and Ring 10
+        self.assertEqual(len(after), 1)
+        self.assertEqual(len(before), len(self.STATUSES) + 1)
+
+    def test_item_list_counts_statuses_in_one_query(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('item_list'), {'sort': 'name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_items'], 10)
+        self.assertEqual(response.context['available_items'], 5)
+        self.assertEqual(response.context['pawned_items'], 3)
+        self.assertEqual(response.context['sold_items'], 2)
+
+        item_counts = [q['sql'] for q in context.captured_queries
+                       if 'COUNT(' in q['sql'] and 'FROM "inventory_item"' in q['sql']]
+        # The paginator's COUNT(*) and the status histogram
+        self.assertEqual(len(item_counts), 2, item_counts)
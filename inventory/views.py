@@ -3,13 +3,15 @@ from django.views.generic import ListView, DetailView, CreateView, UpdateView, D
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.db.models import Q, Sum, Count
+from django.db.models import Sum, Count
 from django.http import JsonResponse
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required, permission_required
 
 from .models import Item, Category, ItemImage
 from .forms import ItemForm, CategoryForm, ItemImageForm
+from pawnshop_management.stats import status_histogram
+from search import index as search_index
 
 
 class ItemListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
@@ -29,13 +31,7 @@ class ItemListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
         # Filter by search query
         search_query = self.request.GET.get('search', '')
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(item_id__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(customer__first_name__icontains=search_query) |
-                Q(customer__last_name__icontains=search_query)
-            )
+            queryset = search_index.filter_queryset(queryset, search_index.ITEM, search_query)
         
         # Filter by category
         category_id = self.request.GET.get('category', '')
@@ -57,10 +53,12 @@ class ItemListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['categories'] = Category.objects.all()
-        context['total_items'] = self.get_queryset().count()
-        context['available_items'] = self.get_queryset().filter(status='available').count()
-        context['pawned_items'] = self.get_queryset().filter(status='pawned').count()
-        context['sold_items'] = self.get_queryset().filter(status='sold').count()
+        # One grouped query over the filtered items for all the status cards
+        counts = status_histogram(self.object_list)
+        context['total_items'] = counts['total']
+        context['available_items'] = counts['available']
+        context['pawned_items'] = counts['pawned']
+        context['sold_items'] = counts['sold']
         
         # Add search params for maintaining filters during pagination
         context['search_query'] = self.request.GET.get('search', '')
@@ -265,14 +263,7 @@ def inventory_search(request):
     
     # Apply search filters
     if search_query:
-        items = items.filter(
-            Q(name__icontains=search_query) |
-            Q(item_id__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(serial_number__icontains=search_query) |
-            Q(brand__icontains=search_query) |
-            Q(model__icontains=search_query)
-        )
+        items = search_index.filter_queryset(items, search_index.ITEM, search_query)
     
     # Filter by category if provided
     if category_id and category_id.isdigit():
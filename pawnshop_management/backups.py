@@ -0,0 +1,533 @@
+"""
+Incremental backups of the transactional tables as gzipped NDJSON shards.
+
+Every ``backup`` run writes a directory under the backup root::
+
+    backups/incremental/20250101_020000/
+        manifest.json
+        loans-0001.ndjson.gz
+        payments-0001.ndjson.gz
+        ...
+
+Tables are read in primary key order, ``CHUNK_SIZE`` rows per query, and
+written to shards of at most ``SHARD_ROWS`` rows, so neither side holds a
+table in memory. The manifest lists each shard with its row count and SHA-256
+and records a high-water mark per table: the newest ``updated_at`` for tables
+that have one, otherwise the highest primary key (payments, extensions and
+loan items are only ever appended). ``state.json`` in the backup root keeps
+the marks of the last complete run, and the next run only captures rows past
+them. Rows changed within the same timestamp as the mark are written again;
+restore is an upsert, so that is harmless. Deletions are not captured.
+
+``restore`` applies runs oldest first. It checks every shard's checksum
+before touching the database, then upserts rows with ``bulk_create`` and
+``bulk_update`` in batches of ``BATCH_SIZE``. Bulk writes skip model signals,
+so run ``backfill_rollups``, ``rebuild_search_index`` and
+``rebuild_loan_ledger`` after a restore.
+
+``backup_branches`` and ``restore_branches`` do the same per branch on a
+process pool: each worker has its own database connection and writes its own
+``branch-<id>-*`` shards, and the run's single manifest lists every branch's
+shards. Restore works one table at a time, so a loan never lands before a
+customer from another branch that it points at, and restores every branch's
+shards of that table in parallel.
+"""
+import base64
+import contextlib
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Rows fetched per query while backing up
+CHUNK_SIZE = 2000
+
+# Rows per shard file
+SHARD_ROWS = 100000
+
+# Rows written per bulk_create/bulk_update while restoring
+BATCH_SIZE = 1000
+
+MANIFEST = 'manifest.json'
+STATE = 'state.json'
+
+
+class BackupEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder without its millisecond rounding, so timestamps restore exactly"""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class BackupError(Exception):
+    """Raised when a backup cannot be read or fails verification"""
+
+
+class Table:
+    """A backed-up table: model, high-water mark column and path to its branch"""
+
+    def __init__(self, name, model, mark, branch_path):
+        self.name = name
+        self.model_label = model
+        self.mark = mark
+        self.branch_path = branch_path
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @property
+    def fields(self):
+        return self.model._meta.concrete_fields
+
+
+# In restore order: every table's foreign keys point at tables listed before it
+# or at configuration (branches, schemes, users) restored by restore_all_data.py
+TABLES = [
+    Table('customers', 'accounts.Customer', 'updated_at', 'branch'),
+    Table('items', 'inventory.Item', 'modified_at', 'branch'),
+    Table('loans', 'transactions.Loan', 'updated_at', 'branch'),
+    Table('loan_items', 'transactions.LoanItem', 'pk', 'loan__branch'),
+    Table('payments', 'transactions.Payment', 'pk', 'loan__branch'),
+    Table('extensions', 'transactions.LoanExtension', 'pk', 'loan__branch'),
+    Table('sales', 'transactions.Sale', 'updated_at', 'branch'),
+]
+TABLES_BY_NAME = {table.name: table for table in TABLES}
+
+
+def default_root():
+    return os.path.join(settings.BACKUP_DIR, 'incremental')
+
+
+def default_branch_root():
+    return os.path.join(settings.BACKUP_DIR, 'branches')
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _encode(value):
+    if isinstance(value, (bytes, memoryview)):
+        # BinaryField.to_python decodes base64 strings on the way back
+        return base64.b64encode(bytes(value)).decode('ascii')
+    return value
+
+
+def _read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    # Write then rename, so a crash never leaves a half-written manifest or state
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(data, f, indent=2, cls=BackupEncoder)
+    os.replace(f"{path}.tmp", path)
+
+
+# Backup
+
+class ShardWriter:
+    """Gzipped NDJSON files of at most SHARD_ROWS rows each"""
+
+    def __init__(self, directory, prefix, shard_rows=None):
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_rows = shard_rows or SHARD_ROWS
+        self.shards = []
+        self.file = None
+
+    def _open(self):
+        name = f"{self.prefix}-{len(self.shards) + 1:04d}.ndjson.gz"
+        self.file = gzip.open(os.path.join(self.directory, name), 'wt', encoding='utf-8')
+        self.shards.append({'file': name, 'rows': 0, 'first_pk': None, 'last_pk': None})
+
+    def write(self, pk, row):
+        if self.file is None or self.shards[-1]['rows'] >= self.shard_rows:
+            self.close()
+            self._open()
+        self.file.write(json.dumps(row, cls=BackupEncoder) + '\n')
+        shard = self.shards[-1]
+        shard['rows'] += 1
+        shard['first_pk'] = pk if shard['first_pk'] is None else shard['first_pk']
+        shard['last_pk'] = pk
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            shard = self.shards[-1]
+            shard['sha256'] = _sha256(os.path.join(self.directory, shard['file']))
+
+
+def changed_rows(table, since=None, queryset=None, chunk_size=CHUNK_SIZE):
+    """Yield (pk, row dict, mark value) for rows past the since mark, in primary key order.
+
+    Keyset pagination (pk > last) keeps every query an index range scan, however
+    deep into the table the backup is.
+    """
+    model = table.model
+    if queryset is None:
+        queryset = model._base_manager.all()
+    if since is not None:
+        if table.mark == 'pk':
+            queryset = queryset.filter(pk__gt=since)
+        else:
+            queryset = queryset.filter(**{f"{table.mark}__gte": since})
+    columns = [field.attname for field in table.fields]
+    mark_column = model._meta.pk.attname if table.mark == 'pk' else table.mark
+    last_pk = None
+    while True:
+        chunk = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        rows = list(chunk.values(*columns)[:chunk_size])
+        if not rows:
+            return
+        for row in rows:
+            yield row[model._meta.pk.attname], {key: _encode(value) for key, value in row.items()}, row[mark_column]
+        last_pk = rows[-1][model._meta.pk.attname]
+
+
+def _parse_mark(table, value):
+    if isinstance(value, str) and table.mark != 'pk':
+        return parse_datetime(value)
+    return value
+
+
+def backup_tables(directory, tables, marks, querysets=None, shard_prefix='', log=print):
+    """Write shards for each table into directory; returns (manifest entries, new marks)"""
+    entries = {}
+    new_marks = dict(marks)
+    for table in tables:
+        writer = ShardWriter(directory, f"{shard_prefix}{table.name}")
+        since = newest = _parse_mark(table, marks.get(table.name))
+        rows = 0
+        for pk, row, mark in changed_rows(table, since, (querysets or {}).get(table.name)):
+            writer.write(pk, row)
+            rows += 1
+            if mark is not None and (newest is None or mark > newest):
+                newest = mark
+        writer.close()
+        new_marks[table.name] = newest
+        entries[table.name] = writer.shards
+        log(f"  {table.name}: {rows} rows in {len(writer.shards)} shard(s)")
+    return entries, new_marks
+
+
+def backup(root=None, tables=None, full=False, log=print):
+    """Run one backup into a new directory under root; returns the manifest"""
+    root = root or default_root()
+    tables = [TABLES_BY_NAME[name] for name in tables] if tables else TABLES
+    os.makedirs(root, exist_ok=True)
+    state = {} if full else _read_json(os.path.join(root, STATE), {})
+    marks = state.get('marks', {})
+
+    started = timezone.now()
+    run_id = timezone.localtime(started).strftime('%Y%m%d_%H%M%S_%f')
+    directory = os.path.join(root, run_id)
+    os.makedirs(directory)
+    log(f"{'Full' if full or not marks else 'Incremental'} backup {run_id}")
+
+    entries, new_marks = backup_tables(directory, tables, marks, log=log)
+    manifest = {
+        'run_id': run_id,
+        'started_at': started,
+        'finished_at': timezone.now(),
+        'base': None if full else state.get('run_id'),
+        'since': {table.name: marks.get(table.name) for table in tables},
+        'marks': {table.name: new_marks.get(table.name) for table in tables},
+        'tables': entries,
+    }
+    _write_json(os.path.join(directory, MANIFEST), manifest)
+    # Tables not in this run keep their previous marks
+    _write_json(os.path.join(root, STATE), {'run_id': run_id, 'marks': {**marks, **manifest['marks']}})
+    return manifest
+
+
+# Per-branch backups on a process pool
+
+# Shard and mark key for rows without a branch (customers and items may have none)
+NO_BRANCH = 'none'
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _branch_querysets(tables, branch_key):
+    if branch_key == NO_BRANCH:
+        return {table.name: table.model._base_manager.filter(**{f"{table.branch_path}__isnull": True})
+                for table in tables}
+    return {table.name: table.model._base_manager.filter(**{f"{table.branch_path}_id": branch_key})
+            for table in tables}
+
+
+def _backup_branch_job(directory, branch_key, table_names, marks):
+    """Process-pool job: back up one branch; returns (branch key, manifest entries, new marks, log lines)"""
+    lines = []
+    tables = [TABLES_BY_NAME[name] for name in table_names]
+    try:
+        entries, new_marks = backup_tables(
+            directory, tables, marks, _branch_querysets(tables, branch_key),
+            shard_prefix=f"branch-{branch_key}-", log=lines.append,
+        )
+    finally:
+        connection.close()
+    for shards in entries.values():
+        for shard in shards:
+            shard['branch'] = branch_key
+    return branch_key, entries, new_marks, lines
+
+
+def _branch_keys(branch_ids):
+    from branches.models import Branch
+    if branch_ids:
+        return [str(pk) for pk in branch_ids]
+    return [str(pk) for pk in Branch.objects.order_by('pk').values_list('pk', flat=True)] + [NO_BRANCH]
+
+
+def backup_branches(root=None, branch_ids=None, tables=None, full=False, workers=None, log=print):
+    """Back up each branch in its own worker process into one run; returns the combined manifest"""
+    root = root or default_branch_root()
+    workers = workers or getattr(settings, 'BACKUP_WORKERS', 1)
+    table_names = tables or [table.name for table in TABLES]
+    os.makedirs(root, exist_ok=True)
+    state = {} if full else _read_json(os.path.join(root, STATE), {})
+    branch_marks = state.get('branches', {})
+    keys = _branch_keys(branch_ids)
+
+    started = timezone.now()
+    run_id = timezone.localtime(started).strftime('%Y%m%d_%H%M%S_%f')
+    directory = os.path.join(root, run_id)
+    os.makedirs(directory)
+    log(f"Backup {run_id}: {len(keys)} branch(es), {workers} worker(s)")
+
+    entries = {name: [] for name in table_names}
+    new_branch_marks = dict(branch_marks)
+    # Children must open their own database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = [executor.submit(_backup_branch_job, directory, key, table_names, branch_marks.get(key, {}))
+                   for key in keys]
+        for done, future in enumerate(as_completed(futures), 1):
+            key, branch_entries, marks, lines = future.result()
+            for name, shards in branch_entries.items():
+                entries[name].extend(shards)
+            new_branch_marks[key] = {**branch_marks.get(key, {}), **marks}
+            rows = sum(shard['rows'] for shards in branch_entries.values() for shard in shards)
+            log(f"  branch {key}: {rows} rows [{done}/{len(keys)}]")
+
+    for shards in entries.values():
+        shards.sort(key=lambda shard: shard['file'])
+    manifest = {
+        'run_id': run_id,
+        'started_at': started,
+        'finished_at': timezone.now(),
+        'base': None if full else state.get('run_id'),
+        'branches': keys,
+        'tables': entries,
+    }
+    _write_json(os.path.join(directory, MANIFEST), manifest)
+    _write_json(os.path.join(root, STATE), {'run_id': run_id, 'branches': new_branch_marks})
+    return manifest
+
+
+# Restore
+
+def runs(root=None):
+    """Complete backup runs under root, oldest first"""
+    root = root or default_root()
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, MANIFEST)))
+
+
+def load_manifest(directory):
+    manifest = _read_json(os.path.join(directory, MANIFEST))
+    if manifest is None:
+        raise BackupError(f"No manifest in {directory}")
+    return manifest
+
+
+def verify(directory, manifest):
+    """Check every shard exists and matches its checksum"""
+    for table_name, shards in manifest['tables'].items():
+        for shard in shards:
+            path = os.path.join(directory, shard['file'])
+            if not os.path.exists(path):
+                raise BackupError(f"Missing shard {shard['file']} in {directory}")
+            if _sha256(path) != shard['sha256']:
+                raise BackupError(f"Checksum mismatch for {shard['file']} in {directory}")
+
+
+def _read_shard(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _instance(model, fields, row):
+    return model(**{field.attname: field.to_python(row.get(field.attname)) for field in fields})
+
+
+@contextlib.contextmanager
+def _keep_timestamps(model):
+    """Stop auto_now/auto_now_add from overwriting restored timestamps during bulk_create"""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def upsert(model, rows):
+    """bulk_update rows whose primary key exists and bulk_create the rest; returns (created, updated)"""
+    fields = model._meta.concrete_fields
+    instances = [_instance(model, fields, row) for row in rows]
+    existing = set(model._base_manager.filter(pk__in=[obj.pk for obj in instances]).values_list('pk', flat=True))
+    to_create = [obj for obj in instances if obj.pk not in existing]
+    to_update = [obj for obj in instances if obj.pk in existing]
+    with transaction.atomic(), _keep_timestamps(model):
+        if to_create:
+            model._base_manager.bulk_create(to_create, batch_size=BATCH_SIZE)
+        if to_update:
+            model._base_manager.bulk_update(
+                to_update, [field.attname for field in fields if not field.primary_key], batch_size=BATCH_SIZE
+            )
+    return len(to_create), len(to_update)
+
+
+def restore_shards(directory, table, shards, batch_size=BATCH_SIZE, log=print):
+    """Upsert the rows of a table's shards in batches, reporting progress; returns rows restored"""
+    model = table.model
+    total = sum(shard['rows'] for shard in shards)
+    done = created = updated = 0
+    for shard in shards:
+        batch = []
+        for row in _read_shard(os.path.join(directory, shard['file'])):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                c, u = upsert(model, batch)
+                created, updated, done = created + c, updated + u, done + len(batch)
+                batch = []
+                log(f"  {table.name}: {done}/{total}")
+        if batch:
+            c, u = upsert(model, batch)
+            created, updated, done = created + c, updated + u, done + len(batch)
+            log(f"  {table.name}: {done}/{total}")
+    if total:
+        log(f"  {table.name}: {created} created, {updated} updated")
+    return done
+
+
+def reset_sequences(tables):
+    """Move database id sequences past the restored primary keys (no-op on SQLite)"""
+    statements = connection.ops.sequence_reset_sql(no_style(), [table.model for table in tables])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def _verified_manifests(root, until, log):
+    """(directory, manifest) of the runs to apply, oldest first, after checking every shard"""
+    selected = runs(root)
+    if until is not None:
+        if until not in selected:
+            raise BackupError(f"Unknown backup run: {until}")
+        selected = selected[:selected.index(until) + 1]
+    if not selected:
+        raise BackupError(f"No backup runs in {root}")
+
+    # Verify everything first so a corrupt increment cannot leave a half-applied restore
+    manifests = []
+    for run_id in selected:
+        directory = os.path.join(root, run_id)
+        manifest = load_manifest(directory)
+        verify(directory, manifest)
+        manifests.append((directory, manifest))
+    log(f"Verified {len(manifests)} backup run(s)")
+    return manifests
+
+
+def restore(root=None, until=None, tables=None, log=print):
+    """Apply every backup run under root (up to and including until) oldest first; returns rows restored"""
+    root = root or default_root()
+    manifests = _verified_manifests(root, until, log)
+
+    names = tables or [table.name for table in TABLES]
+    restored = 0
+    for directory, manifest in manifests:
+        log(f"Restoring {manifest['run_id']}")
+        for table in TABLES:
+            if table.name in names and manifest['tables'].get(table.name):
+                restored += restore_shards(directory, table, manifest['tables'][table.name], log=log)
+    reset_sequences([TABLES_BY_NAME[name] for name in names])
+    return restored
+
+
+def _restore_branch_job(directory, table_name, shards):
+    """Process-pool job: restore one branch's shards of one table; returns rows restored"""
+    try:
+        return restore_shards(directory, TABLES_BY_NAME[table_name], shards, log=lambda message: None)
+    finally:
+        connection.close()
+
+
+def restore_branches(root=None, until=None, branch_ids=None, tables=None, workers=None, log=print):
+    """Apply per-branch backup runs oldest first, restoring branches in parallel; returns rows restored"""
+    root = root or default_branch_root()
+    workers = workers or getattr(settings, 'BACKUP_WORKERS', 1)
+    manifests = _verified_manifests(root, until, log)
+    names = tables or [table.name for table in TABLES]
+    wanted = {str(pk) for pk in branch_ids} if branch_ids else None
+
+    restored = 0
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        for directory, manifest in manifests:
+            log(f"Restoring {manifest['run_id']} with {workers} worker(s)")
+            for table in TABLES:
+                by_branch = {}
+                for shard in manifest['tables'].get(table.name, []) if table.name in names else []:
+                    if wanted is None or shard.get('branch') in wanted:
+                        by_branch.setdefault(shard.get('branch'), []).append(shard)
+                if not by_branch:
+                    continue
+                # Every branch's rows of this table land before the next table starts
+                futures = {executor.submit(_restore_branch_job, directory, table.name, shards): key
+                           for key, shards in by_branch.items()}
+                rows = 0
+                for future in as_completed(futures):
+                    rows += future.result()
+                log(f"  {table.name}: {rows} rows from {len(by_branch)} branch(es)")
+                restored += rows
+    reset_sequences([TABLES_BY_NAME[name] for name in names])
+    return restored
@@ -0,0 +1,142 @@
+"""
+Content-addressed blob store for captured photos.
+
+Base64 data URLs posted by the camera widgets are decoded and written once
+under MEDIA_ROOT/blobs, keyed by the SHA-256 of their bytes. Model rows keep
+only the short reference URL returned by ``externalize``, and the files are
+served by ``serve_blob`` with long-lived cache headers since their content
+can never change.
+"""
+import base64
+import binascii
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.views.decorators.http import require_GET
+
+BLOB_DIR = 'blobs'
+BLOB_URL_PREFIX = f"{settings.MEDIA_URL.rstrip('/')}/{BLOB_DIR}/"
+
+# Only image payloads from the capture widgets are externalized
+ALLOWED_EXTENSIONS = {'jpeg', 'jpg', 'png', 'gif', 'webp'}
+
+_DATA_URL_RE = re.compile(r'^data:image/(?P<ext>[a-zA-Z0-9.+-]+);base64,(?P<data>.*)$', re.DOTALL)
+_BLOB_NAME_RE = re.compile(r'^(?P<digest>[0-9a-f]{64})\.(?P<ext>[a-z0-9]+)$')
+
+
+def is_data_url(value):
+    """Return True if value is a base64 image data URL"""
+    return isinstance(value, str) and value.startswith('data:image/')
+
+
+def is_blob_url(value):
+    """Return True if value references a blob in this store"""
+    return isinstance(value, str) and value.startswith(BLOB_URL_PREFIX)
+
+
+def _storage_name(digest, ext):
+    # Two-level fan-out keeps directories small
+    return os.path.join(BLOB_DIR, digest[:2], f"{digest}.{ext}")
+
+
+def store_bytes(data, ext):
+    """Write bytes to the store (once per distinct content) and return the blob URL"""
+    ext = ext.lower()
+    if ext == 'jpg':
+        ext = 'jpeg'
+    if ext not in ALLOWED_EXTENSIONS:
+        raise ValueError(f"Unsupported image type: {ext}")
+
+    digest = hashlib.sha256(data).hexdigest()
+    name = _storage_name(digest, ext)
+    if not default_storage.exists(name):
+        saved_name = default_storage.save(name, ContentFile(data))
+        if saved_name != name:
+            # Another writer stored the same content first; keep the canonical copy
+            default_storage.delete(saved_name)
+    return f"{BLOB_URL_PREFIX}{digest}.{ext}"
+
+
+def store_data_url(data_url):
+    """Decode a base64 image data URL into the store and return the blob URL"""
+    match = _DATA_URL_RE.match(data_url.strip())
+    if not match:
+        raise ValueError("Not a base64 image data URL")
+    try:
+        data = base64.b64decode(match.group('data'), validate=False)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Invalid base64 image data: {e}")
+    return store_bytes(data, match.group('ext'))
+
+
+def externalize(value):
+    """Replace a data URL with its blob URL; any other value is returned unchanged"""
+    if is_data_url(value):
+        try:
+            return store_data_url(value)
+        except ValueError as e:
+            print(f"Could not move image into media store: {e}")
+    return value
+
+
+def externalize_list(values):
+    """Externalize every data URL in a list of photos"""
+    return [externalize(value) for value in values]
+
+
+def _resolve(blob_url):
+    """Map a blob URL to its storage name, or None if it is not a valid reference"""
+    if not is_blob_url(blob_url):
+        return None
+    match = _BLOB_NAME_RE.match(blob_url[len(BLOB_URL_PREFIX):])
+    if not match:
+        return None
+    return _storage_name(match.group('digest'), match.group('ext'))
+
+
+def read_blob(blob_url):
+    """Return the stored bytes for a blob URL, or None if it is missing"""
+    name = _resolve(blob_url)
+    if not name or not default_storage.exists(name):
+        return None
+    with default_storage.open(name, 'rb') as f:
+        return f.read()
+
+
+def read_blob_base64(blob_url):
+    """Return the stored image as a base64 string (without the data URL prefix)"""
+    data = read_blob(blob_url)
+    if data is None:
+        return None
+    return base64.b64encode(data).decode('utf-8')
+
+
+@require_GET
+@login_required
+def serve_blob(request, name):
+    """Serve a stored blob; content never changes, so it is cacheable indefinitely"""
+    match = _BLOB_NAME_RE.match(name)
+    if not match:
+        raise Http404("Invalid image reference")
+    digest = match.group('digest')
+    storage_name = _storage_name(digest, match.group('ext'))
+    if not default_storage.exists(storage_name):
+        raise Http404("Image not found")
+
+    etag = f'"{digest}"'
+    cache_control = 'private, max-age=31536000, immutable'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        content_type = mimetypes.guess_type(storage_name)[0] or 'application/octet-stream'
+        response = FileResponse(default_storage.open(storage_name, 'rb'), content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
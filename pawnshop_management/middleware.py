@@ -1,17 +1,23 @@
-from django.db import close_old_connections
+from django.db import connections
+
 
 class DatabaseConnectionMiddleware:
+    """Discard database connections a request left broken.
+
+    Django already closes connections past CONN_MAX_AGE when a request starts
+    and finishes, so healthy persistent connections are kept here. Only a
+    connection whose queries failed and that no longer answers is closed, so
+    the next request on this worker reconnects instead of inheriting it.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        # Close any stale database connections before processing request
-        close_old_connections()
-        
-        # Process the request
         response = self.get_response(request)
-        
-        # Close connections after processing
-        close_old_connections()
-        
-        return response
\ No newline at end of file
+
+        for conn in connections.all(initialized_only=True):
+            if conn.connection is not None and conn.errors_occurred and not conn.is_usable():
+                conn.close()
+
+        return response
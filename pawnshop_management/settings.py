@@ -51,6 +51,7 @@ INSTALLED_APPS = [
     'biometrics',
     'integrations',
     'schemes',  # Schemes management app
+    'search',  # Full-text search index
 ]
 
 # For minimal startup, remove optional middleware
@@ -104,14 +105,66 @@ SKIP_DB_CHECKS = os.environ.get('SKIP_DB_CHECKS', '').lower() == 'true'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-# Database configuration - Always use SQLite regardless of environment
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database configuration
+# PostgreSQL (or any backend) when DATABASE_URL is set, otherwise the local SQLite file.
+DATABASE_URL = os.environ.get('DATABASE_URL')
+# Seconds a connection is reused across requests; 0 closes it after every request
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+
+if DATABASE_URL:
+    DATABASES = {
+        'default': dj_database_url.parse(
+            DATABASE_URL,
+            conn_max_age=DB_CONN_MAX_AGE,
+            conn_health_checks=True,
+        )
     }
-}
-print(f"Using SQLite database in all environments")
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+        DATABASES['default'].setdefault('OPTIONS', {})
+        # Pooled connections need psycopg 3 with psycopg_pool; with psycopg2 each
+        # worker keeps its persistent connection instead.
+        if os.environ.get('DB_POOL', '').lower() == 'true':
+            try:
+                import psycopg_pool  # noqa: F401
+            except ImportError:
+                print("DB_POOL requested but psycopg_pool is not installed; using persistent connections")
+            else:
+                DATABASES['default']['CONN_MAX_AGE'] = 0  # the pool manages connection lifetime
+                DATABASES['default']['OPTIONS']['pool'] = {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                }
+        # Server-side cursors do not survive transaction-level poolers such as PgBouncer
+        if os.environ.get('DB_PGBOUNCER', '').lower() == 'true':
+            DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    print(f"Using {DATABASES['default']['ENGINE'].rsplit('.', 1)[-1]} database from DATABASE_URL")
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Seconds to wait for a write lock before raising "database is locked"
+                'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+                # Take the write lock when a transaction starts rather than on its first write,
+                # so concurrent writers queue on the busy timeout instead of deadlocking
+                'transaction_mode': 'IMMEDIATE',
+                # Applied on every new connection: WAL lets readers run alongside the writer,
+                # synchronous=NORMAL is durable under WAL without an fsync per commit
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))};"
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA cache_size=-65536;'
+                ),
+            },
+        }
+    }
+    print("Using SQLite database")
 
 # Skip testing database connections during startup in minimal mode
 if SKIP_DB_CHECKS:
@@ -162,6 +215,64 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Rendered PDF documents (loan agreements, receipts); kept outside MEDIA_ROOT.
+# run_document_renderer (started by start.sh) renders queued documents with PDF_RENDER_WORKERS
+# processes and must see the same directory; while it is not running, requests render inline
+PDF_CACHE_DIR = Path(os.environ.get('PDF_CACHE_DIR', BASE_DIR / 'cache' / 'pdf'))
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', 2))
+PDF_BATCH_WORKERS = int(os.environ.get('PDF_BATCH_WORKERS', os.cpu_count() or 1))
+# Most agreements the export view renders in one request; larger exports use export_agreements
+AGREEMENT_EXPORT_MAX_LOANS = int(os.environ.get('AGREEMENT_EXPORT_MAX_LOANS', 200))
+
+# Root of the backup scripts' output; incremental shards go in BACKUP_DIR/incremental,
+# per-branch shards in BACKUP_DIR/branches, written by up to BACKUP_WORKERS processes
+BACKUP_DIR = Path(os.environ.get('BACKUP_DIR', BASE_DIR / 'backups'))
+BACKUP_WORKERS = int(os.environ.get('BACKUP_WORKERS', os.cpu_count() or 1))
+
+# Memory-mapped face-embedding indexes, one file pair per branch (see biometrics.face_index).
+# The web service and run_face_encoder must share this directory, e.g. on a network mount.
+FACE_INDEX_DIR = Path(os.environ.get('FACE_INDEX_DIR', BASE_DIR / 'face_index'))
+
+# Processes used by run_face_encoder to compute face encodings from captured images;
+# the encoder needs requirements-intensive.txt (face_recognition, numpy)
+FACE_ENCODER_WORKERS = int(os.environ.get('FACE_ENCODER_WORKERS', 2))
+
+# Shared cache for access policies and other per-user data; without REDIS_URL each
+# process keeps its own local-memory cache
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
+# Seconds a user's resolved role, permissions and branches are cached (see accounts.access)
+ACCESS_POLICY_CACHE_TIMEOUT = int(os.environ.get('ACCESS_POLICY_CACHE_TIMEOUT', 300))
+
+# Seconds a process keeps the loan form's category and scheme lists without
+# seeing a change (see transactions.form_choices)
+LOAN_FORM_CHOICES_TIMEOUT = int(os.environ.get('LOAN_FORM_CHOICES_TIMEOUT', 300))
+
+# Home-page dashboard counters (see accounts.dashboard): fresh for DASHBOARD_CACHE_TTL
+# seconds; after that, or after a change, stale values are served for up to
+# DASHBOARD_STALE_TTL seconds while a background thread recomputes them
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 30))
+DASHBOARD_STALE_TTL = int(os.environ.get('DASHBOARD_STALE_TTL', 300))
+DASHBOARD_STALE_WHILE_REVALIDATE = os.environ.get('DASHBOARD_STALE_WHILE_REVALIDATE', 'True').lower() == 'true'
+
+# Threads run_report_worker uses for queued report executions (see reporting.report_jobs)
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+
+# run_scheduler: concurrent scheduled runs and what to do with runs missed while it was down
+# ('none', 'latest' or 'all'; see reporting.scheduler).
+REPORT_SCHEDULER_WORKERS = int(os.environ.get('REPORT_SCHEDULER_WORKERS', 2))
+REPORT_SCHEDULER_CATCH_UP = os.environ.get('REPORT_SCHEDULER_CATCH_UP', 'latest')
+
+# Loan numbers and item IDs reserved per database write by each process (see branches.sequences).
+# 1 keeps numbers gap-free; larger blocks trade gaps for fewer writes.
+SEQUENCE_BLOCK_SIZE = int(os.environ.get('SEQUENCE_BLOCK_SIZE', 1))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -170,6 +281,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom user model
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
+# Role permissions are resolved from the user's role rather than copied onto each user
+AUTHENTICATION_BACKENDS = ['accounts.backends.RoleModelBackend']
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -0,0 +1,45 @@
+"""
+Count rows per status in a single query.
+
+List and detail pages used to show cards like "available / pawned / sold"
+by running one COUNT query per card, each one repeating the page's search
+filters. ``status_histogram`` runs a single GROUP BY over the filtered
+queryset instead::
+
+    counts = status_histogram(items)
+    counts['total'], counts['available'], counts['pawned']
+
+Counts that a plain GROUP BY cannot give, such as overdue loans, are passed
+as named Q conditions and counted in the same query::
+
+    status_histogram(branch.loans, overdue=Q(status='active', due_date__lt=today))
+"""
+from django.db.models import Count
+
+
+def status_histogram(queryset, field='status', **conditions):
+    """
+    Row counts per value of field, plus 'total' and one count per condition.
+
+    Choices of field with no rows are reported as 0, so callers can index
+    any status without checking.
+    """
+    model_field = queryset.model._meta.get_field(field)
+    counts = {value: 0 for value, _label in model_field.flatchoices}
+    counts.update(dict.fromkeys(conditions, 0))
+    counts['total'] = 0
+
+    # A .distinct() queryset may join to many rows per object; count each object once
+    distinct = queryset.query.distinct
+    rows = (queryset.order_by()
+            .values(field)
+            .annotate(_count=Count('pk', distinct=distinct), **{
+                f'_{name}': Count('pk', filter=condition, distinct=distinct)
+                for name, condition in conditions.items()
+            }))
+    for row in rows:
+        counts[row[field]] = counts.get(row[field], 0) + row['_count']
+        counts['total'] += row['_count']
+        for name in conditions:
+            counts[name] += row[f'_{name}']
+    return counts
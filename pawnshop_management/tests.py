@@ -0,0 +1,169 @@
+import datetime
+import gzip
+import os
+import tempfile
+from concurrent.futures import Future
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+
+from accounts.models import Customer
+from branches.models import Branch
+from inventory.models import Category, Item
+from pawnshop_management import backups
+from transactions.models import Loan, LoanItem, Payment
+
+
+def quiet(message):
+    pass
+
+
+class InlineExecutor:
+    """Stands in for the backup process pool; runs each job as it is submitted"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def snapshot():
+    """Every backed-up row, by table, as the database holds it"""
+    return {table.name: list(table.model._base_manager.order_by('pk').values()) for table in backups.TABLES}
+
+
+def wipe():
+    for table in reversed(backups.TABLES):
+        table.model._base_manager.all().delete()
+
+
+class BackupFixture:
+    @classmethod
+    def setUpTestData(cls):
+        today = datetime.date(2024, 3, 10)
+        category = Category.objects.create(name='Gold', slug='gold')
+        cls.branches = []
+        for n in (1, 2):
+            branch = Branch.objects.create(
+                name=f'Branch {n}', address='1 Street', city='City', state='State', zip_code='1', phone=str(n)
+            )
+            cls.branches.append(branch)
+            for i in range(3):
+                customer = Customer.objects.create(
+                    first_name=f'Customer{n}{i}', last_name='Test', phone=f'{n}{i}', branch=branch
+                )
+                loan = Loan.objects.create(
+                    loan_number=f'LN{n}{i:03d}', customer=customer, branch=branch,
+                    principal_amount=10000, distribution_amount=10000,
+                    issue_date=today, due_date=today + datetime.timedelta(days=90),
+                    grace_period_end=today + datetime.timedelta(days=97),
+                )
+                item = Item.objects.create(
+                    item_id=f'IT{n}{i:03d}', name=f'Ring {n}{i}', description='Ring', category=category,
+                    branch=branch, status='pawned',
+                )
+                LoanItem.objects.create(
+                    loan=loan, item=item, gold_karat=22, gross_weight=Decimal('10.000'),
+                    net_weight=Decimal('9.500'), market_price_22k=Decimal('6000.00'),
+                )
+                Payment.objects.create(loan=loan, amount=Decimal('500.00'), payment_method='cash', payment_date=today)
+        # A customer with no branch is backed up too
+        Customer.objects.create(first_name='Walk', last_name='In', phone='0')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+
+
+class IncrementalBackupTests(BackupFixture, TestCase):
+
+    def test_restore_after_wipe_reproduces_every_row(self):
+        before = snapshot()
+        manifest = backups.backup(self.root, log=quiet)
+        self.assertEqual(manifest['tables']['customers'][0]['rows'], 7)
+
+        wipe()
+        self.assertFalse(Customer.objects.exists())
+        restored = backups.restore(self.root, log=quiet)
+
+        self.assertEqual(restored, sum(len(rows) for rows in before.values()))
+        self.assertEqual(snapshot(), before)
+
+    def test_increment_holds_only_rows_past_the_marks(self):
+        first = backups.backup(self.root, log=quiet)
+        customer = Customer.objects.get(phone='10')
+        customer.first_name = 'Renamed'
+        customer.save()
+        loan = Loan.objects.get(loan_number='LN1000')
+        payment = Payment.objects.create(
+            loan=loan, amount=Decimal('250.00'), payment_method='cash', payment_date=datetime.date(2024, 3, 11)
+        )
+
+        second = backups.backup(self.root, log=quiet)
+
+        self.assertEqual(second['base'], first['run_id'])
+        # The next run starts from the marks as written to disk
+        self.assertEqual(second['since'], backups.load_manifest(os.path.join(self.root, first['run_id']))['marks'])
+        self.assertEqual(second['marks']['payments'], payment.pk)
+        directory = os.path.join(self.root, second['run_id'])
+        customers = [row['id'] for shard in second['tables']['customers']
+                     for row in backups._read_shard(os.path.join(directory, shard['file']))]
+        payments = [row['id'] for shard in second['tables']['payments']
+                    for row in backups._read_shard(os.path.join(directory, shard['file']))]
+        # The row holding the previous updated_at mark is written again (restore upserts it)
+        newest = Customer.objects.exclude(pk=customer.pk).latest('updated_at')
+        self.assertEqual(set(customers), {customer.pk, newest.pk})
+        self.assertEqual(payments, [payment.pk])
+        # Unchanged tables: only the row at the mark, or nothing when the mark is a primary key
+        self.assertEqual([shard['rows'] for shard in second['tables']['items']], [1])
+        self.assertEqual(second['tables']['loan_items'], [])
+
+        # Applying both runs after a wipe lands on the latest state
+        before = snapshot()
+        wipe()
+        backups.restore(self.root, log=quiet)
+        self.assertEqual(snapshot(), before)
+
+    def test_checksum_mismatch_stops_restore_before_any_write(self):
+        backups.backup(self.root, log=quiet)
+        Customer.objects.filter(phone='10').update(first_name='Changed')
+        run_id = backups.runs(self.root)[-1]
+        with gzip.open(os.path.join(self.root, run_id, 'customers-0001.ndjson.gz'), 'at') as f:
+            f.write('{"id": 999999}\n')
+
+        with self.assertRaisesMessage(backups.BackupError, 'Checksum mismatch for customers-0001.ndjson.gz'):
+            backups.restore(self.root, log=quiet)
+        self.assertEqual(Customer.objects.get(phone='10').first_name, 'Changed')
+
+
+@mock.patch.object(backups, 'ProcessPoolExecutor', InlineExecutor)
+class BranchBackupTests(BackupFixture, TestCase):
+
+    def test_restore_after_wipe_reproduces_every_row(self):
+        before = snapshot()
+        manifest = backups.backup_branches(self.root, workers=2, log=quiet)
+        branches = {shard['branch'] for shard in manifest['tables']['customers']}
+        self.assertEqual(branches, {str(branch.pk) for branch in self.branches} | {backups.NO_BRANCH})
+
+        wipe()
+        backups.restore_branches(self.root, workers=2, log=quiet)
+        self.assertEqual(snapshot(), before)
+
+    def test_restore_of_one_branch_leaves_the_others(self):
+        backups.backup_branches(self.root, workers=2, log=quiet)
+        wipe()
+        branch = self.branches[0]
+        backups.restore_branches(self.root, branch_ids=[branch.pk], workers=2, log=quiet)
+        self.assertEqual(set(Loan.objects.values_list('branch_id', flat=True)), {branch.pk})
+        self.assertEqual(Customer.objects.count(), 3)
@@ -0,0 +1,59 @@
+"""
+Remember the database values of selected fields on model instances.
+
+Signal receivers sometimes need to know what a row looked like before a
+save, for example whether a loan's terms changed or which branch a row
+moved away from. Fetching the old row in a pre_save receiver costs one
+extra query per save. Models that mix in ``LoadedValuesMixin`` record the
+values of ``tracked_fields`` (attnames) when they are loaded, and again
+after each save::
+
+    class Loan(LoadedValuesMixin, models.Model):
+        tracked_fields = ('status', 'branch_id')
+
+    loan.loaded_value('branch_id')      # as last read from or written to the row
+    loan.changed_fields()               # tracked fields that differ from the row
+
+For an instance the database has not given values for (a new object, or one
+built with an explicit pk), every tracked field is reported as changed.
+"""
+
+
+class LoadedValuesMixin:
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.tracked_fields
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers have seen the old values by now; the row holds the new ones
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            saved = set(self.tracked_fields)
+        else:
+            saved = {self._meta.get_field(name).attname for name in update_fields}
+        loaded = getattr(self, '_loaded_values', {})
+        deferred = self.get_deferred_fields()
+        for name in self.tracked_fields:
+            if name in saved and name not in deferred:
+                loaded[name] = getattr(self, name)
+        self._loaded_values = loaded
+
+    def loaded_value(self, name, default=None):
+        """The value of a tracked field as last read from or written to the database"""
+        return getattr(self, '_loaded_values', {}).get(name, default)
+
+    def changed_fields(self):
+        """Tracked fields whose current value differs from the database row (or is not known)"""
+        loaded = getattr(self, '_loaded_values', {})
+        deferred = self.get_deferred_fields()
+        return {
+            name for name in self.tracked_fields
+            if name not in deferred and (name not in loaded or loaded[name] != getattr(self, name))
+        }
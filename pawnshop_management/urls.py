@@ -21,6 +21,7 @@ from django.conf.urls.static import static
 from django.views.generic import TemplateView
 from django.http import JsonResponse
 from django.db.migrations.recorder import MigrationRecorder
+from pawnshop_management.media_store import BLOB_DIR, serve_blob
 
 def migration_status(request):
     """View to check migration status - useful for monitoring if migrations have run"""
@@ -69,10 +70,13 @@ urlpatterns = [
     path('reporting/', include('reporting.urls')),
     path('integrations/', include('integrations.urls')),
     path('schemes/', include('schemes.urls')),  # Schemes management URLs
+    path('search/', include('search.urls')),  # Search across loans, customers and items
     path('api/', include('rest_framework.urls')),
     path('', include('accounts.urls')),  # Default route to accounts app
     # Migration status endpoint - for monitoring migrations
     path('migration-status/', migration_status, name='migration_status'),
+    # Content-addressed photo store, served with long-lived cache headers
+    path(f"{settings.MEDIA_URL.strip('/')}/{BLOB_DIR}/<str:name>", serve_blob, name='media_blob'),
 ]
 
 # Serve media files during development
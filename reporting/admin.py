@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Report, ReportSchedule, ReportExecution, Dashboard, DashboardWidget
+from .models import Report, ReportSchedule, ReportExecution, Dashboard, DashboardWidget, BranchDailyRollup, SchedulerLease
 
 
 class ReportScheduleInline(admin.TabularInline):
@@ -31,10 +31,11 @@ class ReportScheduleAdmin(admin.ModelAdmin):
 
 @admin.register(ReportExecution)
 class ReportExecutionAdmin(admin.ModelAdmin):
-    list_display = ('report', 'executed_by', 'start_time', 'end_time', 'status')
-    list_filter = ('status', 'start_time')
+    list_display = ('report', 'executed_by', 'start_time', 'end_time', 'status', 'output_format', 'row_count')
+    list_filter = ('status', 'output_format', 'start_time')
     search_fields = ('report__name',)
-    readonly_fields = ('report', 'schedule', 'executed_by', 'parameters_used', 'start_time', 'end_time', 'status', 'result_file', 'error_message')
+    readonly_fields = ('report', 'schedule', 'executed_by', 'parameters_used', 'output_format', 'queued_at',
+                       'start_time', 'end_time', 'status', 'result_file', 'row_count', 'file_size', 'error_message')
 
 
 class DashboardWidgetInline(admin.TabularInline):
@@ -61,3 +62,17 @@ class DashboardWidgetAdmin(admin.ModelAdmin):
     list_display = ('title', 'dashboard', 'widget_type', 'chart_type')
     list_filter = ('widget_type', 'chart_type')
     search_fields = ('title', 'dashboard__name')
+
+
+@admin.register(BranchDailyRollup)
+class BranchDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'branch', 'loans_issued', 'principal_issued', 'payments_total', 'sales_total')
+    list_filter = ('branch',)
+    date_hierarchy = 'date'
+    readonly_fields = [field.name for field in BranchDailyRollup._meta.fields]
+
+
+@admin.register(SchedulerLease)
+class SchedulerLeaseAdmin(admin.ModelAdmin):
+    list_display = ('name', 'owner', 'expires_at', 'updated_at')
+    readonly_fields = ('name', 'owner', 'expires_at', 'updated_at')
@@ -0,0 +1,444 @@
+"""
+Report execution engine.
+
+``Report.query_definition`` describes a query over one of the ``SOURCES``::
+
+    {
+        "source": "loans",
+        "columns": ["loan_number", {"field": "customer__first_name", "label": "First Name"}],
+        "filters": [{"field": "issue_date", "op": "gte", "value": {"param": "start_date"}}],
+        "exclude": [{"field": "status", "value": "repaid"}],
+        "group_by": ["branch__name"],
+        "aggregates": [{"func": "sum", "field": "principal_amount", "label": "Principal"}],
+        "order_by": ["-issue_date"],
+        "limit": 1000
+    }
+
+``compile_report`` validates it against the model (only whitelisted sources,
+lookups and aggregates; photo, biometric and password columns are refused)
+and builds an ORM query. ``{"param": name}`` values are taken from the
+execution parameters, falling back to ``Report.parameters``. Rows are limited
+to the branches the executing user may see (``accounts.access``).
+
+``enqueue`` records a queued ``ReportExecution`` for ``run_report_worker``
+to pick up (see ``reporting.report_jobs``); ``execute`` runs one
+synchronously (the worker, the scheduler and the ``run_report`` command use
+it). Rows are read with a server-side iterator and written to a temporary
+file one chunk at a time, then stored in ``result_file``, so a large report
+is never held in memory or run in the request cycle.
+"""
+import datetime
+import itertools
+import os
+import tempfile
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files import File
+from django.db.models import Avg, Count, Max, Min, Q, Sum
+from django.utils import timezone
+
+from accounts.access import restrict_to_branches
+
+from .models import ReportExecution
+
+# source name -> (model label, path to the branch for branch-restricted users)
+SOURCES = {
+    'loans': ('transactions.Loan', 'branch'),
+    'payments': ('transactions.Payment', 'loan__branch'),
+    'extensions': ('transactions.LoanExtension', 'loan__branch'),
+    'sales': ('transactions.Sale', 'branch'),
+    'customers': ('accounts.Customer', 'branch'),
+    'items': ('inventory.Item', 'branch'),
+}
+
+# Source used when a definition does not name one
+REPORT_TYPE_SOURCES = {
+    'sales': 'sales',
+    'inventory': 'items',
+    'loans': 'loans',
+    'payments': 'payments',
+    'customer': 'customers',
+}
+
+# Columns that may never be selected, filtered or traversed
+BLOCKED_FIELDS = {
+    'password', 'profile_photo', 'face_encoding', 'customer_face_capture', 'item_photos',
+    'id_image', 'signature',
+}
+
+LOOKUPS = {
+    'exact', 'iexact', 'contains', 'icontains', 'startswith', 'istartswith', 'endswith', 'iendswith',
+    'in', 'gt', 'gte', 'lt', 'lte', 'range', 'isnull', 'year', 'month', 'day', 'date',
+}
+
+AGGREGATES = {
+    'count': Count,
+    'sum': Sum,
+    'avg': Avg,
+    'min': Min,
+    'max': Max,
+}
+
+# Rows fetched from the database and written per chunk
+CHUNK_SIZE = 2000
+
+
+class ReportDefinitionError(ValueError):
+    """Raised when a query definition is invalid or refers to forbidden fields"""
+
+
+class ReportColumn:
+    """One output column: the values() key, its header and the model field it reads (if any)"""
+
+    def __init__(self, key, label, field=None, aggregate=None):
+        self.key = key
+        self.label = label
+        self.field = field
+        self.aggregate = aggregate
+
+
+class CompiledReport:
+    def __init__(self, queryset, columns):
+        self.queryset = queryset
+        self.columns = columns
+
+    @property
+    def headers(self):
+        return [column.label for column in self.columns]
+
+    def iter_rows(self, chunk_size=CHUNK_SIZE):
+        """Yield result rows as tuples, fetched from the database in chunks"""
+        return self.queryset.values_list(*[column.key for column in self.columns]).iterator(chunk_size=chunk_size)
+
+
+# Compilation
+
+def _resolve_field(model, path):
+    """Return the model field a ``__`` path ends at, refusing blocked or unknown fields"""
+    field = None
+    current = model
+    for name in path.split('__'):
+        if name in BLOCKED_FIELDS:
+            raise ReportDefinitionError(f"Field not allowed in reports: {path}")
+        if current is None:
+            raise ReportDefinitionError(f"Cannot follow {path}: {field.name} is not a relation")
+        try:
+            field = current._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise ReportDefinitionError(f"Unknown field {name!r} in {path}")
+        current = field.related_model if field.is_relation else None
+    if field.many_to_many or field.one_to_many:
+        raise ReportDefinitionError(f"Multi-valued relation cannot be a column: {path}")
+    return field
+
+
+def _resolve_value(value, parameters):
+    if isinstance(value, dict) and 'param' in value:
+        name = value['param']
+        if name not in parameters:
+            if 'default' in value:
+                return value['default']
+            raise ReportDefinitionError(f"Missing report parameter: {name}")
+        return parameters[name]
+    if isinstance(value, list):
+        return [_resolve_value(item, parameters) for item in value]
+    return value
+
+
+def parameter_fields(report):
+    """(name, default) for each parameter a report takes, for run forms"""
+    definition = report.query_definition if isinstance(report.query_definition, dict) else {}
+    defaults = dict(report.parameters or {})
+    names = list(defaults)
+
+    def collect(value):
+        if isinstance(value, dict) and 'param' in value:
+            if value['param'] not in names:
+                names.append(value['param'])
+            defaults.setdefault(value['param'], value.get('default', ''))
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+
+    for spec in (definition.get('filters') or []) + (definition.get('exclude') or []):
+        if isinstance(spec, dict):
+            collect(spec.get('value'))
+    return [(name, defaults[name]) for name in names]
+
+
+def _conditions(model, specs, parameters):
+    condition = Q()
+    for spec in specs or []:
+        if not isinstance(spec, dict) or 'field' not in spec:
+            raise ReportDefinitionError(f"Invalid filter: {spec!r}")
+        op = spec.get('op', 'exact')
+        if op not in LOOKUPS:
+            raise ReportDefinitionError(f"Unsupported filter operator: {op}")
+        _resolve_field(model, spec['field'])
+        condition &= Q(**{f"{spec['field']}__{op}": _resolve_value(spec.get('value'), parameters)})
+    return condition
+
+
+def _column_spec(spec):
+    if isinstance(spec, str):
+        return spec, spec.replace('__', ' ').replace('_', ' ').title()
+    if isinstance(spec, dict) and 'field' in spec:
+        return spec['field'], spec.get('label') or spec['field'].replace('__', ' ').replace('_', ' ').title()
+    raise ReportDefinitionError(f"Invalid column: {spec!r}")
+
+
+def compile_report(report, parameters=None, user=None):
+    """Build the queryset and output columns for a report's query definition"""
+    definition = report.query_definition or {}
+    if not isinstance(definition, dict):
+        raise ReportDefinitionError("query_definition must be an object")
+    parameters = {**(report.parameters or {}), **(parameters or {})}
+
+    source = definition.get('source') or REPORT_TYPE_SOURCES.get(report.report_type)
+    if source not in SOURCES:
+        raise ReportDefinitionError(f"Unknown report source: {source!r}")
+    model_label, branch_path = SOURCES[source]
+    model = apps.get_model(model_label)
+
+    queryset = model._default_manager.all()
+    if user is not None:
+        queryset = restrict_to_branches(queryset, user, branch_path)
+
+    queryset = queryset.filter(_conditions(model, definition.get('filters'), parameters))
+    exclude = _conditions(model, definition.get('exclude'), parameters)
+    if exclude:
+        queryset = queryset.exclude(exclude)
+
+    columns = []
+    aggregates = definition.get('aggregates') or []
+    if aggregates:
+        for spec in definition.get('group_by') or []:
+            key, label = _column_spec(spec)
+            columns.append(ReportColumn(key, label, _resolve_field(model, key)))
+        annotations = {}
+        for index, spec in enumerate(aggregates):
+            func = spec.get('func', 'count') if isinstance(spec, dict) else None
+            if func not in AGGREGATES:
+                raise ReportDefinitionError(f"Unsupported aggregate: {spec!r}")
+            field_path = spec.get('field', 'pk')
+            field = None if field_path == 'pk' else _resolve_field(model, field_path)
+            key = f"agg_{index}"
+            annotations[key] = AGGREGATES[func](field_path)
+            label = spec.get('label') or (func.title() if field_path == 'pk' else f"{func.title()} {field_path}")
+            columns.append(ReportColumn(key, label, field, func))
+        queryset = queryset.values(*[column.key for column in columns if not column.aggregate])
+        queryset = queryset.annotate(**annotations)
+    else:
+        specs = definition.get('columns') or []
+        if not specs:
+            raise ReportDefinitionError("A report needs at least one column or aggregate")
+        for spec in specs:
+            key, label = _column_spec(spec)
+            columns.append(ReportColumn(key, label, _resolve_field(model, key)))
+
+    order_by = definition.get('order_by') or []
+    keys = {column.key for column in columns}
+    for name in order_by:
+        path = name.lstrip('-')
+        if path not in keys:
+            _resolve_field(model, path)
+    queryset = queryset.order_by(*order_by) if order_by else queryset.order_by(*(
+        [] if aggregates else ['pk']
+    ))
+
+    limit = definition.get('limit')
+    if limit:
+        queryset = queryset[:int(limit)]
+
+    return CompiledReport(queryset, columns)
+
+
+# Writers: open a file, take rows chunk by chunk, close
+
+def _plain(value):
+    """Convert values that spreadsheet and CSV writers cannot take as-is"""
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+
+class CSVWriter:
+    extension = 'csv'
+
+    def __init__(self, path, columns):
+        import csv
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([column.label for column in columns])
+
+    def write_rows(self, rows):
+        self.writer.writerows([[_plain(value) for value in row] for row in rows])
+
+    def close(self):
+        self.file.close()
+
+
+class XLSXWriter:
+    extension = 'xlsx'
+
+    def __init__(self, path, columns):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise ReportDefinitionError("XLSX output requires openpyxl (pip install openpyxl)")
+        self.path = path
+        # Write-only workbooks stream rows to disk instead of building the sheet in memory
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('Report')
+        self.sheet.append([column.label for column in columns])
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.sheet.append([_plain(value) for value in row])
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class ParquetWriter:
+    extension = 'parquet'
+
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ReportDefinitionError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.pa = pa
+        self.schema = pa.schema([(column.label, self._arrow_type(column)) for column in columns])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def _arrow_type(self, column):
+        pa = self.pa
+        if column.aggregate == 'count':
+            return pa.int64()
+        if column.aggregate == 'avg':
+            return pa.float64()
+        internal = column.field.get_internal_type() if column.field is not None else ''
+        if internal in ('AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+                        'PositiveIntegerField', 'PositiveBigIntegerField', 'PositiveSmallIntegerField',
+                        'ForeignKey', 'OneToOneField'):
+            return pa.int64()
+        if internal in ('DecimalField', 'FloatField'):
+            return pa.float64()
+        if internal == 'BooleanField':
+            return pa.bool_()
+        if internal == 'DateField' and column.aggregate in (None, 'min', 'max'):
+            return pa.date32()
+        if internal == 'DateTimeField' and column.aggregate in (None, 'min', 'max'):
+            return pa.timestamp('us')
+        return pa.string()
+
+    def _convert(self, value, arrow_type):
+        if value is None:
+            return None
+        if arrow_type == self.pa.float64():
+            return float(value)
+        if arrow_type == self.pa.string():
+            return str(value)
+        return _plain(value)
+
+    def write_rows(self, rows):
+        types = [field.type for field in self.schema]
+        columns = list(zip(*rows)) if rows else [[] for _ in types]
+        arrays = [
+            self.pa.array([self._convert(value, arrow_type) for value in values], type=arrow_type)
+            for values, arrow_type in zip(columns, types)
+        ]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'xlsx': XLSXWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def write_report(compiled, output_format, path, chunk_size=CHUNK_SIZE):
+    """Stream a compiled report into a file at path; returns the number of rows written"""
+    writer = WRITERS[output_format](path, compiled.columns)
+    row_count = 0
+    try:
+        rows = compiled.iter_rows(chunk_size)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            writer.write_rows(chunk)
+            row_count += len(chunk)
+    finally:
+        writer.close()
+    return row_count
+
+
+# Execution
+
+def create_execution(report, user=None, parameters=None, output_format='csv', schedule=None,
+                     status='queued'):
+    """Record an execution of a report; callers running it at once pass status='in_progress'"""
+    if output_format not in WRITERS:
+        raise ReportDefinitionError(f"Unsupported output format: {output_format}")
+    now = timezone.now()
+    return ReportExecution.objects.create(
+        report=report,
+        schedule=schedule,
+        executed_by=user,
+        parameters_used=parameters or {},
+        output_format=output_format,
+        queued_at=now,
+        start_time=now,
+        status=status,
+    )
+
+
+def enqueue(report, user=None, parameters=None, output_format='csv', schedule=None):
+    """Queue an execution for run_report_worker"""
+    return create_execution(report, user, parameters, output_format, schedule)
+
+
+def execute(execution):
+    """Run an execution to completion, recording its result, timings and row count"""
+    execution.status = 'in_progress'
+    execution.start_time = timezone.now()
+    execution.save(update_fields=['status', 'start_time'])
+
+    started = time.monotonic()
+    fd, path = tempfile.mkstemp(suffix=f'.{execution.output_format}', dir=getattr(settings, 'FILE_UPLOAD_TEMP_DIR', None))
+    os.close(fd)
+    try:
+        compiled = compile_report(execution.report, execution.parameters_used, execution.executed_by)
+        row_count = write_report(compiled, execution.output_format, path)
+        filename = f"report_{execution.report_id}_{execution.pk}_{timezone.now():%Y%m%d_%H%M%S}.{execution.output_format}"
+        with open(path, 'rb') as f:
+            execution.result_file.save(filename, File(f), save=False)
+        execution.row_count = row_count
+        execution.file_size = os.path.getsize(path)
+        execution.status = 'success'
+        execution.error_message = None
+    except Exception as e:
+        execution.status = 'failure'
+        execution.error_message = f"{type(e).__name__}: {e}"
+        print(f"Report {execution.report_id} execution {execution.pk} failed: {execution.error_message}")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    execution.end_time = timezone.now()
+    execution.lease_expires_at = None
+    execution.save(update_fields=['status', 'end_time', 'result_file', 'row_count', 'file_size', 'error_message',
+                                  'lease_expires_at'])
+    print(f"Report {execution.report_id} execution {execution.pk}: {execution.status}, "
+          f"{execution.row_count or 0} rows in {time.monotonic() - started:.2f}s")
+    return execution
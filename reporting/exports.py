@@ -0,0 +1,290 @@
+"""
+Streaming exports of whole tables as CSV or NDJSON.
+
+Each entry in ``DATASETS`` names a queryset (with the relations it prints
+joined by ``select_related`` and only the columns it prints loaded), its
+branch path for branch-restricted users and its output columns. ``stream``
+reads the queryset with ``iterator(chunk_size=...)`` (a server-side cursor
+on PostgreSQL) and yields encoded lines, so ``StreamingHttpResponse`` starts
+sending bytes at once and memory stays flat however many rows there are.
+"""
+import csv
+import datetime
+import json
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# Rows fetched per database round trip
+CHUNK_SIZE = 2000
+
+# Rows encoded per chunk handed to the server
+LINES_PER_WRITE = 200
+
+
+class ExportColumn:
+    """One output column: NDJSON key, CSV header and how to read it from an instance
+
+    ``formatter``, when given, turns the value into its CSV text instead of
+    the default formatting; NDJSON always carries the raw value.
+    """
+
+    def __init__(self, key, header, value=None, formatter=None):
+        self.key = key
+        self.header = header
+        self.value = value or (lambda obj, path=key: _follow(obj, path))
+        self.formatter = formatter
+
+
+def _follow(obj, path):
+    for name in path.split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, name)
+    return obj
+
+
+def _person(user):
+    if user is None:
+        return ''
+    return user.get_full_name() or user.username
+
+
+def _log_subject_type(log):
+    if log.user_id:
+        return 'Staff'
+    return 'Customer' if log.customer_id else 'Unknown'
+
+
+def _log_subject(log):
+    if log.user_id:
+        return _person(log.user)
+    return log.customer.full_name if log.customer_id else 'Unknown'
+
+
+# CSV formatters matching the biometric log export's original output
+
+def _utc_timestamp(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _success(value):
+    return 'Success' if value else 'Failed'
+
+
+def _confidence(value):
+    return f"{value:.2f}" if value else 'N/A'
+
+
+def _or_na(value):
+    return value or 'N/A'
+
+
+class Dataset:
+    def __init__(self, name, model, branch_path, columns, related=(), only=(), date_field=None, ordering=('pk',)):
+        self.name = name
+        self.model_label = model
+        self.branch_path = branch_path
+        self.columns = columns
+        self.related = related
+        self.only = only
+        self.date_field = date_field
+        self.ordering = ordering
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def queryset(self, queryset=None):
+        """The export queryset, or queryset (e.g. a list view's filtered one) trimmed for export"""
+        if queryset is None:
+            queryset = self.model._default_manager.all()
+        if self.related:
+            queryset = queryset.select_related(*self.related)
+        if self.only:
+            # The joined relations themselves must stay loaded for select_related
+            queryset = queryset.only(*self.only, *self.related)
+        return queryset.order_by(*self.ordering)
+
+
+DATASETS = {dataset.name: dataset for dataset in [
+    Dataset(
+        'loans', 'transactions.Loan', 'branch',
+        related=('customer', 'branch', 'scheme'),
+        only=('loan_number', 'status', 'principal_amount', 'interest_rate', 'processing_fee',
+              'distribution_amount', 'issue_date', 'due_date', 'grace_period_end', 'created_at',
+              'customer__first_name', 'customer__last_name', 'customer__phone', 'branch__name', 'scheme__name'),
+        date_field='issue_date',
+        columns=[
+            ExportColumn('loan_number', 'Loan Number'),
+            ExportColumn('status', 'Status'),
+            ExportColumn('customer', 'Customer', lambda loan: loan.customer.full_name),
+            ExportColumn('customer_phone', 'Customer Phone', lambda loan: loan.customer.phone),
+            ExportColumn('branch', 'Branch', lambda loan: loan.branch.name),
+            ExportColumn('scheme', 'Scheme', lambda loan: loan.scheme.name if loan.scheme_id else ''),
+            ExportColumn('principal_amount', 'Principal'),
+            ExportColumn('interest_rate', 'Interest Rate'),
+            ExportColumn('processing_fee', 'Processing Fee'),
+            ExportColumn('distribution_amount', 'Distribution Amount'),
+            ExportColumn('issue_date', 'Issue Date'),
+            ExportColumn('due_date', 'Due Date'),
+            ExportColumn('grace_period_end', 'Grace Period End'),
+            ExportColumn('created_at', 'Created At'),
+        ],
+    ),
+    Dataset(
+        'payments', 'transactions.Payment', 'loan__branch',
+        related=('loan', 'loan__branch', 'received_by'),
+        only=('amount', 'payment_date', 'payment_method', 'reference_number', 'notes', 'created_at',
+              'loan__loan_number', 'loan__branch__name',
+              'received_by__username', 'received_by__first_name', 'received_by__last_name'),
+        date_field='payment_date',
+        columns=[
+            ExportColumn('id', 'Payment ID'),
+            ExportColumn('loan_number', 'Loan Number', lambda payment: payment.loan.loan_number),
+            ExportColumn('branch', 'Branch', lambda payment: payment.loan.branch.name),
+            ExportColumn('amount', 'Amount'),
+            ExportColumn('payment_date', 'Payment Date'),
+            ExportColumn('payment_method', 'Method'),
+            ExportColumn('reference_number', 'Reference'),
+            ExportColumn('received_by', 'Received By', lambda payment: _person(payment.received_by)),
+            ExportColumn('notes', 'Notes'),
+            ExportColumn('created_at', 'Created At'),
+        ],
+    ),
+    Dataset(
+        'customers', 'accounts.Customer', 'branch',
+        related=('branch',),
+        only=('first_name', 'last_name', 'email', 'phone', 'address', 'city', 'state', 'zip_code',
+              'id_type', 'id_number', 'created_at', 'branch__name'),
+        date_field='created_at__date',
+        columns=[
+            ExportColumn('id', 'Customer ID'),
+            ExportColumn('first_name', 'First Name'),
+            ExportColumn('last_name', 'Last Name'),
+            ExportColumn('email', 'Email'),
+            ExportColumn('phone', 'Phone'),
+            ExportColumn('branch', 'Branch', lambda customer: customer.branch.name if customer.branch_id else ''),
+            ExportColumn('address', 'Address'),
+            ExportColumn('city', 'City'),
+            ExportColumn('state', 'State'),
+            ExportColumn('zip_code', 'Zip Code'),
+            ExportColumn('id_type', 'ID Type'),
+            ExportColumn('id_number', 'ID Number'),
+            ExportColumn('created_at', 'Created At'),
+        ],
+    ),
+    Dataset(
+        'items', 'inventory.Item', 'branch',
+        related=('category', 'branch'),
+        only=('item_id', 'name', 'serial_number', 'brand', 'model', 'condition', 'year', 'purchase_price',
+              'appraised_value', 'selling_price', 'status', 'created_at', 'category__name', 'branch__name'),
+        date_field='created_at__date',
+        columns=[
+            ExportColumn('item_id', 'Item ID'),
+            ExportColumn('name', 'Name'),
+            ExportColumn('category', 'Category', lambda item: item.category.name if item.category_id else ''),
+            ExportColumn('branch', 'Branch', lambda item: item.branch.name if item.branch_id else ''),
+            ExportColumn('serial_number', 'Serial Number'),
+            ExportColumn('brand', 'Brand'),
+            ExportColumn('model', 'Model'),
+            ExportColumn('condition', 'Condition'),
+            ExportColumn('year', 'Year'),
+            ExportColumn('purchase_price', 'Purchase Price'),
+            ExportColumn('appraised_value', 'Appraised Value'),
+            ExportColumn('selling_price', 'Selling Price'),
+            ExportColumn('status', 'Status'),
+            ExportColumn('created_at', 'Created At'),
+        ],
+    ),
+    Dataset(
+        'face_auth_logs', 'biometrics.FaceAuthLog', 'user__branch',
+        related=('user', 'customer'),
+        only=('timestamp', 'success', 'confidence', 'ip_address', 'device_info',
+              'user__username', 'user__first_name', 'user__last_name',
+              'customer__first_name', 'customer__last_name'),
+        date_field='timestamp__date',
+        ordering=('-timestamp',),
+        columns=[
+            ExportColumn('timestamp', 'Timestamp', formatter=_utc_timestamp),
+            ExportColumn('user_type', 'User Type', _log_subject_type),
+            ExportColumn('name', 'User/Customer', _log_subject),
+            ExportColumn('success', 'Success', formatter=_success),
+            ExportColumn('confidence', 'Confidence', formatter=_confidence),
+            ExportColumn('ip_address', 'IP Address', formatter=_or_na),
+            ExportColumn('device_info', 'Device Info', formatter=_or_na),
+        ],
+    ),
+]}
+
+
+# Encoders: each takes the columns and an iterator of instances and yields text
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if value is None:
+        return ''
+    return value
+
+
+class _Line:
+    """File-like object whose write() hands back the formatted line"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, objects):
+    writer = csv.writer(_Line())
+    formatters = [column.formatter or _csv_value for column in columns]
+    yield writer.writerow([column.header for column in columns])
+    for obj in objects:
+        yield writer.writerow([format_value(column.value(obj)) for column, format_value in zip(columns, formatters)])
+
+
+def ndjson_lines(columns, objects):
+    for obj in objects:
+        yield json.dumps({column.key: column.value(obj) for column in columns}, cls=DjangoJSONEncoder) + '\n'
+
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv; charset=utf-8'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
+
+
+def stream(columns, queryset, output_format='csv', chunk_size=CHUNK_SIZE):
+    """Yield an export as encoded chunks of LINES_PER_WRITE lines; the first line goes out alone"""
+    encode, _ = FORMATS[output_format]
+    lines = encode(columns, queryset.iterator(chunk_size=chunk_size))
+    # The CSV header is produced before the query runs, so the download starts at once
+    for line in lines:
+        yield line.encode('utf-8')
+        break
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= LINES_PER_WRITE:
+            yield ''.join(batch).encode('utf-8')
+            batch = []
+    if batch:
+        yield ''.join(batch).encode('utf-8')
+
+
+def streaming_response(columns, queryset, output_format, filename):
+    """A StreamingHttpResponse that downloads the export as filename.<format>"""
+    if output_format not in FORMATS:
+        raise ValueError(f"Unsupported export format: {output_format}")
+    response = StreamingHttpResponse(
+        stream(columns, queryset, output_format),
+        content_type=FORMATS[output_format][1],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output_format}"'
+    # Keep proxies from buffering the whole body before passing it on
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import CustomUser
+from reporting import engine
+from reporting.models import Report
+
+
+class Command(BaseCommand):
+    help = 'Run a saved report and store its result file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('report_id', type=int, help='ID of the report to run')
+        parser.add_argument(
+            '--format',
+            choices=sorted(engine.WRITERS),
+            default='csv',
+            help='Output format (default: csv)'
+        )
+        parser.add_argument(
+            '--params',
+            default='{}',
+            help='Report parameters as a JSON object, e.g. \'{"start_date": "2025-01-01"}\''
+        )
+        parser.add_argument(
+            '--user',
+            help='Username to run as; branch restrictions of that user apply (default: unrestricted)'
+        )
+
+    def handle(self, *args, **options):
+        report = Report.objects.filter(pk=options['report_id']).first()
+        if report is None:
+            raise CommandError(f"Report not found: {options['report_id']}")
+        try:
+            parameters = json.loads(options['params'])
+        except json.JSONDecodeError as e:
+            raise CommandError(f"--params is not valid JSON: {e}")
+
+        user = None
+        if options['user']:
+            user = CustomUser.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"User not found: {options['user']}")
+
+        execution = engine.create_execution(report, user, parameters, options['format'], status='in_progress')
+        engine.execute(execution)
+
+        if execution.status != 'success':
+            raise CommandError(f"Report failed: {execution.error_message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {execution.row_count} rows to {execution.result_file.name} "
+            f"in {execution.duration.total_seconds():.2f}s"
+        ))
@@ -0,0 +1,63 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from reporting import report_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued report executions and store their result files (long-running)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'REPORT_WORKERS', 2),
+            help='Reports run at the same time (default: REPORT_WORKERS)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=2,
+            help='Seconds to wait when the queue is empty (default: 2)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Work through the queue once and exit'
+        )
+
+    def handle(self, *args, **options):
+        runner = report_jobs.ReportRunner(workers=max(options['workers'], 1))
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Stopping after the current batch...")
+            stop.set()
+
+        if not options['once']:
+            signal.signal(signal.SIGTERM, request_stop)
+            signal.signal(signal.SIGINT, request_stop)
+            self.stdout.write(f"Report worker {runner.owner} started: {runner.workers} worker(s)")
+
+        total = 0
+        try:
+            while not stop.is_set():
+                try:
+                    processed = runner.run_once()
+                except Exception as e:
+                    # A database hiccup should not kill the worker; retry after the interval
+                    print(f"Report worker round failed: {e}")
+                    connection.close()
+                    processed = 0
+                total += processed
+                if processed:
+                    continue
+                if options['once'] or stop.wait(max(options['interval'], 1)):
+                    break
+        finally:
+            runner.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Ran {total} report execution(s)"))
@@ -0,0 +1,79 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from reporting import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Run due report schedules and e-mail their results (long-running)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'REPORT_SCHEDULER_WORKERS', 2),
+            help='Scheduled reports run at the same time (default: REPORT_SCHEDULER_WORKERS)'
+        )
+        parser.add_argument(
+            '--catch-up',
+            choices=scheduler.CATCH_UP_POLICIES,
+            default=getattr(settings, 'REPORT_SCHEDULER_CATCH_UP', scheduler.CATCH_UP_LATEST),
+            help='Runs missed while the scheduler was down: skip them, run the latest once, or run each'
+        )
+        parser.add_argument(
+            '--max-catch-up',
+            type=int,
+            default=10,
+            help='With --catch-up=all, most missed runs replayed per schedule (default: 10)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=30,
+            help='Seconds between checks for due schedules (default: 30)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Dispatch due schedules once, wait for them and exit'
+        )
+
+    def handle(self, *args, **options):
+        runner = scheduler.Scheduler(
+            workers=max(options['workers'], 1),
+            catch_up=options['catch_up'],
+            max_catch_up=max(options['max_catch_up'], 1),
+            tick=max(options['interval'], 1),
+        )
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Stopping after running reports finish...")
+            stop.set()
+
+        if not options['once']:
+            signal.signal(signal.SIGTERM, request_stop)
+            signal.signal(signal.SIGINT, request_stop)
+            self.stdout.write(
+                f"Scheduler {runner.owner} started: {runner.workers} worker(s), "
+                f"catch-up {runner.catch_up}, every {runner.tick}s"
+            )
+
+        total = 0
+        try:
+            while True:
+                try:
+                    total += runner.run_once()
+                except Exception as e:
+                    # A database hiccup should not kill the scheduler; retry next tick
+                    print(f"Scheduler tick failed: {e}")
+                    connection.close()
+                if options['once'] or stop.wait(runner.tick):
+                    break
+        finally:
+            runner.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Dispatched {total} scheduled run(s)"))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0003_sequence'),
+        ('reporting', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('loans_issued', models.PositiveIntegerField(default=0)),
+                ('principal_issued', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('interest_accrued', models.DecimalField(decimal_places=2, default=0, help_text='Interest at the loan rate on the principal issued that day', max_digits=14)),
+                ('active_principal', models.DecimalField(decimal_places=2, default=0, help_text='Principal of loans issued that day that are still active', max_digits=14)),
+                ('payments_count', models.PositiveIntegerField(default=0)),
+                ('payments_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('sales_count', models.PositiveIntegerField(default=0)),
+                ('sales_total', models.DecimalField(decimal_places=2, default=0, help_text='Total amount of completed sales', max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='branches.branch')),
+            ],
+            options={
+                'verbose_name': 'branch daily rollup',
+                'verbose_name_plural': 'branch daily rollups',
+                'ordering': ['-date', 'branch'],
+                'constraints': [models.UniqueConstraint(fields=('branch', 'date'), name='unique_branch_daily_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0002_branchdailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportexecution',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Size of the result file in bytes', null=True),
+        ),
+        migrations.AddField(
+            model_name='reportexecution',
+            name='output_format',
+            field=models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel (XLSX)'), ('parquet', 'Parquet')], default='csv', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='reportexecution',
+            name='queued_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reportexecution',
+            name='row_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='reportexecution',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('success', 'Success'), ('failure', 'Failure'), ('in_progress', 'In Progress')], default='in_progress', max_length=20),
+        ),
+    ]
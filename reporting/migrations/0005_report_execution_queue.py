@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def requeue_started_executions(apps, schema_editor):
+    # Runs started by the old in-process pool died with it; run_report_worker picks them up again
+    ReportExecution = apps.get_model('reporting', 'ReportExecution')
+    ReportExecution.objects.filter(status='in_progress').update(status='queued')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0004_schedulerlease'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportexecution',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reportexecution',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reportexecution',
+            name='worker',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='reportexecution',
+            index=models.Index(fields=['status', 'id'], name='report_execution_status_idx'),
+        ),
+        migrations.RunPython(requeue_started_executions, migrations.RunPython.noop),
+    ]
@@ -69,11 +69,18 @@ class ReportSchedule(models.Model):
 class ReportExecution(models.Model):
     """Log of report executions"""
     STATUS_CHOICES = [
+        ('queued', 'Queued'),
         ('success', 'Success'),
         ('failure', 'Failure'),
         ('in_progress', 'In Progress'),
     ]
     
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)'),
+        ('parquet', 'Parquet'),
+    ]
+    
     report = models.ForeignKey(Report, on_delete=models.CASCADE, related_name='executions')
     schedule = models.ForeignKey(ReportSchedule, on_delete=models.SET_NULL, null=True, blank=True, related_name='executions')
     executed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
@@ -83,14 +90,47 @@ class ReportExecution(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
     result_file = models.FileField(upload_to='report_results/', null=True, blank=True)
     error_message = models.TextField(blank=True, null=True)
+    output_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    queued_at = models.DateTimeField(null=True, blank=True)
+    row_count = models.PositiveIntegerField(null=True, blank=True)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True, help_text=_('Size of the result file in bytes'))
+    # Queue bookkeeping for run_report_worker (see reporting.report_jobs)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         verbose_name = _('report execution')
         verbose_name_plural = _('report executions')
         ordering = ['-start_time']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='report_execution_status_idx'),
+        ]
     
     def __str__(self):
         return f"Execution of {self.report.name} at {self.start_time}"
+    
+    @property
+    def duration(self):
+        """Run time as a timedelta, once the execution has finished"""
+        if self.end_time and self.start_time:
+            return self.end_time - self.start_time
+        return None
+
+
+class SchedulerLease(models.Model):
+    """Database lease held by the one run_scheduler process allowed to dispatch schedules"""
+    name = models.CharField(max_length=50, unique=True)
+    owner = models.CharField(max_length=200, blank=True, help_text=_('host:pid of the process holding the lease'))
+    expires_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = _('scheduler lease')
+        verbose_name_plural = _('scheduler leases')
+    
+    def __str__(self):
+        return f"{self.name} held by {self.owner or 'nobody'}"
 
 
 class Dashboard(models.Model):
@@ -149,3 +189,113 @@ class DashboardWidget(models.Model):
     
     def __str__(self):
         return f"{self.title} on {self.dashboard.name}"
+
+
+class BranchDailyRollup(models.Model):
+    """Per-branch totals for one day, maintained by reporting.rollups.
+
+    Dashboards aggregate these rows instead of the loan, payment and sale
+    tables. Loan facts are dated by when the loan was created, payments by
+    payment date and sales by sale date.
+    """
+    branch = models.ForeignKey('branches.Branch', on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+
+    loans_issued = models.PositiveIntegerField(default=0)
+    principal_issued = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    interest_accrued = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0,
+        help_text=_('Interest at the loan rate on the principal issued that day')
+    )
+    active_principal = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0,
+        help_text=_('Principal of loans issued that day that are still active')
+    )
+    payments_count = models.PositiveIntegerField(default=0)
+    payments_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sales_count = models.PositiveIntegerField(default=0)
+    sales_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0,
+        help_text=_('Total amount of completed sales')
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('branch daily rollup')
+        verbose_name_plural = _('branch daily rollups')
+        ordering = ['-date', 'branch']
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'date'], name='unique_branch_daily_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.branch_id} on {self.date}"
+
+
+# Signal handlers keeping BranchDailyRollup in step with loan, payment and sale writes.
+# pre_save remembers the day a row is moving away from, so both days are refreshed.
+from types import SimpleNamespace
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from transactions.models import Loan, Payment, Sale
+
+ROLLUP_SOURCES = {Loan: 'loans', Payment: 'payments', Sale: 'sales'}
+
+_UNKNOWN = object()
+
+
+def _rollup_keys(sender, rows):
+    from . import rollups
+    key_functions = {Loan: rollups.loan_keys, Payment: rollups.payment_keys, Sale: rollups.sale_keys}
+    return key_functions[sender](rows)
+
+
+# Columns the buckets of loans and sales come from, remembered when the row is loaded
+# (see pawnshop_management.tracking); payments need their loan's branch, so they are queried
+ROLLUP_KEY_FIELDS = {Loan: ('branch_id', 'created_at'), Sale: ('branch_id', 'sale_date')}
+
+
+def _loaded_rollup_keys(sender, instance):
+    """Buckets of the row as last loaded or saved, or None when the instance does not know them"""
+    fields = ROLLUP_KEY_FIELDS.get(sender)
+    if fields is None:
+        return None
+    loaded = {name: instance.loaded_value(name, _UNKNOWN) for name in fields}
+    if _UNKNOWN in loaded.values():
+        return None
+    return _rollup_keys(sender, [SimpleNamespace(**loaded)])
+
+
+@receiver(pre_save, sender=Loan)
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=Sale)
+def remember_rollup_keys(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        instance._rollup_keys = set()
+        return
+    keys = _loaded_rollup_keys(sender, instance)
+    instance._rollup_keys = keys if keys is not None else _rollup_keys(sender, sender.objects.filter(pk=instance.pk))
+    if sender is Loan and any(branch_id != instance.branch_id for branch_id, _ in instance._rollup_keys):
+        # Payments are rolled up under their loan's branch, so they move with it
+        from . import rollups
+        instance._rollup_payment_keys = rollups.payment_keys(Payment.objects.filter(loan_id=instance.pk))
+
+
+@receiver(post_save, sender=Loan)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Loan)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Sale)
+def refresh_rollups(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from . import rollups
+    keys = _rollup_keys(sender, [instance]) | getattr(instance, '_rollup_keys', set())
+    rollups.refresh(ROLLUP_SOURCES[sender], keys)
+    payment_keys = getattr(instance, '_rollup_payment_keys', None)
+    if payment_keys is not None:
+        del instance._rollup_payment_keys
+        payment_keys |= rollups.payment_keys(Payment.objects.filter(loan_id=instance.pk))
+        rollups.refresh(rollups.PAYMENTS, payment_keys)
@@ -0,0 +1,120 @@
+"""
+Background report execution queue.
+
+``engine.enqueue`` records a ``ReportExecution`` with status ``queued``; the
+table is the queue, so runs survive restarts and no web process holds them.
+``run_report_worker`` (a ``ReportRunner``) loops as follows:
+
+1. Requeue running executions whose lease expired because their worker
+   died. Retries stop after MAX_ATTEMPTS.
+2. Claim up to ``REPORT_WORKERS`` queued executions with a conditional
+   UPDATE. Several workers never take the same execution.
+3. Run each one with ``engine.execute`` on a thread pool, renewing the
+   leases of the runs still going every RENEW_SECONDS, so a long report is
+   not taken over while it is being written.
+
+Result files go to MEDIA_ROOT; the worker must see the same media storage as
+the web processes. ``start.sh`` runs it beside the web server.
+"""
+import datetime
+import os
+import socket
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from . import engine
+from .models import ReportExecution
+
+# Seconds a claimed execution may go without a renewal before another worker retries it
+LEASE_SECONDS = 300
+
+# Seconds between lease renewals while executions are running
+RENEW_SECONDS = 60
+
+MAX_ATTEMPTS = 3
+
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def requeue_expired(now=None):
+    """Put executions of dead workers back in the queue; returns (requeued, failed)"""
+    now = now or timezone.now()
+    expired = ReportExecution.objects.filter(status='in_progress', lease_expires_at__lt=now)
+    failed = expired.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status='failure', error_message='Report worker stopped responding', end_time=now, lease_expires_at=None
+    )
+    requeued = expired.update(status='queued', worker='', lease_expires_at=None)
+    return requeued, failed
+
+
+def claim(owner, limit, now=None):
+    """Take up to limit queued executions for owner, oldest first"""
+    now = now or timezone.now()
+    pks = list(ReportExecution.objects.filter(status='queued')
+               .order_by('pk').values_list('pk', flat=True)[:limit])
+    if not pks:
+        return []
+    # Only rows still queued are taken, so an execution claimed by another worker in between is skipped
+    ReportExecution.objects.filter(pk__in=pks, status='queued').update(
+        status='in_progress',
+        worker=owner,
+        attempts=F('attempts') + 1,
+        lease_expires_at=now + datetime.timedelta(seconds=LEASE_SECONDS),
+    )
+    return list(ReportExecution.objects.filter(pk__in=pks, status='in_progress', worker=owner)
+                .select_related('report', 'executed_by').order_by('pk'))
+
+
+def renew(owner, now=None):
+    """Extend the leases of every execution owner is running"""
+    now = now or timezone.now()
+    return ReportExecution.objects.filter(status='in_progress', worker=owner).update(
+        lease_expires_at=now + datetime.timedelta(seconds=LEASE_SECONDS)
+    )
+
+
+def run_execution(execution):
+    """Run one claimed execution; runs on a pool thread"""
+    try:
+        engine.execute(execution)
+    except Exception as e:
+        print(f"Report execution {execution.pk} failed to run: {e}")
+    finally:
+        # Pool threads keep their own connection; don't leave it open between runs
+        connection.close()
+
+
+class ReportRunner:
+    """Claim queued executions and run them on a thread pool"""
+
+    def __init__(self, workers=None, owner=None):
+        self.workers = workers or getattr(settings, 'REPORT_WORKERS', 2)
+        self.owner = owner or default_owner()
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='report-run')
+
+    def run_once(self):
+        """Run one batch to completion; returns the number of executions processed"""
+        requeued, failed = requeue_expired()
+        if requeued or failed:
+            print(f"Requeued {requeued} and failed {failed} report execution(s) with expired leases")
+
+        executions = claim(self.owner, self.workers)
+        pending = {self.pool.submit(run_execution, execution) for execution in executions}
+        while pending:
+            _done, pending = wait(pending, timeout=RENEW_SECONDS, return_when=FIRST_COMPLETED)
+            if pending:
+                renew(self.owner)
+        return len(executions)
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+        # Executions this worker still holds go straight back to the queue
+        (ReportExecution.objects
+         .filter(status='in_progress', worker=self.owner)
+         .update(status='queued', worker='', lease_expires_at=None))
@@ -0,0 +1,213 @@
+"""
+Materialized per-branch daily facts for the reporting dashboards.
+
+``BranchDailyRollup`` holds one row per branch and day. Each source table owns
+a group of its columns:
+
+- loans (by creation date): loans_issued, principal_issued, interest_accrued,
+  active_principal
+- payments (by payment date, branch of the loan): payments_count, payments_total
+- sales (by sale date, completed only): sales_count, sales_total
+
+Signals in ``reporting.models`` call ``refresh`` for the days a write touched,
+which recomputes only that source's columns for those days. ``backfill``
+rebuilds a whole date range with one grouped query per source; the
+``backfill_rollups`` command runs it for existing data.
+"""
+import datetime
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import BranchDailyRollup
+
+LOANS = 'loans'
+PAYMENTS = 'payments'
+SALES = 'sales'
+
+FACT_FIELDS = {
+    LOANS: ('loans_issued', 'principal_issued', 'interest_accrued', 'active_principal'),
+    PAYMENTS: ('payments_count', 'payments_total'),
+    SALES: ('sales_count', 'sales_total'),
+}
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+CENT = Decimal('0.01')
+
+
+def _money(value):
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def _local_date(value):
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _day_bounds(start, end):
+    """Aware datetimes spanning local days start..end inclusive"""
+    return (
+        timezone.make_aware(datetime.datetime.combine(start, datetime.time.min)),
+        timezone.make_aware(datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min)),
+    )
+
+
+# Fact queries: {(branch_id, date): {field: value}} for rows matching a filter
+
+def _loan_facts(start, end, branch_ids=None):
+    from transactions.models import Loan
+
+    lower, upper = _day_bounds(start, end)
+    loans = Loan.objects.filter(created_at__gte=lower, created_at__lt=upper)
+    if branch_ids is not None:
+        loans = loans.filter(branch_id__in=branch_ids)
+    rows = (loans.order_by()
+            .values('branch_id', day=TruncDate('created_at'))
+            .annotate(
+                loans_issued=Count('id'),
+                principal_issued=Sum('principal_amount'),
+                interest_accrued=Sum(ExpressionWrapper(
+                    F('principal_amount') * F('interest_rate') / Value(100), output_field=MONEY
+                )),
+                active_principal=Sum('principal_amount', filter=Q(status='active')),
+            ))
+    return {
+        (row['branch_id'], row['day']): {
+            'loans_issued': row['loans_issued'],
+            'principal_issued': _money(row['principal_issued']),
+            'interest_accrued': _money(row['interest_accrued']),
+            'active_principal': _money(row['active_principal']),
+        }
+        for row in rows
+    }
+
+
+def _payment_facts(start, end, branch_ids=None):
+    from transactions.models import Payment
+
+    payments = Payment.objects.filter(payment_date__gte=start, payment_date__lte=end)
+    if branch_ids is not None:
+        payments = payments.filter(loan__branch_id__in=branch_ids)
+    rows = (payments.order_by()
+            .values('loan__branch_id', 'payment_date')
+            .annotate(payments_count=Count('id'), payments_total=Sum('amount')))
+    return {
+        (row['loan__branch_id'], row['payment_date']): {
+            'payments_count': row['payments_count'],
+            'payments_total': _money(row['payments_total']),
+        }
+        for row in rows
+    }
+
+
+def _sale_facts(start, end, branch_ids=None):
+    from transactions.models import Sale
+
+    sales = Sale.objects.filter(sale_date__gte=start, sale_date__lte=end, status='completed')
+    if branch_ids is not None:
+        sales = sales.filter(branch_id__in=branch_ids)
+    rows = (sales.order_by()
+            .values('branch_id', 'sale_date')
+            .annotate(sales_count=Count('id'), sales_total=Sum('total_amount')))
+    return {
+        (row['branch_id'], row['sale_date']): {
+            'sales_count': row['sales_count'],
+            'sales_total': _money(row['sales_total']),
+        }
+        for row in rows
+    }
+
+
+FACT_QUERIES = {
+    LOANS: _loan_facts,
+    PAYMENTS: _payment_facts,
+    SALES: _sale_facts,
+}
+
+
+# Bucket keys touched by a source row
+
+def loan_keys(loans):
+    """(branch_id, date) of each loan in a queryset or list of instances"""
+    if hasattr(loans, 'values_list'):
+        loans = loans.values_list('branch_id', 'created_at')
+    else:
+        loans = [(loan.branch_id, loan.created_at) for loan in loans]
+    return {(branch_id, _local_date(created_at)) for branch_id, created_at in loans if created_at}
+
+
+def payment_keys(payments):
+    if hasattr(payments, 'values_list'):
+        return set(payments.values_list('loan__branch_id', 'payment_date'))
+    from transactions.models import Loan
+    branches = dict(Loan.objects.filter(pk__in={p.loan_id for p in payments}).values_list('pk', 'branch_id'))
+    return {(branches[p.loan_id], _local_date(p.payment_date)) for p in payments if p.loan_id in branches}
+
+
+def sale_keys(sales):
+    if hasattr(sales, 'values_list'):
+        return set(sales.values_list('branch_id', 'sale_date'))
+    return {(sale.branch_id, _local_date(sale.sale_date)) for sale in sales}
+
+
+# Maintenance
+
+def refresh(source, keys):
+    """Recompute one source's columns for the given (branch_id, date) buckets"""
+    for branch_id, day in {key for key in keys if key[0] and key[1]}:
+        values = FACT_QUERIES[source](day, day, [branch_id]).get((branch_id, day))
+        if values is None:
+            # Nothing left for this source on that day
+            values = {field: 0 for field in FACT_FIELDS[source]}
+            BranchDailyRollup.objects.filter(branch_id=branch_id, date=day).update(**values)
+            continue
+        rollup = BranchDailyRollup.objects.filter(branch_id=branch_id, date=day)
+        if rollup.update(**values, updated_at=timezone.now()):
+            continue
+        try:
+            with transaction.atomic():
+                BranchDailyRollup.objects.create(branch_id=branch_id, date=day, **values)
+        except IntegrityError:
+            # Created concurrently by another writer
+            rollup.update(**values, updated_at=timezone.now())
+
+
+def backfill(start, end, branch_ids=None):
+    """Rebuild every rollup row from start to end (inclusive); returns rows written"""
+    facts = {}
+    for source, query in FACT_QUERIES.items():
+        for key, values in query(start, end, branch_ids).items():
+            facts.setdefault(key, {}).update(values)
+
+    with transaction.atomic():
+        existing = BranchDailyRollup.objects.filter(date__gte=start, date__lte=end)
+        if branch_ids is not None:
+            existing = existing.filter(branch_id__in=branch_ids)
+        existing.delete()
+        BranchDailyRollup.objects.bulk_create(
+            [BranchDailyRollup(branch_id=branch_id, date=day, **values)
+             for (branch_id, day), values in sorted(facts.items())],
+            batch_size=1000,
+        )
+    return len(facts)
+
+
+def source_date_range():
+    """Earliest and latest day with any loan, payment or sale, or None"""
+    from django.db.models import Max, Min
+    from transactions.models import Loan, Payment, Sale
+
+    bounds = [
+        Loan.objects.aggregate(first=Min('created_at'), last=Max('created_at')),
+        Payment.objects.aggregate(first=Min('payment_date'), last=Max('payment_date')),
+        Sale.objects.aggregate(first=Min('sale_date'), last=Max('sale_date')),
+    ]
+    firsts = [_local_date(b['first']) for b in bounds if b['first']]
+    lasts = [_local_date(b['last']) for b in bounds if b['last']]
+    if not firsts:
+        return None
+    return min(firsts), max(lasts)
@@ -0,0 +1,337 @@
+"""
+Scheduler for ReportSchedule, run by the ``run_scheduler`` management command.
+
+Every tick the scheduler:
+
+1. Takes or renews a lease row in ``SchedulerLease``. Only the lease holder
+   dispatches, so several web dynos can each run a scheduler safely; if the
+   holder dies its lease expires and another process takes over.
+2. Works out the runs each active schedule missed since ``last_run`` (local
+   time, ``TIME_ZONE``) and applies the catch-up policy:
+   ``none`` skips anything older than one tick, ``latest`` runs once for all
+   missed runs, ``all`` runs each missed run up to a limit.
+3. Claims each run with a conditional UPDATE of ``last_run``, so a run is
+   dispatched once even if two schedulers overlap, then executes it on a
+   bounded thread pool and e-mails the result to the recipients. Runs of
+   one schedule never overlap: a schedule with several runs due (catch-up
+   ``all``) gets one per tick, after the previous one has finished.
+
+Once per local day the lease holder also reconciles scheme statuses with
+their start and end dates (``Scheme.reconcile_statuses``) and then runs the
+loan lifecycle (``transactions.lifecycle.run``). Each job that fails is
+logged and retried on the next tick; dispatch goes on regardless. The
+lifecycle renews the lease after every branch and stops the tick if the
+lease was lost meanwhile.
+
+Only the database and the filesystem are needed. The ``Procfile`` and
+``render.yaml`` declare it as the ``scheduler`` worker process.
+"""
+import calendar
+import datetime
+import logging
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import engine
+from .models import ReportSchedule, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'report-scheduler'
+
+CATCH_UP_NONE = 'none'
+CATCH_UP_LATEST = 'latest'
+CATCH_UP_ALL = 'all'
+CATCH_UP_POLICIES = (CATCH_UP_NONE, CATCH_UP_LATEST, CATCH_UP_ALL)
+
+# Results larger than this are not attached to schedule e-mails
+EMAIL_ATTACHMENT_LIMIT = 10 * 1024 * 1024
+
+QUARTER_MONTHS = (1, 4, 7, 10)
+
+
+class LeaseLost(RuntimeError):
+    """Raised when the scheduler lease passes to another process mid-job"""
+
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# Lease
+
+def acquire_lease(owner, ttl, now=None):
+    """Take or renew the scheduler lease; True when owner holds it until now + ttl"""
+    now = now or timezone.now()
+    expires_at = now + datetime.timedelta(seconds=ttl)
+    taken = (SchedulerLease.objects
+             .filter(name=LEASE_NAME)
+             .filter(Q(owner=owner) | Q(expires_at__isnull=True) | Q(expires_at__lt=now))
+             .update(owner=owner, expires_at=expires_at, updated_at=now))
+    if taken:
+        return True
+    try:
+        with transaction.atomic():
+            SchedulerLease.objects.create(name=LEASE_NAME, owner=owner, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        # The lease exists and someone else holds it
+        return False
+
+
+def release_lease(owner):
+    SchedulerLease.objects.filter(name=LEASE_NAME, owner=owner).update(expires_at=None)
+
+
+# Schedule arithmetic (local time)
+
+def _on_day(year, month, day):
+    """Date for day of month, clamped to the month's last day"""
+    return datetime.date(year, month, min(max(day or 1, 1), calendar.monthrange(year, month)[1]))
+
+
+def _add_months(year, month, months):
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+
+def _candidate_dates(schedule, start):
+    """Dates the schedule fires on, from the period containing start onwards"""
+    frequency = schedule.frequency
+    if frequency == 'daily':
+        day = start
+        while True:
+            yield day
+            day += datetime.timedelta(days=1)
+    elif frequency == 'weekly':
+        weekday = schedule.day_of_week if schedule.day_of_week is not None else 0
+        day = start - datetime.timedelta(days=(start.weekday() - weekday) % 7)
+        while True:
+            yield day
+            day += datetime.timedelta(days=7)
+    else:
+        if frequency == 'monthly':
+            months = None
+        elif frequency == 'quarterly':
+            months = QUARTER_MONTHS
+        else:
+            # Annual schedules fire in the month they were created
+            months = (timezone.localtime(schedule.created_at).month if schedule.created_at else 1,)
+        year, month = start.year, start.month
+        while True:
+            if months is None or month in months:
+                yield _on_day(year, month, schedule.day_of_month)
+            year, month = _add_months(year, month, 1)
+
+
+def runs_between(schedule, after, until):
+    """Fire times in (after, until], as aware datetimes"""
+    local_after = timezone.localtime(after)
+    runs = []
+    # Start one period early so a run later on the same day/week/month is not missed
+    start = local_after.date() - datetime.timedelta(days=1)
+    if schedule.frequency not in ('daily', 'weekly'):
+        start = start.replace(day=1)
+    for day in _candidate_dates(schedule, start):
+        fire = timezone.make_aware(datetime.datetime.combine(day, schedule.time_of_day))
+        if fire > until:
+            break
+        if fire > after:
+            runs.append(fire)
+    return runs
+
+
+def next_run(schedule, now=None):
+    """Next fire time after last_run (or now, for a schedule that has never run)"""
+    now = now or timezone.now()
+    after = schedule.last_run or now
+    # Look far enough ahead for the longest period
+    horizon = after + datetime.timedelta(days=400)
+    runs = runs_between(schedule, after, horizon)
+    return runs[0] if runs else None
+
+
+def due_runs(schedule, now, catch_up, max_catch_up, tick):
+    """Fire times to dispatch now for one schedule under the catch-up policy"""
+    after = schedule.last_run or schedule.created_at or now
+    missed = runs_between(schedule, after, now)
+    if not missed:
+        return []
+    if catch_up == CATCH_UP_ALL:
+        return missed[-max_catch_up:]
+    if catch_up == CATCH_UP_LATEST:
+        return missed[-1:]
+    # none: only a run that became due within the last tick; older ones are skipped
+    latest = missed[-1]
+    if now - latest <= datetime.timedelta(seconds=tick * 2):
+        return [latest]
+    claim(schedule, latest)
+    print(f"Skipping {len(missed)} missed run(s) of schedule {schedule.pk} (catch-up disabled)")
+    return []
+
+
+def claim(schedule, fire):
+    """Move last_run forward to fire unless another scheduler already has; True if claimed"""
+    claimed = (ReportSchedule.objects
+               .filter(pk=schedule.pk)
+               .filter(Q(last_run__isnull=True) | Q(last_run__lt=fire))
+               .update(last_run=fire))
+    if claimed:
+        schedule.last_run = fire
+    return bool(claimed)
+
+
+# Dispatch
+
+def run_schedule(schedule_pk, fire):
+    """Execute one scheduled run and e-mail the result; runs on a pool thread"""
+    try:
+        schedule = ReportSchedule.objects.select_related('report', 'report__created_by').get(pk=schedule_pk)
+        execution = engine.create_execution(
+            schedule.report,
+            user=schedule.report.created_by,
+            parameters={'scheduled_for': timezone.localtime(fire).isoformat()},
+            schedule=schedule,
+            status='in_progress',
+        )
+        engine.execute(execution)
+        send_result(schedule, execution)
+    except Exception as e:
+        print(f"Scheduled run of schedule {schedule_pk} for {fire} failed: {e}")
+    finally:
+        connection.close()
+
+
+def send_result(schedule, execution):
+    recipients = [email for email in schedule.recipients.values_list('email', flat=True) if email]
+    if not recipients:
+        return
+    body = schedule.email_body or ''
+    if execution.status == 'success':
+        body += f"\n\n{execution.report.name}: {execution.row_count} rows."
+    else:
+        body += f"\n\n{execution.report.name} failed: {execution.error_message}"
+    message = EmailMessage(
+        subject=schedule.email_subject,
+        body=body.strip(),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=recipients,
+    )
+    if execution.status == 'success' and execution.file_size and execution.file_size <= EMAIL_ATTACHMENT_LIMIT:
+        with execution.result_file.open('rb') as f:
+            message.attach(os.path.basename(execution.result_file.name), f.read())
+    elif execution.status == 'success':
+        message.body += "\nThe result is too large to attach; download it from the Reports page."
+    message.send(fail_silently=False)
+
+
+class Scheduler:
+    """Dispatch due schedules to a bounded pool while this process holds the lease"""
+
+    def __init__(self, workers=2, catch_up=CATCH_UP_LATEST, max_catch_up=10, tick=30, owner=None):
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"Unknown catch-up policy: {catch_up}")
+        self.workers = workers
+        self.catch_up = catch_up
+        self.max_catch_up = max_catch_up
+        self.tick = tick
+        self.owner = owner or default_owner()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-schedule')
+        # schedule pk -> futures still running, so a slow report is not started twice at once
+        self.running = {}
+        self.schemes_reconciled_on = None
+        self.lifecycle_run_on = None
+
+    def lease_ttl(self):
+        # Outlive a couple of missed ticks before another process may take over
+        return self.tick * 3
+
+    def in_flight(self):
+        """Number of runs still executing; forgets finished ones"""
+        running = {}
+        for pk, futures in self.running.items():
+            futures = [future for future in futures if not future.done()]
+            if futures:
+                running[pk] = futures
+        self.running = running
+        return sum(len(futures) for futures in running.values())
+
+    def run_once(self, now=None):
+        """One scheduler tick; returns the number of runs dispatched"""
+        now = now or timezone.now()
+        if not acquire_lease(self.owner, self.lease_ttl(), now):
+            return 0
+
+        # A failing daily job is retried next tick and never holds up report dispatch
+        try:
+            self.reconcile_schemes(now)
+        except Exception:
+            logger.exception("Scheme reconciliation failed")
+        try:
+            self.run_loan_lifecycle(now)
+        except LeaseLost as e:
+            logger.warning("%s; not dispatching", e)
+            return 0
+        except Exception:
+            logger.exception("Loan lifecycle run failed")
+
+        dispatched = 0
+        self.in_flight()
+        for schedule in ReportSchedule.objects.filter(is_active=True).select_related('report').order_by('pk'):
+            if self.running.get(schedule.pk):
+                # Previous run still executing; its due runs wait for the next tick
+                continue
+            for fire in due_runs(schedule, now, self.catch_up, self.max_catch_up, self.tick):
+                if self.in_flight() >= self.workers:
+                    # Pool is full; the run stays due and is picked up next tick
+                    return dispatched
+                if not claim(schedule, fire):
+                    continue
+                print(f"Dispatching {schedule.report.name} (schedule {schedule.pk}) for {timezone.localtime(fire)}")
+                future = self.pool.submit(run_schedule, schedule.pk, fire)
+                self.running.setdefault(schedule.pk, []).append(future)
+                dispatched += 1
+                # One run per schedule at a time; later catch-up runs stay due until this one finishes
+                break
+        return dispatched
+
+    def reconcile_schemes(self, now):
+        """Move schemes between upcoming, active and expired once per local day"""
+        from schemes.models import Scheme
+
+        today = timezone.localtime(now).date()
+        if self.schemes_reconciled_on == today:
+            return
+        changed = Scheme.reconcile_statuses(today)
+        if any(changed.values()):
+            print(f"Reconciled scheme statuses for {today}: {changed}")
+        self.schemes_reconciled_on = today
+
+    def run_loan_lifecycle(self, now):
+        """Move loans to overdue, defaulted and auction once per local day (idempotent if repeated)"""
+        from transactions import lifecycle
+
+        today = timezone.localtime(now).date()
+        if self.lifecycle_run_on == today:
+            return
+        # A long run renews the lease after each branch, so no other scheduler takes over meanwhile
+        summary = lifecycle.run(today=today, on_branch=self._renew_lease)
+        changed = {branch_id: counts for branch_id, counts in summary.items() if any(counts.values())}
+        if changed:
+            print(f"Ran loan lifecycle for {today}: {changed}")
+        self.lifecycle_run_on = today
+
+    def _renew_lease(self, branch_id=None):
+        if not acquire_lease(self.owner, self.lease_ttl()):
+            raise LeaseLost(f"Scheduler lease lost to another process after branch {branch_id}")
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+        release_lease(self.owner)
@@ -1,3 +1,424 @@
-from django.test import TestCase
+import datetime
+import json
+import tempfile
+from concurrent.futures import Future
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts import access
+from accounts.models import Customer, CustomUser, Region, Role
+from biometrics.models import FaceAuthLog
+from branches.models import Branch
+from reporting import engine, exports, report_jobs, scheduler
+from reporting.models import BranchDailyRollup, Report, ReportExecution, ReportSchedule, SchedulerLease
+from transactions.models import Loan
+
+
+class FakePool:
+    """Stands in for the scheduler's thread pool; runs finish when the test says so"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.submitted.append((args, future))
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class InlinePool(FakePool):
+    """Stands in for the report worker's thread pool; runs each execution as it is submitted"""
+
+    def submit(self, fn, *args):
+        future = super().submit(fn, *args)
+        future.set_result(fn(*args))
+        return future
+
+
+def local(*args):
+    return timezone.make_aware(datetime.datetime(*args))
+
+
+class SchedulerLeaseTests(TestCase):
+    """Only one scheduler process dispatches at a time"""
+
+    def test_lease_is_exclusive_until_it_expires(self):
+        now = local(2024, 3, 10, 12, 0)
+        self.assertTrue(scheduler.acquire_lease('a:1', 90, now))
+        self.assertFalse(scheduler.acquire_lease('b:2', 90, now + datetime.timedelta(seconds=30)))
+        # The holder renews
+        self.assertTrue(scheduler.acquire_lease('a:1', 90, now + datetime.timedelta(seconds=60)))
+        self.assertFalse(scheduler.acquire_lease('b:2', 90, now + datetime.timedelta(seconds=120)))
+        # The holder stopped renewing; another process takes over
+        self.assertTrue(scheduler.acquire_lease('b:2', 90, now + datetime.timedelta(seconds=151)))
+        self.assertEqual(SchedulerLease.objects.get().owner, 'b:2')
+        self.assertFalse(scheduler.acquire_lease('a:1', 90, now + datetime.timedelta(seconds=160)))
+
+    def test_release_hands_over_at_once(self):
+        now = local(2024, 3, 10, 12, 0)
+        self.assertTrue(scheduler.acquire_lease('a:1', 90, now))
+        scheduler.release_lease('a:1')
+        self.assertTrue(scheduler.acquire_lease('b:2', 90, now))
+
+    def test_no_dispatch_without_the_lease(self):
+        now = timezone.now()
+        scheduler.acquire_lease('other:1', 90, now)
+        instance = scheduler.Scheduler(owner='me:1')
+        self.addCleanup(instance.pool.shutdown)
+        self.assertEqual(instance.run_once(now), 0)
+
+
+class SchedulerDispatchTests(TestCase):
+    """Due runs are claimed once, follow the catch-up policy and never overlap per schedule"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        report = Report.objects.create(name='Daily loans', report_type='loans', created_by=user)
+        cls.schedule = ReportSchedule.objects.create(
+            report=report, frequency='daily', time_of_day=datetime.time(6, 0), email_subject='Loans',
+            last_run=local(2024, 3, 7, 6, 0),
+        )
+        cls.now = local(2024, 3, 10, 12, 0)
+
+    def make_scheduler(self, **kwargs):
+        instance = scheduler.Scheduler(owner='me:1', **kwargs)
+        instance.pool.shutdown()
+        instance.pool = FakePool()
+        return instance
+
+    def last_run(self):
+        return ReportSchedule.objects.get(pk=self.schedule.pk).last_run
+
+    def test_catch_up_all_runs_one_at_a_time(self):
+        instance = self.make_scheduler(catch_up=scheduler.CATCH_UP_ALL, workers=4)
+        missed = [local(2024, 3, day, 6, 0) for day in (8, 9, 10)]
+
+        for fire in missed:
+            self.assertEqual(instance.run_once(self.now), 1)
+            args, future = instance.pool.submitted[-1]
+            self.assertEqual(args, (self.schedule.pk, fire))
+            self.assertEqual(self.last_run(), fire)
+            # Still running: the next catch-up run waits
+            self.assertEqual(instance.run_once(self.now), 0)
+            future.set_result(None)
+        self.assertEqual(instance.run_once(self.now), 0)
+        self.assertEqual(len(instance.pool.submitted), 3)
+
+    def test_catch_up_latest_runs_once(self):
+        instance = self.make_scheduler(catch_up=scheduler.CATCH_UP_LATEST)
+        self.assertEqual(instance.run_once(self.now), 1)
+        self.assertEqual(self.last_run(), local(2024, 3, 10, 6, 0))
+        instance.pool.submitted[0][1].set_result(None)
+        self.assertEqual(instance.run_once(self.now), 0)
+
+    def test_catch_up_none_skips_old_runs(self):
+        instance = self.make_scheduler(catch_up=scheduler.CATCH_UP_NONE)
+        self.assertEqual(instance.run_once(self.now), 0)
+        self.assertEqual(self.last_run(), local(2024, 3, 10, 6, 0))
+        # A run that just became due is dispatched
+        self.assertEqual(instance.run_once(local(2024, 3, 11, 6, 0, 20)), 1)
+
+    def test_failing_daily_jobs_do_not_block_dispatch(self):
+        instance = self.make_scheduler()
+        with mock.patch('schemes.models.Scheme.reconcile_statuses', side_effect=RuntimeError('schemes')), \
+                mock.patch('transactions.lifecycle.run', side_effect=RuntimeError('lifecycle')), \
+                self.assertLogs('reporting.scheduler', 'ERROR') as logs:
+            self.assertEqual(instance.run_once(self.now), 1)
+        self.assertEqual(len(logs.records), 2)
+        # Both are retried on the next tick
+        self.assertIsNone(instance.schemes_reconciled_on)
+        self.assertIsNone(instance.lifecycle_run_on)
+
+    def test_run_is_claimed_once(self):
+        fire = local(2024, 3, 8, 6, 0)
+        self.assertTrue(scheduler.claim(self.schedule, fire))
+        other = ReportSchedule.objects.get(pk=self.schedule.pk)
+        other.last_run = local(2024, 3, 7, 6, 0)
+        self.assertFalse(scheduler.claim(other, fire))
+
+
+class SchedulerDailyJobTests(TestCase):
+    """The lease holder runs the loan lifecycle once per local day"""
+
+    def make_scheduler(self, owner='me:1'):
+        instance = scheduler.Scheduler(owner=owner)
+        instance.pool.shutdown()
+        instance.pool = FakePool()
+        return instance
+
+    def test_lifecycle_runs_once_per_local_day(self):
+        instance = self.make_scheduler()
+        with mock.patch('transactions.lifecycle.run', return_value={}) as run:
+            for now in (local(2024, 3, 10, 0, 5), local(2024, 3, 10, 23, 55), local(2024, 3, 11, 0, 5)):
+                instance.run_once(now)
+        self.assertEqual([call.kwargs['today'] for call in run.call_args_list],
+                         [datetime.date(2024, 3, 10), datetime.date(2024, 3, 11)])
+
+    def test_lifecycle_waits_for_the_lease(self):
+        now = local(2024, 3, 10, 0, 5)
+        self.assertTrue(scheduler.acquire_lease('other:2', 90, now))
+        instance = self.make_scheduler()
+        with mock.patch('transactions.lifecycle.run', return_value={}) as run:
+            instance.run_once(now)
+        run.assert_not_called()
+        self.assertIsNone(instance.lifecycle_run_on)
+
+    def test_lifecycle_renews_the_lease_after_each_branch(self):
+        instance = self.make_scheduler()
+        expiries = []
+
+        def run(today, on_branch):
+            for branch_id in (1, 2):
+                on_branch(branch_id)
+                expiries.append(SchedulerLease.objects.get().expires_at)
+            return {}
+
+        with mock.patch('transactions.lifecycle.run', side_effect=run):
+            instance.run_once(local(2024, 3, 10, 0, 5))
+        self.assertEqual(len(expiries), 2)
+        self.assertGreater(expiries[0], timezone.now())
+
+    def test_lease_lost_during_lifecycle_stops_the_tick(self):
+        instance = self.make_scheduler()
+
+        def run(today, on_branch):
+            # Another scheduler took over while the first branch ran
+            SchedulerLease.objects.update(owner='other:2', expires_at=timezone.now() + datetime.timedelta(hours=1))
+            on_branch(1)
+
+        with mock.patch('transactions.lifecycle.run', side_effect=run), \
+                mock.patch.object(scheduler, 'claim') as claim, \
+                self.assertLogs('reporting.scheduler', 'WARNING'):
+            self.assertEqual(instance.run_once(local(2024, 3, 10, 0, 5)), 0)
+        claim.assert_not_called()
+        self.assertIsNone(instance.lifecycle_run_on)
+
+
+class ReportBranchAccessTests(TestCase):
+    """Report rows are limited to the branches the access policy lets the user see"""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='South')
+        cls.branches = {}
+        for name, branch_region in (('A', region), ('B', region), ('C', None)):
+            cls.branches[name] = Branch.objects.create(
+                name=name, address='1 Street', city='City', state='State', zip_code='1', phone=name,
+                region=branch_region,
+            )
+            Customer.objects.create(first_name=name, last_name='Test', phone=name, branch=cls.branches[name])
+        role = Role.objects.create(name='Area Lead', role_type=Role.REGIONAL_MANAGER)
+        cls.regional = CustomUser.objects.create_user('regional', password='password', role=role,
+                                                      branch=cls.branches['A'])
+        cls.regional.regions.add(region)
+        cls.clerk = CustomUser.objects.create_user('clerk', password='password', branch=cls.branches['C'])
+        cls.report = Report.objects.create(
+            name='Customers', report_type='customer', created_by=cls.clerk,
+            query_definition={'source': 'customers', 'columns': ['first_name'], 'order_by': ['first_name']},
+        )
+
+    def setUp(self):
+        access.invalidate()
+
+    def names(self, user):
+        return [row[0] for row in engine.compile_report(self.report, user=user).iter_rows()]
+
+    def test_rows_follow_the_access_policy(self):
+        self.assertEqual(self.names(self.regional), ['A', 'B'])
+        self.assertEqual(self.names(self.clerk), ['C'])
+        self.assertEqual(self.names(None), ['A', 'B', 'C'])
+
+
+class ReportQueueTests(TestCase):
+    """Queued executions are claimed once, run by run_report_worker and retried when a worker dies"""
+
+    @classmethod
+    def setUpTestData(cls):
+        branch = Branch.objects.create(
+            name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1'
+        )
+        for name in ('Asha', 'Ravi'):
+            Customer.objects.create(first_name=name, last_name='Test', phone=name, branch=branch)
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.report = Report.objects.create(
+            name='Customers', report_type='customer', created_by=cls.admin,
+            query_definition={'source': 'customers', 'columns': ['first_name']},
+        )
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make_runner(self, owner='me:1'):
+        runner = report_jobs.ReportRunner(workers=2, owner=owner)
+        runner.pool.shutdown()
+        runner.pool = InlinePool()
+        return runner
+
+    def test_run_form_queues_and_worker_runs(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('report_run', args=[self.report.pk]), {'format': 'csv'})
+        execution = ReportExecution.objects.get()
+        self.assertRedirects(response, reverse('execution_detail', args=[execution.pk]), fetch_redirect_response=False)
+        # Nothing runs in the request
+        self.assertEqual(execution.status, 'queued')
+
+        self.assertEqual(self.make_runner().run_once(), 1)
+        execution.refresh_from_db()
+        self.assertEqual((execution.status, execution.row_count, execution.attempts), ('success', 2, 1))
+        self.assertEqual(execution.worker, 'me:1')
+        self.assertIsNone(execution.lease_expires_at)
+        self.assertEqual(self.make_runner().run_once(), 0)
+
+    def test_detail_page_runs_with_parameters(self):
+        report = Report.objects.create(
+            name='By name', report_type='customer', created_by=self.admin, parameters={'name': 'Asha'},
+            query_definition={'source': 'customers', 'columns': ['first_name'],
+                              'filters': [{'field': 'last_name', 'value': {'param': 'surname', 'default': 'Test'}},
+                                          {'field': 'first_name', 'value': {'param': 'name'}}]},
+        )
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('report_detail', args=[report.pk]))
+        self.assertContains(response, reverse('report_run', args=[report.pk]))
+        self.assertEqual(response.context['parameter_fields'], [('name', 'Asha'), ('surname', 'Test')])
+
+        # Blank fields fall back to the report's defaults
+        self.client.post(reverse('report_run', args=[report.pk]), {'format': 'csv', 'name': 'Ravi', 'surname': ''})
+        self.assertEqual(ReportExecution.objects.get().parameters_used, {'name': 'Ravi'})
+        self.make_runner().run_once()
+        self.assertEqual(ReportExecution.objects.get().row_count, 1)
+
+        other = CustomUser.objects.create_user('other', password='password')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('report_detail', args=[report.pk])).status_code, 404)
+
+    def test_claim_takes_each_execution_once(self):
+        execution = engine.enqueue(self.report, user=self.admin)
+        self.assertEqual(report_jobs.claim('me:1', 5), [execution])
+        self.assertEqual(report_jobs.claim('other:2', 5), [])
+
+    def test_expired_lease_is_requeued_then_failed(self):
+        execution = engine.enqueue(self.report, user=self.admin)
+        report_jobs.claim('dead:1', 1)
+        later = timezone.now() + datetime.timedelta(seconds=report_jobs.LEASE_SECONDS + 1)
+        self.assertEqual(report_jobs.requeue_expired(later), (1, 0))
+        self.assertEqual(ReportExecution.objects.get().status, 'queued')
+
+        ReportExecution.objects.filter(pk=execution.pk).update(attempts=report_jobs.MAX_ATTEMPTS - 1)
+        report_jobs.claim('dead:1', 1)
+        self.assertEqual(report_jobs.requeue_expired(later), (0, 1))
+        execution.refresh_from_db()
+        self.assertEqual((execution.status, execution.attempts), ('failure', report_jobs.MAX_ATTEMPTS))
+
+    def test_renew_keeps_a_long_run_claimed(self):
+        engine.enqueue(self.report, user=self.admin)
+        report_jobs.claim('me:1', 1)
+        later = timezone.now() + datetime.timedelta(seconds=report_jobs.LEASE_SECONDS - 1)
+        self.assertEqual(report_jobs.renew('me:1', later), 1)
+        self.assertEqual(report_jobs.requeue_expired(later + datetime.timedelta(seconds=2)), (0, 0))
+
+
+class RollupBackfillTests(TestCase):
+    """backfill_rollups --if-empty builds the dashboard rollups once, over data that predates them"""
+
+    def test_backfill_if_empty(self):
+        branch = Branch.objects.create(
+            name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1'
+        )
+        customer = Customer.objects.create(first_name='Ramesh', last_name='Kumar', phone='1', branch=branch)
+        today = datetime.date.today()
+        Loan.objects.create(
+            loan_number='LN0001', customer=customer, branch=branch,
+            principal_amount=10000, distribution_amount=10000,
+            issue_date=today, due_date=today + datetime.timedelta(days=90),
+            grace_period_end=today + datetime.timedelta(days=97),
+        )
+        built = list(BranchDailyRollup.objects.values('branch_id', 'date', 'loans_issued', 'principal_issued'))
+        # As after the first migrate over existing loans
+        BranchDailyRollup.objects.all().delete()
+
+        call_command('backfill_rollups', if_empty=True, stdout=StringIO())
+        self.assertEqual(
+            list(BranchDailyRollup.objects.values('branch_id', 'date', 'loans_issued', 'principal_issued')), built
+        )
+
+        BranchDailyRollup.objects.update(loans_issued=5)
+        out = StringIO()
+        call_command('backfill_rollups', if_empty=True, stdout=out)
+        self.assertIn('already built', out.getvalue())
+        self.assertEqual(BranchDailyRollup.objects.get().loans_issued, 5)
+
+
+class FaceAuthLogExportTests(TestCase):
+    """The face_auth_logs CSV keeps the layout of the original biometric log export"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        branch = Branch.objects.create(
+            name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1'
+        )
+        clerk = CustomUser.objects.create_user('clerk', first_name='Ravi', last_name='Shah', branch=branch)
+        customer = Customer.objects.create(first_name='Asha', last_name='Test', phone='1', branch=branch)
+        cls.logs = [
+            FaceAuthLog.objects.create(user=clerk, success=True, confidence=0.8731, ip_address='10.0.0.5',
+                                       device_info='Mozilla/5.0, "kiosk"'),
+            FaceAuthLog.objects.create(user=cls.admin, customer=customer, success=False, confidence=None),
+            FaceAuthLog.objects.create(user=clerk, success=False, confidence=0.0, ip_address=None),
+        ]
+
+    def baseline_csv(self, logs):
+        """The rows the biometric log view wrote before exports were streamed"""
+        import csv
+        import io
+
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['Timestamp', 'User Type', 'User/Customer', 'Success', 'Confidence', 'IP Address', 'Device Info'])
+        for log in logs:
+            writer.writerow([
+                log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                'Staff',
+                log.user.get_full_name() or log.user.username,
+                'Success' if log.success else 'Failed',
+                f"{log.confidence:.2f}" if log.confidence else 'N/A',
+                log.ip_address or 'N/A',
+                log.device_info or 'N/A',
+            ])
+        return out.getvalue().encode('utf-8')
+
+    @override_settings(TIME_ZONE='Asia/Kolkata')
+    def test_csv_matches_baseline(self):
+        dataset = exports.DATASETS['face_auth_logs']
+        logs = FaceAuthLog.objects.order_by('-timestamp', '-pk')
+        exported = b''.join(exports.stream(dataset.columns, dataset.queryset(logs), 'csv'))
+        self.assertEqual(exported, self.baseline_csv(logs))
+
+    def test_ndjson_keeps_raw_values(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('export', args=['face_auth_logs']), {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        by_confidence = {row['confidence']: row for row in rows}
+        self.assertIs(by_confidence[0.8731]['success'], True)
+        self.assertIsNone(by_confidence[None]['ip_address'])
+
+    def test_invalid_branch_is_a_bad_request(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('export', args=['face_auth_logs']), {'branch': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('export', args=['face_auth_logs']), {'branch': '999'})
+        self.assertEqual(response.status_code, 200)
+        # Header only: no logs in an unknown branch
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
@@ -49,6 +49,9 @@ urlpatterns = [
     # Report executions
     path('executions/', views.ExecutionListView.as_view(), name='execution_list'),
     path('executions/<int:pk>/', views.ExecutionDetailView.as_view(), name='execution_detail'),
+
+    # Streaming table exports
+    path('exports/<str:dataset>/', views.ExportView.as_view(), name='export'),
     
     # Analysis tools
     path('analysis/sales/', views.SalesAnalysisView.as_view(), name='sales_analysis'),
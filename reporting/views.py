@@ -4,18 +4,24 @@ from django.views.generic import ListView, DetailView, CreateView, UpdateView, D
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.db.models import Sum, Count, Avg, Q, F
+from django.db.models import Sum, Count, Avg, Q, F, Case, When, DateField
+from django.db.models.functions import TruncMonth
 from django.utils import timezone
-from django.http import HttpResponse, FileResponse
+from django.http import HttpResponse, FileResponse, JsonResponse, Http404, HttpResponseBadRequest
+from django.utils.dateparse import parse_date
 
 # Model imports
 from transactions.models import Sale, Loan, Payment
 from branches.models import Branch
-from .models import Report, ReportSchedule, ReportExecution, Dashboard, DashboardWidget
+from accounts.access import restrict_to_branches, visible_branch_ids
+from .models import Report, ReportSchedule, ReportExecution, Dashboard, DashboardWidget, BranchDailyRollup
+from . import engine, exports
 
 import csv
 import io
+import os
 from datetime import datetime, timedelta
+from decimal import Decimal
 
 # Placeholder views for reporting functionality
 class DashboardListView(LoginRequiredMixin, ListView):
@@ -85,13 +91,25 @@ class WidgetDeleteView(LoginRequiredMixin, TemplateView):
         return context
 
 
+def visible_reports(user):
+    """Reports a user may run and download: their own, public ones, or all for superusers"""
+    reports = Report.objects.select_related('created_by')
+    if user.is_superuser:
+        return reports
+    return reports.filter(Q(created_by=user) | Q(is_public=True))
+
+
 class ReportListView(LoginRequiredMixin, ListView):
     template_name = 'reporting/report_list.html'
     context_object_name = 'reports'
+    paginate_by = 25
     
     def get_queryset(self):
-        # Will be implemented with actual Report model
-        return []
+        reports = visible_reports(self.request.user)
+        report_type = self.request.GET.get('report_type')
+        if report_type:
+            reports = reports.filter(report_type=report_type)
+        return reports
 
 
 class ReportCreateView(LoginRequiredMixin, TemplateView):
@@ -99,12 +117,19 @@ class ReportCreateView(LoginRequiredMixin, TemplateView):
 
 
 class ReportDetailView(LoginRequiredMixin, DetailView):
+    """A saved report, its recent executions and the form that queues a run"""
     template_name = 'reporting/report_detail.html'
     context_object_name = 'report'
     
-    def get_object(self):
-        # Will be implemented with actual Report model
-        return None
+    def get_queryset(self):
+        return visible_reports(self.request.user)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['parameter_fields'] = engine.parameter_fields(self.object)
+        context['formats'] = ReportExecution.FORMAT_CHOICES
+        context['executions'] = visible_executions(self.request.user).filter(report=self.object)[:10]
+        return context
 
 
 class ReportUpdateView(LoginRequiredMixin, TemplateView):
@@ -126,10 +151,21 @@ class ReportDeleteView(LoginRequiredMixin, TemplateView):
 
 # Missing views referenced in URLs
 class ReportRunView(LoginRequiredMixin, View):
-    def get(self, request, pk):
-        # Logic to run a report based on its ID
-        messages.success(request, "Report execution started")
-        return redirect('report_detail', pk=pk)
+    """Queue a report execution; run_report_worker runs it, not this request"""
+    
+    def post(self, request, pk):
+        report = get_object_or_404(visible_reports(request.user), pk=pk)
+        output_format = request.POST.get('format') or 'csv'
+        # Report parameters are the submitted form fields, minus the control fields; blank ones keep their defaults
+        parameters = {key: value for key, value in request.POST.items()
+                      if key not in ('format', 'csrfmiddlewaretoken') and value != ''}
+        try:
+            execution = engine.enqueue(report, user=request.user, parameters=parameters, output_format=output_format)
+        except engine.ReportDefinitionError as e:
+            messages.error(request, f"Could not run report: {e}")
+            return redirect('report_detail', pk=report.pk)
+        messages.success(request, "Report execution queued")
+        return redirect('execution_detail', pk=execution.pk)
 
 
 class ReportScheduleCreateView(LoginRequiredMixin, TemplateView):
@@ -142,17 +178,60 @@ class ReportScheduleCreateView(LoginRequiredMixin, TemplateView):
 
 
 class ReportDownloadView(LoginRequiredMixin, View):
+    """Download the latest successful result of a report"""
+    
     def get(self, request, pk):
-        # Logic to download report results
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="report_{pk}_{timezone.now().strftime("%Y%m%d")}.csv"'
-        
-        # Sample CSV data
-        writer = csv.writer(response)
-        writer.writerow(['Date', 'Category', 'Amount'])
-        writer.writerow([timezone.now().date(), 'Sample Category', '100.00'])
-        
-        return response
+        report = get_object_or_404(visible_reports(request.user), pk=pk)
+        execution = (report.executions.filter(status='success')
+                     .exclude(result_file='')
+                     .order_by('-end_time')
+                     .first())
+        if execution is None:
+            messages.warning(request, "This report has no results yet. Run it first.")
+            return redirect('report_list')
+        return execution_file_response(execution)
+
+
+def execution_file_response(execution):
+    """Stream an execution's result file"""
+    filename = os.path.basename(execution.result_file.name)
+    return FileResponse(execution.result_file.open('rb'), as_attachment=True, filename=filename)
+
+
+class ExportView(LoginRequiredMixin, View):
+    """Stream a whole table as CSV or NDJSON, e.g. /reporting/exports/loans/?format=ndjson&date_from=2025-01-01
+
+    Optional filters: date_from and date_to (on the dataset's date), status,
+    and branch (only for users who can see every branch).
+    """
+
+    def get(self, request, dataset):
+        spec = exports.DATASETS.get(dataset)
+        if spec is None:
+            raise Http404(f"Unknown export: {dataset}")
+        output_format = request.GET.get('format', 'csv')
+        if output_format not in exports.FORMATS:
+            return HttpResponseBadRequest(f"Unsupported export format: {output_format}")
+
+        queryset = spec.queryset()
+        user = request.user
+        if visible_branch_ids(user) is not None:
+            queryset = restrict_to_branches(queryset, user, spec.branch_path)
+        elif branch := request.GET.get('branch'):
+            if not branch.isdigit():
+                return HttpResponseBadRequest("Invalid branch.")
+            queryset = queryset.filter(**{f"{spec.branch_path}_id": int(branch)})
+
+        if spec.date_field:
+            if date_from := parse_date(request.GET.get('date_from') or ''):
+                queryset = queryset.filter(**{f"{spec.date_field}__gte": date_from})
+            if date_to := parse_date(request.GET.get('date_to') or ''):
+                queryset = queryset.filter(**{f"{spec.date_field}__lte": date_to})
+        if (status := request.GET.get('status')) and any(f.name == 'status' for f in spec.model._meta.fields):
+            queryset = queryset.filter(status=status)
+
+        filename = f"{dataset}_{timezone.localdate():%Y%m%d}"
+        return exports.streaming_response(spec.columns, queryset, output_format, filename)
 
 
 class ReportGenerateView(LoginRequiredMixin, TemplateView):
@@ -225,51 +304,58 @@ class FinancialDashboardView(LoginRequiredMixin, TemplateView):
         if not self.request.user.is_superuser and self.request.user.branch:
             branch_filter = Q(branch=self.request.user.branch)
         
-        # Calculate revenue metrics
-        current_month_sales = Sale.objects.filter(
-            branch_filter,
-            sale_date__year=today.year,
-            sale_date__month=today.month,
-            status='completed'
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        last_month_sales = Sale.objects.filter(
-            branch_filter,
-            sale_date__year=last_month.year,
-            sale_date__month=last_month.month,
-            status='completed'
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
+        # Everything below comes from one grouped query over the daily rollups:
+        # one row per branch and month of this year (and last month), plus one row
+        # per branch for older days, which only feed the portfolio totals.
+        window_start = min(today.replace(month=1, day=1), last_month)
+        period = Case(When(date__gte=window_start, then=TruncMonth('date')), output_field=DateField())
+        rows = (BranchDailyRollup.objects.filter(branch_filter)
+                .values('branch_id', 'branch__name', 'branch__is_active', period=period)
+                .annotate(
+                    interest=Sum('interest_accrued'),
+                    sales=Sum('sales_total'),
+                    active_principal=Sum('active_principal'),
+                )
+                .order_by('branch__name', 'branch_id'))
         
-        # Calculate loan metrics
-        loan_portfolio = Loan.objects.filter(
-            branch_filter,
-            status='active'
-        ).aggregate(total=Sum('principal_amount'))['total'] or 0
+        current_month_sales = Decimal('0')
+        last_month_sales = Decimal('0')
+        loan_portfolio = Decimal('0')
+        last_month_portfolio = Decimal('0')
+        interest_income_data = [0.0] * 12
+        sales_revenue_data = [0.0] * 12
+        branch_sales = {}
         
-        last_month_portfolio = Loan.objects.filter(
-            branch_filter,
-            status='active',
-            created_at__lt=first_day
-        ).aggregate(total=Sum('principal_amount'))['total'] or 0
+        for row in rows:
+            sales = row['sales'] or Decimal('0')
+            active_principal = row['active_principal'] or Decimal('0')
+            month = row['period']
+            
+            # Active loans, and those that were already on the books before this month
+            loan_portfolio += active_principal
+            if month is None or month < first_day:
+                last_month_portfolio += active_principal
+            
+            if month == first_day:
+                current_month_sales += sales
+            elif month == last_month:
+                last_month_sales += sales
+            if month is not None and month.year == today.year:
+                interest_income_data[month.month - 1] += float(row['interest'] or 0)
+                sales_revenue_data[month.month - 1] += float(sales)
+            
+            if row['branch__is_active']:
+                branch = branch_sales.setdefault(row['branch_id'], {'name': row['branch__name'], 'revenue': Decimal('0')})
+                if month == first_day:
+                    branch['revenue'] += sales
         
         # Get branch data
-        branches = Branch.objects.filter(is_active=True)
-        if not self.request.user.is_superuser and self.request.user.branch:
-            branches = branches.filter(id=self.request.user.branch.id)
-        
         branch_data = []
         branch_labels = []
         branch_revenue = []
         branch_colors = []
         
-        for idx, branch in enumerate(branches):
-            revenue = Sale.objects.filter(
-                branch=branch,
-                sale_date__year=today.year,
-                sale_date__month=today.month,
-                status='completed'
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
+        for idx, branch in enumerate(branch_sales.values()):
             color = [
                 'rgba(78, 115, 223, 0.8)',
                 'rgba(28, 200, 138, 0.8)',
@@ -279,40 +365,20 @@ class FinancialDashboardView(LoginRequiredMixin, TemplateView):
             ][idx % 5]
             
             branch_data.append({
-                'name': branch.name,
-                'revenue': revenue,
+                'name': branch['name'],
+                'revenue': branch['revenue'],
                 'color': color
             })
-            branch_labels.append(branch.name)
-            branch_revenue.append(revenue)
+            branch_labels.append(branch['name'])
+            branch_revenue.append(float(branch['revenue']))
             branch_colors.append(color)
         
-        # Calculate monthly data for charts
-        months = range(1, 13)
-        interest_income_data = []
-        sales_revenue_data = []
+        # Calculate monthly margins for charts
         other_revenue_data = []
         gross_margin_data = []
         net_margin_data = []
         
-        for month in months:
-            # Interest income from loans
-            interest = Loan.objects.filter(
-                branch_filter,
-                created_at__year=today.year,
-                created_at__month=month
-            ).aggregate(
-                total=Sum(F('principal_amount') * F('interest_rate') / 100)
-            )['total'] or 0
-            
-            # Sales revenue
-            sales = Sale.objects.filter(
-                branch_filter,
-                sale_date__year=today.year,
-                sale_date__month=month,
-                status='completed'
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
+        for interest, sales in zip(interest_income_data, sales_revenue_data):
             # Other revenue (placeholder - implement based on your needs)
             other = 0
             
@@ -329,8 +395,6 @@ class FinancialDashboardView(LoginRequiredMixin, TemplateView):
                 gross_margin = 0
                 net_margin = 0
             
-            interest_income_data.append(interest)
-            sales_revenue_data.append(sales)
             other_revenue_data.append(other)
             gross_margin_data.append(gross_margin)
             net_margin_data.append(net_margin)
@@ -343,11 +407,11 @@ class FinancialDashboardView(LoginRequiredMixin, TemplateView):
         context.update({
             'total_revenue': current_month_sales,
             'revenue_growth': revenue_growth,
-            'net_profit': current_month_sales * 0.2,  # Placeholder - implement actual calculation
+            'net_profit': float(current_month_sales) * 0.2,  # Placeholder - implement actual calculation
             'profit_growth': 2.5,  # Placeholder - implement actual calculation
             'loan_portfolio': loan_portfolio,
             'portfolio_growth': portfolio_growth,
-            'expenses': current_month_sales * 0.6,  # Placeholder - implement actual calculation
+            'expenses': float(current_month_sales) * 0.6,  # Placeholder - implement actual calculation
             'expense_growth': 1.8,  # Placeholder - implement actual calculation
             
             # Chart data
@@ -457,22 +521,41 @@ class ScheduleDeleteView(LoginRequiredMixin, TemplateView):
 
 
 # Report execution views
+def visible_executions(user):
+    executions = ReportExecution.objects.select_related('report', 'executed_by')
+    if user.is_superuser:
+        return executions
+    return executions.filter(Q(executed_by=user) | Q(report__created_by=user))
+
+
 class ExecutionListView(LoginRequiredMixin, ListView):
     template_name = 'reporting/execution_list.html'
     context_object_name = 'executions'
+    paginate_by = 50
     
     def get_queryset(self):
-        # Will be implemented with actual ReportExecution model
-        return []
+        return visible_executions(self.request.user)
 
 
 class ExecutionDetailView(LoginRequiredMixin, DetailView):
     template_name = 'reporting/execution_detail.html'
     context_object_name = 'execution'
     
-    def get_object(self):
-        # Will be implemented with actual ReportExecution model
-        return None
+    def get_queryset(self):
+        return visible_executions(self.request.user)
+    
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        if request.GET.get('format') == 'json':
+            # Polled by the detail page while the execution is queued or running
+            return JsonResponse({
+                'status': self.object.status,
+                'row_count': self.object.row_count,
+                'error': self.object.error_message,
+            })
+        if request.GET.get('download') and self.object.status == 'success' and self.object.result_file:
+            return execution_file_response(self.object)
+        return self.render_to_response(self.get_context_data(object=self.object))
 
 
 # Analysis tool views
@@ -1,4 +1,5 @@
 from django import forms
+from accounts.access import policy_for, visible_branches
 from .models import Scheme
 from django.utils import timezone
 
@@ -117,17 +118,14 @@ class SchemeForm(forms.ModelForm):
         # Make branch field optional
         self.fields['branch'].required = False
         
-        # If there's a user and they have a branch, limit choices
+        # Branch managers are fixed to their branch; others choose among the branches they may see
         if user and not user.is_superuser:
-            if user.branch:
-                if user.role and user.role.name.lower() == 'branch manager':
-                    self.fields['branch'].initial = user.branch
-                    self.fields['branch'].widget.attrs['readonly'] = True
-                    self.fields['branch'].disabled = True
-                elif user.role and user.role.name.lower() == 'regional manager':
-                    managed_branches = user.managed_branches.all()
-                    if managed_branches.exists():
-                        self.fields['branch'].queryset = managed_branches
+            if policy_for(user).is_branch_manager and user.branch:
+                self.fields['branch'].initial = user.branch
+                self.fields['branch'].widget.attrs['readonly'] = True
+                self.fields['branch'].disabled = True
+            else:
+                self.fields['branch'].queryset = visible_branches(user)
         
         # If editing an existing scheme with additional conditions, populate the fields
         if self.instance.pk and self.instance.additional_conditions:
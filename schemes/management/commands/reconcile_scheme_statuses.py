@@ -0,0 +1,28 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from schemes.models import Scheme
+
+
+class Command(BaseCommand):
+    help = ('Move schemes between upcoming, active and expired according to their dates '
+            '(run_scheduler also does this daily)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Date to reconcile for, YYYY-MM-DD (default: today)'
+        )
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid --date '{options['date']}', expected YYYY-MM-DD")
+
+        changed = Scheme.reconcile_statuses(today)
+        for status, count in changed.items():
+            self.stdout.write(f"{count} scheme(s) now {status}")
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {sum(changed.values())} scheme status(es)"))
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 from branches.models import Branch
 from accounts.models import CustomUser
@@ -89,6 +90,30 @@ class Scheme(models.Model):
             return self.additional_conditions['no_interest_period_days']
         return None
     
+    @classmethod
+    def reconcile_statuses(cls, today=None):
+        """
+        Set-based version of update_status for every scheme: three UPDATEs on
+        the status index move schemes to expired, upcoming or active according
+        to their dates. Inactive schemes are left alone. Returns the number of
+        schemes moved to each status.
+        """
+        today = today or timezone.localdate()
+        current = Q(start_date__lte=today) & (Q(end_date__isnull=True) | Q(end_date__gte=today))
+        changed = {
+            'expired': cls.objects.filter(status__in=['active', 'upcoming'], end_date__lt=today)
+                                  .update(status='expired'),
+            'upcoming': cls.objects.filter(status__in=['active', 'expired'], start_date__gt=today)
+                                   .update(status='upcoming'),
+            'active': cls.objects.filter(current, status__in=['upcoming', 'expired'])
+                                 .update(status='active'),
+        }
+        if any(changed.values()):
+            # Queryset updates send no signals; the loan form caches the active schemes
+            from transactions import form_choices
+            form_choices.invalidate()
+        return changed
+
     def update_status(self):
         """
         Update the status of the scheme based on current date and start/end dates
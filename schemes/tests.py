@@ -1,3 +1,70 @@
+import datetime
+
+from django.contrib.auth.models import Permission
 from django.test import TestCase
+from django.urls import reverse
+
+from accounts import access
+from accounts.models import CustomUser, Region, Role
+from branches.models import Branch
+from schemes.models import Scheme
+
+
+class SchemeAccessTests(TestCase):
+    """Scheme views follow the access policy's branches, whatever the role is called"""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='South')
+        cls.branches = {
+            name: Branch.objects.create(
+                name=name, address='1 Street', city='City', state='State', zip_code='1', phone=name,
+                region=branch_region,
+            )
+            for name, branch_region in (('A', region), ('B', region), ('C', None))
+        }
+        role = Role.objects.create(name='Area Lead', role_type=Role.REGIONAL_MANAGER)
+        cls.regional = CustomUser.objects.create_user('regional', password='password', role=role,
+                                                      branch=cls.branches['A'])
+        cls.regional.regions.add(region)
+        cls.regional.user_permissions.add(*Permission.objects.filter(
+            content_type__app_label='schemes', codename__in=['view_scheme', 'change_scheme'],
+        ))
+        cls.schemes = {
+            name: Scheme.objects.create(
+                name=f'Scheme {name}', description=name, interest_rate=12, loan_duration=90,
+                minimum_amount=1000, maximum_amount=100000, start_date=datetime.date.today(),
+                branch=cls.branches.get(name),
+            )
+            for name in ('B', 'C', 'global')
+        }
+
+    def setUp(self):
+        access.invalidate()
+        self.client.force_login(self.regional)
+
+    def test_list_shows_the_regions_branches_and_global_schemes(self):
+        response = self.client.get(reverse('scheme_list'))
+        self.assertEqual({scheme.name for scheme in response.context['schemes']}, {'Scheme B', 'Scheme global'})
+        self.assertEqual({branch.name for branch in response.context['available_branches']}, {'A', 'B'})
+
+    def test_edit_rights_follow_the_branches(self):
+        response = self.client.get(reverse('scheme_detail', args=[self.schemes['B'].pk]))
+        self.assertTrue(response.context['can_edit'])
+        self.assertFalse(response.context['can_delete'])
+        # Global schemes need manage_global_schemes
+        response = self.client.get(reverse('scheme_detail', args=[self.schemes['global'].pk]))
+        self.assertFalse(response.context['can_edit'])
+        response = self.client.get(reverse('scheme_update', args=[self.schemes['global'].pk]))
+        self.assertRedirects(response, reverse('scheme_detail', args=[self.schemes['global'].pk]),
+                             fetch_redirect_response=False)
+
+        self.assertEqual(self.client.get(reverse('scheme_detail', args=[self.schemes['C'].pk])).status_code, 404)
+
+    def test_json_refuses_other_regions(self):
+        self.assertEqual(self.client.get(reverse('scheme_json', args=[self.schemes['B'].pk])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('scheme_json', args=[self.schemes['C'].pk])).status_code, 403)
 
-# Create your tests here.
+    def test_form_offers_the_users_branches(self):
+        response = self.client.get(reverse('scheme_update', args=[self.schemes['B'].pk]))
+        self.assertEqual({branch.name for branch in response.context['form'].fields['branch'].queryset}, {'A', 'B'})
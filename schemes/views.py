@@ -11,9 +11,19 @@ from decimal import Decimal
 
 from .models import Scheme, SchemeAuditLog
 from .forms import SchemeForm
+from accounts.access import can_access_branch, policy_for, visible_branch_ids, visible_branches
 from accounts.models import UserActivity
 
 
+def can_manage_scheme(user, scheme):
+    """Whether user may change a scheme: one of their branches', or a global one with manage_global_schemes"""
+    if user.is_superuser:
+        return True
+    if scheme.branch_id is None:
+        return user.has_perm('schemes.manage_global_schemes')
+    return can_access_branch(user, scheme.branch_id)
+
+
 class SchemeMixin(LoginRequiredMixin):
     """Base mixin for scheme views with common functionality"""
     
@@ -30,22 +40,11 @@ class SchemeMixin(LoginRequiredMixin):
         if user.has_perm('schemes.view_all_schemes'):
             return base_queryset
         
-        # Regional managers can see schemes from branches they manage
-        if user.role and user.role.name.lower() == 'regional manager':
-            if hasattr(user, 'managed_branches'):
-                managed_branches = user.managed_branches.all()
-                return base_queryset.filter(
-                    Q(branch__in=managed_branches) | Q(branch__isnull=True)
-                )
-        
-        # Branch managers can only see schemes for their branch and global schemes
-        if user.branch:
-            return base_queryset.filter(
-                Q(branch=user.branch) | Q(branch__isnull=True)
-            )
-        
-        # Default: only show global schemes if the user doesn't have a branch
-        return base_queryset.filter(branch__isnull=True)
+        # Everyone else sees global schemes and those of the branches they may see
+        branch_ids = visible_branch_ids(user)
+        if branch_ids is None:
+            return base_queryset
+        return base_queryset.filter(Q(branch_id__in=branch_ids) | Q(branch__isnull=True))
     
     def log_user_activity(self, action_type, description):
         """Log user activity for auditing purposes"""
@@ -104,15 +103,7 @@ class SchemeListView(SchemeMixin, PermissionRequiredMixin, ListView):
         context['status_choices'] = Scheme.STATUS_CHOICES
         
         # Get available branches for filtering
-        user = self.request.user
-        if user.is_superuser:
-            from branches.models import Branch
-            context['available_branches'] = Branch.objects.filter(is_active=True)
-        elif user.role and user.role.name.lower() == 'regional manager':
-            if hasattr(user, 'managed_branches'):
-                context['available_branches'] = user.managed_branches.filter(is_active=True)
-        elif user.branch:
-            context['available_branches'] = [user.branch]
+        context['available_branches'] = visible_branches(self.request.user).filter(is_active=True)
         
         # Log view action
         self.log_user_activity('scheme_list_viewed', 'Viewed schemes list')
@@ -137,33 +128,10 @@ class SchemeDetailView(SchemeMixin, PermissionRequiredMixin, DetailView):
         # Add audit logs
         context['audit_logs'] = scheme.audit_logs.all().order_by('-timestamp')[:10]
         
-        # Check if user can edit or delete
-        can_edit = False
-        can_delete = False
-        
-        if user.is_superuser:
-            can_edit = True
-            can_delete = True
-        elif user.has_perm('schemes.change_scheme'):
-            # Branch managers can edit schemes for their branch
-            if user.role and user.role.name.lower() == 'branch manager':
-                if user.branch and scheme.branch == user.branch:
-                    can_edit = True
-            # Regional managers can edit schemes for branches they manage
-            elif user.role and user.role.name.lower() == 'regional manager':
-                if scheme.branch and hasattr(user, 'managed_branches'):
-                    if scheme.branch in user.managed_branches.all():
-                        can_edit = True
-                # Regional managers can also manage global schemes if they have permission
-                elif scheme.branch is None and user.has_perm('schemes.manage_global_schemes'):
-                    can_edit = True
-        
-        # Delete permission follows similar rules as edit
-        if can_edit and user.has_perm('schemes.delete_scheme'):
-            can_delete = True
-        
+        # Edit and delete follow the user's branches, plus the model permissions
+        can_edit = user.has_perm('schemes.change_scheme') and can_manage_scheme(user, scheme)
         context['can_edit'] = can_edit
-        context['can_delete'] = can_delete
+        context['can_delete'] = can_edit and user.has_perm('schemes.delete_scheme')
         
         # Log view action
         self.log_user_activity('scheme_viewed', f'Viewed scheme: {scheme.name}')
@@ -190,7 +158,7 @@ class SchemeCreateView(SchemeMixin, PermissionRequiredMixin, CreateView):
         # Auto-set branch for branch managers
         user = self.request.user
         if not scheme.branch and not user.is_superuser:
-            if user.role and user.role.name.lower() == 'branch manager' and user.branch:
+            if policy_for(user).is_branch_manager and user.branch:
                 scheme.branch = user.branch
         
         # Check permission for global schemes
@@ -234,22 +202,12 @@ class SchemeUpdateView(SchemeMixin, PermissionRequiredMixin, UpdateView):
         scheme = self.get_object()
         user = request.user
         
-        if not user.is_superuser:
-            # Branch managers can only edit schemes for their branch
-            if user.role and user.role.name.lower() == 'branch manager':
-                if scheme.branch != user.branch:
-                    messages.error(request, "You don't have permission to edit this scheme.")
-                    return redirect('scheme_detail', pk=scheme.pk)
-            
-            # Regional managers can edit schemes for branches they manage
-            elif user.role and user.role.name.lower() == 'regional manager':
-                if scheme.branch and hasattr(user, 'managed_branches'):
-                    if scheme.branch not in user.managed_branches.all():
-                        messages.error(request, "You don't have permission to edit this scheme.")
-                        return redirect('scheme_detail', pk=scheme.pk)
-                elif scheme.branch is None and not user.has_perm('schemes.manage_global_schemes'):
-                    messages.error(request, "You don't have permission to edit global schemes.")
-                    return redirect('scheme_detail', pk=scheme.pk)
+        if not can_manage_scheme(user, scheme):
+            if scheme.branch_id is None:
+                messages.error(request, "You don't have permission to edit global schemes.")
+            else:
+                messages.error(request, "You don't have permission to edit this scheme.")
+            return redirect('scheme_detail', pk=scheme.pk)
         
         return super().dispatch(request, *args, **kwargs)
     
@@ -310,23 +268,12 @@ class SchemeDeleteView(SchemeMixin, PermissionRequiredMixin, DeleteView):
         scheme = self.get_object()
         user = request.user
         
-        if not user.is_superuser:
-            # Branch managers can only delete schemes for their branch
-            if user.role and user.role.name.lower() == 'branch manager':
-                if scheme.branch != user.branch:
-                    messages.error(request, "You don't have permission to delete this scheme.")
-                    return redirect('scheme_detail', pk=scheme.pk)
-            
-            # Regional managers can delete schemes for branches they manage
-            elif user.role and user.role.name.lower() == 'regional manager':
-                if scheme.branch and hasattr(user, 'managed_branches'):
-                    if scheme.branch not in user.managed_branches.all():
-                        messages.error(request, "You don't have permission to delete this scheme.")
-                        return redirect('scheme_detail', pk=scheme.pk)
-                # Regional managers need special permission for global schemes
-                elif scheme.branch is None and not user.has_perm('schemes.manage_global_schemes'):
-                    messages.error(request, "You don't have permission to delete global schemes.")
-                    return redirect('scheme_detail', pk=scheme.pk)
+        if not can_manage_scheme(user, scheme):
+            if scheme.branch_id is None:
+                messages.error(request, "You don't have permission to delete global schemes.")
+            else:
+                messages.error(request, "You don't have permission to delete this scheme.")
+            return redirect('scheme_detail', pk=scheme.pk)
         
         return super().dispatch(request, *args, **kwargs)
     
@@ -360,11 +307,8 @@ class SchemeJsonView(SchemeMixin, View):
             scheme = get_object_or_404(Scheme, pk=pk)
             
             # Check permissions
-            user = request.user
-            if not user.is_superuser:
-                if scheme.branch and user.branch != scheme.branch:
-                    if not (user.role and user.role.name.lower() == 'regional manager'):
-                        return JsonResponse({'error': 'Permission denied'}, status=403)
+            if scheme.branch_id and not can_access_branch(request.user, scheme.branch_id):
+                return JsonResponse({'error': 'Permission denied'}, status=403)
             
             # Return scheme data as JSON
             scheme_data = {
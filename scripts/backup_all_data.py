@@ -2,6 +2,7 @@
 """
 Script to backup all critical data to JSON files that can be committed to version control.
 Run this script before deployment to ensure all important data can be restored in production.
+Customers, items, loans, payments and sales are backed up by backup_incremental.py.
 """
 import os
 import sys
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Incremental backup of customers, items, loans, loan items, payments, extensions and sales.
+
+Each run writes gzipped NDJSON shards and a manifest to backups/incremental/<run>/
+and only captures rows changed since the previous run (see pawnshop_management.backups).
+Configuration data (branches, schemes, roles) is still covered by backup_all_data.py.
+
+Usage:
+    python scripts/backup_incremental.py            # changes since the last run
+    python scripts/backup_incremental.py --full     # everything, starting a new chain
+"""
+import os
+import sys
+import argparse
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Set up Django
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pawnshop_management.settings')
+django.setup()
+
+from pawnshop_management import backups
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incremental backup of the transactional tables')
+    parser.add_argument('--dir', default=None, help='Backup root (default: backups/incremental)')
+    parser.add_argument('--full', action='store_true', help='Back up every row instead of changes since the last run')
+    parser.add_argument('--table', action='append', choices=list(backups.TABLES_BY_NAME),
+                        help='Only back up this table (repeatable)')
+    args = parser.parse_args()
+
+    manifest = backups.backup(args.dir, tables=args.table, full=args.full, log=logger.info)
+    rows = sum(shard['rows'] for shards in manifest['tables'].values() for shard in shards)
+    logger.info(f"✅ Backup {manifest['run_id']} complete: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
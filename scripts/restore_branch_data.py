@@ -2,10 +2,17 @@
 """
 Script to restore branch data from JSON backup files.
 Run this script after deployment to restore branch data in the production environment.
+
+With --parallel it then restores the per-branch shards written by
+backup_branch_data.py --parallel, several branches at a time:
+
+    python scripts/restore_branch_data.py --parallel --workers 8
+    python scripts/restore_branch_data.py --parallel --branch 3 --until 20250101_020000_000000
 """
 import os
 import sys
 import json
+import argparse
 import datetime
 import logging
 
@@ -28,7 +35,9 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pawnshop_management.settings')
 django.setup()
 
 from django.db import transaction
+from django.conf import settings as django_settings
 from branches.models import Branch, BranchSettings
+from pawnshop_management import backups
 from django.utils.timezone import make_aware
 from datetime import datetime
 
@@ -161,8 +170,34 @@ def create_default_branch_if_empty():
         logger.info(f"✅ Created default branch: {branch.name}")
 
 
+def restore_branch_shards(args):
+    """Restore the branches' transactional data, several branches at a time"""
+    try:
+        rows = backups.restore_branches(
+            args.dir, until=args.until, branch_ids=args.branch, workers=args.workers, log=logger.info,
+        )
+    except backups.BackupError as e:
+        logger.error(f"❌ {e}")
+        return False
+    logger.info(f"✅ Restored {rows} rows")
+    return True
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Restore branch data')
+    parser.add_argument('--parallel', action='store_true',
+                        help="Also restore each branch's transactional data on a process pool")
+    parser.add_argument('--workers', type=int, default=django_settings.BACKUP_WORKERS,
+                        help='Branches restored at the same time (default: BACKUP_WORKERS)')
+    parser.add_argument('--branch', type=int, action='append', help='Only this branch ID (repeatable)')
+    parser.add_argument('--until', default=None, help='Last backup run to apply (default: the latest)')
+    parser.add_argument('--dir', default=None, help='Shard root (default: backups/branches)')
+    args = parser.parse_args()
+
     success = restore_branch_data()
     
     if not success:
-        create_default_branch_if_empty()
\ No newline at end of file
+        create_default_branch_if_empty()
+
+    if args.parallel and not restore_branch_shards(args):
+        sys.exit(1)
\ No newline at end of file
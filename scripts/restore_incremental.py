@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Restore the transactional tables from incremental backups made by backup_incremental.py.
+
+Runs are applied oldest first; every shard's checksum is verified before any
+row is written. Restore branches, schemes and users first (restore_all_data.py),
+then rebuild derived data: backfill_rollups, rebuild_search_index and
+rebuild_loan_ledger.
+
+Usage:
+    python scripts/restore_incremental.py                          # all runs
+    python scripts/restore_incremental.py --until 20250101_020000_000000
+"""
+import os
+import sys
+import argparse
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Set up Django
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pawnshop_management.settings')
+django.setup()
+
+from pawnshop_management import backups
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Restore the transactional tables from incremental backups')
+    parser.add_argument('--dir', default=None, help='Backup root (default: backups/incremental)')
+    parser.add_argument('--until', default=None, help='Last backup run to apply (default: the latest)')
+    parser.add_argument('--table', action='append', choices=list(backups.TABLES_BY_NAME),
+                        help='Only restore this table (repeatable)')
+    parser.add_argument('--verify-only', action='store_true', help='Check shard checksums without restoring')
+    args = parser.parse_args()
+
+    root = args.dir or backups.default_root()
+    try:
+        if args.verify_only:
+            for run_id in backups.runs(root):
+                directory = os.path.join(root, run_id)
+                backups.verify(directory, backups.load_manifest(directory))
+                logger.info(f"✅ {run_id} verified")
+            return 0
+        rows = backups.restore(root, until=args.until, tables=args.table, log=logger.info)
+    except backups.BackupError as e:
+        logger.error(f"❌ {e}")
+        return 1
+    logger.info(f"✅ Restored {rows} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
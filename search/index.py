@@ -0,0 +1,333 @@
+"""
+Search index for loans, customers and inventory items.
+
+On SQLite the index lives in two FTS5 tables created by the search migration:
+
+- ``search_document``: names and descriptions, unicode61 tokens with prefix
+  indexes, so "ram kum" finds "Ramesh Kumar".
+- ``search_fragment``: loan numbers, phone numbers and other codes, trigram
+  tokens, so any fragment of three or more characters matches.
+
+Each object has one row per table with rowid ``object_id * len(KINDS) + kind``,
+which makes updates and deletes point lookups. Signals in ``search.models``
+keep the rows in sync; ``rebuild_search_index`` fills the index for existing
+data (``start.sh`` runs it with ``--if-empty`` after migrating). Other
+databases, and an index that has never been filled, fall back to the original
+``icontains`` filters.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+LOAN = 'loan'
+CUSTOMER = 'customer'
+ITEM = 'item'
+KINDS = (LOAN, CUSTOMER, ITEM)
+
+# Fragments shorter than a trigram can only be matched as word prefixes
+MIN_FRAGMENT_LENGTH = 3
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# Set once the index is seen holding rows; an index is not emptied again in use
+_populated = False
+
+
+def is_available():
+    """True when the FTS5 index is in use for the default database"""
+    return connection.vendor == 'sqlite'
+
+
+def is_populated():
+    """True when the FTS5 index is in use and has been filled"""
+    global _populated
+    if not _populated and is_available():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM search_document LIMIT 1")
+            _populated = cursor.fetchone() is not None
+    return _populated
+
+
+def _rowid(kind, object_id):
+    return int(object_id) * len(KINDS) + KINDS.index(kind)
+
+
+def _join(*values):
+    return ' '.join(str(value) for value in values if value)
+
+
+# Documents
+
+def _loan_documents(ids):
+    from transactions.models import Loan, LoanItem
+
+    item_names = {}
+    for loan_id, name in LoanItem.objects.filter(loan_id__in=ids).values_list('loan_id', 'item__name'):
+        item_names.setdefault(loan_id, []).append(name)
+
+    loans = Loan.objects.filter(pk__in=ids).values_list(
+        'pk', 'branch_id', 'loan_number', 'customer__first_name', 'customer__last_name', 'customer__phone',
+    )
+    for pk, branch_id, loan_number, first_name, last_name, phone in loans:
+        yield (
+            pk, branch_id,
+            _join(loan_number, first_name, last_name),
+            _join(*item_names.get(pk, [])),
+            _join(loan_number, phone),
+        )
+
+
+def _customer_documents(ids):
+    from accounts.models import Customer
+
+    customers = Customer.objects.filter(pk__in=ids).values_list(
+        'pk', 'branch_id', 'first_name', 'last_name', 'email', 'phone', 'city', 'id_number',
+    )
+    for pk, branch_id, first_name, last_name, email, phone, city, id_number in customers:
+        yield (
+            pk, branch_id,
+            _join(first_name, last_name),
+            _join(email, city),
+            _join(phone, id_number, email),
+        )
+
+
+def _item_documents(ids):
+    from inventory.models import Item
+
+    items = Item.objects.filter(pk__in=ids).values_list(
+        'pk', 'branch_id', 'item_id', 'name', 'description', 'brand', 'model', 'serial_number',
+        'customer__first_name', 'customer__last_name',
+    )
+    for pk, branch_id, item_id, name, description, brand, model, serial_number, first_name, last_name in items:
+        yield (
+            pk, branch_id,
+            _join(name, brand, model),
+            _join(description, first_name, last_name),
+            _join(item_id, serial_number),
+        )
+
+
+DOCUMENT_BUILDERS = {
+    LOAN: _loan_documents,
+    CUSTOMER: _customer_documents,
+    ITEM: _item_documents,
+}
+
+
+# Index maintenance
+
+def remove_objects(kind, ids):
+    """Delete index rows for the given objects"""
+    if not is_available() or not ids:
+        return
+    rowids = [(_rowid(kind, pk),) for pk in ids]
+    with connection.cursor() as cursor:
+        cursor.executemany("DELETE FROM search_document WHERE rowid = %s", rowids)
+        cursor.executemany("DELETE FROM search_fragment WHERE rowid = %s", rowids)
+
+
+def index_objects(kind, ids):
+    """(Re)index the given objects; ids that no longer exist are removed"""
+    if not is_available() or not ids:
+        return
+    ids = list(ids)
+    documents = []
+    fragments = []
+    for pk, branch_id, title, body, codes in DOCUMENT_BUILDERS[kind](ids):
+        rowid = _rowid(kind, pk)
+        documents.append((rowid, kind, pk, branch_id, title, body))
+        fragments.append((rowid, kind, pk, branch_id, codes))
+
+    with transaction.atomic():
+        remove_objects(kind, ids)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO search_document (rowid, kind, object_id, branch_id, title, body) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                documents,
+            )
+            cursor.executemany(
+                "INSERT INTO search_fragment (rowid, kind, object_id, branch_id, codes) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                fragments,
+            )
+
+
+def clear():
+    """Empty the whole index"""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM search_document")
+        cursor.execute("DELETE FROM search_fragment")
+
+
+def optimize():
+    """Merge FTS5 b-tree segments after bulk changes"""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO search_document (search_document) VALUES ('optimize')")
+        cursor.execute("INSERT INTO search_fragment (search_fragment) VALUES ('optimize')")
+
+
+# Queries
+
+def _quote(token):
+    return '"' + token.replace('"', '""') + '"'
+
+
+def _text_query(query):
+    """FTS5 expression requiring every word as a prefix"""
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    return ' AND '.join(_quote(token) + '*' for token in tokens)
+
+
+def _fragment_query(query):
+    """Trigram expression requiring every 3+ character fragment as a substring"""
+    tokens = [token for token in _TOKEN_RE.findall(query) if len(token) >= MIN_FRAGMENT_LENGTH]
+    if not tokens:
+        return None
+    return ' AND '.join(_quote(token) for token in tokens)
+
+
+def _filters(table, kinds, branch_ids):
+    clauses = []
+    params = []
+    if kinds:
+        clauses.append(f"{table}.kind IN ({', '.join(['%s'] * len(kinds))})")
+        params.extend(kinds)
+    if branch_ids is not None:
+        if not branch_ids:
+            clauses.append("0")
+        else:
+            clauses.append(f"{table}.branch_id IN ({', '.join(['%s'] * len(branch_ids))})")
+            params.extend(branch_ids)
+    return ''.join(f" AND {clause}" for clause in clauses), params
+
+
+def search(query, kinds=None, branch_ids=None, limit=20):
+    """Return ranked hits for a query across loans, customers and items.
+
+    Each hit is a dict with ``kind``, ``id``, ``branch_id``, ``title`` and
+    ``score`` (lower is better). ``branch_ids`` restricts results to those
+    branches when given.
+    """
+    kinds = [kind for kind in (kinds or KINDS) if kind in KINDS]
+    if not query or not kinds:
+        return []
+    if not is_populated():
+        return _fallback_search(query, kinds, branch_ids, limit)
+
+    hits = {}
+    with connection.cursor() as cursor:
+        text_query = _text_query(query)
+        if text_query:
+            where, params = _filters('search_document', kinds, branch_ids)
+            cursor.execute(
+                "SELECT kind, object_id, branch_id, title, bm25(search_document, 0, 0, 0, 10.0, 1.0) "
+                "FROM search_document WHERE search_document MATCH %s" + where +
+                " ORDER BY 5 LIMIT %s",
+                [text_query] + params + [limit],
+            )
+            for kind, object_id, branch_id, title, score in cursor.fetchall():
+                hits[(kind, object_id)] = {'kind': kind, 'id': object_id, 'branch_id': branch_id,
+                                           'title': title, 'score': score}
+
+        fragment_query = _fragment_query(query)
+        if fragment_query:
+            where, params = _filters('search_fragment', kinds, branch_ids)
+            cursor.execute(
+                "SELECT search_fragment.kind, search_fragment.object_id, search_fragment.branch_id, "
+                "search_document.title, bm25(search_fragment) "
+                "FROM search_fragment JOIN search_document ON search_document.rowid = search_fragment.rowid "
+                "WHERE search_fragment MATCH %s" + where + " ORDER BY 5 LIMIT %s",
+                [fragment_query] + params + [limit],
+            )
+            for kind, object_id, branch_id, title, score in cursor.fetchall():
+                hit = hits.get((kind, object_id))
+                if hit is None or score < hit['score']:
+                    hits[(kind, object_id)] = {'kind': kind, 'id': object_id, 'branch_id': branch_id,
+                                               'title': title, 'score': score}
+
+    return sorted(hits.values(), key=lambda hit: hit['score'])[:limit]
+
+
+def _match_subquery(kind, query):
+    """SQL selecting the ids of objects of one kind that match the query"""
+    parts = []
+    params = []
+    text_query = _text_query(query)
+    if text_query:
+        parts.append("SELECT object_id FROM search_document WHERE search_document MATCH %s AND kind = %s")
+        params.extend([text_query, kind])
+    fragment_query = _fragment_query(query)
+    if fragment_query:
+        parts.append("SELECT object_id FROM search_fragment WHERE search_fragment MATCH %s AND kind = %s")
+        params.extend([fragment_query, kind])
+    if not parts:
+        return None, []
+    return ' UNION '.join(parts), params
+
+
+# icontains filters used where FTS5 is not available or the index is still empty
+FALLBACK_FILTERS = {
+    LOAN: lambda q: (
+        Q(customer__first_name__icontains=q) |
+        Q(customer__last_name__icontains=q) |
+        Q(loan_number__icontains=q) |
+        Q(loanitem__item__name__icontains=q)
+    ),
+    CUSTOMER: lambda q: (
+        Q(first_name__icontains=q) |
+        Q(last_name__icontains=q) |
+        Q(email__icontains=q) |
+        Q(phone__icontains=q)
+    ),
+    ITEM: lambda q: (
+        Q(name__icontains=q) |
+        Q(item_id__icontains=q) |
+        Q(description__icontains=q) |
+        Q(serial_number__icontains=q) |
+        Q(brand__icontains=q) |
+        Q(model__icontains=q) |
+        Q(customer__first_name__icontains=q) |
+        Q(customer__last_name__icontains=q)
+    ),
+}
+
+
+def filter_queryset(queryset, kind, query):
+    """Restrict a Loan, Customer or Item queryset to objects matching the query"""
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    if not is_populated():
+        return queryset.filter(FALLBACK_FILTERS[kind](query)).distinct()
+    sql, params = _match_subquery(kind, query)
+    if sql is None:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(sql, params))
+
+
+def _fallback_search(query, kinds, branch_ids, limit):
+    from accounts.models import Customer
+    from inventory.models import Item
+    from transactions.models import Loan
+
+    models = {LOAN: (Loan, 'loan_number'), CUSTOMER: (Customer, 'first_name'), ITEM: (Item, 'name')}
+    hits = []
+    for kind in kinds:
+        model, title_field = models[kind]
+        queryset = filter_queryset(model.objects.all(), kind, query)
+        if branch_ids is not None:
+            queryset = queryset.filter(branch_id__in=branch_ids)
+        for pk, branch_id, title in queryset.values_list('pk', 'branch_id', title_field)[:limit]:
+            hits.append({'kind': kind, 'id': pk, 'branch_id': branch_id, 'title': title, 'score': 0.0})
+    return hits[:limit]
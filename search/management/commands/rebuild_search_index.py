@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from accounts.models import Customer
+from inventory.models import Item
+from transactions.models import Loan
+from search import index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for loans, customers and items'
+
+    MODELS = {
+        index.LOAN: Loan,
+        index.CUSTOMER: Customer,
+        index.ITEM: Item,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            choices=index.KINDS,
+            action='append',
+            help='Only rebuild this kind of object (can be repeated)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of objects to index per transaction'
+        )
+        parser.add_argument(
+            '--if-empty',
+            action='store_true',
+            help='Only build the index when it holds no rows yet, as after the first migrate'
+        )
+
+    def handle(self, *args, **options):
+        if not index.is_available():
+            raise CommandError("The search index requires SQLite with FTS5; other databases search with icontains")
+
+        if options['if_empty'] and index.is_populated():
+            self.stdout.write("The search index is already built")
+            return
+
+        kinds = options.get('kind') or index.KINDS
+        batch_size = options['batch_size']
+
+        if set(kinds) == set(index.KINDS):
+            index.clear()
+
+        for kind in kinds:
+            model = self.MODELS[kind]
+            ids = model._base_manager.order_by('pk').values_list('pk', flat=True)
+            total = ids.count()
+            self.stdout.write(f"Indexing {total} {kind} records")
+
+            processed = 0
+            last_pk = 0
+            while True:
+                batch = list(ids.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1]
+                with transaction.atomic():
+                    index.index_objects(kind, batch)
+                processed += len(batch)
+                self.stdout.write(f"Indexed {processed}/{total} {kind} records")
+
+        index.optimize()
+        self.stdout.write(self.style.SUCCESS("Successfully rebuilt the search index"))
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_index_tables(apps, schema_editor):
+    # FTS5 is SQLite-only; other databases use the icontains fallback in search.index
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_document USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, branch_id UNINDEXED, title, body, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_fragment USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, branch_id UNINDEXED, codes, "
+        "tokenize = 'trigram')"
+    )
+
+
+def drop_index_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS search_fragment")
+    schema_editor.execute("DROP TABLE IF EXISTS search_document")
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.RunPython(create_index_tables, drop_index_tables),
+    ]
@@ -0,0 +1,60 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from accounts.models import Customer
+from inventory.models import Item
+from transactions.models import Loan, LoanItem
+from . import index
+
+# The search index is stored in FTS5 virtual tables created by migration 0001
+# (see search.index). The receivers below keep it in sync with the source rows;
+# index writes share the caller's transaction, so they roll back together.
+
+
+@receiver(post_save, sender=Loan)
+def index_loan(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index.index_objects(index.LOAN, [instance.pk])
+
+
+@receiver(post_save, sender=Customer)
+def index_customer(sender, instance, raw=False, **kwargs):
+    """Customer names are also indexed on their loans and items"""
+    if raw:
+        return
+    index.index_objects(index.CUSTOMER, [instance.pk])
+    index.index_objects(index.LOAN, Loan.objects.filter(customer=instance).values_list('pk', flat=True))
+    index.index_objects(index.ITEM, Item.objects.filter(customer=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Item)
+def index_item(sender, instance, raw=False, **kwargs):
+    """Item names are also indexed on the loans they are pledged against"""
+    if raw:
+        return
+    index.index_objects(index.ITEM, [instance.pk])
+    index.index_objects(index.LOAN, LoanItem.objects.filter(item=instance).values_list('loan_id', flat=True))
+
+
+@receiver(post_save, sender=LoanItem)
+@receiver(post_delete, sender=LoanItem)
+def index_loan_items(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index.index_objects(index.LOAN, [instance.loan_id])
+
+
+@receiver(post_delete, sender=Loan)
+def remove_loan(sender, instance, **kwargs):
+    index.remove_objects(index.LOAN, [instance.pk])
+
+
+@receiver(post_delete, sender=Customer)
+def remove_customer(sender, instance, **kwargs):
+    index.remove_objects(index.CUSTOMER, [instance.pk])
+
+
+@receiver(post_delete, sender=Item)
+def remove_item(sender, instance, **kwargs):
+    index.remove_objects(index.ITEM, [instance.pk])
@@ -0,0 +1,127 @@
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from accounts import access
+from accounts.models import Customer, CustomUser
+from branches.models import Branch
+from inventory.models import Category, Item
+from search import index
+from transactions.models import Loan, LoanItem
+
+
+def make_branch(name):
+    return Branch.objects.create(name=name, address='1 Street', city='City', state='State', zip_code='1', phone='1')
+
+
+class SearchIndexTests(TestCase):
+    """The FTS index follows saves and deletes and ranks matches for the search view"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = make_branch('Main')
+        cls.other_branch = make_branch('North')
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.clerk = CustomUser.objects.create_user('clerk', password='password', branch=cls.branch)
+
+        category = Category.objects.create(name='Gold', slug='gold')
+        cls.customers = {}
+        for i, (first_name, last_name, branch) in enumerate([
+            ('Ramesh', 'Kumar', cls.branch),
+            ('Sita', 'Devi', cls.branch),
+            ('Ramesh', 'Rao', cls.other_branch),
+        ]):
+            customer = Customer.objects.create(
+                first_name=first_name, last_name=last_name, phone=f'98450{i:05d}', branch=branch
+            )
+            cls.customers[(first_name, last_name)] = customer
+            item = Item.objects.create(
+                item_id=f'IT{i:04d}', name=f'Bangle {i}', description='22k bangle', category=category,
+                branch=branch, customer=customer,
+            )
+            today = datetime.date.today()
+            loan = Loan.objects.create(
+                loan_number=f'2024-03-{branch.pk:02d}-{i:04d}', customer=customer, branch=branch,
+                principal_amount=10000, distribution_amount=10000,
+                issue_date=today, due_date=today + datetime.timedelta(days=90),
+                grace_period_end=today + datetime.timedelta(days=97),
+            )
+            LoanItem.objects.create(
+                loan=loan, item=item, gold_karat=22, gross_weight=10, net_weight=9.5, market_price_22k=6000,
+            )
+
+    def setUp(self):
+        if not index.is_available():
+            self.skipTest('the search index needs SQLite FTS5')
+        # Rolled-back users keep their pks; drop policies cached by earlier tests
+        access.invalidate()
+
+    def hits(self, query, **kwargs):
+        return {(hit['kind'], hit['title']) for hit in index.search(query, **kwargs)}
+
+    def test_word_prefixes(self):
+        self.assertEqual(self.hits('ram kum', kinds=[index.CUSTOMER]), {(index.CUSTOMER, 'Ramesh Kumar')})
+        self.assertIn((index.LOAN, '2024-03-%02d-0000 Ramesh Kumar' % self.branch.pk), self.hits('ram kum'))
+
+    def test_fragments(self):
+        # Middle of a phone number, and of a loan number
+        self.assertEqual(self.hits('5000001', kinds=[index.CUSTOMER]), {(index.CUSTOMER, 'Sita Devi')})
+        loans = self.hits('0002', kinds=[index.LOAN])
+        self.assertEqual(loans, {(index.LOAN, '2024-03-%02d-0002 Ramesh Rao' % self.other_branch.pk)})
+
+    def test_reindex_on_save_and_delete(self):
+        customer = self.customers[('Sita', 'Devi')]
+        customer.last_name = 'Sharma'
+        customer.save()
+        self.assertFalse(self.hits('devi'))
+        # The new name is indexed on the customer and on their loan and item
+        self.assertEqual({kind for kind, _title in self.hits('sita sharma')}, set(index.KINDS))
+
+        Item.objects.filter(customer=customer).get().delete()
+        self.assertFalse(self.hits('bangle 1', kinds=[index.ITEM]))
+
+    def test_branch_restriction(self):
+        self.assertEqual(len(self.hits('ramesh', kinds=[index.CUSTOMER])), 2)
+        self.assertEqual(self.hits('ramesh', kinds=[index.CUSTOMER], branch_ids=[self.branch.pk]),
+                         {(index.CUSTOMER, 'Ramesh Kumar')})
+        self.assertFalse(self.hits('ramesh', branch_ids=[]))
+
+        self.client.force_login(self.clerk)
+        results = self.client.get(reverse('search'), {'q': 'ramesh'}).json()['results']
+        self.assertTrue(results)
+        self.assertEqual({hit['branch_id'] for hit in results}, {self.branch.pk})
+
+    def test_view_fetches_loan_urls_in_one_query(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('search'), {'q': 'bangle'})
+        # Session, user, and the loan numbers of every loan hit; then the two FTS queries
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('search'), {'q': 'bangle'})
+        results = response.json()['results']
+        loan_urls = sorted(hit['url'] for hit in results if hit['kind'] == index.LOAN)
+        self.assertEqual(loan_urls, sorted(reverse('loan_detail', args=[loan.loan_number])
+                                           for loan in Loan.objects.all()))
+
+    def test_empty_index_falls_back_until_built(self):
+        # As after the first migrate over existing data
+        index.clear()
+        index._populated = False
+        self.addCleanup(setattr, index, '_populated', False)
+
+        hits = index.search('ramesh', kinds=[index.CUSTOMER])
+        self.assertEqual({hit['id'] for hit in hits},
+                         {self.customers[('Ramesh', 'Kumar')].pk, self.customers[('Ramesh', 'Rao')].pk})
+        loans = index.filter_queryset(Loan.objects.all(), index.LOAN, 'kumar')
+        self.assertEqual(list(loans.values_list('customer__last_name', flat=True)), ['Kumar'])
+        self.assertFalse(index.is_populated())
+
+        call_command('rebuild_search_index', if_empty=True, stdout=StringIO())
+        self.assertTrue(index.is_populated())
+        self.assertEqual(self.hits('ram kum', kinds=[index.CUSTOMER]), {(index.CUSTOMER, 'Ramesh Kumar')})
+
+        out = StringIO()
+        call_command('rebuild_search_index', if_empty=True, stdout=out)
+        self.assertIn('already built', out.getvalue())
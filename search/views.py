@@ -0,0 +1,48 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.generic import View
+
+from accounts.access import visible_branch_ids
+
+from . import index
+
+
+def _result_urls(hits):
+    """Set each hit's url; loan URLs use the loan number, fetched for all loan hits in one query"""
+    from transactions.models import Loan
+
+    loan_ids = [hit['id'] for hit in hits if hit['kind'] == index.LOAN]
+    loan_numbers = dict(Loan.objects.filter(pk__in=loan_ids).values_list('pk', 'loan_number')) if loan_ids else {}
+    for hit in hits:
+        if hit['kind'] == index.LOAN:
+            loan_number = loan_numbers.get(hit['id'])
+            hit['url'] = reverse('loan_detail', args=[loan_number]) if loan_number else None
+        elif hit['kind'] == index.CUSTOMER:
+            hit['url'] = reverse('customer_detail', args=[hit['id']])
+        else:
+            hit['url'] = reverse('item_detail', args=[hit['id']])
+
+
+class SearchView(LoginRequiredMixin, View):
+    """Ranked search across loans, customers and items
+
+    GET /search/?q=<text>[&kind=loan&kind=customer][&limit=20]
+    """
+
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        kinds = request.GET.getlist('kind') or None
+        try:
+            limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+        except ValueError:
+            limit = 20
+
+        # Branch staff only see results from the branches they may access
+        branch_ids = visible_branch_ids(request.user)
+        if branch_ids is not None:
+            branch_ids = sorted(branch_ids)
+
+        hits = index.search(query, kinds=kinds, branch_ids=branch_ids, limit=limit)
+        _result_urls(hits)
+        return JsonResponse({'query': query, 'results': hits})
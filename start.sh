@@ -35,6 +35,14 @@ fi
 echo "Ensuring all critical data is restored..."
 python scripts/restore_all_data.py || echo "⚠️ Data restoration had issues, but continuing"
 
+# Fill the search index on the first deploy; searches use icontains until then
+echo "Building search index if empty..."
+python manage.py rebuild_search_index --if-empty || echo "⚠️ Search index build had issues, searches fall back to icontains"
+
+# The dashboards read only the daily rollups; build them on the first deploy
+echo "Backfilling dashboard rollups if empty..."
+python manage.py backfill_rollups --if-empty || echo "⚠️ Rollup backfill had issues, run backfill_rollups by hand"
+
 # Create superuser if environment variables are set
 echo "Checking for superuser credentials..."
 if [[ -n "$DJANGO_SUPERUSER_USERNAME" && -n "$DJANGO_SUPERUSER_PASSWORD" && -n "$DJANGO_SUPERUSER_EMAIL" ]]; then
@@ -107,6 +115,14 @@ ls -la
 echo "Python path:"
 python -c "import sys; print(sys.path)"
 
+# Render queued PDFs beside the web server; both must see the same PDF_CACHE_DIR
+echo "Starting document renderer..."
+python manage.py run_document_renderer &
+
+# Run queued reports beside the web server; both must see the same MEDIA_ROOT
+echo "Starting report worker..."
+python manage.py run_report_worker &
+
 # Start the application server after migrations have completed
 echo "Starting web server..."
 {
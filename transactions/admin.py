@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Loan, Payment, LoanExtension, Sale
+from .models import Loan, Payment, LoanExtension, LoanLifecycleEvent, DocumentRenderJob, Sale
 
 
 class PaymentInline(admin.TabularInline):
@@ -75,3 +75,19 @@ class SaleAdmin(admin.ModelAdmin):
         if not obj.sold_by:
             obj.sold_by = request.user
         super().save_model(request, obj, form, change)
+
+
+@admin.register(LoanLifecycleEvent)
+class LoanLifecycleEventAdmin(admin.ModelAdmin):
+    list_display = ('loan', 'event', 'from_status', 'to_status', 'threshold_date', 'run_date', 'items_updated')
+    list_filter = ('event', 'run_date', 'loan__branch')
+    search_fields = ('loan__loan_number',)
+    raw_id_fields = ('loan',)
+
+
+@admin.register(DocumentRenderJob)
+class DocumentRenderJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'object_id', 'status', 'attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('object_id', 'key')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
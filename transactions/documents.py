@@ -0,0 +1,482 @@
+"""
+PDF rendering service for loan agreements and payment receipts.
+
+Documents are rendered outside the web processes and cached on disk under
+PDF_CACHE_DIR. A request for a document that is not cached queues a
+``DocumentRenderJob`` (see ``transactions.render_jobs``), which the
+``run_document_renderer`` command picks up. Each file is keyed by a
+fingerprint of the data it shows, so a changed loan or payment gets a new
+file, and the stale one is removed when its replacement is written. Marker
+files make the pending and failed states visible to every web process.
+
+The renderer touches a heartbeat file in the cache directory every round.
+Without a recent heartbeat (no renderer running, or one that cannot see
+this PDF_CACHE_DIR) the request renders the document itself, so documents
+are never left pending with nobody to render them.
+
+Agreements for a whole branch and date range can also be exported as one
+ZIP archive, streamed entry by entry. The ``export_agreements`` command
+renders them in a process pool; the export view renders them one at a time
+in the request, so it never forks or closes connections mid-response.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.utils import timezone
+from xhtml2pdf import pisa
+
+from pawnshop_management import media_store
+
+LOAN_AGREEMENT = 'loan_agreement'
+PAYMENT_RECEIPT = 'payment_receipt'
+
+# Bump to invalidate every cached document after a template change
+DOCUMENT_VERSION = 1
+
+# Seconds after which a pending marker is considered abandoned (e.g. the process died)
+PENDING_TIMEOUT = 300
+
+# Seconds after the renderer's last heartbeat before requests render documents themselves
+RENDERER_TIMEOUT = 60
+RENDERER_HEARTBEAT = '.renderer-heartbeat'
+
+# Placeholder image for a missing customer photo (base64 PNG)
+DEFAULT_CUSTOMER_PHOTO = "iVBORw0KGgoAAAANSUhEUgAAADAAAAAwCAYAAABXAvmHAAAABGdBTUEAALGPC/xhBQAAACBjSFJNAAB6JgAAgIQAAPoAAACA6AAAdTAAAOpgAAA6mAAAF3CculE8AAAABmJLR0QA/wD/AP+gvaeTAAAACXBIWXMAAAsTAAALEwEAmpwYAAAAB3RJTUUH5gQaDyoKQAHnpAAAA+1JREFUaN7tmm1IVEEUht+Z3VxXs7TdVikRIlMhkEgogxDCQrGPBCMsP37RD21D/RH0L/xRUJFA/QiMwC9E0NAfJUVEaYmGJWUUUUFFJZG2rru3H+ruuO7u3L1z72p04ID7dWbmnPec887ZO8A0pmlM07j+2DFy5I+4/r9YSYa7MX4QCSRsKTR0Fbgd6olObJyXhEJX+gbPsQ15E+iEo02rpf6MgR9gOFU5Ksv4ISDBqaYMPcQIn51zQcr4pZBAx8xkZcxZmxA3BNrryPb1syWgdNdVXwxzNr+W6wvNmUKNAZdnCJHRqKAEsOQk7HoWi8S1Bs6Fc2Gl6IfDSFWl8bPv84LInywiKoYNOImHCTMDXCus2ITOPGmfmjNkIbRMiTwLnkIfJ/xJx9OESkDZFNJbIPpOIfdggxLnPbdWNnQV4EY6AyDPkXf2gwlZdtwbhRG+sVJrYDDcxEn+uWhCFi751Jzb67iapgbrppCaIQw4Pzc7ya9k2HwLtVAXmnzCN3rKtBIIf4j9FB5aSIi0sJIVIvAQS8jcBe9qBX+qDpn47Nxs5HtvuVYzrd9ByDmkqd5lu+XLGDJw430Gl/PrvTfSfgm7+gYR97x1ED88UyL280r7Nsf3vePRpFBroMH7ky6F3K5mjHSJ/2n0h3HbH03MsE+MdL5cStHVBfLQBcGJezoH53Pi4N1/14UkfnEFz7RcoXp37qiWqA402CT/XV8/BNb5qVSubK9IxhsOAlHO5ykJSF6oMpHAThZjkBDARO/XkRnQMsIXeCnfeNU0YRbid/oG5ji2Uw5CI524/x4x7i4p441DgOHTnTdciRxaSHCYyzEQiSC10Ymlg1ay8Un3UydIcEEo5zN8QWPyfcM19aGeZRXja+O3FTGBLiXD52aCZw1oeAAAAAA="
+
+# Placeholder image for a missing item photo (base64 PNG)
+DEFAULT_ITEM_PHOTO = "iVBORw0KGgoAAAANSUhEUgAAADAAAAAwCAYAAABXAvmHAAAABGdBTUEAALGPC/xhBQAAACBjSFJNAAB6JgAAgIQAAPoAAACA6AAAdTAAAOpgAAA6mAAAF3CculE8AAAABmJLR0QA/wD/AP+gvaeTAAAACXBIWXMAAAsTAAALEwEAmpwYAAAAB3RJTUUH5gQaDysZXrfKuwAABXtJREFUaN7tmGtsFFUUx/93Zna7W2i7pbbG+EAoaEUUIpo04MvEYIKpfNCIJsRCY/PBGBIKftBIeAa/+MlAYtSAihETozGa+ACJSIAItGDCw1RLQYRYbIFC2+3O7MydO9cPs9ty587M3N1G4wb+yc3svTt3zv93zrnnnnsXSJEiRYoUKVKk+A8hOgf/uqv8Or7ZZ0XNXdGU5btsItkmNGFH8YOw3rFdfOgvTyRBE7bvWUaIhcA4RA7DAU0eBkiBAnflIt6DIj4gfiQ73AbQVbr17EeZw8TQox5JSvUaA0MllUg0gTZkTrt+oU8awwAgDM1DF9BM0OQvA9NEra45tJi3FCeBNfXAgjkj+vMlJk/XA1kYiQaiVZ9MwawDhcSSqKzm8pmrRwIYn0BXNrPdE6H4Uf0IIfAp9uRP15xdZk31YV+3H+s33wWjJu7+Ph/dPdmI9GUbmSMiDvK+omp0p1F1DrMuFuUTB2FEgu9YNW5CSUExoyZau7OQbo7BXmAwQxGm1wDfREP1oUDCG29D5JqADoFh6I+gQBj4naxhxCMBg8EMsxKjxz10kzwegTg3XnPoPqbXBOIhIGAGYhAYQ+T0+CEdI8wXbog89IHypZbiJRC74VdUHxRXryWEs63gwNqcPucLkmzLuCqUNDFGlO6qj0CF6XsRqpsbDMkKkei9UcLaziBX89n3RL8t4IkvJQFpYplhwrxXVGFc7nPVBOvXHfI1fFtkVUPiExDljBXKiIpQt7k39MJv10KoKC2pRas3PioK5GR9BPQXIf/X1SpnkykI0nPUdasZA0MZcLNYTfKWJs7xfRU1EJYxav0+iN4xnmXu5+WEtQVBxV2a4scqP1uwnDAecLey1dWLJl+KkMFFnukzeZRihB7YhU7OkODZ36xsa7gm24/1wrWhHzboeBa5G+QjaI0zwVPKvK1MMGkB9/Vf3BDnhPew3ROnrKkB2YGWm+BHGuIdFlacPKW6jjqS1SJACQcYxIQUWt5EQJuZLUmCioOWqkDYv6nyMNnBZn9CyD6Jv9MI3m3qYvQNkkKaCSlIhOliQqALmB5VcM7qCa+h3zh/hQYJFgTmBrJ6lLCaPt9mZFmNZGolTBylLem+/80HP2YDlmBB0q2obXpIddxJjkVq3UkkQVvQtIl7p0OWfHrO5o8eV28SFKk1Tj8H4mduJJRe45ysqGZ7I+sxbdLez1SYQw8bbA1wboC9TFTXNMijzgXh/SUcaFOny3vCXQHZnwPCPbR0GUmqZtFFwn+doBeUOad11A4srRlA3KmzxggCDZ15iBck6PeSdB+9K8Rr02YC3qBMXJjmtQYy9LkQXxHm9pnCa0IpgVeQnFaYaPQlgSupBHDn/QP47JeuLG66siH8vMb02/b25tLAG2drPCFjBadPHwN4nIL25Ew7VuI3gRg676aXlO6Z1a0F850ggfiOE1NveuviAlwheCt5bsujuOJvATvQuhaFhQeojTvG8lHPBw/tq0c8p0/5HBicapyDg6qTG8eHu3IiPzVOGvPrCVfQSDCYbduH9/YCo/2mGa7DHRf7yuoVv2nDSHVi1oAFEnRmRFJerG3yve91/Pc59OJRx8/MPVowMDJRheY4t8U6VWjE2GJf9y674+krJV4Hjw9sWjBiLD0kqJ1xFUYUd7h6q9JkH17KDf3UeC+Pp+/xScDm1cNAeN+AEOfUuYkhhCaEE7uudKLDHURHcBJO+YpxpXcWzkTyAnmuUykJengC//auQEJeWb05MAMxK0/arKwojaFdBNwrZlkCDo9ZHFEMjFoGBrICCIsalBVT97lw5xXel4j0DUw0Y+h2/piI4l4h8QikjWhP0FIl8eP4b/BDw9VdlJqtNJoMlE5VsXuijUqzAlnmhJgliJ0OQZXEyj0JQIoUKVKkSJEiRYq/AT4c/wPH0I0QAAAAJXRFWHRkYXRlOmNyZWF0ZQAyMDIyLTA0LTI2VDE1OjQzOjI1KzAwOjAwf2xAQwAAACV0RVh0ZGF0ZTptb2RpZnkAMjAyMi0wNC0yNlQxNTo0MzoyNSswMDowMA4x+P8AAAAASUVORK5CYII="
+
+class DocumentRenderError(Exception):
+    """Raised when xhtml2pdf fails to produce a document"""
+
+
+class DocumentStatus:
+    """Result of requesting a document: ready (with a path), pending or failed"""
+    READY = 'ready'
+    PENDING = 'pending'
+    FAILED = 'failed'
+
+    def __init__(self, status, path=None, error=None):
+        self.status = status
+        self.path = path
+        self.error = error
+
+    @property
+    def is_ready(self):
+        return self.status == self.READY
+
+
+def safe_filename(name):
+    """Make a download filename URL-safe"""
+    return re.sub(r'[^\w\-_.]', '_', name)
+
+
+def render_pdf(template, context):
+    """Render a template (name or compiled template) to PDF bytes"""
+    if isinstance(template, str):
+        template = get_template(template)
+    html = template.render(context)
+    result = BytesIO()
+    pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result)
+    if pdf.err:
+        raise DocumentRenderError(f"xhtml2pdf reported {pdf.err} error(s)")
+    return result.getvalue()
+
+
+# Loan agreement
+
+def photo_base64(photo, default):
+    """Return a photo as a bare base64 string for embedding in a PDF.
+
+    Accepts data URLs, media store URLs, /media/ file paths and raw base64;
+    anything that cannot be read falls back to the placeholder.
+    """
+    if not isinstance(photo, str) or not photo:
+        return default
+    if photo.startswith('data:image/'):
+        try:
+            return photo.split(';base64,', 1)[1]
+        except IndexError:
+            return default
+    if media_store.is_blob_url(photo):
+        return media_store.read_blob_base64(photo) or default
+    if photo.startswith('/media/'):
+        media_root = os.path.abspath(settings.MEDIA_ROOT)
+        file_path = os.path.abspath(os.path.join(media_root, photo[len('/media/'):]))
+        # Validate file path to prevent directory traversal attacks
+        if not file_path.startswith(media_root):
+            print(f"Security warning: Invalid file path requested: {file_path}")
+            return default
+        try:
+            with open(file_path, 'rb') as f:
+                return base64.b64encode(f.read()).decode('utf-8')
+        except (IOError, OSError) as e:
+            print(f"Image file not found or not accessible: {file_path} ({e})")
+            return default
+    # Assume it's already a base64 string without prefix
+    return photo
+
+
+def _item_photo_list(item_photos):
+    """Parse the item_photos column into a list of photo strings"""
+    if isinstance(item_photos, list):
+        return item_photos
+    if not isinstance(item_photos, str) or not item_photos.strip():
+        return []
+    cleaned_data = item_photos.strip()
+    if (cleaned_data.startswith('"') and cleaned_data.endswith('"')) or \
+       (cleaned_data.startswith("'") and cleaned_data.endswith("'")):
+        cleaned_data = cleaned_data[1:-1]
+    try:
+        photos = json.loads(cleaned_data)
+    except json.JSONDecodeError:
+        # Maybe it's a single base64 string
+        return [cleaned_data] if cleaned_data.startswith('data:image/') else [None]
+    return photos if isinstance(photos, list) else [None]
+
+
+def loan_agreement_context(loan):
+    """Build the template context for a loan agreement"""
+    loan_items = list(loan.loanitem_set.select_related('item'))
+
+    customer_photo = photo_base64(loan.customer_face_capture, DEFAULT_CUSTOMER_PHOTO)
+    item_photos = [
+        photo_base64(photo, DEFAULT_ITEM_PHOTO)
+        for photo in _item_photo_list(loan.item_photos)
+        if photo is None or isinstance(photo, str)
+    ]
+    if not item_photos:
+        # One placeholder per pledged item, or at least one
+        item_photos = [DEFAULT_ITEM_PHOTO] * max(len(loan_items), 1)
+
+    return {
+        'loan': loan,
+        'loan_items': loan_items,
+        'customer': loan.customer,
+        'branch': loan.branch,
+        'date_today': timezone.now().date(),
+        'customer_photo': customer_photo,
+        'item_photos': item_photos,
+    }
+
+
+def loan_agreement_filename(loan):
+    """CustomerName_ItemName.pdf"""
+    customer_name = f"{loan.customer.first_name}_{loan.customer.last_name}"
+    first_item = loan.loanitem_set.select_related('item').first()
+    item_name = first_item.item.name.replace(' ', '_') if first_item and first_item.item else "NoItem"
+    return safe_filename(f"{customer_name}_{item_name}.pdf")
+
+
+def loan_agreement_fingerprint(loan):
+    """Values the loan agreement depends on"""
+    items = list(loan.loanitem_set.order_by('pk').values_list(
+        'pk', 'gold_karat', 'gross_weight', 'net_weight', 'item__name', 'item__description',
+    ))
+    return [
+        timezone.now().date(), loan.pk, loan.updated_at, loan.customer.updated_at, loan.branch.updated_at,
+        loan.customer_face_capture, loan.item_photos, items,
+    ]
+
+
+def _load_loan(pk):
+    from .models import Loan
+    return Loan.objects.with_photos().select_related('customer', 'branch', 'scheme').get(pk=pk)
+
+
+# Payment receipt
+
+def payment_receipt_context(payment):
+    """Build the template context for a payment receipt"""
+    from decimal import Decimal
+    from num2words import num2words
+
+    loan = payment.loan
+    interest_amount = max(Decimal('0'), loan.total_payable_till_date - loan.principal_amount)
+    total_paid = loan.amount_paid
+    remaining_balance = max(Decimal('0'), loan.total_payable_till_date - total_paid)
+
+    # Determine payment type (full or partial)
+    payment_type = 'partial'
+    notes = (payment.notes or '').lower()
+    if 'full payment' in notes or 'loan closed' in notes or 'fully repaid' in notes:
+        payment_type = 'full'
+
+    return {
+        'payment': payment,
+        'loan': loan,
+        'branch': loan.branch,
+        'interest_amount': interest_amount,
+        'total_paid': total_paid,
+        'remaining_balance': remaining_balance,
+        'payment_type': payment_type,
+        'amount_in_words': num2words(payment.amount, lang='en_IN').title() + " Rupees Only",
+        'date_today': timezone.now(),
+    }
+
+
+def payment_receipt_filename(payment):
+    customer_name = f"{payment.loan.customer.first_name}_{payment.loan.customer.last_name}"
+    payment_date = payment.payment_date.strftime('%d%b%Y')
+    return safe_filename(f"Payment_Receipt_{customer_name}_{payment_date}.pdf")
+
+
+def payment_receipt_fingerprint(payment):
+    """Values the receipt depends on, including the loan's running balance"""
+    loan = payment.loan
+    return [
+        timezone.now().date(), payment.pk, payment.amount, payment.payment_date, payment.payment_method,
+        payment.reference_number, payment.notes, payment.received_by_id,
+        loan.updated_at, loan.status, str(loan.amount_paid), loan.customer.updated_at, loan.branch.updated_at,
+    ]
+
+
+def _load_payment(pk):
+    from .models import Payment
+    return Payment.objects.select_related(
+        'received_by', 'loan__ledger', 'loan__scheme', 'loan__branch', 'loan__customer'
+    ).get(pk=pk)
+
+
+DOCUMENTS = {
+    LOAN_AGREEMENT: {
+        'template': 'transactions/loan_document_pdf.html',
+        'load': _load_loan,
+        'context': loan_agreement_context,
+        'fingerprint': loan_agreement_fingerprint,
+    },
+    PAYMENT_RECEIPT: {
+        'template': 'transactions/payment_receipt_pdf.html',
+        'load': _load_payment,
+        'context': payment_receipt_context,
+        'fingerprint': payment_receipt_fingerprint,
+    },
+}
+
+
+# Disk cache
+
+def cache_dir():
+    path = Path(getattr(settings, 'PDF_CACHE_DIR', Path(settings.BASE_DIR) / 'cache' / 'pdf'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def document_key(kind, obj):
+    """Content hash of everything the document shows"""
+    values = [DOCUMENT_VERSION, kind] + DOCUMENTS[kind]['fingerprint'](obj)
+    return hashlib.sha256(json.dumps(values, default=str).encode('utf-8')).hexdigest()
+
+
+def _document_path(kind, pk, key, suffix='.pdf'):
+    return cache_dir() / f"{kind}-{pk}-{key}{suffix}"
+
+
+def invalidate(kind, pk, keep=None):
+    """Delete cached files for one document, optionally keeping one key"""
+    for path in cache_dir().glob(f"{kind}-{pk}-*"):
+        if keep and path.name.startswith(f"{kind}-{pk}-{keep}"):
+            continue
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _write_to_cache(kind, pk, key, pdf_bytes):
+    """Atomically store a rendered document and drop older versions"""
+    tmp_path = _document_path(kind, pk, key, f'.{os.getpid()}.tmp')
+    tmp_path.write_bytes(pdf_bytes)
+    os.replace(tmp_path, _document_path(kind, pk, key))
+    invalidate(kind, pk, keep=key)
+
+
+def renderer_heartbeat():
+    """Mark a renderer as serving this cache directory (see RENDERER_TIMEOUT)"""
+    (cache_dir() / RENDERER_HEARTBEAT).touch()
+
+
+def renderer_running():
+    try:
+        return time.time() - (cache_dir() / RENDERER_HEARTBEAT).stat().st_mtime < RENDERER_TIMEOUT
+    except FileNotFoundError:
+        return False
+
+
+def render_to_cache(kind, pk, key):
+    """Render one document into the cache; returns None, or the error written to its .error marker"""
+    pending = _document_path(kind, pk, key, '.pending')
+    try:
+        spec = DOCUMENTS[kind]
+        obj = spec['load'](pk)
+        _write_to_cache(kind, pk, key, render_pdf(spec['template'], spec['context'](obj)))
+        return None
+    except Exception as e:
+        print(f"Error rendering {kind} {pk}: {e}")
+        _document_path(kind, pk, key, '.error').write_text(str(e))
+        return str(e)
+    finally:
+        try:
+            pending.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def request_document(kind, obj):
+    """Return the cached document for obj, queueing a render job (or rendering it, with no renderer) if there is none"""
+    from . import render_jobs
+
+    key = document_key(kind, obj)
+    path = _document_path(kind, obj.pk, key)
+    if path.exists():
+        return DocumentStatus(DocumentStatus.READY, path=path)
+
+    error_path = _document_path(kind, obj.pk, key, '.error')
+    if error_path.exists():
+        error = error_path.read_text()
+        # Report the failure once; the next request retries
+        error_path.unlink(missing_ok=True)
+        return DocumentStatus(DocumentStatus.FAILED, error=error)
+
+    pending = _document_path(kind, obj.pk, key, '.pending')
+    try:
+        fd = os.open(pending, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if time.time() - pending.stat().st_mtime < PENDING_TIMEOUT:
+            return DocumentStatus(DocumentStatus.PENDING)
+        # Left by a request whose job was lost; queue it again (a job still queued is reused)
+        os.utime(pending)
+    else:
+        os.close(fd)
+
+    if not renderer_running():
+        error = render_to_cache(kind, obj.pk, key)
+        if error:
+            error_path.unlink(missing_ok=True)
+            return DocumentStatus(DocumentStatus.FAILED, error=error)
+        return DocumentStatus(DocumentStatus.READY, path=path)
+
+    render_jobs.enqueue(kind, obj.pk, key)
+    return DocumentStatus(DocumentStatus.PENDING)
+
+
+# Batch export
+
+# Compiled agreement template, kept per worker process across documents
+_batch_template = None
+
+
+def agreement_loan_ids(start_date, end_date, branch_ids=None):
+    """Primary keys of loans issued in the date range, in filing order"""
+    from .models import Loan
+    loans = Loan.objects.filter(issue_date__range=(start_date, end_date))
+    if branch_ids is not None:
+        loans = loans.filter(branch_id__in=branch_ids)
+    return list(loans.order_by('branch_id', 'issue_date', 'loan_number').values_list('pk', flat=True))
+
+
+def _init_batch_worker():
+    import django
+    django.setup()
+
+
+def _render_batch_agreement(pk):
+    """Process-pool job: return (archive name, pdf bytes, error) for one loan"""
+    global _batch_template
+    try:
+        loan = _load_loan(pk)
+        archive_name = f"{loan.loan_number}_{loan_agreement_filename(loan)}"
+        key = document_key(LOAN_AGREEMENT, loan)
+        cached = _document_path(LOAN_AGREEMENT, pk, key)
+        if cached.exists():
+            return archive_name, cached.read_bytes(), None
+        if _batch_template is None:
+            _batch_template = get_template(DOCUMENTS[LOAN_AGREEMENT]['template'])
+        pdf_bytes = render_pdf(_batch_template, loan_agreement_context(loan))
+        _write_to_cache(LOAN_AGREEMENT, pk, key, pdf_bytes)
+        return archive_name, pdf_bytes, None
+    except Exception as e:
+        return f"loan_{pk}.pdf", None, str(e)
+
+
+def _render_batch(loan_ids, workers):
+    """Yield rendered agreements in order, keeping at most 2 * workers in flight"""
+    if workers <= 1:
+        for pk in loan_ids:
+            yield _render_batch_agreement(pk)
+        return
+
+    # Children must open their own database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as executor:
+        pending = deque()
+        loan_ids = iter(loan_ids)
+        for pk in loan_ids:
+            pending.append(executor.submit(_render_batch_agreement, pk))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            yield pending.popleft().result()
+            next_pk = next(loan_ids, None)
+            if next_pk is not None:
+                pending.append(executor.submit(_render_batch_agreement, next_pk))
+
+
+class _ZipStream:
+    """Write-only file object; the archive is read back out chunk by chunk"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_agreements_zip(loan_ids, workers=1):
+    """Yield a ZIP archive of loan agreements as each document is finished.
+
+    With workers > 1 the agreements are rendered in a process pool; only use
+    that outside web processes. Only the documents in flight are held in
+    memory. Loans that fail to render are listed in errors.txt at the end
+    of the archive.
+    """
+    stream = _ZipStream()
+    errors = []
+    # PDFs are already compressed, so entries are stored as-is
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+        for archive_name, pdf_bytes, error in _render_batch(loan_ids, workers):
+            if error:
+                print(f"Error rendering agreement {archive_name}: {error}")
+                errors.append(f"{archive_name}: {error}")
+                continue
+            archive.writestr(archive_name, pdf_bytes)
+            yield stream.drain()
+        if errors:
+            archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+    yield stream.drain()
@@ -0,0 +1,126 @@
+"""
+In-process cache of the LoanForm choice lists.
+
+The ordered ornament categories, and each branch's active schemes, are
+loaded once per process and then served from memory.
+``CachedModelChoiceField`` renders and validates against those lists, so
+building, rendering and validating a loan form runs no category or scheme
+queries.
+
+Invalidation:
+
+- Category and Scheme saves and deletes (receivers in ``transactions.models``)
+  call ``invalidate``. So does ``Scheme.reconcile_statuses``.
+- ``invalidate`` bumps a version number in the cache. Each process checks the
+  version before using its lists and reloads them when it has changed.
+- With a shared cache (``REDIS_URL``), every process sees a change at once.
+  With the default local-memory cache, other processes reload after
+  ``LOAN_FORM_CHOICES_TIMEOUT`` seconds.
+"""
+import copy
+import time
+
+from django import forms
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+
+VERSION_KEY = 'loan-form-choices:version'
+
+ALL = 'all'
+
+# key -> (version, loaded at, objects)
+_loaded = {}
+
+
+def _timeout():
+    return getattr(settings, 'LOAN_FORM_CHOICES_TIMEOUT', 300)
+
+
+def _cached(key, load):
+    version = cache.get(VERSION_KEY, 0)
+    entry = _loaded.get(key)
+    if entry is None or entry[0] != version or time.monotonic() - entry[1] > _timeout():
+        entry = (version, time.monotonic(), load())
+        _loaded[key] = entry
+    return entry[2]
+
+
+def invalidate():
+    """Drop every cached choice list, in this and (through the cache) every other process"""
+    _loaded.clear()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Version key evicted or never set; a fresh value no process has seen
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def ornament_categories():
+    """The ornament categories in display order (see inventory.ornaments)"""
+    from inventory.models import Category
+    from inventory.ornaments import ORNAMENT_CATEGORY_NAMES
+
+    def load():
+        by_name = {}
+        for category in Category.objects.filter(name__in=ORNAMENT_CATEGORY_NAMES).order_by('pk'):
+            by_name.setdefault(category.name, category)
+        return [by_name[name] for name in ORNAMENT_CATEGORY_NAMES if name in by_name]
+
+    return _cached('categories', load)
+
+
+def active_schemes(branch_id=None):
+    """Active schemes, most recently modified first: global and branch_id's, or all when branch_id is None"""
+    from django.db.models import Q
+    from schemes.models import Scheme
+
+    def load():
+        schemes = Scheme.objects.filter(status='active')
+        if branch_id is not None:
+            schemes = schemes.filter(Q(branch__isnull=True) | Q(branch_id=branch_id))
+        return list(schemes.order_by('-updated_at'))
+
+    return _cached(('schemes', branch_id or ALL), load)
+
+
+class CachedModelChoiceIterator(ModelChoiceIterator):
+    """Choices from the field's cached objects instead of its queryset"""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.field.objects:
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.objects) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.objects)
+
+
+class CachedModelChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField offering a list of cached instances; rendering and validation run no queries"""
+    iterator = CachedModelChoiceIterator
+
+    def __init__(self, queryset, *args, **kwargs):
+        super().__init__(queryset, *args, **kwargs)
+        self.objects = []
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        key = self.to_field_name or 'pk'
+        if isinstance(value, self.queryset.model):
+            value = getattr(value, key)
+        for obj in self.objects:
+            if str(getattr(obj, key)) == str(value):
+                # A copy, so a request never modifies the shared instance
+                return copy.copy(obj)
+        raise ValidationError(
+            self.error_messages['invalid_choice'],
+            code='invalid_choice',
+            params={'value': value},
+        )
@@ -7,6 +7,9 @@ from inventory.models import Item, Category
 from inventory.forms import ItemForm
 from accounts.models import Customer
 from schemes.models import Scheme  # Changed from content_manager.models to schemes.models
+from inventory import ornaments
+from . import form_choices
+from .form_choices import CachedModelChoiceField
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Row, Column, Div
 from decimal import Decimal, InvalidOperation
@@ -24,9 +27,9 @@ class LoanForm(forms.ModelForm):
         })
     )
 
-    # Scheme field definition (will be properly configured in __init__)
-    scheme = forms.ModelChoiceField(
-        queryset=Scheme.objects.none(),  # Empty queryset as placeholder, will set in __init__
+    # Scheme field definition (choices are set in __init__ from the cached active schemes)
+    scheme = CachedModelChoiceField(
+        queryset=Scheme.objects.filter(status='active'),
         empty_label="Select a Loan Scheme",
         required=True,
         help_text="Select a loan scheme to apply to this loan"
@@ -63,9 +66,9 @@ class LoanForm(forms.ModelForm):
         help_text='Optional: Detailed description of the item including any distinguishing marks or damaged parts',
         widget=forms.TextInput(attrs={'class': 'form-control'})
     )
-    item_category = forms.ModelChoiceField(
+    item_category = CachedModelChoiceField(
         required=True,
-        queryset=Category.objects.all(),  # Will filter in __init__
+        queryset=Category.objects.all(),  # Choices are the cached ornament categories, set in __init__
         label='Ornament Type',
         help_text="Select the type of gold ornament"
     )
@@ -141,34 +144,18 @@ class LoanForm(forms.ModelForm):
         self.user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
 
-        # Filter schemes to match exactly what's shown in the Loan Schemes page
-        scheme_queryset = Scheme.objects.filter(status='active')
-        
+        # Active schemes, global or of the user's branch, as shown on the Loan Schemes page.
+        # Status follows the scheme dates (Scheme.reconcile_statuses), so no date checks are needed here
+        branch_id = None
         if self.user and not self.user.is_superuser:
-            # For branch users: Show active schemes that are either global or specific to their branch
-            branch_id = self.user.branch.id if hasattr(self.user, 'branch') and self.user.branch else None
-            if branch_id:
-                scheme_queryset = scheme_queryset.filter(
-                    Q(branch__isnull=True) | Q(branch_id=branch_id)
-                )
-                print(f"Filtered to {scheme_queryset.count()} schemes for branch {branch_id}")
+            branch_id = self.user.branch_id
+        schemes = form_choices.active_schemes(branch_id)
+        self.fields['scheme'].objects = schemes
 
-        # Order schemes by most recently modified first
-        self.fields['scheme'].queryset = scheme_queryset.order_by('-updated_at')
-        
-        # Print debug info - how many schemes were found
-        print(f"Found {scheme_queryset.count()} active schemes in schemes app")
-        for scheme in scheme_queryset.order_by('-updated_at'):  # Keep same ordering in debug output
-            print(f"  - {scheme.name} (Branch: {scheme.branch}, Last modified: {scheme.updated_at})")
-        
         # Set "Standard Gold Loan" as the default selection if it exists
-        standard_gold_loan = scheme_queryset.filter(name='Standard Gold Loan').first()
+        standard_gold_loan = next((scheme for scheme in schemes if scheme.name == 'Standard Gold Loan'), None)
         if standard_gold_loan:
-            self.fields['scheme'].initial = standard_gold_loan
-        
-        # If no schemes are available, create a default one to prevent form errors
-        if not scheme_queryset.exists():
-            print("No schemes found in schemes app, consider creating some.")
+            self.fields['scheme'].initial = standard_gold_loan.pk
 
         # Update principal_amount field to use integer values
         self.fields['principal_amount'] = forms.DecimalField(
@@ -187,9 +174,9 @@ class LoanForm(forms.ModelForm):
         )
 
         # Configure customer field - filter by current branch if user has branch assigned
-        if self.user and not self.user.is_superuser and self.user.branch:
+        if self.user and not self.user.is_superuser and self.user.branch_id:
             # Only show customers from the current branch
-            self.fields['customer'].queryset = Customer.objects.filter(branch=self.user.branch).order_by('first_name', 'last_name')
+            self.fields['customer'].queryset = Customer.objects.filter(branch_id=self.user.branch_id).order_by('first_name', 'last_name')
         else:
             # Show all customers for superusers or users without a branch
             self.fields['customer'].queryset = Customer.objects.all().order_by('first_name', 'last_name')
@@ -199,57 +186,14 @@ class LoanForm(forms.ModelForm):
         # Add data attribute to customer field to support setting branch based on customer's branch
         self.fields['customer'].widget.attrs['data-branch-update'] = 'true'
 
-        # Define top priority ornament types and Tamil Nadu relevant gold ornament categories
-        top_categories = [
-            'Mixed Items',
-            'Chain', 
-            'Chain with Dollar', 
-            'Chain without Dollar', 
-            'Ring'
-        ]
-
-        # Create Mixed Items category first to ensure it exists
-        mixed_items_category, created = Category.objects.get_or_create(
-            name='Mixed Items',
-            defaults={'description': 'Multiple types of gold ornaments'}
-        )
-        category_ids = [mixed_items_category.id]
-
-        # Create other top categories
-        for category_name in top_categories[1:]:  # Skip Mixed Items as it's already created
-            category, created = Category.objects.get_or_create(
-                name=category_name,
-                defaults={'description': f'Gold ornament: {category_name}'}
-            )
-            category_ids.append(category.id)
-
-        # Then create or get the Tamil Nadu categories
-        tamilnadu_categories = [
-            'Thali (Mangalsutra)', 'Jimikki (Earrings)', 'Mothiram (Rings)', 
-            'Valai (Bangles)', 'Malai (Necklaces)', 'Koppu (Studs)',
-            'Odiyanam (Waist Belt)', 'Thodu (Ear Hoops)', 'Vanki (Armlet)',
-            'Kolusu (Anklet)', 'Metti (Toe Ring)', 'Jadai Nagam (Hair Ornament)'
-        ]
-
-        for category_name in tamilnadu_categories:
-            category, created = Category.objects.get_or_create(
-                name=category_name,
-                defaults={'description': f'Traditional Tamil Nadu gold ornament: {category_name}'}
-            )
-            category_ids.append(category.id)
-        
-        # Create the complete categories list in order
-        all_categories = ['Mixed Items'] + top_categories[1:] + tamilnadu_categories
-        
-        # Order the categories to ensure Mixed Items appears first
-        self.fields['item_category'].queryset = Category.objects.filter(id__in=category_ids).order_by(
-            models.Case(
-                *[models.When(name=name, then=pos) for pos, name in enumerate(all_categories)]
-            )
-        )
+        # Ornament categories in display order, Mixed Items first (seeded by inventory migration 0004)
+        categories = form_choices.ornament_categories()
+        self.fields['item_category'].objects = categories
         
         # Always set Mixed Items as default
-        self.fields['item_category'].initial = mixed_items_category
+        mixed_items_category = next((c for c in categories if c.name == ornaments.MIXED_ITEMS), None)
+        if mixed_items_category:
+            self.fields['item_category'].initial = mixed_items_category.pk
         self.fields['item_category'].label = 'Ornament Type'
         self.fields['item_category'].help_text = 'Select the type of gold ornament'
 
@@ -264,19 +208,19 @@ class LoanForm(forms.ModelForm):
         self.items_formset = ItemFormSet(prefix='items')
 
         # Set branch if user belongs to one
-        if self.user and not self.user.is_superuser and self.user.branch:
-            self.fields['branch'].initial = self.user.branch
+        if self.user and not self.user.is_superuser and self.user.branch_id:
+            self.fields['branch'].initial = self.user.branch_id
             self.fields['branch'].widget = forms.HiddenInput()
             
         # If this is an existing loan, populate the item fields
         if self.instance and self.instance.pk:
             # Get the first loan item associated with this loan
-            loan_item = self.instance.loanitem_set.first()
+            loan_item = self.instance.loanitem_set.select_related('item').first()
             if loan_item:
                 # Populate all item-related fields from the existing data
                 self.fields['item_name'].initial = loan_item.item.name
                 self.fields['item_description'].initial = loan_item.item.description
-                self.fields['item_category'].initial = loan_item.item.category
+                self.fields['item_category'].initial = loan_item.item.category_id
                 
                 # Convert Decimal to string for gold_karat field
                 if loan_item.gold_karat:
@@ -0,0 +1,233 @@
+"""
+Batch interest engine for loan portfolios.
+
+Computes the same figures as the per-loan properties on ``Loan``
+(``monthly_interest_till_date``, ``total_payable_till_date``,
+``total_payable_mature``) for a whole portfolio in one vectorized pass.
+Amounts are carried as integer paise so results match the Decimal
+properties exactly.
+
+Requires numpy (listed in requirements-intensive.txt).
+"""
+from decimal import Decimal
+
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is an optional dependency
+    np = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError(
+            "The portfolio interest engine requires numpy. "
+            "Install it with: pip install -r requirements-intensive.txt"
+        )
+
+
+def _paise_to_decimal(value):
+    """Convert an integer paise amount to a rupee Decimal with two places"""
+    return Decimal(int(value)).scaleb(-2)
+
+
+def _months_between(start, end):
+    """Calendar month difference, same as (end.year - start.year) * 12 + end.month - start.month"""
+    return (end.astype('datetime64[M]') - start.astype('datetime64[M]')).astype(np.int64)
+
+
+def _day_of_month(dates):
+    return (dates - dates.astype('datetime64[M]')).astype(np.int64) + 1
+
+
+def _monthly_amount_paise(principal, rate_hundredths):
+    """Monthly interest in paise: round_half_even(principal * rate / 1200, 2 places)
+
+    The Decimal property divides the rate by 12 at 28 digits of precision
+    before multiplying, which only differs from exact rounding on half-paise
+    ties. Those rows are recomputed with the property's own arithmetic.
+    """
+    numerator = principal * rate_hundredths
+    quotient, remainder = np.divmod(numerator, 1200)
+    amount = quotient + (remainder * 2 > 1200)
+    ties = np.nonzero(remainder * 2 == 1200)[0]
+    for i in ties:
+        monthly_rate = (Decimal(int(rate_hundredths[i])) / Decimal('100')) / Decimal('12')
+        value = (Decimal(int(principal[i])) * monthly_rate) / Decimal('100')
+        amount[i] = int(value.quantize(Decimal('0.01')).scaleb(2))
+    return amount
+
+
+class PortfolioInterest:
+    """Vectorized interest figures for a set of loans.
+
+    All money arrays are int64 paise; use ``decimal()`` or ``rows()`` to get
+    rupee Decimals matching the ``Loan`` properties.
+    """
+
+    MONEY_FIELDS = ('monthly_amount', 'accrued_interest', 'payable_till_date', 'payable_mature')
+
+    def __init__(self, loan_ids, branch_ids, principal, monthly_amount, accrued_interest,
+                 payable_till_date, payable_mature, days_overdue):
+        self.loan_ids = loan_ids
+        self.branch_ids = branch_ids
+        self.principal = principal
+        self.monthly_amount = monthly_amount
+        self.accrued_interest = accrued_interest
+        self.payable_till_date = payable_till_date
+        self.payable_mature = payable_mature
+        self.days_overdue = days_overdue
+
+    def __len__(self):
+        return len(self.loan_ids)
+
+    def decimal(self, field, index):
+        """Return one money value as a rupee Decimal"""
+        return _paise_to_decimal(getattr(self, field)[index])
+
+    def rows(self):
+        """Yield one dict per loan with Decimal amounts"""
+        for i, loan_id in enumerate(self.loan_ids):
+            row = {'loan_id': int(loan_id), 'days_overdue': int(self.days_overdue[i])}
+            for field in self.MONEY_FIELDS:
+                row[field] = self.decimal(field, i)
+            yield row
+
+    def totals(self):
+        """Portfolio-wide sums plus overdue count"""
+        result = {field: _paise_to_decimal(getattr(self, field).sum()) for field in self.MONEY_FIELDS}
+        result['overdue_count'] = int((self.days_overdue > 0).sum())
+        result['overdue_payable'] = _paise_to_decimal(self.payable_till_date[self.days_overdue > 0].sum())
+        return result
+
+    def totals_by_branch(self):
+        """Per-branch sums of payable amounts and overdue exposure"""
+        if not len(self):
+            return {}
+        branches, index = np.unique(self.branch_ids, return_inverse=True)
+        overdue = self.days_overdue > 0
+
+        def group_sum(values):
+            # Integer accumulation keeps paise sums exact beyond float precision
+            sums = np.zeros(len(branches), dtype=np.int64)
+            np.add.at(sums, index, values)
+            return sums
+
+        sums = {field: group_sum(getattr(self, field)) for field in self.MONEY_FIELDS}
+        overdue_payable = group_sum(np.where(overdue, self.payable_till_date, 0))
+        overdue_count = group_sum(overdue.astype(np.int64))
+        result = {}
+        for i, branch_id in enumerate(branches):
+            branch_totals = {field: _paise_to_decimal(sums[field][i]) for field in self.MONEY_FIELDS}
+            branch_totals['overdue_payable'] = _paise_to_decimal(overdue_payable[i])
+            branch_totals['overdue_count'] = int(overdue_count[i])
+            result[int(branch_id)] = branch_totals
+        return result
+
+
+def compute_interest(principal, rate, issue_date, due_date, no_interest_days, is_active,
+                     has_scheme=None, loan_ids=None, branch_ids=None, today=None):
+    """Compute interest figures from columnar inputs.
+
+    Args:
+        principal: whole-rupee principal amounts
+        rate: scheme annual interest rates in percent (two decimal places)
+        issue_date, due_date: date sequences or datetime64[D] arrays
+        no_interest_days: scheme no-interest period in days (0 or NaN for none)
+        is_active: booleans, True where the loan status is 'active'
+        has_scheme: booleans, False for loans without a scheme
+        today: date to compute as of (defaults to today)
+
+    Returns:
+        PortfolioInterest
+    """
+    _require_numpy()
+    today = np.datetime64(today or timezone.now().date(), 'D')
+
+    principal = np.asarray(principal, dtype=np.int64)
+    count = len(principal)
+    rate_hundredths = np.rint(np.asarray(rate, dtype=np.float64) * 100).astype(np.int64)
+    issue = np.asarray(issue_date, dtype='datetime64[D]')
+    due = np.asarray(due_date, dtype='datetime64[D]')
+    no_interest = np.nan_to_num(np.asarray(no_interest_days, dtype=np.float64), nan=0.0)
+    active = np.asarray(is_active, dtype=bool)
+    scheme = np.ones(count, dtype=bool) if has_scheme is None else np.asarray(has_scheme, dtype=bool)
+    loan_ids = np.arange(count) if loan_ids is None else np.asarray(loan_ids, dtype=np.int64)
+    branch_ids = np.zeros(count, dtype=np.int64) if branch_ids is None else np.asarray(branch_ids, dtype=np.int64)
+
+    monthly_amount = np.where(scheme, _monthly_amount_paise(principal, rate_hundredths), 0)
+    principal_paise = principal * 100
+    has_no_interest = no_interest > 0
+
+    # Loan.monthly_interest_till_date
+    months_elapsed = _months_between(issue, today)
+    charge_current = active & ((months_elapsed > 0) | ((months_elapsed == 0) & (_day_of_month(issue) < _day_of_month(today))))
+    months_elapsed = np.maximum(months_elapsed + charge_current, 0)
+    accrued_interest = monthly_amount * months_elapsed
+
+    # Loan.total_payable_till_date
+    days_since_issue = (today - issue).astype(np.int64)
+    in_no_interest = has_no_interest & (days_since_issue <= no_interest)
+    payable_till_date = np.where(
+        ~active, 0,
+        np.where(~scheme | in_no_interest, principal_paise, principal_paise + accrued_interest)
+    )
+
+    # Loan.total_payable_mature
+    term_months = _months_between(issue, due) + (_day_of_month(due) > _day_of_month(issue))
+    term_in_no_interest = has_no_interest & ((due - issue).astype(np.int64) <= no_interest)
+    payable_mature = np.where(
+        ~active | ~scheme, 0,
+        np.where(term_in_no_interest, principal_paise, principal_paise + monthly_amount * term_months)
+    )
+
+    # Loan.is_overdue expressed as a day count
+    days_overdue = np.where(active, np.maximum((today - due).astype(np.int64), 0), 0)
+
+    return PortfolioInterest(
+        loan_ids=loan_ids,
+        branch_ids=branch_ids,
+        principal=principal_paise,
+        monthly_amount=monthly_amount,
+        accrued_interest=accrued_interest,
+        payable_till_date=payable_till_date,
+        payable_mature=payable_mature,
+        days_overdue=days_overdue,
+    )
+
+
+def _no_interest_days(conditions):
+    if conditions and 'no_interest_period_days' in conditions:
+        try:
+            return float(conditions['no_interest_period_days'] or 0)
+        except (TypeError, ValueError):
+            return 0.0
+    return 0.0
+
+
+def compute_portfolio_interest(queryset, today=None):
+    """Compute interest figures for every loan in a queryset with a single query"""
+    _require_numpy()
+    rows = list(queryset.order_by().values_list(
+        'pk', 'branch_id', 'principal_amount', 'status', 'issue_date', 'due_date',
+        'scheme_id', 'scheme__interest_rate', 'scheme__additional_conditions',
+    ))
+    if not rows:
+        return compute_interest([], [], [], [], [], [], today=today)
+
+    (loan_ids, branch_ids, principal, status, issue_date, due_date,
+     scheme_ids, rates, conditions) = zip(*rows)
+
+    return compute_interest(
+        principal=[int(p) for p in principal],
+        rate=[float(r) if r is not None else 0.0 for r in rates],
+        issue_date=issue_date,
+        due_date=due_date,
+        no_interest_days=[_no_interest_days(c) for c in conditions],
+        is_active=[s == 'active' for s in status],
+        has_scheme=[s is not None for s in scheme_ids],
+        loan_ids=loan_ids,
+        branch_ids=branch_ids,
+        today=today,
+    )
@@ -0,0 +1,238 @@
+"""
+Nightly loan lifecycle: overdue, default and auction transitions.
+
+``run`` walks each branch through three stages:
+
+1. Overdue: open loans (active or extended) past their due date but still
+   inside the grace period. The status stays as is, because overdue is derived
+   from due_date elsewhere. The run only records an audit event.
+2. Defaulted: open loans past ``grace_period_end`` become 'defaulted'.
+3. Auction: defaulted loans more than the branch's
+   ``BranchSettings.auction_delay_days`` past their grace period release
+   their still-pawned items for auction (item status 'expired').
+
+The report scheduler (``run_scheduler``) calls ``run`` once per local day.
+The ``run_loan_lifecycle`` command runs it by hand, for example to catch up
+a missed date.
+
+Implementation:
+
+- Candidates come from range scans on the (branch, status, due_date) and
+  (branch, status, grace_period_end) indexes.
+- Changes are made in batches. Each batch runs one conditional UPDATE and
+  one INSERT ... SELECT of ``LoanLifecycleEvent`` rows, so a backlog of
+  many thousands of loans never builds model instances.
+- The job is idempotent:
+  - Updates only touch rows still in the expected status.
+  - Audit events are unique per (loan, event, threshold date).
+  - Re-running a day, or two overlapping runs, changes nothing twice.
+- Queryset updates send no signals. Each branch's dashboard counters and
+  loan rollups are refreshed once at the end instead.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from branches.models import Branch, BranchSettings
+from inventory.models import Item
+from .models import Loan, LoanItem, LoanLifecycleEvent
+
+OPEN_STATUSES = ('active', 'extended')
+DEFAULTED = 'defaulted'
+ITEM_PLEDGED = 'pawned'
+ITEM_FOR_AUCTION = 'expired'
+
+BATCH_SIZE = 2000
+
+
+def _batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def auction_delays(branch_ids):
+    """Days after grace period end before pledged items go to auction, per branch"""
+    default = BranchSettings._meta.get_field('auction_delay_days').default
+    delays = dict.fromkeys(branch_ids, default)
+    delays.update(BranchSettings.objects.filter(branch_id__in=branch_ids)
+                  .values_list('branch_id', 'auction_delay_days'))
+    return delays
+
+
+def _new_events(event, rows, today):
+    """LoanLifecycleEvent rows for (loan_id, from_status, to_status, threshold_date, items) not yet recorded"""
+    recorded = set(LoanLifecycleEvent.objects
+                   .filter(event=event, loan_id__in=[row[0] for row in rows])
+                   .values_list('loan_id', 'threshold_date'))
+    return [
+        LoanLifecycleEvent(
+            loan_id=loan_id, event=event, from_status=from_status, to_status=to_status,
+            threshold_date=threshold_date, run_date=today, items_updated=items,
+        )
+        for loan_id, from_status, to_status, threshold_date, items in rows
+        if (loan_id, threshold_date) not in recorded
+    ]
+
+
+def _record_from_loans(event, loan_ids, threshold_field, today, to_status=None):
+    """
+    Audit rows for loan_ids copied straight from the loan table with one
+    INSERT ... SELECT, so no model instances are built for large batches.
+    from_status is the loan's current status (call before changing it);
+    to_status defaults to the same. Events already recorded are skipped.
+    Returns the number of rows inserted.
+    """
+    if not loan_ids:
+        return 0
+    qn = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(loan_ids))
+    sql = (
+        f"INSERT INTO {qn(LoanLifecycleEvent._meta.db_table)} "
+        f"(loan_id, event, from_status, to_status, threshold_date, run_date, items_updated, created_at) "
+        f"SELECT id, %s, status, COALESCE(%s, status), {qn(threshold_field)}, %s, 0, %s "
+        f"FROM {qn(Loan._meta.db_table)} WHERE id IN ({placeholders}) "
+        # Covers re-runs and an overlapping run that recorded the same events first
+        f"ON CONFLICT (loan_id, event, threshold_date) DO NOTHING"
+    )
+    params = [
+        event, to_status,
+        connection.ops.adapt_datefield_value(today),
+        connection.ops.adapt_datetimefield_value(timezone.now()),
+        *loan_ids,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def mark_overdue(branch_id, today, batch_size=BATCH_SIZE, dry_run=False):
+    """Record overdue events for loans past due but within grace; returns the number recorded"""
+    loans = Loan.objects.filter(
+        branch_id=branch_id, status__in=OPEN_STATUSES, due_date__lt=today, grace_period_end__gte=today
+    ).order_by()
+    if dry_run:
+        return loans.exclude(Exists(LoanLifecycleEvent.objects.filter(
+            loan=OuterRef('pk'), event=LoanLifecycleEvent.OVERDUE, threshold_date=OuterRef('due_date')
+        ))).count()
+
+    count = 0
+    for batch in _batches(list(loans.values_list('pk', flat=True)), batch_size):
+        count += _record_from_loans(LoanLifecycleEvent.OVERDUE, batch, 'due_date', today)
+    return count
+
+
+def mark_defaulted(branch_id, today, batch_size=BATCH_SIZE, dry_run=False):
+    """Default open loans past their grace period; returns the ids of the loans changed"""
+    candidates = Loan.objects.filter(
+        branch_id=branch_id, status__in=OPEN_STATUSES, grace_period_end__lt=today
+    ).order_by()
+    pks = list(candidates.values_list('pk', flat=True))
+    if dry_run:
+        return pks
+
+    changed = []
+    for batch in _batches(pks, batch_size):
+        with transaction.atomic():
+            # Lock the batch; rows repaid or extended since the scan drop out here
+            batch = list(candidates.filter(pk__in=batch).select_for_update().values_list('pk', flat=True))
+            if not batch:
+                continue
+            _record_from_loans(LoanLifecycleEvent.DEFAULTED, batch, 'grace_period_end', today, DEFAULTED)
+            Loan.objects.filter(pk__in=batch).update(status=DEFAULTED, updated_at=timezone.now())
+        changed.extend(batch)
+    return changed
+
+
+def release_for_auction(branch_id, today, delay_days, batch_size=BATCH_SIZE, dry_run=False):
+    """Mark the pledged items of long-defaulted loans for auction; returns (ids of loans with items released, items changed)"""
+    cutoff = today - datetime.timedelta(days=delay_days)
+    loans = Q(loan__status=DEFAULTED)
+    if dry_run:
+        # Nothing was defaulted by the previous stage; count the open loans it would have defaulted
+        loans |= Q(loan__status__in=OPEN_STATUSES, loan__grace_period_end__lt=today)
+    pledges = (LoanItem.objects
+               .filter(loans, loan__branch_id=branch_id, loan__grace_period_end__lt=cutoff,
+                       item__status=ITEM_PLEDGED)
+               .order_by('loan_id')
+               .values_list('loan_id', 'item_id', 'loan__grace_period_end'))
+    items_by_loan = defaultdict(list)
+    grace_ends = {}
+    for loan_id, item_id, grace_end in pledges:
+        items_by_loan[loan_id].append(item_id)
+        grace_ends[loan_id] = grace_end
+
+    loan_ids = list(items_by_loan)
+    if dry_run:
+        return loan_ids, sum(len(items) for items in items_by_loan.values())
+
+    released_loans = []
+    total_items = 0
+    for batch in _batches(loan_ids, batch_size):
+        with transaction.atomic():
+            item_ids = [item_id for loan_id in batch for item_id in items_by_loan[loan_id]]
+            # Only items still pledged are released; a sale or return since the scan wins
+            released = set(Item.objects.filter(pk__in=item_ids, status=ITEM_PLEDGED)
+                           .select_for_update().values_list('pk', flat=True))
+            if not released:
+                continue
+            total_items += Item.objects.filter(pk__in=released).update(
+                status=ITEM_FOR_AUCTION, modified_at=timezone.now()
+            )
+            rows = []
+            for loan_id in batch:
+                count = sum(1 for item_id in items_by_loan[loan_id] if item_id in released)
+                if count:
+                    auction_date = grace_ends[loan_id] + datetime.timedelta(days=delay_days)
+                    rows.append((loan_id, DEFAULTED, DEFAULTED, auction_date, count))
+            released_loans.extend(row[0] for row in rows)
+            LoanLifecycleEvent.objects.bulk_create(
+                _new_events(LoanLifecycleEvent.AUCTION, rows, today), ignore_conflicts=True
+            )
+    return released_loans, total_items
+
+
+def _refresh_derived(branch_id, defaulted_ids):
+    """Bring signal-maintained caches up to date after bulk updates"""
+    from accounts import dashboard
+    from reporting import rollups
+
+    dashboard.invalidate(branch_id)
+    if defaulted_ids:
+        # Rollups total active principal per branch and local creation day (as rollups.loan_keys)
+        keys = set()
+        for batch in _batches(defaulted_ids, BATCH_SIZE):
+            keys.update(Loan.objects.filter(pk__in=batch).order_by()
+                        .values_list('branch_id', TruncDate('created_at')).distinct())
+        rollups.refresh(rollups.LOANS, keys)
+
+
+def run(today=None, branch_ids=None, batch_size=BATCH_SIZE, dry_run=False, on_branch=None):
+    """Run every stage for each branch; returns {branch_id: {stage: count, 'items': count}}
+
+    on_branch, when given, is called with each branch id once that branch is done.
+    """
+    today = today or timezone.localdate()
+    if branch_ids is None:
+        branch_ids = list(Branch.objects.order_by('pk').values_list('pk', flat=True))
+    delays = auction_delays(branch_ids)
+
+    summary = {}
+    for branch_id in branch_ids:
+        overdue = mark_overdue(branch_id, today, batch_size, dry_run)
+        defaulted = mark_defaulted(branch_id, today, batch_size, dry_run)
+        auctioned, items = release_for_auction(branch_id, today, delays[branch_id], batch_size, dry_run)
+        if not dry_run and (defaulted or items):
+            _refresh_derived(branch_id, defaulted)
+        summary[branch_id] = {
+            LoanLifecycleEvent.OVERDUE: overdue,
+            LoanLifecycleEvent.DEFAULTED: len(defaulted),
+            LoanLifecycleEvent.AUCTION: len(auctioned),
+            'items': items,
+        }
+        if on_branch is not None:
+            on_branch(branch_id)
+    return summary
@@ -0,0 +1,74 @@
+import datetime
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from branches.models import Branch
+from transactions import documents
+
+
+class Command(BaseCommand):
+    help = 'Export the loan agreements issued by a branch in a date range as a ZIP of PDFs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--branch',
+            help='Branch ID or name (default: all branches)'
+        )
+        parser.add_argument(
+            '--from',
+            dest='start_date',
+            help='First issue date, YYYY-MM-DD (default: today)'
+        )
+        parser.add_argument(
+            '--to',
+            dest='end_date',
+            help='Last issue date, YYYY-MM-DD (default: same as --from)'
+        )
+        parser.add_argument(
+            '--output',
+            help='Path of the ZIP file to write (default: agreements_<branch>_<dates>.zip)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Number of rendering processes (default: PDF_BATCH_WORKERS)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start_date = datetime.date.fromisoformat(options['start_date'] or timezone.now().date().isoformat())
+            end_date = datetime.date.fromisoformat(options['end_date'] or start_date.isoformat())
+        except ValueError:
+            raise CommandError("Dates must be in YYYY-MM-DD format")
+        if end_date < start_date:
+            raise CommandError("--to is before --from")
+
+        branch_ids = None
+        branch_label = 'all'
+        if options['branch']:
+            branch_value = options['branch']
+            if branch_value.isdigit():
+                branch = Branch.objects.filter(pk=int(branch_value)).first()
+            else:
+                branch = Branch.objects.filter(name__iexact=branch_value).first()
+            if branch is None:
+                raise CommandError(f"Branch not found: {branch_value}")
+            branch_ids = [branch.pk]
+            branch_label = documents.safe_filename(branch.name)
+            self.stdout.write(f"Filtering to branch: {branch.name}")
+
+        loan_ids = documents.agreement_loan_ids(start_date, end_date, branch_ids)
+        if not loan_ids:
+            self.stdout.write(self.style.WARNING("No loan agreements issued in the selected period"))
+            return
+        self.stdout.write(f"Found {len(loan_ids)} loan agreements issued {start_date} to {end_date}")
+
+        output = options['output'] or f"agreements_{branch_label}_{start_date:%Y%m%d}_{end_date:%Y%m%d}.zip"
+        with open(output, 'wb') as f:
+            workers = options['workers'] or getattr(settings, 'PDF_BATCH_WORKERS', os.cpu_count() or 1)
+            for chunk in documents.iter_agreements_zip(loan_ids, workers=workers):
+                f.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(loan_ids)} agreements to {output}"))
@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from accounts.models import Customer
+from transactions.models import Loan
+from pawnshop_management import media_store
+
+
+class Command(BaseCommand):
+    help = 'Move base64 photos stored on loan and customer rows into the content-addressed media store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of rows to load per batch'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report how many rows would be migrated without writing anything'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        loans_updated = self.externalize_loans(batch_size, dry_run)
+        customers_updated = self.externalize_customers(batch_size, dry_run)
+
+        verb = 'Would update' if dry_run else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {loans_updated} loans and {customers_updated} customers"
+        ))
+
+    def externalize_loans(self, batch_size, dry_run):
+        # Only the photo columns are loaded (with_photos() undoes the default manager's
+        # deferral, which only() would keep); rows are written with update() so
+        # timestamps and ledger signals are left untouched
+        loans = Loan.objects.with_photos().only('pk', 'customer_face_capture', 'item_photos').order_by('pk')
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(loans.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            with transaction.atomic():
+                for loan in batch:
+                    face_capture = loan.customer_face_capture
+                    item_photos = loan.item_photos
+                    if not (media_store.is_data_url(face_capture) or 'data:image/' in str(item_photos)):
+                        continue
+                    updated += 1
+                    if dry_run:
+                        continue
+                    Loan.objects.filter(pk=loan.pk).update(
+                        customer_face_capture=media_store.externalize(face_capture),
+                        item_photos=Loan._externalize_item_photos(item_photos),
+                    )
+
+            self.stdout.write(f"Processed loans up to id {last_pk} ({updated} updated)")
+        return updated
+
+    def externalize_customers(self, batch_size, dry_run):
+        # with_photos() first: only() would otherwise keep the default manager's deferral of the photos
+        customers = (Customer.objects.with_photos().filter(profile_photo__startswith='data:image/')
+                     .only('pk', 'profile_photo').order_by('pk'))
+        if dry_run:
+            return customers.count()
+
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(customers.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            with transaction.atomic():
+                for customer in batch:
+                    photo_url = media_store.externalize(customer.profile_photo)
+                    if photo_url != customer.profile_photo:
+                        Customer.objects.filter(pk=customer.pk).update(profile_photo=photo_url)
+                        updated += 1
+
+            self.stdout.write(f"Processed customers up to id {last_pk} ({updated} updated)")
+        return updated
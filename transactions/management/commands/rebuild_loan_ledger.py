@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from transactions.models import Loan, LoanLedger
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized loan balance ledger from payments and extensions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loan',
+            help='Rebuild the ledger for a single loan number only'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of loans to rebuild per transaction'
+        )
+
+    def handle(self, *args, **options):
+        loan_number = options.get('loan')
+        batch_size = options['batch_size']
+
+        loans = Loan.objects.select_related('scheme').order_by('pk')
+        if loan_number:
+            loans = loans.filter(loan_number=loan_number)
+            self.stdout.write(f"Filtering to loan: {loan_number}")
+
+        total_loans = loans.count()
+        self.stdout.write(f"Found {total_loans} loans to process")
+
+        today = timezone.now().date()
+        processed = 0
+        last_pk = 0
+        while True:
+            batch = list(loans.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            totals = LoanLedger.totals_for([loan.pk for loan in batch])
+            ledgers = []
+            for loan in batch:
+                ledgers.append(LoanLedger(
+                    loan=loan,
+                    interest_accrued=loan.monthly_interest_till_date(),
+                    interest_as_of=today,
+                    updated_at=timezone.now(),
+                    **totals[loan.pk]
+                ))
+
+            with transaction.atomic():
+                LoanLedger.objects.bulk_create(
+                    ledgers,
+                    update_conflicts=True,
+                    unique_fields=['loan'],
+                    update_fields=[
+                        'amount_paid', 'payment_count', 'last_payment_date',
+                        'extension_fees', 'interest_accrued', 'interest_as_of', 'updated_at',
+                    ],
+                )
+
+            processed += len(batch)
+            self.stdout.write(f"Rebuilt {processed}/{total_loans} ledgers")
+
+        self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt {processed} loan ledgers"))
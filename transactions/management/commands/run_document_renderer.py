@@ -0,0 +1,63 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from transactions import render_jobs
+
+
+class Command(BaseCommand):
+    help = 'Render queued loan agreement and receipt PDFs into the document cache (long-running)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'PDF_RENDER_WORKERS', 2),
+            help='Rendering processes (default: PDF_RENDER_WORKERS; 1 renders in this process)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=2,
+            help='Seconds to wait when the queue is empty (default: 2)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Work through the queue once and exit'
+        )
+
+    def handle(self, *args, **options):
+        renderer = render_jobs.Renderer(workers=max(options['workers'], 1))
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Stopping after the current batch...")
+            stop.set()
+
+        if not options['once']:
+            signal.signal(signal.SIGTERM, request_stop)
+            signal.signal(signal.SIGINT, request_stop)
+            self.stdout.write(f"Document renderer {renderer.owner} started: {renderer.workers} worker(s)")
+
+        total = 0
+        try:
+            while not stop.is_set():
+                try:
+                    processed = renderer.run_once()
+                except Exception as e:
+                    # A database hiccup should not kill the renderer; retry after the interval
+                    print(f"Document renderer round failed: {e}")
+                    connection.close()
+                    processed = 0
+                total += processed
+                if processed:
+                    continue
+                if options['once'] or stop.wait(max(options['interval'], 1)):
+                    break
+        finally:
+            renderer.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered {total} document job(s)"))
@@ -0,0 +1,69 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from transactions import lifecycle
+from transactions.models import LoanLifecycleEvent
+
+
+class Command(BaseCommand):
+    help = ('Move loans past their due date, grace period or auction delay to the next lifecycle stage '
+            '(idempotent; run_scheduler already runs it once a day)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Business date to run for, YYYY-MM-DD (default: today); use to catch up missed nights'
+        )
+        parser.add_argument(
+            '--branch',
+            action='append',
+            type=int,
+            help='Only process this branch ID (repeatable)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=lifecycle.BATCH_SIZE,
+            help=f'Loans changed per transaction (default: {lifecycle.BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without actually making changes'
+        )
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid --date '{options['date']}', expected YYYY-MM-DD")
+
+        dry_run = options['dry_run']
+        if dry_run:
+            self.stdout.write(self.style.WARNING("DRY RUN: No changes will be made"))
+
+        summary = lifecycle.run(
+            today=today,
+            branch_ids=options['branch'],
+            batch_size=max(options['batch_size'], 1),
+            dry_run=dry_run,
+        )
+
+        totals = dict.fromkeys([LoanLifecycleEvent.OVERDUE, LoanLifecycleEvent.DEFAULTED,
+                                LoanLifecycleEvent.AUCTION, 'items'], 0)
+        for branch_id, counts in summary.items():
+            for key in totals:
+                totals[key] += counts[key]
+            if any(counts.values()):
+                self.stdout.write(
+                    f"Branch {branch_id}: {counts['overdue']} newly overdue, {counts['defaulted']} defaulted, "
+                    f"{counts['auction']} released for auction ({counts['items']} item(s))"
+                )
+
+        prefix = "Would process" if dry_run else "Processed"
+        message = (f"{prefix} {len(summary)} branch(es): {totals['overdue']} newly overdue, "
+                   f"{totals['defaulted']} defaulted, {totals['auction']} released for auction "
+                   f"({totals['items']} item(s))")
+        self.stdout.write(self.style.WARNING(message) if dry_run else self.style.SUCCESS(message))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:26
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0016_alter_loan_processing_fee'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanLedger',
+            fields=[
+                ('loan', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger', serialize=False, to='transactions.loan')),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('payment_count', models.PositiveIntegerField(default=0)),
+                ('last_payment_date', models.DateField(blank=True, null=True)),
+                ('extension_fees', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('interest_accrued', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Monthly interest accrued as of interest_as_of', max_digits=12)),
+                ('interest_as_of', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'loan ledger',
+                'verbose_name_plural': 'loan ledgers',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0017_loanledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loan',
+            name='customer_face_capture',
+            field=models.TextField(blank=True, help_text='Customer photo URL in the media store', null=True),
+        ),
+    ]
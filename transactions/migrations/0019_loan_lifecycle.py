@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_alter_customer_profile_photo'),
+        ('branches', '0003_sequence'),
+        ('inventory', '0003_alter_item_loans'),
+        ('schemes', '0002_rename_schemes_sche_status_e91afc_idx_schemes_sch_status_739aec_idx_and_more'),
+        ('transactions', '0018_alter_loan_customer_face_capture'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanLifecycleEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('overdue', 'Past due date'), ('defaulted', 'Defaulted after grace period'), ('auction', 'Items released for auction')], max_length=20)),
+                ('from_status', models.CharField(max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('threshold_date', models.DateField(help_text='Due date, grace period end or auction date the loan passed')),
+                ('run_date', models.DateField(help_text='Business date of the lifecycle run')),
+                ('items_updated', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'loan lifecycle event',
+                'verbose_name_plural': 'loan lifecycle events',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['branch', 'status', 'due_date'], name='loan_branch_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['branch', 'status', 'grace_period_end'], name='loan_branch_status_grace_idx'),
+        ),
+        migrations.AddField(
+            model_name='loanlifecycleevent',
+            name='loan',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lifecycle_events', to='transactions.loan'),
+        ),
+        migrations.AddConstraint(
+            model_name='loanlifecycleevent',
+            constraint=models.UniqueConstraint(fields=('loan', 'event', 'threshold_date'), name='unique_loan_lifecycle_event'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0019_loan_lifecycle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentRenderJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text='Document type, e.g. loan_agreement', max_length=30)),
+                ('object_id', models.PositiveIntegerField(help_text='Primary key of the loan or payment')),
+                ('key', models.CharField(help_text='Fingerprint of the document content', max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'document render job',
+                'verbose_name_plural': 'document render jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'id'], name='document_job_status_idx'), models.Index(fields=['kind', 'object_id', 'key'], name='document_job_document_idx')],
+            },
+        ),
+    ]
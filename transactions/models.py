@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import functions
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
-from accounts.models import Customer  # Import Customer from accounts app
+from accounts.models import Customer, CustomerQuerySet  # Import Customer from accounts app
 from schemes.models import Scheme  # Changed from content_manager.models to schemes.models
 import uuid
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -10,9 +13,195 @@ from decimal import Decimal
 import datetime
 import json
 from .utils import item_photo_path
+from pawnshop_management import media_store
+from pawnshop_management.tracking import LoadedValuesMixin
+from branches import sequences
 
-class Loan(models.Model):
+
+class DaysBetween(models.Func):
+    """Whole days from ``start`` to ``end`` for two date expressions"""
+    output_field = models.IntegerField()
+    arity = 2
+
+    def __init__(self, end, start, **extra):
+        super().__init__(end, start, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL: subtracting two dates yields an integer day count
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(',
+            **extra_context
+        )
+
+
+class AsDecimal(functions.Cast):
+    """Cast to a money decimal; SQLite's NUMERIC cast keeps integers, so use REAL there"""
+
+    def __init__(self, expression):
+        super().__init__(expression, output_field=models.DecimalField(max_digits=14, decimal_places=2))
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(%(expressions)s AS REAL)', **extra_context)
+
+
+class LoanQuerySet(models.QuerySet):
+    # Columns that can hold image payloads; only detail and document views need them
+    PHOTO_FIELDS = ('customer_face_capture', 'item_photos')
+
+    def without_photos(self):
+        """Leave the photo columns out of the SELECT"""
+        return self.defer(*self.PHOTO_FIELDS)
+
+    def with_photos(self):
+        """Load every column, including the photos deferred by the default manager"""
+        return self.defer(None)
+
+    def with_customer(self):
+        """select_related('customer') without the customer's photo and biometric columns"""
+        return self.select_related('customer').defer(
+            *(f'customer__{name}' for name in CustomerQuerySet.HEAVY_FIELDS)
+        )
+
+    def with_photo_refs(self):
+        """Annotate ``face_capture_ref`` and ``item_photo_refs`` for list thumbnails.
+
+        Media store references are passed through while inline base64
+        payloads come back as NULL, so lists stay small until
+        ``externalize_photos`` has migrated old rows.
+        """
+        from django.db.models.functions import Cast
+
+        return self.alias(
+            _item_photos_text=Cast('item_photos', models.TextField()),
+        ).annotate(
+            face_capture_ref=models.Case(
+                models.When(customer_face_capture__startswith='data:', then=models.Value(None)),
+                default=models.F('customer_face_capture'),
+                output_field=models.TextField(),
+            ),
+            item_photo_refs=models.Case(
+                models.When(_item_photos_text__contains='data:', then=models.Value(None)),
+                default=models.F('item_photos'),
+                output_field=models.JSONField(),
+            ),
+        )
+
+    def with_financials(self, today=None):
+        """Annotate database-side equivalents of the loan's financial properties.
+
+        Adds ``paid_amount``, ``months_elapsed``, ``monthly_interest_amount``,
+        ``payable_till_date`` and ``outstanding_balance`` so that lists can
+        filter, sort and paginate on them in SQL. The expressions mirror
+        ``monthly_interest_till_date`` and ``total_payable_till_date``, working
+        in integer paise. The only difference is on exact half-paise ties,
+        which are rounded to even here while the property's 28-digit
+        ``rate / 12`` can tip them either way.
+        """
+        from django.db.models.fields.json import KeyTextTransform
+        from django.db.models.functions import Cast, Coalesce, ExtractMonth, ExtractYear, Greatest, Round
+
+        today = today or timezone.now().date()
+        money = models.DecimalField(max_digits=14, decimal_places=2)
+        zero = models.Value(Decimal('0.00'), output_field=money)
+
+        paid_subquery = (Payment.objects.filter(loan=models.OuterRef('pk'))
+                         .order_by()
+                         .values('loan')
+                         .annotate(total=models.Sum('amount'))
+                         .values('total'))
+        calendar_months = (
+            (models.Value(today.year) - ExtractYear('issue_date')) * 12
+            + models.Value(today.month) - ExtractMonth('issue_date')
+        )
+
+        return self.annotate(
+            paid_amount=Coalesce(models.Subquery(paid_subquery, output_field=money), zero),
+            _calendar_months=calendar_months,
+            _no_interest_days=Coalesce(
+                Cast(KeyTextTransform('no_interest_period_days', 'scheme__additional_conditions'), models.FloatField()),
+                models.Value(0.0),
+            ),
+            _days_since_issue=DaysBetween(models.Value(today, output_field=models.DateField()), 'issue_date'),
+            # principal * rate / 1200 in integer paise, rate taken in hundredths of a percent
+            _interest_numerator=(
+                Cast('principal_amount', models.BigIntegerField())
+                * Cast(Round(models.F('scheme__interest_rate') * 100), models.BigIntegerField())
+            ),
+        ).annotate(
+            _interest_quotient=models.F('_interest_numerator') / 1200,
+            _interest_remainder=models.F('_interest_numerator') % 1200,
+            _interest_quotient_parity=(models.F('_interest_numerator') / 1200) % 2,
+        ).annotate(
+            # For active loans the current month is always charged once a day has passed
+            months_elapsed=models.Case(
+                models.When(_calendar_months__lt=0, then=models.Value(0)),
+                models.When(
+                    models.Q(status='active') & (
+                        models.Q(_calendar_months__gt=0)
+                        | models.Q(_calendar_months=0, issue_date__day__lt=today.day)
+                    ),
+                    then=models.F('_calendar_months') + 1,
+                ),
+                default=models.F('_calendar_months'),
+                output_field=models.IntegerField(),
+            ),
+            # Round half-paise ties to even, as Decimal.quantize does in the property
+            _monthly_interest_paise=models.Case(
+                models.When(scheme__isnull=True, then=models.Value(0)),
+                models.When(
+                    models.Q(_interest_remainder__gt=600)
+                    | models.Q(_interest_remainder=600, _interest_quotient_parity=1),
+                    then=models.F('_interest_quotient') + 1,
+                ),
+                default=models.F('_interest_quotient'),
+                output_field=models.BigIntegerField(),
+            ),
+        ).annotate(
+            monthly_interest_amount=models.ExpressionWrapper(
+                AsDecimal(models.F('_monthly_interest_paise')) / models.Value(Decimal('100')),
+                output_field=money,
+            ),
+        ).annotate(
+            payable_till_date=models.Case(
+                models.When(~models.Q(status='active'), then=zero),
+                models.When(scheme__isnull=True, then=models.F('principal_amount')),
+                models.When(
+                    _no_interest_days__gt=0,
+                    _days_since_issue__lte=models.F('_no_interest_days'),
+                    then=models.F('principal_amount'),
+                ),
+                default=models.ExpressionWrapper(
+                    models.F('principal_amount') + models.F('monthly_interest_amount') * models.F('months_elapsed'),
+                    output_field=money,
+                ),
+                output_field=money,
+            ),
+        ).annotate(
+            outstanding_balance=Greatest(models.F('payable_till_date') - models.F('paid_amount'), zero, output_field=money),
+        )
+
+
+class LoanManager(models.Manager.from_queryset(LoanQuerySet)):
+    """Default loan manager; photo columns are deferred unless ``with_photos()`` is used"""
+
+    def get_queryset(self):
+        return super().get_queryset().without_photos()
+
+
+class Loan(LoadedValuesMixin, models.Model):
     """Pawn loan model"""
+    # Fields the LoanLedger interest snapshot is computed from (see sync_loan_ledger)
+    LEDGER_FIELDS = (
+        'principal_amount', 'interest_rate', 'issue_date', 'due_date', 'grace_period_end', 'status', 'scheme_id',
+    )
+    # Ledger inputs, plus the branch and creation time its dashboard and rollup buckets come from
+    tracked_fields = LEDGER_FIELDS + ('branch_id', 'created_at')
+
     # Loan ID with prefix for easier identification
     loan_number = models.CharField(
         max_length=50, 
@@ -62,7 +251,7 @@ class Loan(models.Model):
     grace_period_end = models.DateField()
     
     # Customer verification and photos
-    customer_face_capture = models.TextField(blank=True, null=True, help_text="Base64-encoded customer photo")
+    customer_face_capture = models.TextField(blank=True, null=True, help_text="Customer photo URL in the media store")
     item_photos = models.JSONField(default=list, blank=True, help_text="List of photo URLs or base64 data")
     
     # Metadata
@@ -72,11 +261,18 @@ class Loan(models.Model):
         'accounts.CustomUser', on_delete=models.SET_NULL,
         null=True, blank=True, related_name='loans_created'
     )
+
+    objects = LoanManager()
     
     class Meta:
         verbose_name = _('loan')
         verbose_name_plural = _('loans')
         ordering = ['-created_at']
+        indexes = [
+            # Range scans of the nightly lifecycle job (see transactions.lifecycle) and branch dashboards
+            models.Index(fields=['branch', 'status', 'due_date'], name='loan_branch_status_due_idx'),
+            models.Index(fields=['branch', 'status', 'grace_period_end'], name='loan_branch_status_grace_idx'),
+        ]
         permissions = [
             ("can_approve_loan", "Can approve loan"),
             ("can_extend_loan", "Can extend loan"),
@@ -126,67 +322,72 @@ class Loan(models.Model):
             return (self.due_date - timezone.now().date()).days
         return 0
 
+    @classmethod
+    def next_loan_number(cls, branch, when=None):
+        """Allocate the next loan number (YYYY-MM-BRANCH-NNNN) for a branch and month"""
+        when = when or timezone.now()
+        branch_code = str(branch.id).zfill(2) if branch else "00"
+        prefix = f"{when.year}-{when.month:02d}-{branch_code}-"
+        seq_num = sequences.next_value(
+            'loan', prefix,
+            seed=lambda: sequences.max_numeric_suffix(cls.objects.all(), 'loan_number', prefix),
+        )
+        return f"{prefix}{seq_num:04d}"
+
     def save(self, *args, **kwargs):
-        # Handle base64 photos
-        if isinstance(self.item_photos, str) and self.item_photos.startswith('data:image/'):
-            # Convert base64 to file and update item_photos
-            from django.core.files.base import ContentFile
-            import base64
-            import os
-            
-            try:
-                # Extract image format and data
-                format, imgstr = self.item_photos.split(';base64,')
-                ext = format.split('/')[-1]
-                
-                # Decode base64
-                image_data = base64.b64decode(imgstr)
-                
-                # Generate filename and save
-                filename = f"{uuid.uuid4()}.{ext}"
-                file_path = item_photo_path(self, filename)
-                file_path = os.path.join('media', file_path)
-                
-                # Ensure directory exists
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                
-                # Write file
-                with open(file_path, 'wb') as f:
-                    f.write(image_data)
-                
-                # Update item_photos with URL
-                self.item_photos = [f"/media/inventory_images/loan_{self.loan_number}/{filename}"]
-                
-            except Exception as e:
-                print(f"Error processing base64 image: {e}")
-                # Default to empty list if there's an error
-                if not isinstance(self.item_photos, list):
-                    self.item_photos = []
-        
-        # Convert item_photos to JSON if it's a list
-        if isinstance(self.item_photos, list):
-            try:
-                self.item_photos = json.dumps(self.item_photos)
-            except Exception as e:
-                print(f"Error converting item_photos to JSON: {e}")
-                self.item_photos = "[]"  # Default to empty JSON array
-        
-        # Ensure item_photos is a valid JSON string
-        if isinstance(self.item_photos, str) and not self.item_photos.startswith('data:image/'):
+        # Move embedded base64 images into the media store, keeping only references on the row.
+        # Deferred photo columns are not saved, so they are left unloaded.
+        deferred = self.get_deferred_fields()
+        if 'customer_face_capture' not in deferred:
+            self.customer_face_capture = media_store.externalize(self.customer_face_capture)
+        if 'item_photos' not in deferred:
+            self.item_photos = self._externalize_item_photos(self.item_photos)
+
+            # Convert item_photos to JSON if it's a list
+            if isinstance(self.item_photos, list):
+                try:
+                    self.item_photos = json.dumps(self.item_photos)
+                except Exception as e:
+                    print(f"Error converting item_photos to JSON: {e}")
+                    self.item_photos = "[]"  # Default to empty JSON array
+
+            # Ensure item_photos is a valid JSON string
+            if isinstance(self.item_photos, str) and not self.item_photos.startswith('data:image/'):
+                try:
+                    # Validate JSON format
+                    json.loads(self.item_photos)
+                except json.JSONDecodeError:
+                    # If not valid JSON, reset to empty array
+                    print("Invalid JSON in item_photos, resetting to empty array")
+                    self.item_photos = "[]"
+
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def _externalize_item_photos(item_photos):
+        """Replace base64 entries in item_photos with media store URLs"""
+        if media_store.is_data_url(item_photos):
+            return [media_store.externalize(item_photos)]
+        if isinstance(item_photos, str) and 'data:image/' in item_photos:
             try:
-                # Validate JSON format
-                json.loads(self.item_photos)
+                photos = json.loads(item_photos)
             except json.JSONDecodeError:
-                # If not valid JSON, reset to empty array
-                print("Invalid JSON in item_photos, resetting to empty array")
-                self.item_photos = "[]"
-        
-        super().save(*args, **kwargs)
+                return item_photos
+            if isinstance(photos, list):
+                return json.dumps(media_store.externalize_list(photos))
+            return item_photos
+        if isinstance(item_photos, list):
+            return media_store.externalize_list(item_photos)
+        return item_photos
 
     @property
     def amount_paid(self):
-        """Calculate total amount paid on this loan"""
-        return self.payments.aggregate(total=models.Sum('amount'))['total'] or Decimal('0.00')
+        """Total amount paid on this loan, read from the balance ledger"""
+        try:
+            return self.ledger.amount_paid
+        except LoanLedger.DoesNotExist:
+            # Legacy loans without a ledger row fall back to the aggregate
+            return self.payments.aggregate(total=models.Sum('amount'))['total'] or Decimal('0.00')
 
     @property
     def remaining_balance(self):
@@ -400,8 +601,174 @@ class LoanExtension(models.Model):
         return f"Extension for {self.loan} - {self.extension_date}"
 
 
-class Sale(models.Model):
+class LoanLedger(models.Model):
+    """Denormalized running balance for a loan.
+
+    Kept in step with Payment and LoanExtension writes so that loan pages and
+    lists can read balances without aggregating over payments.
+    """
+    loan = models.OneToOneField(Loan, on_delete=models.CASCADE, primary_key=True, related_name='ledger')
+    amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    payment_count = models.PositiveIntegerField(default=0)
+    last_payment_date = models.DateField(null=True, blank=True)
+    extension_fees = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    interest_accrued = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal('0.00'),
+        help_text="Monthly interest accrued as of interest_as_of"
+    )
+    interest_as_of = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('loan ledger')
+        verbose_name_plural = _('loan ledgers')
+
+    def __str__(self):
+        return f"Ledger for loan #{self.loan_id}"
+
+    @classmethod
+    def totals_for(cls, loan_ids):
+        """Return {loan_id: field values} computed from the source tables"""
+        totals = {
+            loan_id: {
+                'amount_paid': Decimal('0.00'),
+                'payment_count': 0,
+                'last_payment_date': None,
+                'extension_fees': Decimal('0.00'),
+            }
+            for loan_id in loan_ids
+        }
+        payments = (Payment.objects.filter(loan_id__in=loan_ids)
+                    .order_by()
+                    .values('loan_id')
+                    .annotate(total=models.Sum('amount'), count=models.Count('id'),
+                              last=models.Max('payment_date')))
+        for row in payments:
+            totals[row['loan_id']].update(
+                amount_paid=row['total'] or Decimal('0.00'),
+                payment_count=row['count'],
+                last_payment_date=row['last'],
+            )
+        fees = (LoanExtension.objects.filter(loan_id__in=loan_ids)
+                .order_by()
+                .values('loan_id')
+                .annotate(total=models.Sum('fee')))
+        for row in fees:
+            totals[row['loan_id']]['extension_fees'] = row['total'] or Decimal('0.00')
+        return totals
+
+    @classmethod
+    def rebuild(cls, loan, create=True):
+        """Recompute the ledger row for a single loan from its payments and extensions"""
+        values = cls.totals_for([loan.pk])[loan.pk]
+        values['interest_accrued'] = loan.monthly_interest_till_date()
+        values['interest_as_of'] = timezone.now().date()
+        with transaction.atomic():
+            if create:
+                ledger, _ = cls.objects.select_for_update().get_or_create(loan=loan)
+            else:
+                ledger = cls.objects.select_for_update().filter(loan=loan).first()
+                if ledger is None:
+                    return None
+            for field, value in values.items():
+                setattr(ledger, field, value)
+            ledger.save()
+        # Keep the cached relation on the caller's instance current
+        loan.ledger = ledger
+        return ledger
+
+    @classmethod
+    def record_payment(cls, payment):
+        """Apply a newly created payment to the running totals"""
+        with transaction.atomic():
+            ledger, created = cls.objects.select_for_update().get_or_create(loan_id=payment.loan_id)
+            if created:
+                # First ledger write for a legacy loan - the totals already include this payment
+                return cls.rebuild(payment.loan)
+            ledger.amount_paid += payment.amount
+            ledger.payment_count += 1
+            if not ledger.last_payment_date or payment.payment_date > ledger.last_payment_date:
+                ledger.last_payment_date = payment.payment_date
+            ledger.save(update_fields=['amount_paid', 'payment_count', 'last_payment_date', 'updated_at'])
+        return ledger
+
+
+class LoanLifecycleEvent(models.Model):
+    """Audit trail of the status changes made by the nightly lifecycle job"""
+    OVERDUE = 'overdue'
+    DEFAULTED = 'defaulted'
+    AUCTION = 'auction'
+    EVENT_CHOICES = (
+        (OVERDUE, _('Past due date')),
+        (DEFAULTED, _('Defaulted after grace period')),
+        (AUCTION, _('Items released for auction')),
+    )
+
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='lifecycle_events')
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    from_status = models.CharField(max_length=20)
+    to_status = models.CharField(max_length=20)
+    threshold_date = models.DateField(help_text="Due date, grace period end or auction date the loan passed")
+    run_date = models.DateField(help_text="Business date of the lifecycle run")
+    items_updated = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('loan lifecycle event')
+        verbose_name_plural = _('loan lifecycle events')
+        ordering = ['-created_at']
+        constraints = [
+            # Re-running the job for a date records nothing twice; an extended loan can pass its new dates again
+            models.UniqueConstraint(fields=['loan', 'event', 'threshold_date'], name='unique_loan_lifecycle_event'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_event_display()} for {self.loan_id} on {self.run_date}"
+
+
+class DocumentRenderJob(models.Model):
+    """Queued PDF render of a loan agreement or payment receipt (see transactions.render_jobs)"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, _('Pending')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+    ]
+
+    kind = models.CharField(max_length=30, help_text="Document type, e.g. loan_agreement")
+    object_id = models.PositiveIntegerField(help_text="Primary key of the loan or payment")
+    key = models.CharField(max_length=64, help_text="Fingerprint of the document content")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    worker = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('document render job')
+        verbose_name_plural = _('document render jobs')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='document_job_status_idx'),
+            models.Index(fields=['kind', 'object_id', 'key'], name='document_job_document_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} ({self.get_status_display()})"
+
+
+class Sale(LoadedValuesMixin, models.Model):
     """Model for sale transactions"""
+    # Dashboard and rollup buckets a saved sale may be moving away from
+    tracked_fields = ('branch_id', 'sale_date')
+
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('completed', 'Completed'),
@@ -441,3 +808,71 @@ class Sale(models.Model):
     
     def __str__(self):
         return f"Sale #{self.transaction_number} - ₹{self.total_amount}"
+
+
+# Signal handlers keeping LoanLedger in step with payment, extension and loan writes
+@receiver(post_save, sender=Loan)
+def sync_loan_ledger(sender, instance, created, raw=False, **kwargs):
+    """Create the ledger for new loans and refresh it when the loan's terms change"""
+    if raw:
+        return
+    # Payment and extension writes rebuild through their own receivers; other loan
+    # edits (notes, photos, timestamps) leave the ledger as it is
+    if created or instance.changed_fields() & set(Loan.LEDGER_FIELDS):
+        LoanLedger.rebuild(instance)
+
+
+@receiver(post_save, sender=Payment)
+def apply_payment_to_ledger(sender, instance, created, raw=False, **kwargs):
+    """Add new payments to the running totals; recompute when a payment is edited"""
+    if raw:
+        return
+    if created:
+        LoanLedger.record_payment(instance)
+    else:
+        LoanLedger.rebuild(instance.loan)
+
+
+@receiver(post_save, sender=LoanExtension)
+def apply_extension_to_ledger(sender, instance, raw=False, **kwargs):
+    """Recompute extension fees when an extension is recorded or changed"""
+    if raw:
+        return
+    LoanLedger.rebuild(instance.loan)
+
+
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=LoanExtension)
+def remove_from_ledger(sender, instance, **kwargs):
+    """Recompute totals after a delete, without recreating ledgers of deleted loans"""
+    loan = Loan.objects.filter(pk=instance.loan_id).first()
+    if loan is not None:
+        LoanLedger.rebuild(loan, create=False)
+
+
+@receiver(post_save, sender='inventory.Category')
+@receiver(post_delete, sender='inventory.Category')
+@receiver(post_save, sender=Scheme)
+@receiver(post_delete, sender=Scheme)
+def invalidate_loan_form_choices(sender, raw=False, **kwargs):
+    """Reload the cached LoanForm category and scheme lists after a change"""
+    if raw:
+        return
+    from . import form_choices
+    form_choices.invalidate()
+
+
+# Cached PDFs are keyed by a fingerprint of their content, so an edited loan or
+# payment is simply rendered under a new key; only deleted rows need cleaning up
+@receiver(post_delete, sender=Loan)
+def remove_loan_documents(sender, instance, **kwargs):
+    """Delete the cached agreement PDFs of a deleted loan"""
+    from . import documents
+    documents.invalidate(documents.LOAN_AGREEMENT, instance.pk)
+
+
+@receiver(post_delete, sender=Payment)
+def remove_payment_documents(sender, instance, **kwargs):
+    """Delete the cached receipt PDFs of a deleted payment"""
+    from . import documents
+    documents.invalidate(documents.PAYMENT_RECEIPT, instance.pk)
@@ -0,0 +1,159 @@
+"""
+Background PDF rendering queue.
+
+xhtml2pdf holds the GIL for the whole render, so rendering inside a web
+worker stalls every other request that worker serves. Instead,
+``documents.request_document`` adds a pending ``DocumentRenderJob`` row and
+the page polls until the file appears in PDF_CACHE_DIR. The database table
+is the queue, so jobs survive restarts.
+
+``run_document_renderer`` (a ``Renderer``) loops as follows:
+
+1. Requeue running jobs whose lease expired because their worker died.
+   Retries stop after MAX_ATTEMPTS.
+2. Claim a batch of pending jobs with a conditional UPDATE. Several
+   renderers never take the same job.
+3. Render each document on a process pool of ``PDF_RENDER_WORKERS``
+   processes into the shared cache directory. The renderer must see the
+   same PDF_CACHE_DIR as the web processes.
+4. Mark the job done or failed. A failure also leaves an ``.error`` marker,
+   which the next request reports once before queueing a retry.
+
+Each round, and each finished job, touches the renderer heartbeat that tells
+web processes to queue rather than render (see ``documents.renderer_running``).
+``start.sh`` runs the renderer beside the web server.
+"""
+import datetime
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+from . import documents
+from .models import DocumentRenderJob
+
+# Jobs claimed per pool worker per round
+BATCH_PER_WORKER = 4
+
+# Seconds a claimed job may run before another renderer retries it
+LEASE_SECONDS = 300
+
+MAX_ATTEMPTS = 3
+
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(kind, pk, key):
+    """Queue a render of one document version; returns the new or already queued job"""
+    pending = (DocumentRenderJob.objects
+               .filter(kind=kind, object_id=pk, key=key,
+                       status__in=[DocumentRenderJob.PENDING, DocumentRenderJob.RUNNING])
+               .first())
+    return pending or DocumentRenderJob.objects.create(kind=kind, object_id=pk, key=key)
+
+
+def requeue_expired(now=None):
+    """Put jobs of dead renderers back in the queue; returns (requeued, failed)"""
+    now = now or timezone.now()
+    expired = DocumentRenderJob.objects.filter(status=DocumentRenderJob.RUNNING, lease_expires_at__lt=now)
+    failed = expired.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=DocumentRenderJob.FAILED, error='Renderer stopped responding', finished_at=now, lease_expires_at=None
+    )
+    requeued = expired.update(status=DocumentRenderJob.PENDING, worker='', lease_expires_at=None)
+    return requeued, failed
+
+
+def claim(owner, limit, now=None):
+    """Take up to limit pending jobs for owner, oldest first"""
+    now = now or timezone.now()
+    pks = list(DocumentRenderJob.objects.filter(status=DocumentRenderJob.PENDING)
+               .order_by('pk').values_list('pk', flat=True)[:limit])
+    if not pks:
+        return []
+    # Only rows still pending are taken, so a job claimed by another renderer in between is skipped
+    DocumentRenderJob.objects.filter(pk__in=pks, status=DocumentRenderJob.PENDING).update(
+        status=DocumentRenderJob.RUNNING,
+        worker=owner,
+        attempts=F('attempts') + 1,
+        started_at=now,
+        lease_expires_at=now + datetime.timedelta(seconds=LEASE_SECONDS),
+    )
+    return list(DocumentRenderJob.objects.filter(pk__in=pks, status=DocumentRenderJob.RUNNING, worker=owner)
+                .order_by('pk'))
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def render_job(kind, pk, key):
+    """Render one document; runs in a pool process, returns None or the error"""
+    try:
+        return documents.render_to_cache(kind, pk, key)
+    finally:
+        # Pool processes keep no connection open between jobs
+        connections.close_all()
+
+
+def _finish(job, status, error='', now=None):
+    DocumentRenderJob.objects.filter(pk=job.pk, worker=job.worker).update(
+        status=status, error=error, finished_at=now or timezone.now(), lease_expires_at=None
+    )
+
+
+class Renderer:
+    """Claim queued jobs and render them, on a process pool unless workers is 1"""
+
+    def __init__(self, workers=None, owner=None):
+        self.workers = workers or getattr(settings, 'PDF_RENDER_WORKERS', 2)
+        self.owner = owner or default_owner()
+        self.pool = None
+        if self.workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+    def _render(self, jobs):
+        """Yield (job, error) as each job finishes"""
+        if self.pool is None:
+            for job in jobs:
+                yield job, documents.render_to_cache(job.kind, job.object_id, job.key)
+            return
+        # Pool processes are forked on first use and must not share this process's connections
+        connections.close_all()
+        futures = {self.pool.submit(render_job, job.kind, job.object_id, job.key): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                yield job, future.result()
+            except Exception as e:
+                yield job, str(e)
+
+    def run_once(self):
+        """Render one batch; returns the number of jobs processed"""
+        documents.renderer_heartbeat()
+        requeued, failed = requeue_expired()
+        if requeued or failed:
+            print(f"Requeued {requeued} and failed {failed} document render job(s) with expired leases")
+
+        jobs = claim(self.owner, self.workers * BATCH_PER_WORKER)
+        for job, error in self._render(jobs):
+            documents.renderer_heartbeat()
+            if error:
+                _finish(job, DocumentRenderJob.FAILED, error)
+            else:
+                _finish(job, DocumentRenderJob.DONE)
+        return len(jobs)
+
+    def shutdown(self, wait=True):
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait)
+        # Jobs this renderer still holds go straight back to the queue
+        (DocumentRenderJob.objects
+         .filter(status=DocumentRenderJob.RUNNING, worker=self.owner)
+         .update(status=DocumentRenderJob.PENDING, worker='', lease_expires_at=None))
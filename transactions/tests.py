@@ -1,3 +1,641 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
+import os
+import tempfile
+import time
+import unittest
+import unittest.mock
+import zipfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Customer, CustomUser
+from branches.models import Branch, BranchSettings
+from pawnshop_management import media_store
+from inventory import ornaments
+from inventory.models import Category, Item
+from schemes.models import Scheme
+from transactions import documents, form_choices, interest, lifecycle, render_jobs
+from transactions.forms import LoanForm
+from transactions.models import (
+    DocumentRenderJob, Loan, LoanExtension, LoanItem, LoanLedger, LoanLifecycleEvent, Payment,
+)
+
+
+def fetched_bytes(queries):
+    """Re-run the captured SELECTs and total the size of the values they return"""
+    total = 0
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute(sql)
+            for row in cursor.fetchall():
+                for value in row:
+                    if isinstance(value, (str, bytes, memoryview)):
+                        total += len(value)
+                    elif value is not None:
+                        total += 8
+    return total
+
+
+class HeavyColumnFetchTests(TestCase):
+    """List and dashboard views must not pull photo or biometric columns"""
+
+    ROWS = 10
+    # Roughly the size of a camera capture stored inline
+    PHOTO_BYTES = 64 * 1024
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        branch = Branch.objects.create(
+            name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1'
+        )
+        photo = 'data:image/jpeg;base64,' + base64.b64encode(b'x' * cls.PHOTO_BYTES).decode()
+        issue_date = datetime.date.today()
+
+        for i in range(cls.ROWS):
+            customer = Customer.objects.create(
+                first_name=f'Customer{i}', last_name='Test', phone=str(i), branch=branch
+            )
+            loan = Loan.objects.create(
+                loan_number=f'LN{i:04d}', customer=customer, branch=branch,
+                principal_amount=10000, distribution_amount=10000,
+                issue_date=issue_date, due_date=issue_date + datetime.timedelta(days=90),
+                grace_period_end=issue_date + datetime.timedelta(days=97),
+            )
+            # Write inline payloads directly, as rows saved before the media store would have them
+            Customer.objects.filter(pk=customer.pk).update(
+                profile_photo=photo, face_encoding=b'\x00' * cls.PHOTO_BYTES
+            )
+            Loan.objects.filter(pk=loan.pk).update(
+                customer_face_capture=photo, item_photos=json.dumps([photo, photo])
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertFetchesUnder(self, url_name, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        fetched = fetched_bytes(context.captured_queries)
+        self.assertLess(fetched, limit, f"{url_name} fetched {fetched} bytes")
+        return fetched
+
+    def test_loan_list_skips_photo_columns(self):
+        self.assertFetchesUnder('loan_list', self.PHOTO_BYTES)
+
+    def test_dashboard_skips_photo_columns(self):
+        self.assertFetchesUnder('dashboard', self.PHOTO_BYTES)
+
+    def test_customer_list_skips_photo_columns(self):
+        self.assertFetchesUnder('customer_list', self.PHOTO_BYTES)
+
+    def test_externalize_photos_loads_photos_in_batches(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            with CaptureQueriesContext(connection) as context:
+                call_command('externalize_photos', '--batch-size', '4', stdout=StringIO())
+        selects = [q['sql'] for q in context.captured_queries if q['sql'].startswith('SELECT')]
+        # Three batches and an empty one per table, whatever the number of rows
+        self.assertEqual(len(selects), 8, selects)
+
+        loan = Loan.objects.with_photos().get(loan_number='LN0000')
+        self.assertTrue(media_store.is_blob_url(loan.customer_face_capture))
+        self.assertFalse(Customer.objects.filter(profile_photo__startswith='data:image/').exists())
+
+    def test_detail_queryset_loads_photos(self):
+        loan = Loan.objects.with_photos().get(loan_number='LN0000')
+        self.assertNotIn('customer_face_capture', loan.get_deferred_fields())
+        self.assertTrue(loan.customer_face_capture.startswith('data:image/'))
+
+
+class LoanFormQueryTests(TestCase):
+    """Building the loan form reads categories and schemes from the in-process cache"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(
+            name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1'
+        )
+        cls.user = CustomUser.objects.create_user('clerk', password='password', branch=cls.branch)
+        Scheme.objects.create(
+            name='Standard Gold Loan', description='Standard', interest_rate=12, loan_duration=365,
+            minimum_amount=1000, maximum_amount=100000, start_date=datetime.date.today(),
+        )
+
+    def setUp(self):
+        # Rolled-back test data sends no signals; start each test from the database
+        form_choices.invalidate()
+
+    def test_warm_form_runs_no_queries(self):
+        LoanForm(user=self.user)
+        with self.assertNumQueries(0):
+            form = LoanForm(user=self.user)
+        self.assertEqual(form.fields['item_category'].objects[0].name, 'Mixed Items')
+        self.assertEqual(len(form.fields['item_category'].objects), len(ornaments.ORNAMENT_CATEGORIES))
+        self.assertEqual([scheme.name for scheme in form.fields['scheme'].objects], ['Standard Gold Loan'])
+
+    def test_scheme_save_refreshes_choices(self):
+        LoanForm(user=self.user)
+        scheme = Scheme.objects.get(name='Standard Gold Loan')
+        scheme.name = 'Gold Saver'
+        scheme.save()
+        self.assertEqual([scheme.name for scheme in LoanForm(user=self.user).fields['scheme'].objects], ['Gold Saver'])
+
+    def test_scheme_delete_refreshes_choices(self):
+        LoanForm(user=self.user)
+        Scheme.objects.get(name='Standard Gold Loan').delete()
+        self.assertEqual(LoanForm(user=self.user).fields['scheme'].objects, [])
+
+
+class LoanLedgerTests(TestCase):
+    """The ledger row matches the payment and extension aggregates after every write"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(
+            name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1'
+        )
+        cls.customer = Customer.objects.create(first_name='Asha', last_name='Test', phone='1', branch=cls.branch)
+
+    def setUp(self):
+        today = datetime.date.today()
+        self.loan = Loan.objects.create(
+            loan_number='LN0001', customer=self.customer, branch=self.branch,
+            principal_amount=10000, distribution_amount=10000,
+            issue_date=today, due_date=today + datetime.timedelta(days=90),
+            grace_period_end=today + datetime.timedelta(days=97),
+        )
+
+    def assertLedgerMatchesTotals(self):
+        ledger = LoanLedger.objects.get(loan=self.loan)
+        for field, value in LoanLedger.totals_for([self.loan.pk])[self.loan.pk].items():
+            self.assertEqual(getattr(ledger, field), value, field)
+        return ledger
+
+    def pay(self, amount, days=0):
+        return Payment.objects.create(
+            loan=self.loan, amount=amount, payment_method='cash',
+            payment_date=datetime.date.today() + datetime.timedelta(days=days),
+        )
+
+    def test_payment_create(self):
+        self.pay(1500)
+        self.pay(500, days=3)
+        ledger = self.assertLedgerMatchesTotals()
+        self.assertEqual(ledger.payment_count, 2)
+        self.assertEqual(ledger.amount_paid, 2000)
+
+    def test_payment_delete(self):
+        self.pay(1500)
+        self.pay(500, days=3).delete()
+        ledger = self.assertLedgerMatchesTotals()
+        self.assertEqual(ledger.amount_paid, 1500)
+        self.assertEqual(ledger.last_payment_date, datetime.date.today())
+
+    def test_extension(self):
+        previous = self.loan.due_date
+        self.loan.due_date = previous + datetime.timedelta(days=30)
+        self.loan.status = 'extended'
+        self.loan.save()
+        LoanExtension.objects.create(
+            loan=self.loan, extension_date=datetime.date.today(), previous_due_date=previous,
+            new_due_date=self.loan.due_date, fee=250,
+        )
+        ledger = self.assertLedgerMatchesTotals()
+        self.assertEqual(ledger.extension_fees, 250)
+
+    def test_rebuilds_only_when_terms_change(self):
+        loan = Loan.objects.get(pk=self.loan.pk)
+        loan.customer_face_capture = 'https://example.com/face.jpg'
+        with CaptureQueriesContext(connection) as context:
+            loan.save()
+        self.assertFalse([q for q in context.captured_queries if 'transactions_loanledger' in q['sql']])
+
+        loan.principal_amount = 20000
+        with CaptureQueriesContext(connection) as context:
+            loan.save()
+        self.assertTrue([q for q in context.captured_queries if 'transactions_loanledger' in q['sql']])
+        self.assertEqual(loan.changed_fields(), set())
+
+
+class PortfolioFixture:
+    """Loans covering the interest edge cases: rates, half-paise ties, no-interest periods, status"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.now().date()
+        cls.branch = Branch.objects.create(
+            name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1'
+        )
+        customer = Customer.objects.create(first_name='Asha', last_name='Test', phone='1', branch=cls.branch)
+
+        def scheme(name, rate, **conditions):
+            return Scheme.objects.create(
+                name=name, description=name, interest_rate=rate, loan_duration=90,
+                minimum_amount=1000, maximum_amount=1000000, start_date=cls.today,
+                additional_conditions=conditions or None,
+            )
+
+        standard = scheme('Standard', Decimal('12.00'))
+        odd_rate = scheme('Odd rate', Decimal('13.75'))
+        tie = scheme('Half paise', Decimal('6.00'))  # 10001 * 6% / 12 = 50.005
+        grace = scheme('Grace', Decimal('18.00'), no_interest_period_days=30)
+
+        # (principal, scheme, days since issue, term in days, status)
+        cases = [
+            (10000, standard, 100, 90, 'active'),      # past due
+            (10000, standard, 0, 90, 'active'),        # issued today
+            (25000, standard, 40, 90, 'active'),
+            (99999, odd_rate, 400, 365, 'active'),
+            (10001, tie, 75, 90, 'active'),
+            (20000, grace, 10, 90, 'active'),          # inside the no-interest period
+            (20000, grace, 60, 90, 'active'),          # past it
+            (20000, grace, 5, 30, 'active'),           # whole term inside it
+            (15000, standard, 120, 150, 'extended'),   # due date moved by an extension
+            (15000, standard, 200, 90, 'repaid'),
+            (15000, standard, 200, 90, 'defaulted'),
+            (5000, None, 50, 90, 'active'),            # no scheme
+        ]
+        for i, (principal, loan_scheme, age, term, status) in enumerate(cases):
+            issue_date = cls.today - datetime.timedelta(days=age)
+            Loan.objects.create(
+                loan_number=f'PF{i:04d}', customer=customer, branch=cls.branch, scheme=loan_scheme,
+                principal_amount=principal, distribution_amount=principal, status=status,
+                issue_date=issue_date, due_date=issue_date + datetime.timedelta(days=term),
+                grace_period_end=issue_date + datetime.timedelta(days=term + 7),
+            )
+
+
+@unittest.skipIf(interest.np is None, 'numpy is not installed')
+class PortfolioInterestTests(PortfolioFixture, TestCase):
+    """The vectorized engine gives the same figures as the per-loan properties"""
+
+    def test_matches_loan_properties(self):
+        loans = {loan.pk: loan for loan in Loan.objects.select_related('scheme')}
+        rows = list(interest.compute_portfolio_interest(Loan.objects.all(), today=self.today).rows())
+        self.assertEqual(len(rows), len(loans))
+        for row in rows:
+            loan = loans[row['loan_id']]
+            with self.subTest(loan=loan.loan_number):
+                if loan.scheme:
+                    self.assertEqual(row['monthly_amount'], loan.monthly_interest['amount'])
+                self.assertEqual(row['accrued_interest'], loan.monthly_interest_till_date())
+                self.assertEqual(row['payable_till_date'], loan.total_payable_till_date)
+                self.assertEqual(row['payable_mature'], loan.total_payable_mature)
+                self.assertEqual(row['days_overdue'] > 0, loan.is_overdue)
+
+    def test_totals_by_branch(self):
+        portfolio = interest.compute_portfolio_interest(Loan.objects.all(), today=self.today)
+        totals = portfolio.totals()
+        self.assertEqual(portfolio.totals_by_branch()[self.branch.pk], totals)
+        self.assertEqual(totals['payable_till_date'],
+                         sum(loan.total_payable_till_date for loan in Loan.objects.select_related('scheme')))
+
+
+class FinancialAnnotationTests(PortfolioFixture, TestCase):
+    """with_financials() computes in SQL what the Loan properties compute in Python"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for loan in Loan.objects.filter(loan_number__in=['PF0000', 'PF0003', 'PF0008']):
+            Payment.objects.create(loan=loan, amount=Decimal('1234.50'), payment_method='cash', payment_date=cls.today)
+
+    def test_matches_loan_properties(self):
+        loans = Loan.objects.select_related('scheme').with_financials(today=self.today)
+        self.assertEqual(len(loans), 12)
+        for loan in loans:
+            with self.subTest(loan=loan.loan_number):
+                payable = loan.total_payable_till_date
+                self.assertEqual(loan.paid_amount, loan.amount_paid)
+                if loan.scheme:
+                    self.assertEqual(loan.monthly_interest_amount, loan.monthly_interest['amount'])
+                self.assertEqual(loan.payable_till_date, payable)
+                self.assertEqual(loan.outstanding_balance, max(Decimal('0.00'), payable - loan.amount_paid))
+
+    def test_filters_and_sorts_in_sql(self):
+        loans = Loan.objects.select_related('scheme')
+        expected = sorted((loan for loan in loans if loan.total_payable_till_date > 20000),
+                          key=lambda loan: (loan.total_payable_till_date, loan.pk))
+        annotated = (loans.with_financials(today=self.today)
+                     .filter(payable_till_date__gt=20000)
+                     .order_by('payable_till_date', 'pk'))
+        self.assertEqual([loan.pk for loan in annotated], [loan.pk for loan in expected])
+
+
+class DocumentRenderQueueTests(TestCase):
+    """PDFs are rendered by the queue worker while one is running, otherwise in the request"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        branch = Branch.objects.create(
+            name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1'
+        )
+        customer = Customer.objects.create(first_name='Asha', last_name='Test', phone='1', branch=branch)
+        today = datetime.date.today()
+        cls.loan = Loan.objects.create(
+            loan_number='LN0001', customer=customer, branch=branch,
+            principal_amount=10000, distribution_amount=10000,
+            issue_date=today, due_date=today + datetime.timedelta(days=90),
+            grace_period_end=today + datetime.timedelta(days=97),
+        )
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.user)
+        documents.renderer_heartbeat()
+
+    def request(self):
+        return documents.request_document(documents.LOAN_AGREEMENT, documents._load_loan(self.loan.pk))
+
+    def stop_renderer(self):
+        heartbeat = documents.cache_dir() / documents.RENDERER_HEARTBEAT
+        stale = time.time() - documents.RENDERER_TIMEOUT - 1
+        os.utime(heartbeat, (stale, stale))
+
+    def test_request_queues_one_job(self):
+        self.assertEqual(self.request().status, documents.DocumentStatus.PENDING)
+        self.assertEqual(self.request().status, documents.DocumentStatus.PENDING)
+        job = DocumentRenderJob.objects.get()
+        self.assertEqual((job.kind, job.object_id, job.status),
+                         (documents.LOAN_AGREEMENT, self.loan.pk, DocumentRenderJob.PENDING))
+        self.assertTrue(list(documents.cache_dir().glob('*.pending')))
+
+    def test_renderer_writes_the_cached_file(self):
+        response = self.client.get(reverse('loan_document', args=[self.loan.loan_number]))
+        self.assertTemplateUsed(response, 'transactions/document_pending.html')
+
+        self.assertEqual(render_jobs.Renderer(workers=1).run_once(), 1)
+        self.assertEqual(DocumentRenderJob.objects.get().status, DocumentRenderJob.DONE)
+        self.assertFalse(list(documents.cache_dir().glob('*.pending')))
+
+        response = self.client.get(reverse('loan_document', args=[self.loan.loan_number]))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_edit_renders_under_a_new_key(self):
+        self.request()
+        render_jobs.Renderer(workers=1).run_once()
+        (old_file,) = documents.cache_dir().glob('*.pdf')
+
+        loan = Loan.objects.get(pk=self.loan.pk)
+        loan.principal_amount = 12000
+        loan.save()
+        # Saving leaves the cache alone; the new fingerprint misses it
+        self.assertTrue(old_file.exists())
+        self.assertEqual(self.request().status, documents.DocumentStatus.PENDING)
+
+        render_jobs.Renderer(workers=1).run_once()
+        (new_file,) = documents.cache_dir().glob('*.pdf')
+        self.assertNotEqual(new_file, old_file)
+        self.assertTrue(self.request().is_ready)
+
+    def test_failure_is_reported_once(self):
+        self.request()
+        with unittest.mock.patch.object(documents, 'render_pdf', side_effect=documents.DocumentRenderError('boom')):
+            render_jobs.Renderer(workers=1).run_once()
+        job = DocumentRenderJob.objects.get()
+        self.assertEqual((job.status, job.error), (DocumentRenderJob.FAILED, 'boom'))
+
+        failed = self.request()
+        self.assertEqual((failed.status, failed.error), (documents.DocumentStatus.FAILED, 'boom'))
+        # The next request retries
+        self.assertEqual(self.request().status, documents.DocumentStatus.PENDING)
+        self.assertEqual(DocumentRenderJob.objects.filter(status=DocumentRenderJob.PENDING).count(), 1)
+
+    def test_request_renders_without_a_renderer(self):
+        self.stop_renderer()
+        document = self.request()
+        self.assertTrue(document.is_ready)
+        self.assertTrue(document.path.read_bytes().startswith(b'%PDF'))
+        self.assertFalse(DocumentRenderJob.objects.exists())
+        self.assertFalse(list(documents.cache_dir().glob('*.pending')))
+
+        with unittest.mock.patch.object(documents, 'render_pdf', side_effect=documents.DocumentRenderError('boom')):
+            loan = Loan.objects.get(pk=self.loan.pk)
+            loan.principal_amount = 12000
+            loan.save()
+            failed = self.request()
+        self.assertEqual((failed.status, failed.error), (documents.DocumentStatus.FAILED, 'boom'))
+        self.assertFalse(list(documents.cache_dir().glob('*.error')))
+
+    def test_expired_lease_is_requeued(self):
+        self.request()
+        (job,) = render_jobs.claim('dead-worker', 10)
+        DocumentRenderJob.objects.filter(pk=job.pk).update(
+            lease_expires_at=timezone.now() - datetime.timedelta(seconds=1)
+        )
+        self.assertEqual(render_jobs.requeue_expired(), (1, 0))
+        self.assertEqual(render_jobs.Renderer(workers=1).run_once(), 1)
+        self.assertTrue(self.request().is_ready)
+
+
+class AgreementExportTests(TestCase):
+    """The agreement export streams a ZIP, rendering serially inside the request"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.branch = Branch.objects.create(
+            name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1'
+        )
+        cls.day = datetime.date(2024, 3, 1)
+        cls.loans = []
+        for i in range(3):
+            customer = Customer.objects.create(
+                first_name=f'Customer{i}', last_name='Test', phone=str(i), branch=cls.branch
+            )
+            cls.loans.append(Loan.objects.create(
+                loan_number=f'LN{i:04d}', customer=customer, branch=cls.branch,
+                principal_amount=10000, distribution_amount=10000,
+                issue_date=cls.day, due_date=cls.day + datetime.timedelta(days=90),
+                grace_period_end=cls.day + datetime.timedelta(days=97),
+            ))
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.user)
+
+        failing = self.loans[1].pk
+
+        def render_pdf(template, context):
+            if context['loan'].pk == failing:
+                raise documents.DocumentRenderError('bad template data')
+            return b'%PDF-' + context['loan'].loan_number.encode()
+
+        for target, kwargs in [('render_pdf', {'side_effect': render_pdf}),
+                               ('ProcessPoolExecutor', {'side_effect': AssertionError('pool started')})]:
+            patcher = unittest.mock.patch.object(documents, target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_view_streams_zip(self):
+        response = self.client.get(reverse('loan_agreements_export'), {
+            'start_date': self.day.isoformat(), 'branch': str(self.branch.pk),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('Loan_Agreements_01Mar2024.zip', response['Content-Disposition'])
+        chunks = [chunk for chunk in response.streaming_content if chunk]
+        # One chunk per rendered agreement, then the central directory
+        self.assertEqual(len(chunks), 3)
+
+        with zipfile.ZipFile(BytesIO(b''.join(chunks))) as archive:
+            names = archive.namelist()
+            self.assertEqual(len(names), 3)
+            self.assertTrue(names[0].startswith('LN0000_'))
+            self.assertTrue(names[1].startswith('LN0002_'))
+            self.assertEqual(archive.read(names[1]), b'%PDF-LN0002')
+            self.assertEqual(names[2], 'errors.txt')
+            self.assertIn(b'bad template data', archive.read('errors.txt'))
+
+    def test_invalid_branch(self):
+        response = self.client.get(reverse('loan_agreements_export'), {'branch': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(AGREEMENT_EXPORT_MAX_LOANS=2)
+    def test_export_over_the_limit_is_refused(self):
+        response = self.client.get(reverse('loan_agreements_export'), {'start_date': self.day.isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'at most 2', response.content)
+        documents.render_pdf.assert_not_called()
+
+    def test_command_writes_zip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'agreements.zip'
+            call_command('export_agreements', '--from', self.day.isoformat(), '--workers', '1',
+                         '--output', str(output), stdout=StringIO())
+            with zipfile.ZipFile(output) as archive:
+                self.assertEqual(len(archive.namelist()), 3)
+
+
+class LoanLifecycleTests(TestCase):
+    """The nightly lifecycle is idempotent and its dry run reports what a real run does"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date(2024, 3, 10)
+        cls.branch = Branch.objects.create(
+            name='Main', address='1 Street', city='City', state='State', zip_code='1', phone='1'
+        )
+        BranchSettings.objects.create(branch=cls.branch, auction_delay_days=7)
+        customer = Customer.objects.create(first_name='Asha', last_name='Test', phone='1', branch=cls.branch)
+        category = Category.objects.create(name='Gold', slug='gold')
+
+        def loan(number, due, grace, status='active', items=()):
+            instance = Loan.objects.create(
+                loan_number=number, customer=customer, branch=cls.branch, status=status,
+                principal_amount=10000, distribution_amount=10000,
+                issue_date=due - datetime.timedelta(days=90), due_date=due, grace_period_end=grace,
+            )
+            for item_status in items:
+                n = Item.objects.count() + 1
+                item = Item.objects.create(
+                    item_id=f'IT{n:04d}', name=f'Ring {n}', description='Ring', category=category,
+                    branch=cls.branch,
+                )
+                LoanItem.objects.create(
+                    loan=instance, item=item, gold_karat=22, gross_weight=Decimal('10.000'),
+                    net_weight=Decimal('9.500'), market_price_22k=Decimal('6000.00'),
+                )
+                Item.objects.filter(pk=item.pk).update(status=item_status)
+            return instance
+
+        day = datetime.date
+        cls.overdue = loan('LN-OVERDUE', day(2024, 3, 5), day(2024, 3, 12))
+        cls.defaulting = loan('LN-DEFAULT', day(2024, 3, 1), day(2024, 3, 8), items=['pawned'])
+        # Past grace and the auction delay: defaulted and released in the same run
+        cls.lapsed = loan('LN-LAPSED', day(2024, 2, 20), day(2024, 2, 25), items=['pawned'])
+        cls.defaulted = loan('LN-AUCTION', day(2024, 1, 20), day(2024, 2, 1), status='defaulted',
+                             items=['pawned', 'pawned', 'sold'])
+        cls.current = loan('LN-CURRENT', day(2024, 4, 1), day(2024, 4, 8), items=['pawned'])
+        cls.repaid = loan('LN-REPAID', day(2024, 2, 1), day(2024, 2, 8), status='repaid')
+
+    def state(self):
+        return (
+            dict(Loan.objects.values_list('loan_number', 'status')),
+            dict(Item.objects.values_list('item_id', 'status')),
+            sorted(LoanLifecycleEvent.objects.values_list('loan__loan_number', 'event', 'threshold_date')),
+        )
+
+    def test_dry_run_matches_real_run(self):
+        before = self.state()
+        planned = lifecycle.run(self.today, dry_run=True)
+        self.assertEqual(self.state(), before)
+
+        self.assertEqual(lifecycle.run(self.today), planned)
+        self.assertEqual(planned[self.branch.pk], {'overdue': 1, 'defaulted': 2, 'auction': 2, 'items': 3})
+
+    def test_rerun_changes_nothing(self):
+        lifecycle.run(self.today)
+        after = self.state()
+
+        summary = lifecycle.run(self.today, batch_size=1)
+
+        self.assertEqual(summary[self.branch.pk], {'overdue': 0, 'defaulted': 0, 'auction': 0, 'items': 0})
+        self.assertEqual(self.state(), after)
+        self.assertEqual(lifecycle.run(self.today, dry_run=True), summary)
+
+    def test_transitions(self):
+        lifecycle.run(self.today)
+        statuses, items, events = self.state()
+
+        self.assertEqual(statuses['LN-OVERDUE'], 'active')
+        self.assertEqual(statuses['LN-DEFAULT'], 'defaulted')
+        self.assertEqual(statuses['LN-LAPSED'], 'defaulted')
+        self.assertEqual(statuses['LN-CURRENT'], 'active')
+        self.assertEqual(statuses['LN-REPAID'], 'repaid')
+        self.assertEqual(events, sorted([
+            ('LN-OVERDUE', 'overdue', datetime.date(2024, 3, 5)),
+            ('LN-DEFAULT', 'defaulted', datetime.date(2024, 3, 8)),
+            ('LN-LAPSED', 'defaulted', datetime.date(2024, 2, 25)),
+            ('LN-LAPSED', 'auction', datetime.date(2024, 3, 3)),
+            ('LN-AUCTION', 'auction', datetime.date(2024, 2, 8)),
+        ]))
+
+    def test_auction_releases_only_pledged_items(self):
+        lifecycle.run(self.today)
+
+        released = Item.objects.filter(loanitem__loan=self.defaulted).order_by('pk').values_list('status', flat=True)
+        self.assertEqual(list(released), ['expired', 'expired', 'sold'])
+        event = LoanLifecycleEvent.objects.get(loan=self.defaulted, event=LoanLifecycleEvent.AUCTION)
+        self.assertEqual((event.from_status, event.to_status, event.items_updated), ('defaulted', 'defaulted', 2))
+        # Items of a loan inside its auction delay stay pledged
+        self.assertEqual(Item.objects.get(loanitem__loan=self.defaulting).status, 'pawned')
+
+    def test_auction_reports_only_loans_that_released_items(self):
+        lifecycle.mark_defaulted(self.branch.pk, self.today)
+        batches = lifecycle._batches
+
+        def sell_then_batch(rows, size):
+            # The pledged items of one candidate are sold between the scan and the release
+            Item.objects.filter(loanitem__loan=self.defaulted, status='pawned').update(status='sold')
+            return batches(rows, size)
+
+        with unittest.mock.patch.object(lifecycle, '_batches', sell_then_batch):
+            loan_ids, items = lifecycle.release_for_auction(self.branch.pk, self.today, 7)
+
+        self.assertEqual((loan_ids, items), ([self.lapsed.pk], 1))
+        self.assertFalse(LoanLifecycleEvent.objects.filter(loan=self.defaulted, event=LoanLifecycleEvent.AUCTION))
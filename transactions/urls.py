@@ -5,6 +5,7 @@ urlpatterns = [
     # Loans
     path('loans/', views.LoanListView.as_view(), name='loan_list'),
     path('loans/add/', views.LoanCreateView.as_view(), name='loan_create'),
+    path('loans/agreements/export/', views.LoanAgreementExportView.as_view(), name='loan_agreements_export'),
     path('loans/<str:loan_number>/', views.LoanDetailView.as_view(), name='loan_detail'),
     path('loans/<str:loan_number>/edit/', views.LoanUpdateView.as_view(), name='loan_update'),
     path('loans/<str:loan_number>/payment/', views.PaymentCreateView.as_view(), name='payment_create'),
@@ -4,19 +4,21 @@ from django.urls import reverse_lazy, reverse
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.utils import timezone
-from django.http import Http404, HttpResponse, JsonResponse
-from django.template.loader import get_template
-from xhtml2pdf import pisa
-from io import BytesIO
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from .models import Loan, Payment, LoanExtension, Sale
 from .forms import LoanForm, SaleForm, LoanExtensionForm
 from .utils import ManagerPermissionMixin
-from django.db.models import Q
+from . import documents
+from search import index as search_index
+from accounts.access import can_access_branch, restrict_to_branches, visible_branch_ids
+from django.db import transaction
 from num2words import num2words
 from django.core.files.base import ContentFile
 import base64
 import json
 import ast
+import datetime
 
 # Basic placeholder views for the transactions app
 # These will need to be implemented properly with the correct models
@@ -26,16 +28,21 @@ class LoanListView(LoginRequiredMixin, ListView):
     context_object_name = 'loans'
     paginate_by = 10
 
+    # Maps the ?sort= parameter to LoanQuerySet.with_financials() annotations
+    SORT_OPTIONS = {
+        'outstanding_desc': '-outstanding_balance',
+        'outstanding_asc': 'outstanding_balance',
+        'payable_desc': '-payable_till_date',
+        'payable_asc': 'payable_till_date',
+    }
+
     def get_queryset(self):
-        queryset = Loan.objects.all()
+        # Photo columns stay deferred; the thumbnails only need their references
+        queryset = Loan.objects.with_photo_refs()
         user = self.request.user
 
-        # Branch filter for branch managers
-        # Branch managers can only see loans from their branch
-        # Regional managers and superusers can see all loans
-        if not user.is_superuser and user.branch:
-            if not hasattr(user, 'role') or not user.role or not user.role.name.lower() == 'regional manager':
-                queryset = queryset.filter(branch=user.branch)
+        # Branch staff only see their branch's loans (see accounts.access)
+        queryset = restrict_to_branches(queryset, user)
 
         # Status filter
         status = self.request.GET.get('status')
@@ -45,12 +52,7 @@ class LoanListView(LoginRequiredMixin, ListView):
         # Search filter
         search = self.request.GET.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(customer__first_name__icontains=search) |
-                Q(customer__last_name__icontains=search) |
-                Q(loan_number__icontains=search) |
-                Q(loanitem__item__name__icontains=search)
-            ).distinct()
+            queryset = search_index.filter_queryset(queryset, search_index.LOAN, search)
 
         # Date range filter
         date_range = self.request.GET.get('date_range')
@@ -66,13 +68,19 @@ class LoanListView(LoginRequiredMixin, ListView):
         elif date_range == 'this_year':
             queryset = queryset.filter(issue_date__year=today.year)
 
-        return queryset.select_related('customer', 'branch').prefetch_related('loanitem_set', 'loanitem_set__item')
+        # Sorting on financial figures is done in the database via annotations
+        sort = self.request.GET.get('sort')
+        if sort in self.SORT_OPTIONS:
+            queryset = queryset.with_financials().order_by(self.SORT_OPTIONS[sort], '-created_at')
+
+        return queryset.with_customer().select_related('branch', 'scheme', 'ledger').prefetch_related('loanitem_set', 'loanitem_set__item')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_query'] = self.request.GET.get('search', '')
         context['selected_status'] = self.request.GET.get('status', '')
         context['selected_date_range'] = self.request.GET.get('date_range', '')
+        context['selected_sort'] = self.request.GET.get('sort', '')
         return context
 
 
@@ -102,23 +110,8 @@ class LoanCreateView(LoginRequiredMixin, CreateView):
         if not form.instance.branch and self.request.user.branch:
             form.instance.branch = self.request.user.branch
         
-        # Generate loan number (YYYY-MM-BRANCH-XXXX format)
-        from django.utils import timezone
-        import random
-        import string
-        
-        current_date = timezone.now()
-        branch_code = str(form.instance.branch.id).zfill(2) if form.instance.branch else "00"
-        
-        # Keep trying to generate a unique loan number until we succeed
-        while True:
-            random_chars = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-            loan_number = f"{current_date.year}-{current_date.month:02d}-{branch_code}-{random_chars}"
-            
-            # Check if this loan number already exists
-            if not Loan.objects.filter(loan_number=loan_number).exists():
-                form.instance.loan_number = loan_number
-                break
+        # Generate loan number (YYYY-MM-BRANCH-NNNN format)
+        form.instance.loan_number = Loan.next_loan_number(form.instance.branch)
             
         # Ensure interest rate is set based on scheme before saving
         if form.instance.scheme:
@@ -171,6 +164,13 @@ class LoanCreateView(LoginRequiredMixin, CreateView):
         # Now we have the loan object with a loan_number, let's process any base64 images and save them to files
         self._process_and_save_photos(self.object)
         
+        # Customers without a face on file get one from the loan capture, encoded in the background
+        if self.object.customer_face_capture:
+            from biometrics import encoding_jobs
+            from biometrics.models import CustomerFaceEnrollment, FaceEncodingJob
+            if not CustomerFaceEnrollment.objects.filter(customer_id=self.object.customer_id, is_active=True).exists():
+                encoding_jobs.enqueue(self.object.customer, self.object.customer_face_capture, FaceEncodingJob.LOAN_CAPTURE)
+        
         return response
 
     def _process_and_save_photos(self, loan):
@@ -241,19 +241,20 @@ class LoanDetailView(LoginRequiredMixin, DetailView):
         if not loan_identifier:
             raise Http404("Invalid loan number")
             
+        if queryset is None:
+            queryset = Loan.objects.with_photos().select_related('customer', 'branch', 'scheme', 'ledger')
         obj = super().get_object(queryset=queryset)
         user = self.request.user
         
         # Branch managers can only access loans from their branch
-        if not user.is_superuser and user.branch and not (hasattr(user, 'role') and user.role and user.role.name.lower() == 'regional manager'):
-            if obj.branch != user.branch:
-                raise Http404("You don't have permission to view this loan.")
+        if not can_access_branch(user, obj.branch_id):
+            raise Http404("You don't have permission to view this loan.")
         
         return obj
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        loan = self.get_object()
+        loan = self.object
         
         # Add payments and other related data to context
         context['payments'] = loan.payments.all().order_by('-payment_date')
@@ -366,23 +367,21 @@ class LoanUpdateView(LoginRequiredMixin, ManagerPermissionMixin, UpdateView):
         
         # First try to find by loan_number (UUID)
         try:
-            loan = Loan.objects.get(loan_number=loan_identifier)
+            loan = Loan.objects.with_photos().select_related('scheme', 'ledger').get(loan_number=loan_identifier)
             # Check branch-based permissions
             user = self.request.user
-            if not user.is_superuser and user.branch and not (hasattr(user, 'role') and user.role and user.role.name.lower() == 'regional manager'):
-                if loan.branch != user.branch:
-                    raise Http404("You don't have permission to edit this loan.")
+            if not can_access_branch(user, loan.branch_id):
+                raise Http404("You don't have permission to edit this loan.")
             return loan
         except Loan.DoesNotExist:
             # If not found, try to find by primary key (ID)
             try:
                 if loan_identifier.isdigit():
-                    loan = Loan.objects.get(pk=int(loan_identifier))
+                    loan = Loan.objects.with_photos().select_related('scheme', 'ledger').get(pk=int(loan_identifier))
                     # Check branch-based permissions
                     user = self.request.user
-                    if not user.is_superuser and user.branch and not (hasattr(user, 'role') and user.role and user.role.name.lower() == 'regional manager'):
-                        if loan.branch != user.branch:
-                            raise Http404("You don't have permission to edit this loan.")
+                    if not can_access_branch(user, loan.branch_id):
+                        raise Http404("You don't have permission to edit this loan.")
                     return loan
             except (Loan.DoesNotExist, ValueError):
                 pass
@@ -655,23 +654,21 @@ class LoanExtensionCreateView(LoginRequiredMixin, CreateView):
         
         # First try to find by loan_number (UUID)
         try:
-            loan = Loan.objects.get(loan_number=loan_identifier)
+            loan = Loan.objects.select_related('scheme', 'ledger').get(loan_number=loan_identifier)
             # Check branch-based permissions
             user = self.request.user
-            if not user.is_superuser and user.branch and not (hasattr(user, 'role') and user.role and user.role.name.lower() == 'regional manager'):
-                if loan.branch != user.branch:
-                    raise Http404("You don't have permission to extend this loan.")
+            if not can_access_branch(user, loan.branch_id):
+                raise Http404("You don't have permission to extend this loan.")
             return loan
         except Loan.DoesNotExist:
             # If not found, try to find by primary key (ID)
             try:
                 if loan_identifier.isdigit():
-                    loan = Loan.objects.get(pk=int(loan_identifier))
+                    loan = Loan.objects.select_related('scheme', 'ledger').get(pk=int(loan_identifier))
                     # Check branch-based permissions
                     user = self.request.user
-                    if not user.is_superuser and user.branch and not (hasattr(user, 'role') and user.role and user.role.name.lower() == 'regional manager'):
-                        if loan.branch != user.branch:
-                            raise Http404("You don't have permission to extend this loan.")
+                    if not can_access_branch(user, loan.branch_id):
+                        raise Http404("You don't have permission to extend this loan.")
                     return loan
             except (Loan.DoesNotExist, ValueError):
                 pass
@@ -690,6 +687,7 @@ class LoanExtensionCreateView(LoginRequiredMixin, CreateView):
         kwargs['user'] = self.request.user
         return kwargs
     
+    @transaction.atomic
     def form_valid(self, form):
         loan = self.get_object_loan()
         form.instance.loan = loan
@@ -719,23 +717,21 @@ class LoanForecloseView(LoginRequiredMixin, UpdateView):
         
         # First try to find by loan_number (UUID)
         try:
-            loan = Loan.objects.get(loan_number=loan_identifier)
+            loan = Loan.objects.select_related('scheme', 'ledger').get(loan_number=loan_identifier)
             # Check branch-based permissions
             user = self.request.user
-            if not user.is_superuser and user.branch and not (hasattr(user, 'role') and user.role and user.role.name.lower() == 'regional manager'):
-                if loan.branch != user.branch:
-                    raise Http404("You don't have permission to foreclose this loan.")
+            if not can_access_branch(user, loan.branch_id):
+                raise Http404("You don't have permission to foreclose this loan.")
             return loan
         except Loan.DoesNotExist:
             # If not found, try to find by primary key (ID)
             try:
                 if loan_identifier.isdigit():
-                    loan = Loan.objects.get(pk=int(loan_identifier))
+                    loan = Loan.objects.select_related('scheme', 'ledger').get(pk=int(loan_identifier))
                     # Check branch-based permissions
                     user = self.request.user
-                    if not user.is_superuser and user.branch and not (hasattr(user, 'role') and user.role and user.role.name.lower() == 'regional manager'):
-                        if loan.branch != user.branch:
-                            raise Http404("You don't have permission to foreclose this loan.")
+                    if not can_access_branch(user, loan.branch_id):
+                        raise Http404("You don't have permission to foreclose this loan.")
                     return loan
             except (Loan.DoesNotExist, ValueError):
                 pass
@@ -745,7 +741,7 @@ class LoanForecloseView(LoginRequiredMixin, UpdateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        loan = self.get_object()
+        loan = self.object
         
         # Add PAYMENT_METHOD_CHOICES to context for the template
         context['payment_method_choices'] = Payment.PAYMENT_METHOD_CHOICES
@@ -776,8 +772,9 @@ class LoanForecloseView(LoginRequiredMixin, UpdateView):
         
         return context
     
+    @transaction.atomic
     def form_valid(self, form):
-        loan = self.get_object()
+        loan = self.object
         form.instance.status = 'foreclosed'
         
         # Get payment method from the form
@@ -832,23 +829,21 @@ class PaymentCreateView(LoginRequiredMixin, CreateView):
         
         # First try to find by loan_number (UUID)
         try:
-            loan = Loan.objects.get(loan_number=loan_identifier)
+            loan = Loan.objects.select_related('scheme', 'ledger').get(loan_number=loan_identifier)
             # Check branch-based permissions
             user = self.request.user
-            if not user.is_superuser and user.branch and not (hasattr(user, 'role') and user.role and user.role.name.lower() == 'regional manager'):
-                if loan.branch != user.branch:
-                    raise Http404("You don't have permission to make payments for this loan.")
+            if not can_access_branch(user, loan.branch_id):
+                raise Http404("You don't have permission to make payments for this loan.")
             return loan
         except Loan.DoesNotExist:
             # If not found, try to find by primary key (ID)
             try:
                 if loan_identifier.isdigit():
-                    loan = Loan.objects.get(pk=int(loan_identifier))
+                    loan = Loan.objects.select_related('scheme', 'ledger').get(pk=int(loan_identifier))
                     # Check branch-based permissions
                     user = self.request.user
-                    if not user.is_superuser and user.branch and not (hasattr(user, 'role') and user.role and user.role.name.lower() == 'regional manager'):
-                        if loan.branch != user.branch:
-                            raise Http404("You don't have permission to make payments for this loan.")
+                    if not can_access_branch(user, loan.branch_id):
+                        raise Http404("You don't have permission to make payments for this loan.")
                     return loan
             except (Loan.DoesNotExist, ValueError):
                 pass
@@ -896,6 +891,7 @@ class PaymentCreateView(LoginRequiredMixin, CreateView):
         
         return context
     
+    @transaction.atomic
     def form_valid(self, form):
         loan = self.get_object_loan()
         form.instance.loan = loan
@@ -1057,11 +1053,8 @@ class SaleListView(LoginRequiredMixin, ListView):
         queryset = Sale.objects.all()
         user = self.request.user
         
-        # Filter sales by branch for branch managers
-        # Allow regional managers and superusers to see all sales
-        if not user.is_superuser and user.branch:
-            if not hasattr(user, 'role') or not user.role or not user.role.name.lower() == 'regional manager':
-                queryset = queryset.filter(branch=user.branch)
+        # Branch staff only see their branch's sales (see accounts.access)
+        queryset = restrict_to_branches(queryset, user)
         
         return queryset.select_related('customer', 'branch', 'item').order_by('-sale_date')
 
@@ -1097,9 +1090,8 @@ class SaleDetailView(LoginRequiredMixin, DetailView):
         user = self.request.user
         
         # Branch managers can only access sales from their branch
-        if not user.is_superuser and user.branch and not (hasattr(user, 'role') and user.role and user.role.name.lower() == 'regional manager'):
-            if obj.branch != user.branch:
-                raise Http404("You don't have permission to view this sale.")
+        if not can_access_branch(user, obj.branch_id):
+            raise Http404("You don't have permission to view this sale.")
         
         return obj
 
@@ -1123,224 +1115,115 @@ class SaleReceiptView(LoginRequiredMixin, DetailView):
     context_object_name = 'sale'
 
 
-class LoanDocumentView(LoginRequiredMixin, View):
+class DocumentResponseMixin:
+    """Serve a PDF from the document cache, or a page that polls until it is rendered"""
+    document_kind = None
+    document_title = 'document'
+    as_attachment = False
+
+    def document_response(self, obj, filename, back_url):
+        document = documents.request_document(self.document_kind, obj)
+
+        # Polling endpoint used by the pending page
+        if self.request.GET.get('format') == 'json':
+            return JsonResponse({'status': document.status})
+
+        if document.is_ready:
+            return FileResponse(
+                open(document.path, 'rb'),
+                as_attachment=self.as_attachment,
+                filename=filename,
+                content_type='application/pdf',
+            )
+        if document.status == documents.DocumentStatus.FAILED:
+            print("PDF generation error:", document.error)
+            return HttpResponse("Error generating PDF. Please try again later.", status=500)
+
+        return render(self.request, 'transactions/document_pending.html', {
+            'document_title': self.document_title,
+            'document_url': self.request.path,
+            'back_url': back_url,
+        })
+
+
+class LoanDocumentView(LoginRequiredMixin, DocumentResponseMixin, View):
     """Generate a PDF loan agreement with Indian rules and conditions"""
+    document_kind = documents.LOAN_AGREEMENT
+    document_title = 'loan agreement'
+    as_attachment = True
     
     def get(self, request, loan_number):
         loan_identifier = loan_number
+        loans = Loan.objects.with_photos().select_related('customer', 'branch')
         
         # First try to find by loan_number (UUID)
         try:
-            loan = Loan.objects.get(loan_number=loan_identifier)
+            loan = loans.get(loan_number=loan_identifier)
         except Loan.DoesNotExist:
             # If not found, try to find by primary key (ID)
             try:
                 if loan_identifier.isdigit():
-                    loan = Loan.objects.get(pk=int(loan_identifier))
+                    loan = loans.get(pk=int(loan_identifier))
                 else:
                     raise Http404("No Loan matches the given query.")
             except (Loan.DoesNotExist, ValueError):
                 raise Http404("No Loan matches the given query.")
         
-        # Get loan items with gold details
-        loan_items = loan.loanitem_set.all()
-        
-        # Default base64 placeholder image for customer photo (minimal version)
-        default_customer_photo = "iVBORw0KGgoAAAANSUhEUgAAADAAAAAwCAYAAABXAvmHAAAABGdBTUEAALGPC/xhBQAAACBjSFJNAAB6JgAAgIQAAPoAAACA6AAAdTAAAOpgAAA6mAAAF3CculE8AAAABmJLR0QA/wD/AP+gvaeTAAAACXBIWXMAAAsTAAALEwEAmpwYAAAAB3RJTUUH5gQaDyoKQAHnpAAAA+1JREFUaN7tmm1IVEEUht+Z3VxXs7TdVikRIlMhkEgogxDCQrGPBCMsP37RD21D/RH0L/xRUJFA/QiMwC9E0NAfJUVEaYmGJWUUUUFFJZG2rru3H+ruuO7u3L1z72p04ID7dWbmnPec887ZO8A0pmlM07j+2DFy5I+4/r9YSYa7MX4QCSRsKTR0Fbgd6olObJyXhEJX+gbPsQ15E+iEo02rpf6MgR9gOFU5Ksv4ISDBqaYMPcQIn51zQcr4pZBAx8xkZcxZmxA3BNrryPb1syWgdNdVXwxzNr+W6wvNmUKNAZdnCJHRqKAEsOQk7HoWi8S1Bs6Fc2Gl6IfDSFWl8bPv84LInywiKoYNOImHCTMDXCus2ITOPGmfmjNkIbRMiTwLnkIfJ/xJx9OESkDZFNJbIPpOIfdggxLnPbdWNnQV4EY6AyDPkXf2gwlZdtwbhRG+sVJrYDDcxEn+uWhCFi751Jzb67iapgbrppCaIQw4Pzc7ya9k2HwLtVAXmnzCN3rKtBIIf4j9FB5aSIi0sJIVIvAQS8jcBe9qBX+qDpn47Nxs5HtvuVYzrd9ByDmkqd5lu+XLGDJw430Gl/PrvTfSfgm7+gYR97x1ED88UyL280r7Nsf3vePRpFBroMH7ky6F3K5mjHSJ/2n0h3HbH03MsE+MdL5cStHVBfLQBcGJezoH53Pi4N1/14UkfnEFz7RcoXp37qiWqA402CT/XV8/BNb5qVSubK9IxhsOAlHO5ykJSF6oMpHAThZjkBDARO/XkRnQMsIXeCnfeNU0YRbid/oG5ji2Uw5CI524/x4x7i4p441DgOHTnTdciRxaSHCYyzEQiSC10Ymlg1ay8Un3UydIcEEo5zN8QWPyfcM19aGeZRXja+O3FTGBLiXD52aCZw1oeAAAAAA="
-                
-        # Default base64 placeholder image for item photo (minimal version)
-        default_item_photo = "iVBORw0KGgoAAAANSUhEUgAAADAAAAAwCAYAAABXAvmHAAAABGdBTUEAALGPC/xhBQAAACBjSFJNAAB6JgAAgIQAAPoAAACA6AAAdTAAAOpgAAA6mAAAF3CculE8AAAABmJLR0QA/wD/AP+gvaeTAAAACXBIWXMAAAsTAAALEwEAmpwYAAAAB3RJTUUH5gQaDysZXrfKuwAABXtJREFUaN7tmGtsFFUUx/93Zna7W2i7pbbG+EAoaEUUIpo04MvEYIKpfNCIJsRCY/PBGBIKftBIeAa/+MlAYtSAihETozGa+ACJSIAItGDCw1RLQYRYbIFC2+3O7MydO9cPs9ty587M3N1G4wb+yc3svTt3zv93zrnnnnsXSJEiRYoUKVKk+A8hOgf/uqv8Or7ZZ0XNXdGU5btsItkmNGFH8YOw3rFdfOgvTyRBE7bvWUaIhcA4RA7DAU0eBkiBAnflIt6DIj4gfiQ73AbQVbr17EeZw8TQox5JSvUaA0MllUg0gTZkTrt+oU8awwAgDM1DF9BM0OQvA9NEra45tJi3FCeBNfXAgjkj+vMlJk/XA1kYiQaiVZ9MwawDhcSSqKzm8pmrRwIYn0BXNrPdE6H4Uf0IIfAp9uRP15xdZk31YV+3H+s33wWjJu7+Ph/dPdmI9GUbmSMiDvK+omp0p1F1DrMuFuUTB2FEgu9YNW5CSUExoyZau7OQbo7BXmAwQxGm1wDfREP1oUDCG29D5JqADoFh6I+gQBj4naxhxCMBg8EMsxKjxz10kzwegTg3XnPoPqbXBOIhIGAGYhAYQ+T0+CEdI8wXbog89IHypZbiJRC74VdUHxRXryWEs63gwNqcPucLkmzLuCqUNDFGlO6qj0CF6XsRqpsbDMkKkei9UcLaziBX89n3RL8t4IkvJQFpYplhwrxXVGFc7nPVBOvXHfI1fFtkVUPiExDljBXKiIpQt7k39MJv10KoKC2pRas3PioK5GR9BPQXIf/X1SpnkykI0nPUdasZA0MZcLNYTfKWJs7xfRU1EJYxav0+iN4xnmXu5+WEtQVBxV2a4scqP1uwnDAecLey1dWLJl+KkMFFnukzeZRihB7YhU7OkODZ36xsa7gm24/1wrWhHzboeBa5G+QjaI0zwVPKvK1MMGkB9/Vf3BDnhPew3ROnrKkB2YGWm+BHGuIdFlacPKW6jjqS1SJACQcYxIQUWt5EQJuZLUmCioOWqkDYv6nyMNnBZn9CyD6Jv9MI3m3qYvQNkkKaCSlIhOliQqALmB5VcM7qCa+h3zh/hQYJFgTmBrJ6lLCaPt9mZFmNZGolTBylLem+/80HP2YDlmBB0q2obXpIddxJjkVq3UkkQVvQtIl7p0OWfHrO5o8eV28SFKk1Tj8H4mduJJRe45ysqGZ7I+sxbdLez1SYQw8bbA1wboC9TFTXNMijzgXh/SUcaFOny3vCXQHZnwPCPbR0GUmqZtFFwn+doBeUOad11A4srRlA3KmzxggCDZ15iBck6PeSdB+9K8Rr02YC3qBMXJjmtQYy9LkQXxHm9pnCa0IpgVeQnFaYaPQlgSupBHDn/QP47JeuLG66siH8vMb02/b25tLAG2drPCFjBadPHwN4nIL25Ew7VuI3gRg676aXlO6Z1a0F850ggfiOE1NveuviAlwheCt5bsujuOJvATvQuhaFhQeojTvG8lHPBw/tq0c8p0/5HBicapyDg6qTG8eHu3IiPzVOGvPrCVfQSDCYbduH9/YCo/2mGa7DHRf7yuoVv2nDSHVi1oAFEnRmRFJerG3yve91/Pc59OJRx8/MPVowMDJRheY4t8U6VWjE2GJf9y674+krJV4Hjw9sWjBiLD0kqJ1xFUYUd7h6q9JkH17KDf3UeC+Pp+/xScDm1cNAeN+AEOfUuYkhhCaEE7uudKLDHURHcBJO+YpxpXcWzkTyAnmuUykJengC//auQEJeWb05MAMxK0/arKwojaFdBNwrZlkCDo9ZHFEMjFoGBrICCIsalBVT97lw5xXel4j0DUw0Y+h2/piI4l4h8QikjWhP0FIl8eP4b/BDw9VdlJqtNJoMlE5VsXuijUqzAlnmhJgliJ0OQZXEyj0JQIoUKVKkSJEiRYq/AT4c/wPH0I0QAAAAJXRFWHRkYXRlOmNyZWF0ZQAyMDIyLTA0LTI2VDE1OjQzOjI1KzAwOjAwf2xAQwAAACV0RVh0ZGF0ZTptb2RpZnkAMjAyMi0wNC0yNlQxNTo0MzoyNSswMDowMA4x+P8AAAAASUVORK5CYII="""
-                
-        # Process customer photo (remove the data:image/jpeg;base64, prefix if present)
-        customer_photo = None
-        if hasattr(loan, 'customer_face_capture') and loan.customer_face_capture:
-            if isinstance(loan.customer_face_capture, str):
-                try:
-                    # Handle various formats of base64 images
-                    if loan.customer_face_capture.startswith('data:image/'):
-                        try:
-                            # Extract the base64 part after the comma
-                            format_prefix, base64_data = loan.customer_face_capture.split(';base64,', 1)
-                            customer_photo = base64_data
-                        except Exception as e:
-                            # Use default if there's an error processing the customer photo
-                            print(f"Error splitting customer face capture: {e}")
-                            customer_photo = default_customer_photo
-                    else:
-                        # Maybe it's already just the base64 string without prefix
-                        customer_photo = loan.customer_face_capture
-                except Exception as e:
-                    print(f"Error processing customer photo: {e}")
-                    customer_photo = default_customer_photo
-        else:
-            # Use default customer photo placeholder
-            customer_photo = default_customer_photo
-                
-        # Process item photos (parse JSON string if needed)
-        item_photos = []
-        if hasattr(loan, 'item_photos') and loan.item_photos:
-            import json
-            try:
-                # If stored as JSON string
-                if isinstance(loan.item_photos, str):
-                    # Clean up any potential whitespace or extra quotes
-                    cleaned_data = loan.item_photos.strip()
-                    if (cleaned_data.startswith('"') and cleaned_data.endswith('"')) or \
-                       (cleaned_data.startswith("'") and cleaned_data.endswith("'")):
-                        cleaned_data = cleaned_data[1:-1]
-                    
-                    # Try parsing as JSON
-                    try:
-                        photo_list = json.loads(cleaned_data)
-                        
-                        # Process each photo in the list
-                        for photo in photo_list:
-                            if isinstance(photo, str):
-                                try:
-                                    if photo.startswith('data:image/'):
-                                        try:
-                                            # Extract the base64 part after the comma
-                                            format_prefix, base64_data = photo.split(';base64,', 1)
-                                            item_photos.append(base64_data)
-                                        except Exception:
-                                            # If we can't split the data URL format, use default instead
-                                            item_photos.append(default_item_photo)
-                                    elif photo.startswith('/media/'):
-                                        # For file URLs, we need to read the file and convert to base64
-                                        try:
-                                            import os
-                                            from django.conf import settings
-                                            import base64
-                                            
-                                            # Clean up the URL to get the file path - correctly handle the first '/'
-                                            if photo.startswith('/'):
-                                                rel_path = photo[1:] # Remove leading slash
-                                            else:
-                                                rel_path = photo
-                                                
-                                            # Extract the part after '/media/' - avoiding path traversal issues
-                                            if rel_path.startswith('media/'):
-                                                media_path = rel_path[6:] # Just the part after 'media/'
-                                            else:
-                                                media_path = rel_path
-                                            
-                                            file_path = os.path.join(settings.MEDIA_ROOT, media_path)
-                                            
-                                            # Validate file path to prevent directory traversal attacks
-                                            if not os.path.abspath(file_path).startswith(os.path.abspath(settings.MEDIA_ROOT)):
-                                                print(f"Security warning: Invalid file path requested: {file_path}")
-                                                item_photos.append(default_item_photo)
-                                                continue
-                                            
-                                            # Check if file exists and is readable
-                                            if os.path.exists(file_path) and os.path.isfile(file_path) and os.access(file_path, os.R_OK):
-                                                try:
-                                                    with open(file_path, 'rb') as f:
-                                                        file_data = f.read()
-                                                        base64_data = base64.b64encode(file_data).decode('utf-8')
-                                                        item_photos.append(base64_data)
-                                                except (IOError, OSError, PermissionError) as e:
-                                                    print(f"File read error for {file_path}: {e}")
-                                                    item_photos.append(default_item_photo)
-                                            else:
-                                                print(f"Image file not found or not accessible: {file_path}")
-                                                item_photos.append(default_item_photo)
-                                        except Exception as e:
-                                            print(f"Error processing image at path {photo}: {str(e)}")
-                                            item_photos.append(default_item_photo)
-                                    else:
-                                        # Assume it's already a base64 string without prefix
-                                        item_photos.append(photo)
-                                except Exception as e:
-                                    print(f"Error processing individual photo: {str(e)}")
-                                    item_photos.append(default_item_photo)
-                    except json.JSONDecodeError as json_err:
-                        print(f"JSON decode error: {json_err}")
-                        # If we failed to process JSON, maybe it's a single base64 string
-                        if cleaned_data.startswith('data:image/'):
-                            try:
-                                format_prefix, base64_data = cleaned_data.split(';base64,', 1)
-                                item_photos.append(base64_data)
-                            except Exception:
-                                item_photos.append(default_item_photo)
-                        else:
-                            # Add default for invalid format
-                            item_photos.append(default_item_photo)
-                else:
-                    # Not a string - add default
-                    item_photos.append(default_item_photo)
-            
-            except Exception as e:
-                # Log the error
-                print(f"Error processing item_photos in loan agreement: {str(e)}")
-                # Add default
-                item_photos.append(default_item_photo)
+        return self.document_response(
+            loan,
+            documents.loan_agreement_filename(loan),
+            reverse('loan_detail', args=[loan.loan_number]),
+        )
 
-        # If no item photos found, add default placeholder images
-        if not item_photos:
-            # Add default placeholder image - if there are loan items, add one placeholder per item
-            if loan_items:
-                for _ in loan_items:
-                    item_photos.append(default_item_photo)
-            else:
-                # If no loan items, add at least one placeholder
-                item_photos.append(default_item_photo)
-        
-        # Debug logging
-        print(f"Item photos processed for loan agreement: {len(item_photos)} photos found")
-        
-        # Prepare context for PDF template
-        context = {
-            'loan': loan,
-            'loan_items': loan_items,
-            'customer': loan.customer,
-            'branch': loan.branch,
-            'date_today': timezone.now().date(),
-            'customer_photo': customer_photo,
-            'item_photos': item_photos
-        }
-        
-        # Render the PDF template
-        template = get_template('transactions/loan_document_pdf.html')
-        html = template.render(context)
-        result = BytesIO()
-        
+class LoanAgreementExportView(LoginRequiredMixin, View):
+    """Stream a ZIP of every loan agreement issued by a branch in a date range"""
+    
+    def get(self, request):
+        user = request.user
+        today = timezone.now().date()
         try:
-            # Create PDF from HTML content with error handling
-            pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result)
-            
-            if not pdf.err:
-                # Generate response with PDF content
-                response = HttpResponse(result.getvalue(), content_type='application/pdf')
-                
-                # Generate filename with customer name and loan item name only
-                customer_name = f"{loan.customer.first_name}_{loan.customer.last_name}"
-                
-                # Get the first item name as part of the filename
-                item_name = "NoItem"
-                if loan_items:
-                    # If there are multiple items, use the first one's name
-                    first_item = loan_items.first()
-                    if first_item and first_item.item:
-                        # Clean the item name to make it URL-safe
-                        item_name = first_item.item.name.replace(' ', '_')
-                
-                # Format the filename: CustomerName_ItemName.pdf
-                filename = f"{customer_name}_{item_name}.pdf"
-                
-                # Make the filename URL-safe (replace special characters)
-                import re
-                filename = re.sub(r'[^\w\-_.]', '_', filename)
-                
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                return response
-            else:
-                # If PDF generation fails
-                print("PDF generation error:", pdf.err)
-                return HttpResponse("Error generating PDF. Please try again later.", status=500)
-        except Exception as e:
-            print(f"Exception during PDF generation: {str(e)}")
-            return HttpResponse("An unexpected error occurred while generating the PDF.", status=500)
+            start_date = datetime.date.fromisoformat(request.GET.get('start_date') or today.isoformat())
+            end_date = datetime.date.fromisoformat(request.GET.get('end_date') or start_date.isoformat())
+        except ValueError:
+            return HttpResponse("Invalid date. Use YYYY-MM-DD.", status=400)
+        if end_date < start_date:
+            return HttpResponse("End date is before start date.", status=400)
+        
+        branch_id = request.GET.get('branch')
+        visible = visible_branch_ids(user)
+        if branch_id:
+            if not branch_id.isdigit():
+                return HttpResponse("Invalid branch.", status=400)
+            # Branch staff can only export branches they can see
+            if visible is not None and int(branch_id) not in visible:
+                raise Http404("You don't have permission to export this branch.")
+            branch_ids = [int(branch_id)]
+        else:
+            branch_ids = None if visible is None else sorted(visible)
+        
+        loan_ids = documents.agreement_loan_ids(start_date, end_date, branch_ids)
+        if not loan_ids:
+            messages.info(request, "No loan agreements were issued in the selected period.")
+            return redirect('loan_list')
+        # Every agreement is rendered inside this request, so its size is capped
+        limit = getattr(settings, 'AGREEMENT_EXPORT_MAX_LOANS', 200)
+        if len(loan_ids) > limit:
+            return HttpResponse(
+                f"{len(loan_ids)} agreements in this period; at most {limit} can be downloaded at once. "
+                f"Choose a shorter period or a single branch, or use the export_agreements command.",
+                status=400,
+            )
+        
+        filename = f"Loan_Agreements_{start_date:%d%b%Y}"
+        if end_date != start_date:
+            filename += f"_to_{end_date:%d%b%Y}"
+        # Rendered one at a time in this request; large exports belong to the export_agreements command
+        response = StreamingHttpResponse(
+            documents.iter_agreements_zip(loan_ids, workers=1), content_type='application/zip'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+        return response
+
 
 def number_to_words(request, number):
     """Convert number to words in Indian format"""
@@ -1352,81 +1235,27 @@ def number_to_words(request, number):
     except (ValueError, TypeError):
         return JsonResponse({'error': 'Invalid number'}, status=400)
 
-class PaymentReceiptView(LoginRequiredMixin, View):
+class PaymentReceiptView(LoginRequiredMixin, DocumentResponseMixin, View):
     """Generate a PDF receipt for a payment"""
+    document_kind = documents.PAYMENT_RECEIPT
+    document_title = 'payment receipt'
     
     def get(self, request, payment_id):
         try:
-            payment = Payment.objects.get(id=payment_id)
-            loan = payment.loan
-            
-            # Check branch-based permissions
-            user = self.request.user
-            if not user.is_superuser and user.branch and not (hasattr(user, 'role') and user.role and user.role.name.lower() == 'regional manager'):
-                if loan.branch != user.branch:
-                    raise Http404("You don't have permission to view this payment receipt.")
-            
-            # Calculate interest amount
-            from decimal import Decimal
-            interest_amount = loan.total_payable_till_date - loan.principal_amount
-            interest_amount = max(Decimal('0'), interest_amount)
-            
-            # Calculate total paid including this payment
-            total_paid = loan.amount_paid
-            
-            # Calculate remaining balance
-            remaining_balance = max(Decimal('0'), loan.total_payable_till_date - total_paid)
-            
-            # Determine payment type (full or partial)
-            payment_type = 'partial'
-            if payment.notes and ('full payment' in payment.notes.lower() or 
-                              'loan closed' in payment.notes.lower() or 
-                              'fully repaid' in payment.notes.lower()):
-                payment_type = 'full'
-            
-            # Convert amount to words
-            from num2words import num2words
-            amount_in_words = num2words(payment.amount, lang='en_IN').title() + " Rupees Only"
-            
-            # Prepare context for PDF template
-            context = {
-                'payment': payment,
-                'loan': loan,
-                'branch': loan.branch,
-                'interest_amount': interest_amount,
-                'total_paid': total_paid,
-                'remaining_balance': remaining_balance,
-                'payment_type': payment_type,
-                'amount_in_words': amount_in_words,
-                'date_today': timezone.now()
-            }
-            
-            # Render the PDF template
-            template = get_template('transactions/payment_receipt_pdf.html')
-            html = template.render(context)
-            result = BytesIO()
-            
-            # Create PDF from HTML content
-            pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result)
-            
-            if not pdf.err:
-                # Generate response with PDF content
-                response = HttpResponse(result.getvalue(), content_type='application/pdf')
-                
-                # Generate filename
-                customer_name = f"{loan.customer.first_name}_{loan.customer.last_name}"
-                payment_date = payment.payment_date.strftime('%d%b%Y')
-                filename = f"Payment_Receipt_{customer_name}_{payment_date}.pdf"
-                
-                # Make the filename URL-safe
-                import re
-                filename = re.sub(r'[^\w\-_.]', '_', filename)
-                
-                response['Content-Disposition'] = f'inline; filename="{filename}"'
-                return response
-            
-            # If PDF generation fails
-            return HttpResponse("Error generating payment receipt PDF", status=400)
-            
+            payment = Payment.objects.select_related(
+                'loan__ledger', 'loan__scheme', 'loan__branch', 'loan__customer'
+            ).get(id=payment_id)
         except Payment.DoesNotExist:
             raise Http404("Payment not found")
+        loan = payment.loan
+        
+        # Check branch-based permissions
+        user = self.request.user
+        if not can_access_branch(user, loan.branch_id):
+            raise Http404("You don't have permission to view this payment receipt.")
+        
+        return self.document_response(
+            payment,
+            documents.payment_receipt_filename(payment),
+            reverse('loan_detail', args=[loan.loan_number]),
+        )